@@ -0,0 +1,421 @@
+"""
+Ambiguity classifier học từ lịch sử phân tích - sàng lọc local trước ClarityCheckNode
+
+Mỗi dòng AnalysisHistory là dữ liệu có nhãn: requirement của text_input nằm trong
+ambiguities_json là mơ hồ, các requirement còn lại là rõ ràng (theo LLM / rule engine).
+Training job dựng một classifier nhẹ của scikit-learn (TF-IDF word + char n-gram ->
+LogisticRegression) từ bảng history. Khi phân tích, mỗi requirement được chấm điểm:
+điểm thấp / cao (chắc chắn) được kết luận local, chỉ dải không chắc chắn ở giữa mới gửi
+cho LLM. Ngưỡng của dải được calibrate trên tập holdout để kết luận local đạt
+AMBIGUITY_CLASSIFIER_TARGET_PRECISION.
+
+Mỗi lần train sinh một model version mới (file .joblib + metadata trong
+AMBIGUITY_CLASSIFIER_DIR); current.json trỏ tới version đang dùng, các process khác tự
+load lại khi nó đổi. Requirement do classifier kết luận (mơ hồ lẫn rõ ràng) được ghi vào
+bảng ambiguity_classifier_settlements, finding mơ hồ còn được đánh dấu CLASSIFIER_ISSUE_PREFIX;
+các requirement này không được dùng làm nhãn khi train lại (tránh model tự học từ chính
+output của nó). Requirement rơi vào dải không chắc chắn ở lần sau được xóa khỏi bảng (đã gửi LLM).
+
+Không cài scikit-learn hoặc chưa có model: pre-screen bị bỏ qua, mọi requirement gửi LLM.
+"""
+
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Collection, Dict, List, Optional, Sequence, Tuple
+from app.database.db import session_scope
+from app.utils.logger import logger
+from app.utils.requirements_text import best_match, requirement_fingerprint, split_requirements
+
+AMBIGUITY_CLASSIFIER_ENABLED = os.getenv("AMBIGUITY_CLASSIFIER_ENABLED", "true").lower() == "true"
+AMBIGUITY_CLASSIFIER_DIR = Path(os.getenv("AMBIGUITY_CLASSIFIER_DIR", "models/ambiguity_classifier"))
+# Độ chính xác tối thiểu của kết luận local (trên holdout) khi calibrate dải không chắc chắn
+AMBIGUITY_CLASSIFIER_TARGET_PRECISION = float(os.getenv("AMBIGUITY_CLASSIFIER_TARGET_PRECISION", "0.95"))
+AMBIGUITY_TRAINING_MIN_SAMPLES = int(os.getenv("AMBIGUITY_TRAINING_MIN_SAMPLES", "200"))
+AMBIGUITY_TRAINING_MIN_PER_CLASS = int(os.getenv("AMBIGUITY_TRAINING_MIN_PER_CLASS", "20"))
+AMBIGUITY_TRAINING_MAX_ROWS = int(os.getenv("AMBIGUITY_TRAINING_MAX_ROWS", "5000"))
+# Khoảng thời gian tối thiểu giữa 2 lần kiểm tra current.json (model do process khác train)
+AMBIGUITY_CLASSIFIER_RELOAD_INTERVAL = float(os.getenv("AMBIGUITY_CLASSIFIER_RELOAD_INTERVAL", "30"))
+
+CLASSIFIER_ISSUE_PREFIX = "[local classifier]"
+_CURRENT_FILE = "current.json"
+_HOLDOUT_FRACTION = 0.2
+_VERSION_RE = re.compile(r"[\w.-]+")
+
+
+class ClassifierTrainingError(ValueError):
+    """Không train được model (thiếu dữ liệu có nhãn, đang có training khác)"""
+
+
+class ClassifierUnavailableError(ClassifierTrainingError):
+    """Thiếu scikit-learn hoặc database không available"""
+
+
+@dataclass
+class ScreenResult:
+    """Kết quả sàng lọc: kết luận local (mơ hồ / rõ ràng) và requirement còn phải hỏi LLM"""
+    ambiguous: List[Tuple[str, float]] = field(default_factory=list)  # (requirement, score)
+    clear: List[str] = field(default_factory=list)
+    uncertain: List[str] = field(default_factory=list)
+
+    def findings(self) -> List[Dict[str, str]]:
+        return [
+            {"req": requirement, "issue": f"{CLASSIFIER_ISSUE_PREFIX} Wording closely matches requirements previously "
+                                         f"judged ambiguous (score {score:.2f}); add measurable criteria."}
+            for requirement, score in self.ambiguous
+        ]
+
+
+def settlement_key(requirement: str) -> str:
+    """Key của requirement trong bảng settlements (theo fingerprint, độc lập với document)"""
+    return hashlib.sha256(requirement_fingerprint(requirement).encode("utf-8")).hexdigest()
+
+
+def build_training_set(
+    rows: Sequence[Tuple[Optional[str], Optional[List[Dict]]]],
+    settled: Collection[str] = frozenset()
+) -> Tuple[List[str], List[int]]:
+    """
+    (text_input, ambiguities) của các analysis -> (requirement, nhãn 0/1)
+
+    Requirement trùng nội dung giữa các analysis chỉ lấy một lần (nhãn của analysis mới
+    nhất - rows theo thứ tự mới -> cũ). Requirement do classifier kết luận (finding có
+    CLASSIFIER_ISSUE_PREFIX hoặc settlement_key nằm trong `settled`) không được dùng làm nhãn.
+    """
+    samples: Dict[str, Tuple[str, int]] = {}
+    for text, ambiguities in rows:
+        requirements = split_requirements(text or "")
+        if not requirements:
+            continue
+        labels = [0] * len(requirements)
+        excluded = set()
+        for item in ambiguities or []:
+            if not isinstance(item, dict):
+                continue
+            index = best_match(item.get("req", ""), requirements)
+            if index is None:
+                continue
+            if str(item.get("issue", "")).startswith(CLASSIFIER_ISSUE_PREFIX):
+                excluded.add(index)
+            else:
+                labels[index] = 1
+        for index, requirement in enumerate(requirements):
+            key = requirement_fingerprint(requirement)
+            if key and key not in samples and index not in excluded and settlement_key(requirement) not in settled:
+                samples[key] = (requirement, labels[index])
+    texts = [text for text, _ in samples.values()]
+    return texts, [label for _, label in samples.values()]
+
+
+def calibrate_thresholds(scores: Sequence[float], labels: Sequence[int], target: float) -> Tuple[float, float]:
+    """
+    Dải không chắc chắn (low, high) trên tập holdout
+
+    high: ngưỡng nhỏ nhất mà các requirement có score >= high là mơ hồ với precision >= target;
+    low: ngưỡng lớn nhất mà các requirement có score <= low là rõ ràng với precision >= target.
+    Không đạt target: (0.0, 1.0) - mọi requirement đều gửi LLM.
+    """
+    pairs = sorted(zip(scores, labels))
+    low, negatives = 0.0, 0
+    for count, (score, label) in enumerate(pairs, start=1):
+        negatives += 1 - label
+        if negatives / count >= target and count >= AMBIGUITY_TRAINING_MIN_PER_CLASS // 2:
+            low = score
+    high, positives = 1.0, 0
+    for count, (score, label) in enumerate(reversed(pairs), start=1):
+        positives += label
+        if positives / count >= target and count >= AMBIGUITY_TRAINING_MIN_PER_CLASS // 2:
+            high = score
+    if low >= high:
+        return 0.0, 1.0
+    return low, high
+
+
+def _build_pipeline():
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import FeatureUnion, Pipeline
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    features = FeatureUnion([
+        ("words", TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=2, lowercase=True)),
+        ("chars", TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 5), sublinear_tf=True, min_df=2)),
+    ])
+    return Pipeline([
+        ("features", features),
+        ("model", LogisticRegression(class_weight="balanced", max_iter=1000)),
+    ])
+
+
+class AmbiguityClassifier:
+    """
+    Model hiện tại (lazy load, tự reload khi current.json đổi) + training / versioning
+
+    Usage:
+        classifier = get_ambiguity_classifier()
+        screen = classifier.screen(requirements)      # None nếu chưa có model
+        metadata = classifier.train()                 # Train version mới từ history và dùng luôn
+        classifier.activate("20240101T000000-ab12cd34")  # Quay lại version cũ
+    """
+
+    def __init__(
+        self,
+        model_dir: Optional[Path] = None,
+        enabled: bool = AMBIGUITY_CLASSIFIER_ENABLED,
+        session_factory: Callable = session_scope,
+        reload_interval: float = AMBIGUITY_CLASSIFIER_RELOAD_INTERVAL,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.model_dir = Path(model_dir) if model_dir is not None else AMBIGUITY_CLASSIFIER_DIR
+        self.enabled = enabled
+        self._session_factory = session_factory
+        self.reload_interval = reload_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._train_lock = threading.Lock()
+        self._model = None
+        self._metadata: Optional[Dict[str, Any]] = None
+        self._current_mtime: Optional[float] = None
+        self._last_check: Optional[float] = None
+        self._failed = False
+        self._stats = {"screened": 0, "local_ambiguous": 0, "local_clear": 0, "uncertain": 0, "trainings": 0}
+
+    @property
+    def version(self) -> Optional[str]:
+        """Version của model đang dùng (None nếu chưa có model)"""
+        self._load()
+        return self._metadata["version"] if self._metadata else None
+
+    @property
+    def training(self) -> bool:
+        return self._train_lock.locked()
+
+    def _load(self):
+        """Model hiện tại (load lại nếu current.json đổi, kiểm tra tối đa một lần mỗi reload_interval)"""
+        if not self.enabled or self._failed:
+            return None
+        now = self._clock()
+        if self._last_check is not None and now - self._last_check < self.reload_interval:
+            return self._model
+        with self._lock:
+            self._last_check = now
+            current = self.model_dir / _CURRENT_FILE
+            try:
+                mtime = current.stat().st_mtime
+            except OSError:
+                return self._model
+            if mtime == self._current_mtime:
+                return self._model
+            try:
+                import joblib
+                version = json.loads(current.read_text(encoding="utf-8"))["version"]
+                bundle = joblib.load(self.model_dir / f"ambiguity-{version}.joblib")
+                self._model, self._metadata, self._current_mtime = bundle["pipeline"], bundle["metadata"], mtime
+                logger.info(f"Loaded ambiguity classifier {version}")
+            except ImportError as e:
+                self._failed = True
+                logger.info(f"Ambiguity classifier unavailable ({str(e)}) - all requirements go to the LLM")
+            except Exception as e:
+                logger.warning(f"Failed to load ambiguity classifier: {str(e)}")
+            return self._model
+
+    def screen(self, requirements: Sequence[str]) -> Optional[ScreenResult]:
+        """Chấm điểm requirement: kết luận local ngoài dải (low, high), còn lại là uncertain"""
+        model = self._load()
+        if model is None or not requirements:
+            return None
+        low, high = self._metadata["thresholds"]
+        scores = [row[1] for row in model.predict_proba(list(requirements))]
+        result = ScreenResult()
+        for requirement, score in zip(requirements, scores):
+            if score >= high:
+                result.ambiguous.append((requirement, float(score)))
+            elif score <= low:
+                result.clear.append(requirement)
+            else:
+                result.uncertain.append(requirement)
+        with self._lock:
+            self._stats["screened"] += len(requirements)
+            self._stats["local_ambiguous"] += len(result.ambiguous)
+            self._stats["local_clear"] += len(result.clear)
+            self._stats["uncertain"] += len(result.uncertain)
+        self._record_settlements(result)
+        return result
+
+    def _record_settlements(self, result: ScreenResult) -> None:
+        """
+        Ghi requirement kết luận local vào bảng settlements, xóa requirement uncertain
+        (lần này gửi LLM nên nhãn trong history là nhãn thật) - lỗi DB chỉ log
+        """
+        from app.database.models import ClassifierSettlement
+
+        settled = {settlement_key(req): (req, "ambiguous") for req, _ in result.ambiguous}
+        settled.update((settlement_key(req), (req, "clear")) for req in result.clear)
+        uncertain = [settlement_key(req) for req in result.uncertain]
+        try:
+            with self._session_factory() as db:
+                if db is None:
+                    return
+                if uncertain:
+                    db.query(ClassifierSettlement).filter(
+                        ClassifierSettlement.settlement_key.in_(uncertain)
+                    ).delete(synchronize_session=False)
+                if settled:
+                    existing = {
+                        entry.settlement_key: entry
+                        for entry in db.query(ClassifierSettlement).filter(
+                            ClassifierSettlement.settlement_key.in_(list(settled))
+                        ).all()
+                    }
+                    now = datetime.now(timezone.utc)
+                    for key, (requirement, verdict) in settled.items():
+                        entry = existing.get(key)
+                        if entry is None:
+                            entry = ClassifierSettlement(settlement_key=key)
+                            db.add(entry)
+                        entry.requirement = requirement
+                        entry.verdict = verdict
+                        entry.model_version = self._metadata["version"] if self._metadata else None
+                        entry.settled_at = now
+                db.commit()
+        except Exception as e:
+            logger.warning(f"Failed to record classifier settlements: {str(e)}")
+
+    def _settled_keys(self) -> set:
+        from app.database.models import ClassifierSettlement
+
+        with self._session_factory() as db:
+            if db is None:
+                raise ClassifierUnavailableError("Database not available")
+            return {key for key, in db.query(ClassifierSettlement.settlement_key).all()}
+
+    def _history_rows(self) -> List[Tuple[Optional[str], Optional[List[Dict]]]]:
+        from app.database.models import AnalysisHistory
+
+        with self._session_factory() as db:
+            if db is None:
+                raise ClassifierUnavailableError("Database not available")
+            rows = (
+                db.query(AnalysisHistory.text_input, AnalysisHistory.ambiguities_json)
+                .filter(AnalysisHistory.text_input.isnot(None))
+                .order_by(AnalysisHistory.id.desc())
+                .limit(AMBIGUITY_TRAINING_MAX_ROWS)
+                .all()
+            )
+        return [(text, ambiguities) for text, ambiguities in rows]
+
+    def train(self, target_precision: float = AMBIGUITY_CLASSIFIER_TARGET_PRECISION) -> Dict[str, Any]:
+        """
+        Train version mới từ bảng history, lưu và dùng luôn (hàm sync - gọi qua threadpool)
+
+        Raises:
+            ClassifierTrainingError: thiếu scikit-learn / dữ liệu, hoặc đang có training khác
+        """
+        if not self._train_lock.acquire(blocking=False):
+            raise ClassifierTrainingError("Training is already running")
+        try:
+            try:
+                import joblib
+                pipeline = _build_pipeline()
+            except ImportError as e:
+                raise ClassifierUnavailableError(f"scikit-learn is not installed ({str(e)})")
+
+            texts, labels = build_training_set(self._history_rows(), self._settled_keys())
+            positives = sum(labels)
+            if len(texts) < AMBIGUITY_TRAINING_MIN_SAMPLES or min(positives, len(texts) - positives) < AMBIGUITY_TRAINING_MIN_PER_CLASS:
+                raise ClassifierTrainingError(
+                    f"Not enough labeled requirements ({len(texts)} samples, {positives} ambiguous; need "
+                    f"{AMBIGUITY_TRAINING_MIN_SAMPLES} with {AMBIGUITY_TRAINING_MIN_PER_CLASS} per class)"
+                )
+
+            # Holdout phân tầng (seed cố định) để calibrate dải không chắc chắn
+            order = list(range(len(texts)))
+            random.Random(0).shuffle(order)
+            holdout = set()
+            for label in (0, 1):
+                indices = [index for index in order if labels[index] == label]
+                holdout.update(indices[:max(1, int(len(indices) * _HOLDOUT_FRACTION))])
+            train_idx = [index for index in order if index not in holdout]
+            pipeline.fit([texts[i] for i in train_idx], [labels[i] for i in train_idx])
+            holdout_idx = sorted(holdout)
+            scores = [float(row[1]) for row in pipeline.predict_proba([texts[i] for i in holdout_idx])]
+            holdout_labels = [labels[i] for i in holdout_idx]
+            low, high = calibrate_thresholds(scores, holdout_labels, target_precision)
+            local = sum(1 for score in scores if score <= low or score >= high)
+
+            pipeline = _build_pipeline().fit(texts, labels)  # Model cuối dùng toàn bộ dữ liệu
+            digest = hashlib.sha256("\x00".join(f"{label}{text}" for text, label in zip(texts, labels)).encode("utf-8"))
+            version = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{digest.hexdigest()[:8]}"
+            metadata = {
+                "version": version,
+                "trained_at": datetime.now(timezone.utc).isoformat(),
+                "samples": len(texts),
+                "ambiguous_samples": positives,
+                "thresholds": [float(low), float(high)],
+                "target_precision": target_precision,
+                "holdout_coverage": round(local / len(holdout_idx), 4) if holdout_idx else 0.0,
+            }
+            self.model_dir.mkdir(parents=True, exist_ok=True)
+            joblib.dump({"pipeline": pipeline, "metadata": metadata}, self.model_dir / f"ambiguity-{version}.joblib")
+            (self.model_dir / f"ambiguity-{version}.json").write_text(json.dumps(metadata, indent=2), encoding="utf-8")
+            self._stats["trainings"] += 1
+            logger.info(f"Trained ambiguity classifier {version} on {len(texts)} requirements "
+                        f"(band {low:.2f}-{high:.2f}, holdout coverage {metadata['holdout_coverage']:.0%})")
+            return self.activate(version)
+        finally:
+            self._train_lock.release()
+
+    def activate(self, version: str) -> Dict[str, Any]:
+        """
+        Dùng một version đã train (vd: quay lại version trước)
+
+        Raises:
+            FileNotFoundError: version không tồn tại
+        """
+        metadata_path = self.model_dir / f"ambiguity-{version}.json"
+        if not _VERSION_RE.fullmatch(version) or not metadata_path.exists() or not (self.model_dir / f"ambiguity-{version}.joblib").exists():
+            raise FileNotFoundError(f"Ambiguity classifier version '{version}' not found")
+        (self.model_dir / _CURRENT_FILE).write_text(json.dumps({"version": version}), encoding="utf-8")
+        with self._lock:
+            self._last_check = None  # Load lại ở lần screen tiếp theo
+            self._current_mtime = None
+        return json.loads(metadata_path.read_text(encoding="utf-8"))
+
+    def versions(self) -> List[Dict[str, Any]]:
+        """Metadata của các version đã train (mới nhất trước)"""
+        if not self.model_dir.exists():
+            return []
+        return sorted(
+            (json.loads(path.read_text(encoding="utf-8")) for path in self.model_dir.glob("ambiguity-*.json")),
+            key=lambda metadata: metadata["version"],
+            reverse=True
+        )
+
+    def get_stats(self) -> dict:
+        self._load()
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "available": self._model is not None,
+                "version": self._metadata["version"] if self._metadata else None,
+                "thresholds": self._metadata["thresholds"] if self._metadata else None,
+                "training": self.training,
+                **self._stats
+            }
+
+
+_ambiguity_classifier: Optional[AmbiguityClassifier] = None
+
+
+def get_ambiguity_classifier() -> AmbiguityClassifier:
+    """Get or create ambiguity classifier instance (model load lazily ở lần screen đầu tiên)"""
+    global _ambiguity_classifier
+    if _ambiguity_classifier is None:
+        _ambiguity_classifier = AmbiguityClassifier()
+    return _ambiguity_classifier
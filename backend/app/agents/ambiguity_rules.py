@@ -0,0 +1,232 @@
+"""
+Rule-based ambiguity pre-analyzer
+
+Phát hiện các weak word kinh điển ("fast", "user-friendly", "as appropriate", "etc.",
+"should", ...) bằng một regex duy nhất được compile từ lexicon, chạy local trước
+clarity_check_node / fast analysis. Requirement đã bị rule flag không cần model giải
+thích lại, nên output của model ngắn hơn.
+
+Lexicon có thể override bằng file JSON (AMBIGUITY_LEXICON_PATH):
+    {
+      "vague_performance": {"issue": "...", "terms": ["fast", "quick"], "patterns": ["\\bin real[- ]time\\b"]},
+      "weak_modal": null    # null = tắt category mặc định
+    }
+"""
+
+import os
+import re
+import json
+import hashlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from app.utils.logger import logger
+from app.utils.requirements_text import normalize_key, split_requirements
+
+AMBIGUITY_RULES_ENABLED = os.getenv("AMBIGUITY_RULES_ENABLED", "true").lower() in ("1", "true", "yes")
+AMBIGUITY_LEXICON_PATH = os.getenv("AMBIGUITY_LEXICON_PATH", "")
+
+DEFAULT_LEXICON: Dict[str, Dict[str, Any]] = {
+    "vague_performance": {
+        "issue": "no measurable performance target (response time, throughput)",
+        "terms": [
+            "fast", "faster", "quick", "quickly", "rapid", "rapidly", "efficient", "efficiently",
+            "responsive", "high performance", "high-performance", "instant", "instantly",
+            "nhanh", "nhanh chóng"
+        ],
+        "patterns": [r"in real[- ]time"]
+    },
+    "subjective_quality": {
+        "issue": "subjective quality that cannot be verified by a test",
+        "terms": [
+            "user-friendly", "user friendly", "easy to use", "easy-to-use", "intuitive", "simple",
+            "flexible", "robust", "modern", "seamless", "seamlessly", "state-of-the-art",
+            "high quality", "good", "nice", "clean", "thân thiện", "dễ sử dụng"
+        ],
+        "patterns": []
+    },
+    "open_ended": {
+        "issue": "open-ended wording, scope is not defined",
+        "terms": [
+            "etc.", "etc", "and so on", "and/or", "as appropriate", "as needed", "as necessary",
+            "if necessary", "if needed", "where applicable", "if applicable", "as required",
+            "such as", "including but not limited to", "v.v."
+        ],
+        "patterns": []
+    },
+    "vague_quantity": {
+        "issue": "unspecified quantity or size",
+        "terms": [
+            "some", "several", "many", "few", "most", "various", "numerous", "large", "small",
+            "adequate", "sufficient", "reasonable", "minimal", "maximum possible", "a lot of"
+        ],
+        "patterns": []
+    },
+    "vague_time": {
+        "issue": "unspecified time or frequency",
+        "terms": [
+            "soon", "as soon as possible", "asap", "in a timely manner", "timely", "periodically",
+            "regularly", "frequently", "occasionally", "eventually"
+        ],
+        "patterns": []
+    },
+    "weak_modal": {
+        "issue": "weak modal, unclear whether the requirement is mandatory",
+        "terms": ["should", "may", "might", "could", "possibly", "if possible", "ideally"],
+        "patterns": []
+    },
+}
+
+# Dòng note thêm vào cuối input của fast prompt khi rule đã flag một số requirement
+PRE_FLAGGED_HEADER = "[Ambiguities already detected by local rules - do not report them again]"
+
+
+@dataclass
+class RuleMatch:
+    """Một weak word / pattern khớp trong requirement"""
+    category: str
+    term: str
+    start: int
+    end: int
+
+
+@dataclass
+class RulePreAnalysis:
+    """Kết quả pre-analysis của một document"""
+    ambiguities: List[Dict[str, str]] = field(default_factory=list)  # Theo schema AmbiguityItem
+    settled: List[str] = field(default_factory=list)  # Requirement đã có ambiguity từ rule
+    unsettled: List[str] = field(default_factory=list)  # Requirement vẫn cần model kiểm tra
+
+    def annotate(self, input_text: str) -> str:
+        """Thêm danh sách requirement đã flag vào cuối input để model không lặp lại"""
+        if not self.settled:
+            return input_text
+        lines = "\n".join(f"- {req}" for req in self.settled)
+        return f"{input_text}\n\n{PRE_FLAGGED_HEADER}\n{lines}"
+
+    def is_settled(self, item: Dict[str, Any]) -> bool:
+        """Ambiguity của model cho requirement mà rule đã flag (bị bỏ, giữ item của rule)"""
+        settled_keys = {normalize_key(req) for req in self.settled}
+        return normalize_key(item.get("req", "")) in settled_keys
+
+    def merge(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Gộp ambiguity của rule vào kết quả của model (schema AmbiguityItem không đổi)"""
+        llm_ambiguities = [
+            item for item in result.get("ambiguities", []) or []
+            if isinstance(item, dict) and not self.is_settled(item)
+        ]
+        return {**result, "ambiguities": self.ambiguities + llm_ambiguities}
+
+
+def load_lexicon(path: str = AMBIGUITY_LEXICON_PATH) -> Dict[str, Dict[str, Any]]:
+    """Lexicon mặc định, merge với file JSON override nếu có"""
+    lexicon = {name: dict(entry) for name, entry in DEFAULT_LEXICON.items()}
+    if not path:
+        return lexicon
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Could not load ambiguity lexicon {path}: {str(e)} - using defaults")
+        return lexicon
+    for name, entry in overrides.items():
+        if entry is None:
+            lexicon.pop(name, None)
+        else:
+            lexicon[name] = {
+                "issue": entry.get("issue", lexicon.get(name, {}).get("issue", "ambiguous wording")),
+                "terms": list(entry.get("terms", [])),
+                "patterns": list(entry.get("patterns", []))
+            }
+    return lexicon
+
+
+class AmbiguityRuleEngine:
+    """
+    Lexicon + pattern engine compile thành một regex (mỗi category là một named group)
+
+    Usage:
+        engine = AmbiguityRuleEngine()
+        pre = engine.analyze(text)
+        result = pre.merge(llm_result)
+    """
+
+    def __init__(self, lexicon: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.lexicon = lexicon if lexicon is not None else load_lexicon()
+        self._groups: Dict[str, str] = {}
+        self._regex = self._compile()
+        # Fingerprint của lexicon - thay đổi rule phải làm mất hiệu lực result cache
+        self.version = hashlib.sha256(
+            json.dumps(self.lexicon, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:16]
+
+    def _compile(self) -> Optional["re.Pattern"]:
+        alternatives = []
+        for index, (name, entry) in enumerate(self.lexicon.items()):
+            terms = sorted({term.strip() for term in entry.get("terms", []) if term.strip()}, key=len, reverse=True)
+            parts = [re.escape(term) for term in terms] + list(entry.get("patterns", []))
+            if not parts:
+                continue
+            group = f"c{index}"
+            self._groups[group] = name
+            # Lookaround thay cho \b: term có thể bắt đầu/kết thúc bằng dấu câu ("etc.", "and/or")
+            alternatives.append(f"(?P<{group}>(?<!\\w)(?:{'|'.join(parts)})(?!\\w))")
+        if not alternatives:
+            return None
+        return re.compile("|".join(alternatives), re.IGNORECASE)
+
+    def scan(self, requirement: str) -> List[RuleMatch]:
+        """Tất cả weak word / pattern trong một requirement"""
+        if self._regex is None:
+            return []
+        matches = []
+        for match in self._regex.finditer(requirement):
+            group = match.lastgroup
+            matches.append(RuleMatch(
+                category=self._groups[group],
+                term=match.group(group),
+                start=match.start(),
+                end=match.end()
+            ))
+        return matches
+
+    def describe(self, matches: List[RuleMatch]) -> str:
+        """Issue text cho AmbiguityItem từ các match của một requirement"""
+        by_category: Dict[str, List[str]] = {}
+        for match in matches:
+            terms = by_category.setdefault(match.category, [])
+            if match.term.lower() not in (term.lower() for term in terms):
+                terms.append(match.term)
+        parts = [
+            f"{', '.join(repr(term) for term in terms)}: {self.lexicon[category]['issue']}"
+            for category, terms in by_category.items()
+        ]
+        return "Vague wording - " + "; ".join(parts)
+
+    def analyze_requirements(self, requirements: List[str]) -> RulePreAnalysis:
+        """Pre-analysis trên danh sách requirement đã tách sẵn"""
+        result = RulePreAnalysis()
+        for requirement in requirements:
+            matches = self.scan(requirement)
+            if matches:
+                result.settled.append(requirement)
+                result.ambiguities.append({"req": requirement, "issue": self.describe(matches)})
+            else:
+                result.unsettled.append(requirement)
+        return result
+
+    def analyze(self, text: str) -> RulePreAnalysis:
+        """Pre-analysis trên toàn bộ text (tách requirement bằng split_requirements)"""
+        return self.analyze_requirements(split_requirements(text))
+
+
+_rule_engine: Optional[AmbiguityRuleEngine] = None
+
+
+def get_rule_engine() -> Optional[AmbiguityRuleEngine]:
+    """Get or create rule engine instance (None nếu AMBIGUITY_RULES_ENABLED=false)"""
+    global _rule_engine
+    if not AMBIGUITY_RULES_ENABLED:
+        return None
+    if _rule_engine is None:
+        _rule_engine = AmbiguityRuleEngine()
+    return _rule_engine
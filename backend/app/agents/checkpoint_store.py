@@ -0,0 +1,334 @@
+"""
+LangGraph checkpointer lưu trong analysis DB
+
+Full pipeline lưu checkpoint sau mỗi superstep và output của từng node đã xong (pending
+writes) theo run id. Run bị lỗi / timeout (vd: improve node timeout sau khi parse và 2
+check đã xong) được chạy tiếp từ node cuối cùng đã hoàn tất thay vì gọi lại toàn bộ LLM
+call: client gửi lại request với resume_run_id.
+
+Checkpoint của run thành công bị xóa ngay (kết quả đã nằm trong result cache); checkpoint
+của run lỗi bị xóa sau ANALYSIS_CHECKPOINT_TTL_HOURS.
+"""
+
+import os
+import asyncio
+import uuid
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, Sequence
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+from app.database.db import session_scope
+from app.database.models import GraphCheckpoint, GraphCheckpointWrite
+from app.utils.logger import logger
+
+ANALYSIS_CHECKPOINTS_ENABLED = os.getenv("ANALYSIS_CHECKPOINTS_ENABLED", "true").lower() in ("1", "true", "yes")
+ANALYSIS_CHECKPOINT_TTL_HOURS = float(os.getenv("ANALYSIS_CHECKPOINT_TTL_HOURS", "24"))
+# Dọn checkpoint hết hạn sau mỗi N run
+ANALYSIS_CHECKPOINT_PRUNE_EVERY = int(os.getenv("ANALYSIS_CHECKPOINT_PRUNE_EVERY", "100"))
+
+
+class RunMismatchError(ValueError):
+    """resume_run_id thuộc về một input khác"""
+
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex
+
+
+class AnalysisCheckpointSaver(BaseCheckpointSaver):
+    """
+    BaseCheckpointSaver trên SQLAlchemy (bảng graph_checkpoints / graph_checkpoint_writes)
+
+    Mỗi checkpoint lưu toàn bộ channel values (state của pipeline nhỏ, không cần tách blob
+    theo channel). Không có DB (session_scope trả None) thì không lưu gì và run không
+    resume được - pipeline vẫn chạy bình thường.
+
+    Usage:
+        graph = builder.compile(checkpointer=get_checkpoint_saver())
+        config = {"configurable": {"thread_id": run_id}}
+        await graph.ainvoke(state, config)  # Lỗi giữa chừng
+        await graph.ainvoke(None, config)  # Chạy tiếp từ checkpoint cuối
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = session_scope,
+        ttl_hours: float = ANALYSIS_CHECKPOINT_TTL_HOURS,
+        prune_every: int = ANALYSIS_CHECKPOINT_PRUNE_EVERY
+    ):
+        super().__init__()
+        self._session_factory = session_factory
+        self.ttl_hours = ttl_hours
+        self.prune_every = max(1, prune_every)
+        self._runs_since_prune = 0
+        # Ghi checkpoint tuần tự (các nhánh song song cùng ghi; SQLite không cho commit đồng thời)
+        self._lock = threading.Lock()
+        self._stats = {"checkpoints": 0, "writes": 0, "resumed": 0, "completed": 0, "pruned": 0}
+
+    # ------------------------------------------------------------------
+    # BaseCheckpointSaver
+    # ------------------------------------------------------------------
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        with self._session() as db:
+            if db is None:
+                return None
+            query = db.query(GraphCheckpoint).filter(
+                GraphCheckpoint.thread_id == thread_id,
+                GraphCheckpoint.checkpoint_ns == checkpoint_ns
+            )
+            checkpoint_id = get_checkpoint_id(config)
+            if checkpoint_id:
+                row = query.filter(GraphCheckpoint.checkpoint_id == checkpoint_id).first()
+            else:
+                row = query.order_by(GraphCheckpoint.checkpoint_id.desc()).first()
+            return self._to_tuple(db, row) if row is not None else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None
+    ) -> Iterator[CheckpointTuple]:
+        with self._session() as db:
+            if db is None:
+                return
+            query = db.query(GraphCheckpoint)
+            if config:
+                configurable = config["configurable"]
+                query = query.filter(GraphCheckpoint.thread_id == configurable["thread_id"])
+                if configurable.get("checkpoint_ns") is not None:
+                    query = query.filter(GraphCheckpoint.checkpoint_ns == configurable["checkpoint_ns"])
+                if get_checkpoint_id(config):
+                    query = query.filter(GraphCheckpoint.checkpoint_id == get_checkpoint_id(config))
+            if before and get_checkpoint_id(before):
+                query = query.filter(GraphCheckpoint.checkpoint_id < get_checkpoint_id(before))
+            tuples = []
+            for row in query.order_by(GraphCheckpoint.checkpoint_id.desc()).all():
+                item = self._to_tuple(db, row)
+                if filter and not all(item.metadata.get(key) == value for key, value in filter.items()):
+                    continue
+                tuples.append(item)
+                if limit is not None and len(tuples) >= limit:
+                    break
+        yield from tuples
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions
+    ) -> RunnableConfig:
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        checkpoint_type, checkpoint_blob = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._session() as db:
+            if db is not None:
+                db.merge(GraphCheckpoint(
+                    thread_id=thread_id,
+                    checkpoint_ns=checkpoint_ns,
+                    checkpoint_id=checkpoint["id"],
+                    parent_checkpoint_id=configurable.get("checkpoint_id"),
+                    checkpoint_type=checkpoint_type,
+                    checkpoint=checkpoint_blob,
+                    metadata_type=metadata_type,
+                    checkpoint_metadata=metadata_blob
+                ))
+                db.commit()
+                self._stats["checkpoints"] += 1
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple],
+        task_id: str,
+        task_path: str = ""
+    ) -> None:
+        configurable = config["configurable"]
+        key = {
+            "thread_id": configurable["thread_id"],
+            "checkpoint_ns": configurable.get("checkpoint_ns", ""),
+            "checkpoint_id": configurable["checkpoint_id"],
+            "task_id": task_id,
+        }
+        with self._session() as db:
+            if db is None:
+                return
+            for index, (channel, value) in enumerate(writes):
+                idx = WRITES_IDX_MAP.get(channel, index)
+                existing = db.query(GraphCheckpointWrite).filter_by(**key, idx=idx).first()
+                if existing is not None and idx >= 0:
+                    continue  # Write thường chỉ ghi một lần; special write (idx < 0) ghi đè
+                value_type, value_blob = self.serde.dumps_typed(value)
+                db.merge(GraphCheckpointWrite(
+                    **key, idx=idx, channel=channel, value_type=value_type, value=value_blob, task_path=task_path
+                ))
+            db.commit()
+            self._stats["writes"] += len(writes)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._session() as db:
+            if db is None:
+                return
+            db.query(GraphCheckpointWrite).filter(GraphCheckpointWrite.thread_id == thread_id).delete(synchronize_session=False)
+            db.query(GraphCheckpoint).filter(GraphCheckpoint.thread_id == thread_id).delete(synchronize_session=False)
+            db.commit()
+
+    # Async API: DB sync chạy trong thread để không block event loop
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None
+    ) -> AsyncIterator[CheckpointTuple]:
+        tuples = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in tuples:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple],
+        task_id: str,
+        task_path: str = ""
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # ------------------------------------------------------------------
+    # Run lifecycle
+    # ------------------------------------------------------------------
+    def has_run(self, run_id: str) -> bool:
+        """Run có checkpoint để resume không"""
+        try:
+            return self.get_tuple({"configurable": {"thread_id": run_id, "checkpoint_ns": ""}}) is not None
+        except Exception as e:
+            logger.warning(f"Checkpoint lookup failed: {str(e)}")
+            return False
+
+    async def acomplete(self, run_id: str, resumed: bool = False) -> None:
+        """Run thành công: xóa checkpoint của run, thỉnh thoảng dọn checkpoint hết hạn"""
+        self._stats["completed"] += 1
+        if resumed:
+            self._stats["resumed"] += 1
+        try:
+            await self.adelete_thread(run_id)
+            self._runs_since_prune += 1
+            if self._runs_since_prune >= self.prune_every:
+                self._runs_since_prune = 0
+                await asyncio.to_thread(self.prune_expired)
+        except Exception as e:
+            logger.warning(f"Checkpoint cleanup failed: {str(e)}")
+
+    def prune_expired(self) -> int:
+        """Xóa checkpoint của các run lỗi đã quá ANALYSIS_CHECKPOINT_TTL_HOURS"""
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=self.ttl_hours)
+        with self._session() as db:
+            if db is None:
+                return 0
+            expired = {
+                thread_id for (thread_id,) in
+                db.query(GraphCheckpoint.thread_id).filter(GraphCheckpoint.created_at < cutoff).distinct().all()
+            }
+            if not expired:
+                return 0
+            db.query(GraphCheckpointWrite).filter(GraphCheckpointWrite.thread_id.in_(expired)).delete(synchronize_session=False)
+            db.query(GraphCheckpoint).filter(GraphCheckpoint.thread_id.in_(expired)).delete(synchronize_session=False)
+            db.commit()
+        self._stats["pruned"] += len(expired)
+        logger.info(f"Pruned checkpoints of {len(expired)} expired analysis runs")
+        return len(expired)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "ttl_hours": self.ttl_hours}
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+    @contextmanager
+    def _session(self):
+        with self._lock, self._session_factory() as db:
+            yield db
+
+    def _to_tuple(self, db, row: GraphCheckpoint) -> CheckpointTuple:
+        writes = db.query(GraphCheckpointWrite).filter(
+            GraphCheckpointWrite.thread_id == row.thread_id,
+            GraphCheckpointWrite.checkpoint_ns == row.checkpoint_ns,
+            GraphCheckpointWrite.checkpoint_id == row.checkpoint_id
+        ).all()
+        writes.sort(key=lambda write: writes_sort_key(write.task_path, write.task_id, write.idx))
+
+        def config_for(checkpoint_id: str) -> RunnableConfig:
+            return {
+                "configurable": {
+                    "thread_id": row.thread_id,
+                    "checkpoint_ns": row.checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            }
+
+        return CheckpointTuple(
+            config=config_for(row.checkpoint_id),
+            checkpoint=self.serde.loads_typed((row.checkpoint_type, row.checkpoint)),
+            metadata=self.serde.loads_typed((row.metadata_type, row.checkpoint_metadata)),
+            parent_config=config_for(row.parent_checkpoint_id) if row.parent_checkpoint_id else None,
+            pending_writes=[
+                (write.task_id, write.channel, self.serde.loads_typed((write.value_type, write.value)))
+                for write in writes
+            ]
+        )
+
+
+_checkpoint_saver: Optional[AnalysisCheckpointSaver] = None
+
+
+def get_checkpoint_saver() -> Optional[AnalysisCheckpointSaver]:
+    """Checkpointer dùng chung (None nếu ANALYSIS_CHECKPOINTS_ENABLED=false)"""
+    global _checkpoint_saver
+    if not ANALYSIS_CHECKPOINTS_ENABLED:
+        return None
+    if _checkpoint_saver is None:
+        _checkpoint_saver = AnalysisCheckpointSaver()
+    return _checkpoint_saver
@@ -0,0 +1,251 @@
+"""
+Map-reduce chunked analysis cho SRS rất lớn
+
+1. Split: tách text theo section heading và ranh giới requirement, đóng gói thành các chunk
+   không vượt quá CHUNK_MAX_CHARS (heading của section được lặp lại làm context)
+2. Map: phân tích từng chunk bằng fast prompt, chạy song song có giới hạn (CHUNK_PARALLELISM)
+3. Cross-chunk pass: lấy cặp requirement ứng viên (top-k láng giềng, conflict_candidates)
+   trên toàn bộ document, chỉ giữ cặp thuộc hai chunk khác nhau, gửi conflict prompt theo
+   batch - số call tăng tuyến tính theo số requirement thay vì theo bình phương số nhóm
+4. Reduce: merge và deduplicate conflicts / ambiguities / suggestions
+
+Latency ~ (số chunk / parallelism) thay vì tăng tuyến tính theo kích thước document,
+và một chunk lỗi chỉ làm mất kết quả của chunk đó thay vì cả document.
+"""
+
+import os
+import re
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, TYPE_CHECKING
+from app.agents.conflict_candidates import build_conflict_inputs
+from app.utils.logger import logger
+from app.utils.requirements_text import normalize_key, split_units
+
+if TYPE_CHECKING:
+    from app.agents.langgraph_agent import RequirementsAnalysisAgent
+
+# Config qua .env
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "12000"))
+CHUNK_PARALLELISM = int(os.getenv("CHUNK_PARALLELISM", "4"))
+CHUNKED_MIN_CHARS = int(os.getenv("CHUNKED_MIN_CHARS", "30000"))  # Text dài hơn -> dùng chunked engine
+# Requirement (rút gọn) của cả document vừa giới hạn này -> cross-chunk pass chỉ một call
+CROSS_CHUNK_MAX_CHARS = int(os.getenv("CROSS_CHUNK_MAX_CHARS", "20000"))
+CROSS_CHUNK_REQ_MAX_CHARS = 300  # Mỗi requirement được cắt ngắn khi đưa vào cross-chunk pass
+
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?;])\s+")
+
+
+@dataclass
+class TextChunk:
+    """Một chunk để gửi cho LLM"""
+    index: int
+    text: str
+    requirements: List[str] = field(default_factory=list)
+
+
+def _split_long_unit(text: str, max_chars: int) -> List[str]:
+    """Cắt một unit quá dài theo ranh giới câu (hard-cut nếu một câu vẫn quá dài)"""
+    pieces: List[str] = []
+    buffer = ""
+    for sentence in _SENTENCE_SPLIT_RE.split(text):
+        while len(sentence) > max_chars:
+            if buffer:
+                pieces.append(buffer)
+                buffer = ""
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if buffer and len(buffer) + 1 + len(sentence) > max_chars:
+            pieces.append(buffer)
+            buffer = sentence
+        else:
+            buffer = f"{buffer} {sentence}".strip()
+    if buffer:
+        pieces.append(buffer)
+    return pieces
+
+
+def split_into_chunks(text: str, max_chars: int = CHUNK_MAX_CHARS) -> List[TextChunk]:
+    """
+    Đóng gói các unit thành chunk <= max_chars, không cắt ngang requirement
+
+    Heading của section hiện tại được lặp lại ở đầu mỗi chunk mới để giữ context.
+    """
+    chunks: List[TextChunk] = []
+    parts: List[str] = []
+    requirements: List[str] = []
+    size = 0
+    section_heading: Optional[str] = None
+
+    def flush():
+        nonlocal parts, requirements, size
+        if requirements:
+            chunks.append(TextChunk(index=len(chunks), text="\n".join(parts), requirements=requirements))
+        parts, requirements, size = [], [], 0
+
+    for unit in split_units(text):
+        if unit.is_heading:
+            section_heading = unit.text
+            if size + len(unit.text) + 1 > max_chars:
+                flush()
+            parts.append(unit.text)
+            size += len(unit.text) + 1
+            continue
+
+        for piece in _split_long_unit(unit.text, max_chars) if len(unit.text) > max_chars else [unit.text]:
+            if size + len(piece) + 1 > max_chars and requirements:
+                flush()
+                if section_heading and len(section_heading) + len(piece) + 1 <= max_chars:
+                    parts.append(section_heading)
+                    size += len(section_heading) + 1
+            parts.append(piece)
+            requirements.append(piece)
+            size += len(piece) + 1
+    flush()
+    return chunks
+
+
+def merge_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge và deduplicate kết quả của nhiều chunk / pass
+
+    - Conflict: trùng nếu cùng cặp requirement (không phân biệt thứ tự)
+    - Ambiguity / suggestion: trùng nếu cùng requirement
+    """
+    merged: Dict[str, List[Dict]] = {"conflicts": [], "ambiguities": [], "suggestions": []}
+    seen = {"conflicts": set(), "ambiguities": set(), "suggestions": set()}
+
+    for result in results:
+        for item in result.get("conflicts", []) or []:
+            if not isinstance(item, dict):
+                continue
+            key = frozenset([normalize_key(item.get("req1", "")), normalize_key(item.get("req2", ""))])
+            if key not in seen["conflicts"]:
+                seen["conflicts"].add(key)
+                merged["conflicts"].append(item)
+        for section in ("ambiguities", "suggestions"):
+            for item in result.get(section, []) or []:
+                if not isinstance(item, dict):
+                    continue
+                key = normalize_key(item.get("req", ""))
+                if key not in seen[section]:
+                    seen[section].add(key)
+                    merged[section].append(item)
+    return merged
+
+
+class ChunkedAnalysisEngine:
+    """
+    Map-reduce engine chạy trên một RequirementsAnalysisAgent
+
+    Mỗi chunk đi qua fast path (có result cache theo chunk), nên khi chỉ một section của
+    document thay đổi, các chunk còn lại được lấy từ cache.
+    """
+
+    def __init__(
+        self,
+        agent: "RequirementsAnalysisAgent",
+        max_chars: int = CHUNK_MAX_CHARS,
+        parallelism: int = CHUNK_PARALLELISM,
+        cross_chunk_max_chars: int = CROSS_CHUNK_MAX_CHARS
+    ):
+        self.agent = agent
+        self.max_chars = max_chars
+        self.parallelism = max(1, parallelism)
+        self.cross_chunk_max_chars = cross_chunk_max_chars
+
+    async def aanalyze(
+        self,
+        input_text: str,
+        cache_mode: str = None,
+        on_progress: Optional[Callable[[int, int], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Phân tích document theo map-reduce
+
+        Args:
+            input_text: SRS/User Stories text
+            cache_mode: None, "bypass" hoặc "refresh" (áp dụng cho từng chunk)
+            on_progress: callback(done, total) sau mỗi LLM call hoàn thành
+
+        Returns:
+            Dict với keys: conflicts, ambiguities, suggestions
+        """
+        chunks = split_into_chunks(input_text, self.max_chars)
+        if not chunks:
+            return {"conflicts": [], "ambiguities": [], "suggestions": []}
+
+        # Embedding của candidate pairs chạy trên CPU - không block event loop
+        cross_inputs = await asyncio.to_thread(self._cross_chunk_inputs, chunks)
+        total_calls = len(chunks) + len(cross_inputs)
+        logger.info(f"Chunked analysis: {len(chunks)} chunks, {len(cross_inputs)} cross-chunk calls, "
+                    f"parallelism {self.parallelism}")
+
+        semaphore = asyncio.Semaphore(self.parallelism)
+        done = 0
+
+        def progress():
+            nonlocal done
+            done += 1
+            if on_progress:
+                on_progress(done, total_calls)
+
+        async def run_chunk(chunk: TextChunk) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                try:
+                    return await self.agent._acached_fast(chunk.text, cache_mode)
+                except Exception as e:
+                    logger.warning(f"Chunk {chunk.index + 1}/{len(chunks)} failed: {str(e)}")
+                    return None
+                finally:
+                    progress()
+
+        async def run_cross(requirements_text: str) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                try:
+                    conflicts = await self.agent._aconflict_prompt(requirements_text)
+                    return {"conflicts": conflicts}
+                except Exception as e:
+                    logger.warning(f"Cross-chunk conflict pass failed: {str(e)}")
+                    return None
+                finally:
+                    progress()
+
+        results = await asyncio.gather(
+            *[run_chunk(chunk) for chunk in chunks],
+            *[run_cross(text) for text in cross_inputs]
+        )
+
+        failed = sum(1 for r in results if r is None)
+        if failed == len(results):
+            raise RuntimeError("All chunks failed during chunked analysis")
+        if failed:
+            logger.warning(f"Chunked analysis: {failed}/{len(results)} LLM calls failed, returning partial result")
+
+        merged = merge_results([r for r in results if r])
+        logger.info(f"Chunked analysis completed: {len(merged['conflicts'])} conflicts, "
+                    f"{len(merged['ambiguities'])} ambiguities, {len(merged['suggestions'])} suggestions")
+        return merged
+
+    def _cross_chunk_inputs(self, chunks: List[TextChunk]) -> List[str]:
+        """
+        Input của conflict prompt cho cross-chunk pass
+
+        Nếu toàn bộ requirement (rút gọn) vừa CROSS_CHUNK_MAX_CHARS -> 1 call với cả danh sách.
+        Nếu không, candidate pairs được tạo một lần trên mọi requirement, chỉ giữ cặp thuộc
+        hai chunk khác nhau (cặp trong cùng chunk đã được map pass so sánh) và chia batch.
+        """
+        if len(chunks) < 2:
+            return []
+
+        requirements: List[str] = []
+        owners: List[int] = []
+        for chunk in chunks:
+            for req in chunk.requirements:
+                requirements.append(req[:CROSS_CHUNK_REQ_MAX_CHARS])
+                owners.append(chunk.index)
+        if sum(len(req) + 3 for req in requirements) <= self.cross_chunk_max_chars:
+            return ["\n".join(f"- {req}" for req in requirements)]
+        return build_conflict_inputs(
+            requirements, min_requirements=0, pair_filter=lambda i, j: owners[i] != owners[j]
+        )
@@ -0,0 +1,180 @@
+"""
+Compact output schema cho các node check / improve (ID requirement thay vì chép lại text)
+
+ConflictItem / AmbiguityItem / SuggestionItem bắt model chép lại nguyên văn requirement
+(req1, req2, req) - với document lớn phần lớn output token (chậm và đắt nhất) là text bị
+chép lại. Ở compact mode mỗi requirement trong prompt được gắn ID ("- [REQ-001] ..."),
+prompt được nối thêm hướng dẫn output dạng ID + mã ngắn + mô tả ngắn, và kết quả được mở
+rộng local về đúng schema hiện tại từ bảng requirement đã tách - API không đổi.
+
+LLM_OUTPUT_SCHEMA: "full" (schema gốc), "compact", hoặc "auto" (compact khi một lần gọi
+có từ COMPACT_OUTPUT_MIN_REQUIREMENTS requirement trở lên).
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Sequence
+from app.utils.logger import logger
+from app.utils.requirements_text import best_match, locate_requirements, normalize_key
+
+SCHEMA_FULL = "full"
+SCHEMA_COMPACT = "compact"
+SCHEMA_AUTO = "auto"
+
+LLM_OUTPUT_SCHEMA = os.getenv("LLM_OUTPUT_SCHEMA", SCHEMA_AUTO).lower()
+COMPACT_OUTPUT_MIN_REQUIREMENTS = int(os.getenv("COMPACT_OUTPUT_MIN_REQUIREMENTS", "20"))
+
+# Mã ngắn model trả về -> mô tả đầy đủ (dùng khi model không kèm "why")
+CONFLICT_CODES: Dict[str, str] = {
+    "NEG": "One requirement negates the other",
+    "VAL": "Incompatible values, limits or timings",
+    "BEH": "Mutually exclusive behaviour under the same condition",
+    "ACC": "Incompatible access or permission rules",
+}
+AMBIGUITY_CODES: Dict[str, str] = {
+    "VAGUE": "Vague or subjective term without a measurable criterion",
+    "SCOPE": "Open-ended list or unbounded scope",
+    "ACTOR": "Unclear actor or subject",
+    "COND": "Missing condition, trigger or error handling",
+    "REF": "Unclear reference to another item",
+}
+
+
+def _codes(codes: Dict[str, str]) -> str:
+    return "; ".join(f"{code} = {description}" for code, description in codes.items())
+
+
+# Nối vào cuối prompt gốc (PromptTemplate - dấu ngoặc nhọn phải escape)
+COMPACT_OUTPUT_FORMATS: Dict[str, str] = {
+    "conflict": (
+        "\n\nOUTPUT FORMAT (overrides any format above): each requirement is prefixed with its ID "
+        "in square brackets. Refer to requirements by ID only and never copy their text. Return only JSON:\n"
+        '{{"conflicts": [{{"ids": ["<ID>", "<ID>"], "code": "<CODE>", "why": "<at most 15 words>"}}]}}\n'
+        f"Codes: {_codes(CONFLICT_CODES)}"
+    ),
+    "ambiguity": (
+        "\n\nOUTPUT FORMAT (overrides any format above): each requirement is prefixed with its ID "
+        "in square brackets. Refer to requirements by ID only and never copy their text. Return only JSON:\n"
+        '{{"ambiguities": [{{"id": "<ID>", "code": "<CODE>", "why": "<at most 15 words>"}}]}}\n'
+        f"Codes: {_codes(AMBIGUITY_CODES)}"
+    ),
+    "improve": (
+        "\n\nOUTPUT FORMAT (overrides any format above): each requirement is prefixed with its ID "
+        "in square brackets and findings refer to requirements by ID. Do not copy the original "
+        "requirement text. Return only JSON:\n"
+        '{{"suggestions": [{{"id": "<ID>", "new": "<rewritten requirement>"}}]}}'
+    ),
+}
+
+
+def use_compact(count: int) -> bool:
+    """Một lần gọi với `count` requirement có dùng compact schema không"""
+    if LLM_OUTPUT_SCHEMA == SCHEMA_COMPACT:
+        return count > 0
+    if LLM_OUTPUT_SCHEMA == SCHEMA_AUTO:
+        return count >= COMPACT_OUTPUT_MIN_REQUIREMENTS
+    return False
+
+
+class RequirementTable:
+    """
+    ID của các requirement trong một lần gọi LLM và mở rộng output compact về schema gốc
+
+    ID lấy từ requirement_records của parse node (REQ-001, R-3fa2c1...); requirement không
+    có record (vd: chunked engine) được gán ID sinh từ nội dung.
+
+    Usage:
+        table = RequirementTable(requirements, state.get("requirement_records"))
+        prompt_text = table.lines()
+        conflicts = table.expand("conflicts", llm_conflicts)
+    """
+
+    def __init__(self, requirements: Sequence[str], records: Optional[Sequence[Dict[str, Any]]] = None):
+        self.requirements = list(requirements)
+        by_text = {}
+        for record in records or []:
+            by_text.setdefault(normalize_key(record["text"]), record["id"])
+        ids = [by_text.get(normalize_key(requirement)) for requirement in self.requirements]
+        if None in ids or len(set(ids)) < len(ids):
+            ids = [record.id for record in locate_requirements("", self.requirements)]
+        self.ids: List[str] = ids
+        self._by_id = {requirement_id.upper(): index for index, requirement_id in enumerate(ids)}
+        self._by_key: Dict[str, int] = {}
+        for index, requirement in enumerate(self.requirements):
+            self._by_key.setdefault(normalize_key(requirement), index)
+        self.unresolved = 0
+
+    def lines(self, requirements: Optional[Sequence[str]] = None) -> str:
+        """Danh sách "- [ID] text" cho `{parsed_requirements}` của prompt"""
+        requirements = self.requirements if requirements is None else requirements
+        return "\n".join(f"- [{self.id_of(requirement) or '?'}] {requirement}" for requirement in requirements)
+
+    def id_of(self, requirement: str) -> Optional[str]:
+        index = self._by_key.get(normalize_key(requirement))
+        if index is None:
+            index = best_match(requirement, self.requirements)
+        return self.ids[index] if index is not None else None
+
+    def resolve(self, ref: Any) -> Optional[str]:
+        """Text requirement của một ID (hoặc của text requirement nếu model vẫn chép lại text)"""
+        if not isinstance(ref, str) or not ref.strip():
+            return None
+        index = self._by_id.get(ref.strip().strip("[]").strip().upper())
+        if index is None:
+            index = best_match(ref, self.requirements)
+        return self.requirements[index] if index is not None else None
+
+    def compact(self, section: str, items: Sequence[Dict]) -> List[Dict]:
+        """Finding (schema gốc) -> dạng ID cho input của improve prompt"""
+        compacted = []
+        for item in items:
+            if section == "conflicts":
+                ids = [self.id_of(item.get("req1", "")), self.id_of(item.get("req2", ""))]
+                compacted.append({"ids": ids, "why": item.get("description", "")} if all(ids) else item)
+            else:
+                requirement_id = self.id_of(item.get("req", ""))
+                compacted.append({"id": requirement_id, "why": item.get("issue", "")} if requirement_id else item)
+        return compacted
+
+    def expand(self, section: str, items: Sequence[Any]) -> List[Dict]:
+        """Output compact -> schema gốc; item đã ở schema gốc được giữ nguyên, ID lạ bị bỏ"""
+        expanded, dropped = [], 0
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            result = self._expand_item(section, item)
+            if result is None:
+                dropped += 1
+                continue
+            expanded.append(result)
+        if dropped:
+            self.unresolved += dropped
+            logger.warning(f"Compact output: dropped {dropped} {section} with unknown requirement IDs")
+        return expanded
+
+    def _expand_item(self, section: str, item: Dict) -> Optional[Dict]:
+        if section == "conflicts":
+            if "req1" in item and "ids" not in item:
+                return item
+            ids = item.get("ids") or []
+            if len(ids) < 2:
+                return None
+            req1, req2 = self.resolve(ids[0]), self.resolve(ids[1])
+            if not req1 or not req2:
+                return None
+            return {"req1": req1, "req2": req2, "description": _describe(item, CONFLICT_CODES)}
+        if "req" in item and "id" not in item:
+            return item
+        requirement = self.resolve(item.get("id"))
+        if not requirement:
+            return None
+        if section == "ambiguities":
+            return {"req": requirement, "issue": _describe(item, AMBIGUITY_CODES)}
+        new_version = item.get("new") or item.get("new_version")
+        return {"req": requirement, "new_version": new_version} if new_version else None
+
+
+def _describe(item: Dict, codes: Dict[str, str]) -> str:
+    """Mô tả của finding: "why" của model, hoặc mô tả đầy đủ của mã"""
+    why = (item.get("why") or "").strip()
+    code = str(item.get("code") or "").strip().upper()
+    return why or codes.get(code, code)
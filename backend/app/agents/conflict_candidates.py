@@ -0,0 +1,197 @@
+"""
+Candidate generation cho conflict detection
+
+Thay vì đưa toàn bộ n requirement vào một prompt (model phải tự so sánh O(n²) cặp),
+mỗi requirement được embed trên CPU, lấy top-k requirement giống nhất / cùng chủ đề
+qua vector index, và chỉ các cặp ứng viên đó được gửi cho conflict prompt theo batch.
+Số token của conflict detection bị chặn bởi CONFLICT_MAX_PAIRS thay vì tăng theo n².
+
+Backend embedding (tự chọn theo package có sẵn):
+1. sentence-transformers (EMBEDDING_MODEL) + scikit-learn NearestNeighbors
+2. scikit-learn TF-IDF + NearestNeighbors
+3. Fallback thuần Python: IDF-weighted cosine + inverted index
+"""
+
+import os
+import math
+import threading
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from app.utils.logger import logger
+from app.utils.requirements_text import content_tokens
+
+# Document ít requirement hơn ngưỡng này vẫn dùng một conflict prompt như trước
+CONFLICT_PRUNING_MIN_REQUIREMENTS = int(os.getenv("CONFLICT_PRUNING_MIN_REQUIREMENTS", "30"))
+CONFLICT_TOP_K = int(os.getenv("CONFLICT_TOP_K", "5"))  # Số láng giềng của mỗi requirement
+CONFLICT_PAIR_BATCH_SIZE = int(os.getenv("CONFLICT_PAIR_BATCH_SIZE", "40"))  # Số cặp mỗi prompt
+CONFLICT_MAX_PAIRS = int(os.getenv("CONFLICT_MAX_PAIRS", "2000"))  # Token budget: số cặp tối đa
+CONFLICT_PAIR_PARALLELISM = int(os.getenv("CONFLICT_PAIR_PARALLELISM", "4"))
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# "auto" = dùng sentence-transformers nếu cài, "tfidf" = luôn dùng TF-IDF
+CONFLICT_EMBEDDINGS = os.getenv("CONFLICT_EMBEDDINGS", "auto").lower()
+
+CandidatePair = Tuple[int, int, float]  # (i, j, similarity) với i < j
+
+_model_lock = threading.Lock()
+_sentence_model = None
+_sentence_model_failed = False
+
+
+def _get_sentence_model():
+    """Load SentenceTransformer một lần (None nếu package/model không có)"""
+    global _sentence_model, _sentence_model_failed
+    if CONFLICT_EMBEDDINGS != "auto" or _sentence_model_failed:
+        return None
+    with _model_lock:
+        if _sentence_model is None and not _sentence_model_failed:
+            try:
+                from sentence_transformers import SentenceTransformer
+                _sentence_model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+                logger.info(f"Loaded embedding model {EMBEDDING_MODEL} for conflict candidates")
+            except Exception as e:
+                _sentence_model_failed = True
+                logger.info(f"Sentence embeddings unavailable ({str(e)}) - using TF-IDF for conflict candidates")
+        return _sentence_model
+
+
+def _neighbors_sklearn(vectors, top_k: int) -> Optional[List[List[Tuple[int, float]]]]:
+    """Top-k láng giềng (cosine) qua sklearn NearestNeighbors"""
+    try:
+        from sklearn.neighbors import NearestNeighbors
+    except ImportError:
+        return None
+    n_neighbors = min(top_k + 1, vectors.shape[0])
+    index = NearestNeighbors(n_neighbors=n_neighbors, metric="cosine").fit(vectors)
+    distances, indices = index.kneighbors(vectors)
+    return [
+        [(int(j), 1.0 - float(d)) for j, d in zip(row_indices, row_distances)]
+        for row_indices, row_distances in zip(indices, distances)
+    ]
+
+
+def _neighbors_embeddings(requirements: Sequence[str], top_k: int) -> Optional[List[List[Tuple[int, float]]]]:
+    model = _get_sentence_model()
+    if model is None:
+        return None
+    vectors = model.encode(list(requirements), batch_size=64, normalize_embeddings=True, show_progress_bar=False)
+    return _neighbors_sklearn(vectors, top_k)
+
+
+def _neighbors_tfidf_sklearn(requirements: Sequence[str], top_k: int) -> Optional[List[List[Tuple[int, float]]]]:
+    try:
+        from sklearn.feature_extraction.text import TfidfVectorizer
+    except ImportError:
+        return None
+    try:
+        vectors = TfidfVectorizer(sublinear_tf=True).fit_transform(requirements)
+    except ValueError:  # Vocabulary rỗng
+        return [[] for _ in requirements]
+    return _neighbors_sklearn(vectors, top_k)
+
+
+def _neighbors_tfidf_python(requirements: Sequence[str], top_k: int) -> List[List[Tuple[int, float]]]:
+    """IDF-weighted cosine thuần Python; inverted index nên chỉ so các cặp có chung từ"""
+    token_sets = [content_tokens(req) for req in requirements]
+    document_frequency = Counter(token for tokens in token_sets for token in tokens)
+    total = len(requirements)
+
+    vectors: List[Dict[str, float]] = []
+    for tokens in token_sets:
+        vector = {token: math.log((1 + total) / (1 + document_frequency[token])) + 1 for token in tokens}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        vectors.append({token: weight / norm for token, weight in vector.items()})
+
+    postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+    for index, vector in enumerate(vectors):
+        for token, weight in vector.items():
+            postings[token].append((index, weight))
+
+    neighbors = []
+    for index, vector in enumerate(vectors):
+        scores: Dict[int, float] = defaultdict(float)
+        for token, weight in vector.items():
+            for other, other_weight in postings[token]:
+                if other != index:
+                    scores[other] += weight * other_weight
+        best = sorted(scores.items(), key=lambda pair: pair[1], reverse=True)[:top_k]
+        neighbors.append(best)
+    return neighbors
+
+
+def find_neighbors(requirements: Sequence[str], top_k: int = CONFLICT_TOP_K) -> List[List[Tuple[int, float]]]:
+    """Top-k requirement giống nhất của mỗi requirement: list (index, similarity)"""
+    for backend in (_neighbors_embeddings, _neighbors_tfidf_sklearn):
+        neighbors = backend(requirements, top_k)
+        if neighbors is not None:
+            return neighbors
+    return _neighbors_tfidf_python(requirements, top_k)
+
+
+def generate_candidate_pairs(
+    requirements: Sequence[str],
+    top_k: int = CONFLICT_TOP_K,
+    max_pairs: int = CONFLICT_MAX_PAIRS,
+    pair_filter: Optional[Callable[[int, int], bool]] = None
+) -> List[CandidatePair]:
+    """
+    Các cặp requirement ứng viên cho conflict detection, similarity giảm dần
+
+    Mỗi requirement góp top-k láng giềng của nó; cặp trùng (i, j) / (j, i) được gộp.
+    pair_filter(i, j): chỉ giữ cặp thỏa điều kiện (vd: hai requirement ở hai chunk khác nhau).
+    """
+    if len(requirements) < 2:
+        return []
+    pairs: Dict[Tuple[int, int], float] = {}
+    for i, row in enumerate(find_neighbors(requirements, top_k)):
+        for j, score in row:
+            if i == j:
+                continue
+            key = (min(i, j), max(i, j))
+            if pair_filter and not pair_filter(*key):
+                continue
+            pairs[key] = max(pairs.get(key, 0.0), score)
+    ranked = sorted(pairs.items(), key=lambda item: item[1], reverse=True)[:max_pairs]
+    return [(i, j, score) for (i, j), score in ranked]
+
+
+def _item(requirements: Sequence[str], labels: Optional[Sequence[str]], index: int) -> str:
+    """Một dòng requirement của prompt ("- [ID] text" nếu có label)"""
+    if labels:
+        return f"- [{labels[index]}] {requirements[index]}"
+    return f"- {requirements[index]}"
+
+
+def format_pair_batch(
+    requirements: Sequence[str],
+    pairs: Sequence[CandidatePair],
+    labels: Optional[Sequence[str]] = None
+) -> str:
+    """Text cho `{parsed_requirements}` của conflict prompt: mỗi cặp là một mục riêng"""
+    lines = ["Candidate requirement pairs - compare only the two requirements within each pair:"]
+    for number, (i, j, _) in enumerate(pairs, start=1):
+        lines.append(f"[{number}]\n{_item(requirements, labels, i)}\n{_item(requirements, labels, j)}")
+    return "\n".join(lines)
+
+
+def build_conflict_inputs(
+    requirements: Sequence[str],
+    min_requirements: int = CONFLICT_PRUNING_MIN_REQUIREMENTS,
+    batch_size: int = CONFLICT_PAIR_BATCH_SIZE,
+    labels: Optional[Sequence[str]] = None,
+    pair_filter: Optional[Callable[[int, int], bool]] = None
+) -> List[str]:
+    """
+    Input cho conflict prompt: một input (danh sách requirement) cho document nhỏ,
+    hoặc các batch cặp ứng viên cho document lớn
+
+    labels: ID của từng requirement (compact output schema) - mỗi dòng thành "- [ID] text"
+    pair_filter: xem generate_candidate_pairs
+    """
+    if len(requirements) < max(2, min_requirements):
+        return ["\n".join(_item(requirements, labels, index) for index in range(len(requirements)))] if requirements else []
+
+    pairs = generate_candidate_pairs(requirements, pair_filter=pair_filter)
+    batches = [pairs[start:start + batch_size] for start in range(0, len(pairs), max(1, batch_size))]
+    logger.info(f"Conflict candidates: {len(pairs)} pairs from {len(requirements)} requirements "
+                f"({len(batches)} prompts instead of one {len(requirements)}-requirement prompt)")
+    return [format_pair_batch(requirements, batch, labels) for batch in batches]
@@ -3,142 +3,261 @@ LangGraph Agent với 5 nodes theo spec:
 1. ParseNode - Phân tích, tách từng requirement
 2. ConflictCheckNode - Phát hiện mâu thuẫn (contradiction/negation)
 3. ClarityCheckNode - Phát hiện câu mơ hồ (ambiguous terms)
-4. ImproveNode - Đề xuất rewrite rõ ràng hơn
+4. ImproveNode - Đề xuất rewrite rõ ràng hơn (tách theo nhánh ambiguity / conflict)
 5. AggregatorNode - Gom kết quả, format thành JSON
+
+Các node đều async: 2 nhánh check chạy đồng thời, mỗi nhánh tự đề xuất cải thiện
+ngay khi check của nó xong, và improve được chia batch chạy song song có giới hạn.
 """
 
 import os
 import json
-from typing import TypedDict, List, Dict, Any
-from pathlib import Path
+import asyncio
+import threading
+from typing import TypedDict, List, Dict, Any, AsyncIterator, Callable, Optional, Tuple
 from langgraph.graph import StateGraph, END
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from dotenv import load_dotenv
+from app.agents.ambiguity_rules import RulePreAnalysis, get_rule_engine
+from app.agents.ambiguity_classifier import get_ambiguity_classifier
+from app.agents.chunked_engine import ChunkedAnalysisEngine, merge_results
+from app.agents.prompt_registry import PromptRegistry, content_hash, get_prompt_registry
+from app.agents.llm_backend import create_chat_model, requires_api_key
+from app.agents.local_backend import BACKEND_LOCAL, LocalParser, node_backend
+from app.agents.conflict_candidates import CONFLICT_PAIR_PARALLELISM, build_conflict_inputs
+from app.agents.compact_output import COMPACT_OUTPUT_FORMATS, RequirementTable, use_compact
+from app.agents.revision_engine import RevisionAnalysisEngine
+from app.agents.checkpoint_store import RunMismatchError, get_checkpoint_saver, new_run_id
+from app.services.analysis_cache import get_analysis_cache, make_cache_key
+from app.services.requirement_memo import (
+    KIND_AMBIGUITY,
+    KIND_FAST,
+    KIND_IMPROVE,
+    FastMemoPlan,
+    ambiguity_verdicts,
+    get_requirement_memo,
+    improve_verdicts,
+    memo_usage,
+)
+from app.utils.json_stream import ExtractionReport, FindingsStreamParser, extract_findings
+from app.utils.rate_limiter import estimate_tokens, get_rate_limiter
+from app.utils.resilience import CircuitOpenError, ResilientChain, get_resilient_caller
+from app.utils.requirements_text import best_match, locate_requirements, normalize_key, split_requirements, strip_list_marker
 from app.utils.logger import logger
 
 # Load environment variables
 load_dotenv()
 
+# Improve node: số requirement mỗi call và số call đồng thời
+IMPROVE_BATCH_SIZE = int(os.getenv("IMPROVE_BATCH_SIZE", "8"))
+IMPROVE_PARALLELISM = int(os.getenv("IMPROVE_PARALLELISM", "4"))
+
 # Define Agent State
 class AgentState(TypedDict):
     input_text: str
     parsed_requirements: List[str]
+    requirement_records: List[Dict[str, Any]]  # ID + offset của từng parsed requirement
     conflicts: List[Dict[str, str]]
     ambiguities: List[Dict[str, str]]
     suggestions: List[Dict[str, str]]
+    ambiguity_suggestions: List[Dict[str, str]]  # Output của nhánh clarity -> improve
+    conflict_suggestions: List[Dict[str, str]]  # Output của nhánh conflict -> improve
     final_result: Dict[str, Any]
 
 
+class ClarityBranchOutput(TypedDict):
+    ambiguities: List[Dict[str, str]]
+    ambiguity_suggestions: List[Dict[str, str]]
+
+
+class ConflictBranchOutput(TypedDict):
+    conflicts: List[Dict[str, str]]
+    conflict_suggestions: List[Dict[str, str]]
+
+
 class RequirementsAnalysisAgent:
     """
     LangGraph Agent để phân tích SRS/User Stories
-    Pipeline: ParseNode -> [ConflictCheckNode, ClarityCheckNode] (parallel) -> ImproveNode -> AggregatorNode
+    Pipeline: ParseNode -> [ConflictCheckNode -> ImproveNode (conflicts),
+                            ClarityCheckNode -> ImproveNode (ambiguities)] (concurrent) -> AggregatorNode
     """
     
-    def __init__(self, api_key: str = None, model: str = "gemini-2.5-flash"):
+    def __init__(self, api_key: str = None, model: str = "gemini-2.5-flash", prompt_registry: PromptRegistry = None):
         """
         Initialize the agent
         
         Args:
             api_key: Gemini API key (nếu None, lấy từ env GEMINI_API_KEY)
             model: Model name (gemini-2.5-flash, gemini-2.5-pro, gemini-1.5-pro, hoặc gemini-1.5-flash)
+            prompt_registry: Registry của prompt files (mặc định: registry dùng chung)
         """
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
+        if not self.api_key and requires_api_key():
             raise ValueError("GEMINI_API_KEY not found. Please set it in .env file")
         
-        # Initialize LLM với Gemini 2.5 Flash (mặc định)
-        # Thêm timeout để tránh đợi quá lâu
-        self.llm_pro = ChatGoogleGenerativeAI(
-            google_api_key=self.api_key,
-            model=model,
-            timeout=120,  # 2 minutes timeout
-            max_retries=2
-        )
+        # Model của agent - mọi node đều chạy trên model này (xem ModelPool)
+        self.model = model
         
-        # Use faster model for parallel checks (cũng dùng 2.5 Flash)
-        self.llm_mini = ChatGoogleGenerativeAI(
-            google_api_key=self.api_key,
-            model="gemini-2.5-flash",  # Faster for parallel processing, Gemini 2.5
-            timeout=120,
-            max_retries=2
-        )
+        # LLM clients theo LLM_BACKEND (live Gemini / record / replay offline từ cassette)
+        # Thêm timeout để tránh đợi quá lâu; retry do ResilientChain đảm nhận (có deadline,
+        # jitter và circuit breaker) nên client không tự retry
+        self.llm_pro = create_chat_model(self.api_key, model, timeout=120)  # 2 minutes timeout
+        
+        # LLM cho parallel checks (client riêng với timeout riêng)
+        self.llm_mini = create_chat_model(self.api_key, model, timeout=120)
         
         # Fast LLM for single-call analysis
-        self.llm_fast = ChatGoogleGenerativeAI(
-            google_api_key=self.api_key,
-            model="gemini-2.5-flash",
-            timeout=90,  # Optimized: 90 seconds (fast analysis should complete in 30-60s)
-            max_retries=2
-        )
+        # Optimized: 90 seconds (fast analysis should complete in 30-60s)
+        self.llm_fast = create_chat_model(self.api_key, model, timeout=90)
+        
+        # Rule-based ambiguity pre-analyzer (None nếu AMBIGUITY_RULES_ENABLED=false)
+        self.ambiguity_rules = get_rule_engine()
+        
+        # Classifier học từ history - kết luận local cho requirement chắc chắn (không có model: bỏ qua)
+        self.ambiguity_classifier = get_ambiguity_classifier()
+        
+        # Prompt registry (hot-reload, versioned) - chains compile một lần cho mỗi prompt version
+        # và được compile lại khi prompt file thay đổi, không cần restart process
+        self.prompts = prompt_registry or get_prompt_registry()
+        self._chains_lock = threading.Lock()
+        self._chains_version = None
+        self._refresh_chains()
         
-        # Load prompts
-        self.prompts_dir = Path(__file__).parent / "prompts"
-        self.parse_prompt = self._load_prompt("parse_requirements.txt")
-        self.conflict_prompt = self._load_prompt("detect_conflict.txt")
-        self.ambiguity_prompt = self._load_prompt("check_ambiguity.txt")
-        self.improve_prompt = self._load_prompt("suggest_improve.txt")
-        self.analyze_all_prompt = self._load_prompt("analyze_all_in_one.txt")
+        # Result cache (memory LRU + analysis DB)
+        self.cache = get_analysis_cache()
+        
+        # Checkpoint của full pipeline theo run id (None = tắt, run lỗi không resume được)
+        self.checkpointer = get_checkpoint_saver()
+        
+        # Verdict theo từng requirement, dùng chung giữa các document
+        self.memo = get_requirement_memo()
         
         # Build graph
         self.graph = self._build_graph()
     
-    def _load_prompt(self, filename: str) -> str:
-        """Load prompt from file"""
-        prompt_path = self.prompts_dir / filename
-        if prompt_path.exists():
-            return prompt_path.read_text(encoding='utf-8')
-        else:
-            raise FileNotFoundError(f"Prompt file not found: {prompt_path}")
+    def _refresh_chains(self) -> None:
+        """
+        Compile chains cho PromptSet hiện tại của registry (no-op nếu version không đổi)
+        
+        Gọi ở đầu mỗi lần phân tích; prompt_version (một phần của cache key) luôn khớp
+        với bộ prompt của chains đang dùng. Mỗi chain được bọc bởi ResilientChain (hedging,
+        retry, circuit breaker dùng chung theo model) và lấy quota từ rate limiter dùng chung
+        giữa các process trước mỗi request.
+        """
+        prompts = self.prompts.current()
+        self._refresh_analysis_version(prompts.version)
+        if prompts.version == self._chains_version:
+            return
+        with self._chains_lock:
+            if prompts.version == self._chains_version:
+                return
+            specs = {
+                "parse_chain": ("parse", self.llm_pro, False),
+                "conflict_chain": ("conflict", self.llm_mini, False),
+                "ambiguity_chain": ("ambiguity", self.llm_mini, False),
+                "improve_chain": ("improve", self.llm_pro, False),
+                "fast_chain": ("analyze_all", self.llm_fast, False),
+                # Cùng prompt + hướng dẫn output theo ID requirement (xem compact_output)
+                "conflict_compact_chain": ("conflict", self.llm_mini, True),
+                "ambiguity_compact_chain": ("ambiguity", self.llm_mini, True),
+                "improve_compact_chain": ("improve", self.llm_pro, True),
+            }
+            for attr, (name, llm, compact) in specs.items():
+                template = prompts[name] + (COMPACT_OUTPUT_FORMATS[name] if compact else "")
+                chain = PromptTemplate.from_template(template) | llm | StrOutputParser()
+                caller = get_resilient_caller(f"{self.model}:{name}", breaker_key=self.model)
+                setattr(self, attr, ResilientChain(
+                    chain, caller, limiter=get_rate_limiter(), prompt_tokens=estimate_tokens(template)
+                ))
+            # Version từng prompt - key của requirement memo (verdict chỉ phụ thuộc prompt tạo ra nó)
+            self._prompt_versions = dict(prompts.versions)
+            if self._chains_version is not None:
+                logger.info(f"Agent for {self.model} recompiled chains for prompt version {prompts.version}")
+            self._chains_version = prompts.version
+    
+    def _refresh_analysis_version(self, prompts_version: str) -> None:
+        """
+        Fingerprint của bộ prompt + lexicon + version của ambiguity classifier - dùng làm
+        một phần của cache key (classifier được train lại thì kết quả cũ không được dùng lại)
+        """
+        classifier_version = self.ambiguity_classifier.version if self.ambiguity_classifier else None
+        self.prompt_version = content_hash(
+            prompts_version,
+            self.ambiguity_rules.version if self.ambiguity_rules else "",
+            *([classifier_version] if classifier_version else [])
+        )
     
     def _build_graph(self) -> StateGraph:
-        """Build LangGraph workflow"""
+        """
+        Build LangGraph workflow (async nodes - chạy bằng graph.ainvoke)
+        
+        Với checkpointer, state được lưu theo run id sau mỗi node (kể cả node trong
+        subgraph của từng nhánh) - run lỗi được chạy tiếp bằng graph.ainvoke(None, config).
+        """
         from langgraph.graph import END
         
         graph = StateGraph(AgentState)
         
-        # Add nodes
+        # Add nodes - mỗi nhánh (check -> improve) là một subgraph để không bị chặn bởi
+        # superstep của nhánh kia: improve của nhánh xong trước bắt đầu ngay
         graph.add_node("parse_node", self.parse_node)
-        graph.add_node("conflict_check_node", self.conflict_check_node)
-        graph.add_node("clarity_check_node", self.clarity_check_node)
-        graph.add_node("merge_results_node", self.merge_results_node)
-        graph.add_node("improve_node", self.improve_node)
+        graph.add_node("conflict_branch", self._build_branch(
+            "conflict_check_node", self.conflict_check_node,
+            "improve_conflicts_node", self.improve_conflicts_node,
+            ConflictBranchOutput
+        ))
+        graph.add_node("clarity_branch", self._build_branch(
+            "clarity_check_node", self.clarity_check_node,
+            "improve_ambiguities_node", self.improve_ambiguities_node,
+            ClarityBranchOutput
+        ))
         graph.add_node("aggregator_node", self.aggregator_node)
         
         # Define flow
         graph.set_entry_point("parse_node")
         
-        # Parse -> Parallel checks (both start from parse_node)
-        graph.add_edge("parse_node", "conflict_check_node")
-        graph.add_edge("parse_node", "clarity_check_node")
+        # Parse -> 2 nhánh chạy đồng thời
+        graph.add_edge("parse_node", "conflict_branch")
+        graph.add_edge("parse_node", "clarity_branch")
         
-        # Parallel checks -> Merge (wait for both to complete)
-        graph.add_edge("conflict_check_node", "merge_results_node")
-        graph.add_edge("clarity_check_node", "merge_results_node")
-        
-        # Merge -> Improve
-        graph.add_edge("merge_results_node", "improve_node")
-        
-        # Improve -> Aggregate
-        graph.add_edge("improve_node", "aggregator_node")
+        # Aggregate đợi cả 2 nhánh
+        graph.add_edge(["conflict_branch", "clarity_branch"], "aggregator_node")
         
         # Aggregate -> END
         graph.add_edge("aggregator_node", END)
         
-        return graph.compile()
+        return graph.compile(checkpointer=self.checkpointer)
+    
+    @staticmethod
+    def _build_branch(check_name: str, check, improve_name: str, improve, output_schema: type):
+        """Subgraph check -> improve của một nhánh (chỉ trả các key của nhánh cho graph chính)"""
+        branch = StateGraph(AgentState, output_schema=output_schema)
+        branch.add_node(check_name, check)
+        branch.add_node(improve_name, improve)
+        branch.set_entry_point(check_name)
+        branch.add_edge(check_name, improve_name)
+        branch.add_edge(improve_name, END)
+        return branch.compile()
     
-    def parse_node(self, state: AgentState) -> AgentState:
+    async def parse_node(self, state: AgentState) -> AgentState:
         """
         ParseNode: Phân tích văn bản, tách từng requirement
-        Model: gemini-2.5-flash (hoặc model được chỉ định)
+        Model: local CPU backend (NODE_BACKENDS "parse=local") hoặc model của agent
         """
         logger.debug("Running ParseNode")
-        prompt_template = PromptTemplate.from_template(self.parse_prompt)
-        chain = prompt_template | self.llm_pro | StrOutputParser()
-        
-        result = chain.invoke({"input_text": state["input_text"]})
+        if node_backend("parse") == BACKEND_LOCAL:
+            records = await LocalParser().asegment(state["input_text"])
+            if records:
+                logger.debug(f"Parsed {len(records)} requirements locally")
+                return {
+                    "parsed_requirements": [record.text for record in records],
+                    "requirement_records": [record.to_dict() for record in records]
+                }
+            logger.info("Local parser found no requirements - falling back to LLM parse")
+        chain = self.parse_chain
+        
+        result = await chain.ainvoke({"input_text": state["input_text"]})
         
         # Parse requirements from result
         # Split by lines and clean
@@ -146,295 +265,626 @@ class RequirementsAnalysisAgent:
         for line in result.split('\n'):
             line = line.strip()
             if line and len(line) > 5:  # Filter out very short lines
-                # Remove markers like "-", "1.", "*", etc.
-                line = line.lstrip('.-*0123456789) ').strip()
+                # Remove markers like "-", "1.", "*", etc. (giữ số thuộc nội dung requirement)
+                line = strip_list_marker(line)
                 if line:
                     requirements.append(line)
         
         logger.debug(f"Parsed {len(requirements)} requirements")
         return {
-            "parsed_requirements": requirements
+            "parsed_requirements": requirements,
+            "requirement_records": [record.to_dict() for record in locate_requirements(state["input_text"], requirements)]
         }
     
-    def conflict_check_node(self, state: AgentState) -> AgentState:
+    async def conflict_check_node(self, state: AgentState) -> AgentState:
         """
         ConflictCheckNode: Phát hiện mâu thuẫn (contradiction/negation)
-        Model: gemini-2.5-flash (faster for parallel processing)
+        Model: model của agent
         """
         logger.debug("Running ConflictCheckNode")
         if not state.get("parsed_requirements"):
             return {"conflicts": []}
         
-        requirements_text = "\n".join([f"- {req}" for req in state["parsed_requirements"]])
-        
-        prompt_template = PromptTemplate.from_template(self.conflict_prompt)
-        chain = prompt_template | self.llm_mini | StrOutputParser()
-        
-        result = chain.invoke({"parsed_requirements": requirements_text})
-        
-        # Parse JSON from result
-        conflicts = self._parse_json_response(result, "conflicts")
+        # Document lớn: chỉ gửi các cặp ứng viên (top-k theo embedding), chia batch
+        conflicts = await self._adetect_conflicts(state["parsed_requirements"], state.get("requirement_records"))
         logger.debug(f"Found {len(conflicts)} conflicts")
         
         return {"conflicts": conflicts}
     
-    def clarity_check_node(self, state: AgentState) -> AgentState:
+    async def clarity_check_node(self, state: AgentState) -> AgentState:
         """
         ClarityCheckNode: Phát hiện câu mơ hồ (ambiguous terms)
-        Model: gemini-2.5-flash (faster for parallel processing)
+        Model: model của agent
         """
         logger.debug("Running ClarityCheckNode")
         if not state.get("parsed_requirements"):
             return {"ambiguities": []}
         
-        requirements_text = "\n".join([f"- {req}" for req in state["parsed_requirements"]])
-        
-        prompt_template = PromptTemplate.from_template(self.ambiguity_prompt)
-        chain = prompt_template | self.llm_mini | StrOutputParser()
-        
-        result = chain.invoke({"parsed_requirements": requirements_text})
+        # Weak word rõ ràng được flag local; chỉ requirement rule không kết luận được mới gửi LLM
+        requirements = state["parsed_requirements"]
+        rule_ambiguities = []
+        if self.ambiguity_rules:
+            pre = self.ambiguity_rules.analyze_requirements(requirements)
+            requirements, rule_ambiguities = pre.unsettled, pre.ambiguities
+            logger.debug(f"Rules flagged {len(rule_ambiguities)} requirements, {len(requirements)} left for LLM")
+        if not requirements:
+            return {"ambiguities": rule_ambiguities}
+        
+        # Requirement đã có verdict (từ document khác) không gửi lại cho model
+        version = self._prompt_versions.get("ambiguity", "")
+        cached = await self.memo.alookup(KIND_AMBIGUITY, requirements, self.model, version)
+        memo_ambiguities = [
+            {"req": requirements[index], "issue": verdict.get("issue") or ""}
+            for index, verdict in sorted(cached.items()) if verdict.get("ambiguous")
+        ]
+        requirements = [req for index, req in enumerate(requirements) if index not in cached]
+        
+        # Classifier học từ history kết luận local các requirement chắc chắn mơ hồ / rõ ràng;
+        # chỉ dải không chắc chắn ở giữa mới gửi LLM
+        classifier_ambiguities = []
+        if self.ambiguity_classifier and requirements:
+            screen = await asyncio.to_thread(self.ambiguity_classifier.screen, requirements)
+            if screen:
+                classifier_ambiguities = screen.findings()
+                requirements = screen.uncertain
+                logger.debug(f"Classifier settled {len(screen.ambiguous) + len(screen.clear)} requirements, "
+                             f"{len(requirements)} left for LLM")
+        if not requirements:
+            return {"ambiguities": rule_ambiguities + memo_ambiguities + classifier_ambiguities}
+        
+        # Document lớn: model trả về ID requirement thay vì chép lại text (compact schema)
+        table = RequirementTable(requirements, state.get("requirement_records")) if use_compact(len(requirements)) else None
+        requirements_text = table.lines() if table else "\n".join([f"- {req}" for req in requirements])
+        
+        chain = self.ambiguity_compact_chain if table else self.ambiguity_chain
+        
+        result = await chain.ainvoke({"parsed_requirements": requirements_text})
         
         # Parse JSON from result
-        ambiguities = self._parse_json_response(result, "ambiguities")
+        llm_ambiguities, report = self._extract_section(result, "ambiguities")
+        if table:
+            llm_ambiguities = table.expand("ambiguities", llm_ambiguities)
+        if report.has_section("ambiguities"):
+            # Output bị salvage / thiếu key "ambiguities" có thể thiếu finding - không lưu "rõ ràng" sai vào memo
+            await self.memo.astore(KIND_AMBIGUITY, ambiguity_verdicts(requirements, llm_ambiguities), self.model, version)
+        ambiguities = rule_ambiguities + memo_ambiguities + classifier_ambiguities + llm_ambiguities
         logger.debug(f"Found {len(ambiguities)} ambiguities")
         
         return {"ambiguities": ambiguities}
     
-    def merge_results_node(self, state: AgentState) -> AgentState:
+    async def improve_ambiguities_node(self, state: AgentState) -> AgentState:
         """
-        Merge node: Đợi cả conflict_check và clarity_check hoàn thành
-        Đảm bảo cả conflicts và ambiguities đều có trong state
+        ImproveNode (nhánh clarity): Đề xuất rewrite cho requirement mơ hồ
+        Chạy ngay sau ClarityCheckNode, đồng thời với nhánh conflict
         """
-        # Đảm bảo cả 2 keys đều có trong state
-        merged_state = {
-            "conflicts": state.get("conflicts", []),
-            "ambiguities": state.get("ambiguities", []),
-            "parsed_requirements": state.get("parsed_requirements", [])
-        }
-        return merged_state
+        logger.debug("Running ImproveNode for ambiguities")
+        ambiguities = state.get("ambiguities", [])
+        requirements = self._requirements_for(ambiguities, ("req",), state.get("parsed_requirements", []))
+        suggestions = await self._aimprove(requirements, [], ambiguities, state.get("requirement_records"))
+        logger.debug(f"Generated {len(suggestions)} suggestions for ambiguities")
+        return {"ambiguity_suggestions": suggestions}
     
-    def improve_node(self, state: AgentState) -> AgentState:
+    async def improve_conflicts_node(self, state: AgentState) -> AgentState:
         """
-        ImproveNode: Đề xuất rewrite rõ ràng hơn
-        Model: gemini-2.5-flash (hoặc model được chỉ định)
+        ImproveNode (nhánh conflict): Đề xuất rewrite cho requirement bị mâu thuẫn
         """
-        logger.debug("Running ImproveNode")
-        if not state.get("parsed_requirements"):
-            return {"suggestions": []}
-        
-        requirements_text = "\n".join([f"- {req}" for req in state["parsed_requirements"]])
-        
-        conflicts_text = json.dumps(state.get("conflicts", []), indent=2, ensure_ascii=False)
-        ambiguities_text = json.dumps(state.get("ambiguities", []), indent=2, ensure_ascii=False)
-        
-        prompt_template = PromptTemplate.from_template(self.improve_prompt)
-        chain = prompt_template | self.llm_pro | StrOutputParser()
-        
-        result = chain.invoke({
-            "parsed_requirements": requirements_text,
-            "conflicts": conflicts_text,
-            "ambiguities": ambiguities_text
-        })
+        logger.debug("Running ImproveNode for conflicts")
+        conflicts = state.get("conflicts", [])
+        requirements = self._requirements_for(conflicts, ("req1", "req2"), state.get("parsed_requirements", []))
+        suggestions = await self._aimprove(requirements, conflicts, [], state.get("requirement_records"))
+        logger.debug(f"Generated {len(suggestions)} suggestions for conflicts")
+        return {"conflict_suggestions": suggestions}
+    
+    def _requirements_for(self, findings: List[Dict], keys: Tuple[str, ...], parsed: List[str]) -> List[str]:
+        """Requirement (theo text đã parse nếu khớp được) mà các finding tham chiếu tới"""
+        requirements: List[str] = []
+        seen = set()
+        for item in findings:
+            if not isinstance(item, dict):
+                continue
+            for key in keys:
+                ref = item.get(key)
+                if not ref:
+                    continue
+                index = best_match(ref, parsed)
+                requirement = parsed[index] if index is not None else ref
+                if normalize_key(requirement) not in seen:
+                    seen.add(normalize_key(requirement))
+                    requirements.append(requirement)
+        return requirements
+    
+    async def _aimprove(
+        self,
+        requirements: List[str],
+        conflicts: List[Dict],
+        ambiguities: List[Dict],
+        records: Optional[List[Dict[str, Any]]] = None
+    ) -> List[Dict]:
+        """
+        Chạy improve prompt theo batch IMPROVE_BATCH_SIZE requirement, tối đa IMPROVE_PARALLELISM
+        call đồng thời; mỗi batch chỉ mang theo finding liên quan tới requirement của nó
+        Nhiều requirement: requirement và finding được tham chiếu theo ID (compact schema).
         
-        # Parse JSON from result
-        suggestions = self._parse_json_response(result, "suggestions")
-        logger.debug(f"Generated {len(suggestions)} suggestions")
+        Rewrite cho requirement mơ hồ (không có conflict) được memo theo requirement; rewrite
+        cho conflict phụ thuộc requirement còn lại của document nên luôn gọi model.
+        """
+        if not requirements:
+            return []
         
-        return {"suggestions": suggestions}
+        memoized = not conflicts
+        version = self._prompt_versions.get("improve", "")
+        memo_suggestions = []
+        if memoized:
+            cached = await self.memo.alookup(KIND_IMPROVE, requirements, self.model, version)
+            memo_suggestions = [
+                {"req": requirements[index], "new_version": verdict["new_version"]}
+                for index, verdict in sorted(cached.items())
+            ]
+            requirements = [req for index, req in enumerate(requirements) if index not in cached]
+            if not requirements:
+                return memo_suggestions
+        
+        table = None
+        if use_compact(len(requirements)):
+            # Requirement của conflict nằm ngoài danh sách cần rewrite cũng cần ID
+            referenced = [item.get(key, "") for item in conflicts for key in ("req1", "req2")]
+            extra = [req for req in referenced if req and best_match(req, requirements) is None]
+            table = RequirementTable(requirements + list(dict.fromkeys(extra)), records)
+        
+        inputs = []
+        for start in range(0, len(requirements), IMPROVE_BATCH_SIZE):
+            batch = requirements[start:start + IMPROVE_BATCH_SIZE]
+            batch_conflicts = [
+                item for item in conflicts
+                if best_match(item.get("req1", ""), batch) is not None or best_match(item.get("req2", ""), batch) is not None
+            ]
+            batch_ambiguities = [item for item in ambiguities if best_match(item.get("req", ""), batch) is not None]
+            if table:
+                batch_conflicts = table.compact("conflicts", batch_conflicts)
+                batch_ambiguities = table.compact("ambiguities", batch_ambiguities)
+            inputs.append({
+                "parsed_requirements": table.lines(batch) if table else "\n".join([f"- {req}" for req in batch]),
+                "conflicts": json.dumps(batch_conflicts, indent=2, ensure_ascii=False),
+                "ambiguities": json.dumps(batch_ambiguities, indent=2, ensure_ascii=False)
+            })
+        
+        chain = self.improve_compact_chain if table else self.improve_chain
+        results = await chain.abatch(inputs, config={"max_concurrency": IMPROVE_PARALLELISM})
+        
+        suggestions = merge_results([
+            {"suggestions": self._expand(table, "suggestions", self._parse_json_response(result, "suggestions"))}
+            for result in results
+        ])["suggestions"]
+        if memoized:
+            await self.memo.astore(KIND_IMPROVE, improve_verdicts(requirements, suggestions), self.model, version)
+        return memo_suggestions + suggestions
     
     def aggregator_node(self, state: AgentState) -> AgentState:
         """
         AggregatorNode: Gom kết quả, format thành JSON
         Local function - không cần AI
         """
+        # Requirement vừa mơ hồ vừa mâu thuẫn: giữ suggestion của nhánh ambiguity
+        suggestions = merge_results([
+            {"suggestions": state.get("ambiguity_suggestions", [])},
+            {"suggestions": state.get("conflict_suggestions", [])}
+        ])["suggestions"]
         final_result = {
             "conflicts": state.get("conflicts", []),
             "ambiguities": state.get("ambiguities", []),
-            "suggestions": state.get("suggestions", [])
+            "suggestions": suggestions
         }
         
-        return {"final_result": final_result}
+        return {"final_result": final_result, "suggestions": suggestions}
+    
+    def _parse_json_response(self, text: str, key: str) -> List[Dict]:
+        """
+        Parse mảng `key` từ LLM response (object {"key": [...]} hoặc mảng trần)
+        Output lệch format / bị cắt được salvage theo từng element (xem extract_findings)
+        """
+        return self._extract_section(text, key)[0]
     
-    def _parse_json_response(self, text: str, key: str = None) -> List[Dict]:
+    def _extract_section(self, text: str, key: str) -> Tuple[List[Dict], ExtractionReport]:
+        """Như _parse_json_response, kèm ExtractionReport (output có phải salvage không)"""
+        findings, report = extract_findings(text, (key,), list_section=key)
+        self._log_extraction(report)
+        return findings[key], report
+    
+    @staticmethod
+    def _memoizable(report: ExtractionReport, result: Dict[str, Any]) -> bool:
         """
-        Parse JSON from LLM response
-        Handles markdown code blocks and extracts JSON
+        Output fast path đủ tin cậy để lưu verdict vào memo: parse strict, có đủ key
+        "ambiguities" / "suggestions" (thiếu key không có nghĩa là "rõ ràng") và có finding
         """
-        # Remove markdown code blocks if present
-        if "```json" in text:
-            start = text.find("```json") + 7
-            end = text.find("```", start)
-            text = text[start:end].strip()
-        elif "```" in text:
-            start = text.find("```") + 3
-            end = text.find("```", start)
-            if end > start:
-                text = text[start:end].strip()
+        return report.has_section("ambiguities") and report.has_section("suggestions") and any(result.values())
+    
+    @staticmethod
+    def _log_extraction(report: ExtractionReport) -> None:
+        if report.salvaged or report.dropped:
+            logger.warning(f"LLM output was malformed - {report.summary()}")
+    
+    def analyze(self, input_text: str, cache_mode: str = None, run_id: str = None) -> Dict[str, Any]:
+        """
+        Main method to analyze requirements (sync wrapper của aanalyze)
         
-        # Try to parse as JSON
-        try:
-            data = json.loads(text)
-            if isinstance(data, dict) and key:
-                return data.get(key, [])
-            elif isinstance(data, list):
-                return data
-            elif isinstance(data, dict):
-                return list(data.values())[0] if len(data) == 1 else []
-            else:
-                return []
-        except json.JSONDecodeError:
-            # Try to extract JSON object using regex
-            import re
-            json_match = re.search(r'\{[^{}]*\}', text, re.DOTALL)
-            if json_match:
-                try:
-                    data = json.loads(json_match.group())
-                    if isinstance(data, dict) and key:
-                        return data.get(key, [])
-                    return data if isinstance(data, list) else []
-                except:
-                    pass
-            
-            # Fallback: return empty list
-            return []
+        Không gọi từ trong event loop đang chạy - dùng `await agent.aanalyze(...)`.
+        
+        Args:
+            input_text: SRS/User Stories text to analyze
+            cache_mode: None (dùng cache), "bypass" hoặc "refresh"
+            run_id: Run id của checkpoint (run lỗi trước đó với cùng id được chạy tiếp)
+        
+        Returns:
+            Dict với keys: conflicts, ambiguities, suggestions
+        """
+        return asyncio.run(self.aanalyze(input_text, cache_mode, run_id))
     
-    def analyze(self, input_text: str) -> Dict[str, Any]:
+    async def aanalyze(self, input_text: str, cache_mode: str = None, run_id: str = None) -> Dict[str, Any]:
         """
-        Main method to analyze requirements
+        Chạy full LangGraph pipeline (async nodes, 2 nhánh check + improve đồng thời)
+        
+        Output của từng node được checkpoint theo run_id. Nếu run_id có checkpoint của một
+        lần chạy lỗi / timeout trước đó, pipeline chạy tiếp từ node cuối cùng đã hoàn tất
+        (chỉ các node chưa xong gọi LLM lại).
         
         Args:
             input_text: SRS/User Stories text to analyze
+            cache_mode: None (dùng cache), "bypass" hoặc "refresh"
+            run_id: Run id (None = run mới với id ngẫu nhiên)
         
         Returns:
             Dict với keys: conflicts, ambiguities, suggestions
+        
+        Raises:
+            RunMismatchError: run_id là checkpoint của một input khác
         """
-        logger.info(f"Starting LangGraph analysis pipeline for text length: {len(input_text)} chars")
-        initial_state: AgentState = {
+        self._refresh_chains()
+        cache_key = make_cache_key(input_text, "full", self.llm_pro.model, self.prompt_version)
+        cached = await self.cache.alookup(cache_key, cache_mode)
+        if cached is not None:
+            logger.info("LangGraph analysis served from cache")
+            return cached
+        
+        run_id = run_id or new_run_id()
+        config = {"configurable": {"thread_id": run_id}}
+        initial_state: Optional[AgentState] = {
             "input_text": input_text,
             "parsed_requirements": [],
+            "requirement_records": [],
             "conflicts": [],
             "ambiguities": [],
             "suggestions": [],
+            "ambiguity_suggestions": [],
+            "conflict_suggestions": [],
             "final_result": {}
         }
+        resumed = False
+        if self.checkpointer:
+            snapshot = await self.graph.aget_state(config)
+            if snapshot.values:
+                if snapshot.values.get("input_text") != input_text:
+                    raise RunMismatchError(f"Run {run_id} was started for a different input")
+                initial_state, resumed = None, True  # None = chạy tiếp từ checkpoint cuối
+                logger.info(f"Resuming LangGraph run {run_id} at {list(snapshot.next) or 'completed state'}")
+        
+        if not resumed:
+            logger.info(f"Starting LangGraph analysis pipeline for text length: {len(input_text)} chars")
         
         # Run the graph
         try:
-            final_state = self.graph.invoke(initial_state)
+            with memo_usage(cache_mode):
+                final_state = await self.graph.ainvoke(initial_state, config)
             logger.info("LangGraph pipeline completed successfully")
         except Exception as e:
-            logger.error(f"LangGraph pipeline failed: {str(e)}")
+            logger.error(f"LangGraph pipeline failed (run {run_id}): {str(e)}")
             raise
         
+        if self.checkpointer:
+            await self.checkpointer.acomplete(run_id, resumed=resumed)
+        
         # Return final result
-        result = final_state.get("final_result", {
+        result = final_state.get("final_result") or {
             "conflicts": final_state.get("conflicts", []),
             "ambiguities": final_state.get("ambiguities", []),
             "suggestions": final_state.get("suggestions", [])
-        })
+        }
         
         logger.info(f"Analysis result: {len(result.get('conflicts', []))} conflicts, "
                    f"{len(result.get('ambiguities', []))} ambiguities, "
                    f"{len(result.get('suggestions', []))} suggestions")
         
+        await self.cache.astore(cache_key, result, cache_mode, model=self.llm_pro.model, prompt_version=self.prompt_version)
         return result
     
-    def analyze_fast(self, input_text: str) -> Dict[str, Any]:
+    def has_run(self, run_id: str) -> bool:
+        """run_id có checkpoint (run lỗi chưa xong) để chạy tiếp không"""
+        return bool(run_id and self.checkpointer and self.checkpointer.has_run(run_id))
+    
+    def analyze_fast(self, input_text: str, cache_mode: str = None) -> Dict[str, Any]:
         """
         Fast analysis method: Single API call to analyze everything at once
         Giảm thời gian từ 3 phút xuống ~30-60 giây
         
         Args:
             input_text: SRS/User Stories text to analyze
+            cache_mode: None (dùng cache), "bypass" hoặc "refresh"
             
         Returns:
             Dict với keys: conflicts, ambiguities, suggestions
         """
+        self._refresh_chains()
+        cache_key = make_cache_key(input_text, "fast", self.llm_fast.model, self.prompt_version)
+        cached = self.cache.lookup(cache_key, cache_mode)
+        if cached is not None:
+            logger.info("FAST analysis served from cache")
+            return cached
+        
         logger.info(f"Starting FAST analysis (single API call) for text length: {len(input_text)} chars")
         
         try:
             # Single prompt for all analysis
-            prompt_template = PromptTemplate.from_template(self.analyze_all_prompt)
-            chain = prompt_template | self.llm_fast | StrOutputParser()
-            
-            # Single API call
-            result_text = chain.invoke({"input_text": input_text})
-            
-            # Parse JSON response
-            result = self._parse_complete_json_response(result_text)
-            
-            # Ensure all keys exist
-            if not isinstance(result, dict):
-                result = {"conflicts": [], "ambiguities": [], "suggestions": []}
-            
-            # Normalize to expected format
-            normalized_result = {
-                "conflicts": result.get("conflicts", []),
-                "ambiguities": result.get("ambiguities", []),
-                "suggestions": result.get("suggestions", [])
-            }
-            
-            logger.info(f"FAST analysis completed: {len(normalized_result.get('conflicts', []))} conflicts, "
-                       f"{len(normalized_result.get('ambiguities', []))} ambiguities, "
-                       f"{len(normalized_result.get('suggestions', []))} suggestions")
-            
-            return normalized_result
+            chain = self.fast_chain
+            pre = self._pre_analyze(input_text)
+            with memo_usage(cache_mode):
+                plan = self._fast_memo_plan(input_text, pre)
+                
+                # Single API call
+                result_text = chain.invoke({"input_text": plan.annotate(pre.annotate(input_text))})
+                result, report = self._normalize_fast_output(result_text)
+                if self._memoizable(report, result):
+                    self.memo.store(KIND_FAST, plan.verdicts(result), self.model, self._prompt_versions.get("analyze_all", ""))
+            result = pre.merge(plan.merge(result))
             
+        except CircuitOpenError:
+            raise  # Upstream đang lỗi: fail fast thay vì trả kết quả rỗng
         except Exception as e:
             logger.error(f"Fast analysis failed: {str(e)}")
             # Fallback to empty result instead of raising
             logger.warning("Returning empty analysis result due to error")
-            return {
-                "conflicts": [],
-                "ambiguities": [],
-                "suggestions": []
-            }
+            return self._empty_result()
+        
+        self.cache.store(cache_key, result, cache_mode, model=self.llm_fast.model, prompt_version=self.prompt_version)
+        return result
     
-    def _parse_complete_json_response(self, text: str) -> Dict[str, Any]:
+    async def aanalyze_fast(self, input_text: str, cache_mode: str = None) -> Dict[str, Any]:
         """
-        Parse complete JSON response from single API call
-        Handles markdown code blocks and extracts full JSON object
-        """
-        # Remove markdown code blocks if present
-        if "```json" in text:
-            start = text.find("```json") + 7
-            end = text.find("```", start)
-            text = text[start:end].strip()
-        elif "```" in text:
-            start = text.find("```") + 3
-            end = text.find("```", start)
-            if end > start:
-                text = text[start:end].strip()
+        Async version của analyze_fast - dùng chain.ainvoke để không block event loop
         
-        # Try to parse as JSON
+        Args:
+            input_text: SRS/User Stories text to analyze
+            cache_mode: None (dùng cache), "bypass" hoặc "refresh"
+            
+        Returns:
+            Dict với keys: conflicts, ambiguities, suggestions
+        """
         try:
-            data = json.loads(text)
-            if isinstance(data, dict):
-                return data
-            else:
-                return {"conflicts": [], "ambiguities": [], "suggestions": []}
-        except json.JSONDecodeError:
-            # Try to extract JSON object using regex
-            import re
-            # Try to find JSON object in the text
-            json_match = re.search(r'\{.*\}', text, re.DOTALL)
-            if json_match:
-                try:
-                    data = json.loads(json_match.group())
-                    if isinstance(data, dict):
-                        return data
-                except:
-                    pass
+            return await self._acached_fast(input_text, cache_mode)
+        except CircuitOpenError:
+            raise  # Upstream đang lỗi: fail fast thay vì trả kết quả rỗng
+        except Exception as e:
+            logger.error(f"Fast async analysis failed: {str(e)}")
+            logger.warning("Returning empty analysis result due to error")
+            return self._empty_result()
+    
+    async def aanalyze_chunked(
+        self,
+        input_text: str,
+        cache_mode: str = None,
+        on_progress: Callable[[int, int], None] = None
+    ) -> Dict[str, Any]:
+        """
+        Map-reduce analysis cho document lớn (xem ChunkedAnalysisEngine)
+        
+        Khác với aanalyze_fast, method này raise exception nếu tất cả chunk đều lỗi
+        thay vì trả về kết quả rỗng.
+        
+        Args:
+            input_text: SRS/User Stories text to analyze
+            cache_mode: None (dùng cache), "bypass" hoặc "refresh"
+            on_progress: callback(done, total) sau mỗi LLM call
+            
+        Returns:
+            Dict với keys: conflicts, ambiguities, suggestions
+        """
+        self._refresh_chains()
+        cache_key = make_cache_key(input_text, "chunked", self.llm_fast.model, self.prompt_version)
+        cached = await self.cache.alookup(cache_key, cache_mode)
+        if cached is not None:
+            logger.info("Chunked analysis served from cache")
+            return cached
+        
+        engine = ChunkedAnalysisEngine(self)
+        result = await engine.aanalyze(input_text, cache_mode=cache_mode, on_progress=on_progress)
+        
+        await self.cache.astore(cache_key, result, cache_mode, model=self.llm_fast.model, prompt_version=self.prompt_version)
+        return result
+    
+    async def aanalyze_revision(
+        self,
+        previous_text: str,
+        previous_result: Dict[str, Any],
+        input_text: str,
+        cache_mode: str = None
+    ) -> Dict[str, Any]:
+        """
+        Incremental analysis cho bản sửa của một document (xem RevisionAnalysisEngine)
+        
+        Chỉ requirement thêm mới / thay đổi (kèm requirement liên quan) được gửi cho LLM;
+        finding cũ chỉ liên quan tới requirement không đổi được giữ nguyên.
+        
+        Args:
+            previous_text: Text của bản đã phân tích
+            previous_result: Kết quả đã lưu của bản đó
+            input_text: Text bản mới
+            cache_mode: None (dùng cache), "bypass" hoặc "refresh"
             
-            # Last resort: try to extract each section separately
-            logger.warning("Failed to parse complete JSON, attempting partial extraction")
-            conflicts = self._parse_json_response(text, "conflicts")
-            ambiguities = self._parse_json_response(text, "ambiguities")
-            suggestions = self._parse_json_response(text, "suggestions")
+        Returns:
+            Dict với keys: conflicts, ambiguities, suggestions, revision (thống kê diff)
+        """
+        engine = RevisionAnalysisEngine(self)
+        return await engine.aanalyze(previous_text, previous_result, input_text, cache_mode=cache_mode)
+    
+    async def astream_fast(self, input_text: str, cache_mode: str = None) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Streaming version của fast analysis
+        
+        Stream token từ model qua incremental JSON parser, yield từng finding ngay khi
+        object của nó hoàn chỉnh. Item cuối cùng luôn là ("result", full_result) - kết quả
+        parse từ toàn bộ output, bổ sung các finding mà incremental parser bỏ sót.
+        
+        Yields:
+            ("conflicts" | "ambiguities" | "suggestions", item) hoặc ("result", dict)
+        """
+        self._refresh_chains()
+        cache_key = make_cache_key(input_text, "fast", self.llm_fast.model, self.prompt_version)
+        cached = await self.cache.alookup(cache_key, cache_mode)
+        if cached is not None:
+            logger.info("FAST streaming analysis served from cache")
+            for section in ("conflicts", "ambiguities", "suggestions"):
+                for item in cached.get(section, []):
+                    yield section, item
+            yield "result", cached
+            return
+        
+        logger.info(f"Starting FAST streaming analysis for text length: {len(input_text)} chars")
+        chain = self.fast_chain
+        
+        parser = FindingsStreamParser()
+        emitted = set()
+        output_parts = []
+        
+        # Ambiguity từ rule có ngay, trước token đầu tiên của model
+        pre = self._pre_analyze(input_text)
+        for item in pre.ambiguities:
+            emitted.add(("ambiguities", json.dumps(item, sort_keys=True, ensure_ascii=False)))
+            yield "ambiguities", item
+        # memo_usage không bọc qua các yield (consumer có thể đọc từng bước trong task khác)
+        with memo_usage(cache_mode):
+            plan = await asyncio.to_thread(self._fast_memo_plan, input_text, pre)
+        
+        async for token in chain.astream({"input_text": plan.annotate(pre.annotate(input_text))}):
+            output_parts.append(token)
+            for section, item in parser.feed(token):
+                if section == "ambiguities" and pre.is_settled(item):
+                    continue
+                if section in ("ambiguities", "suggestions") and plan.is_cached(item):
+                    continue  # Được thay bằng verdict đã memo (emit ở cuối)
+                emitted.add((section, json.dumps(item, sort_keys=True, ensure_ascii=False)))
+                yield section, item
+        
+        result, report = self._normalize_fast_output("".join(output_parts))
+        if self._memoizable(report, result):
+            with memo_usage(cache_mode):
+                await self.memo.astore(KIND_FAST, plan.verdicts(result), self.model, self._prompt_versions.get("analyze_all", ""))
+        result = pre.merge(plan.merge(result))
+        # Emit các finding mà incremental parser không nhận ra (output lệch format) và verdict đã memo
+        for section in ("conflicts", "ambiguities", "suggestions"):
+            for item in result.get(section, []):
+                if (section, json.dumps(item, sort_keys=True, ensure_ascii=False)) not in emitted:
+                    yield section, item
+        
+        await self.cache.astore(cache_key, result, cache_mode, model=self.llm_fast.model, prompt_version=self.prompt_version)
+        yield "result", result
+    
+    async def _acached_fast(self, input_text: str, cache_mode: str = None) -> Dict[str, Any]:
+        """Fast analysis (async) qua result cache - raise exception nếu LLM call lỗi"""
+        self._refresh_chains()
+        cache_key = make_cache_key(input_text, "fast", self.llm_fast.model, self.prompt_version)
+        cached = await self.cache.alookup(cache_key, cache_mode)
+        if cached is not None:
+            logger.info("FAST analysis served from cache")
+            return cached
+        
+        logger.info(f"Starting FAST async analysis (single API call) for text length: {len(input_text)} chars")
+        chain = self.fast_chain
+        pre = self._pre_analyze(input_text)
+        with memo_usage(cache_mode):
+            plan = await asyncio.to_thread(self._fast_memo_plan, input_text, pre)
             
-            return {
-                "conflicts": conflicts,
-                "ambiguities": ambiguities,
-                "suggestions": suggestions
-            }
-
+            result_text = await chain.ainvoke({"input_text": plan.annotate(pre.annotate(input_text))})
+            result, report = self._normalize_fast_output(result_text)
+            if self._memoizable(report, result):
+                await self.memo.astore(KIND_FAST, plan.verdicts(result), self.model, self._prompt_versions.get("analyze_all", ""))
+        result = pre.merge(plan.merge(result))
+        
+        await self.cache.astore(cache_key, result, cache_mode, model=self.llm_fast.model, prompt_version=self.prompt_version)
+        return result
+    
+    async def _adetect_conflicts(self, requirements: List[str], records: Optional[List[Dict[str, Any]]] = None) -> List[Dict]:
+        """
+        Chạy conflict prompt (async) trên một danh sách requirement (pruning theo cặp nếu lớn)
+        Nhiều requirement: model trả về cặp ID, conflict được mở rộng lại thành text (compact schema)
+        """
+        table = RequirementTable(requirements, records) if use_compact(len(requirements)) else None
+        # Embedding chạy trên CPU - không block event loop
+        inputs = await asyncio.to_thread(build_conflict_inputs, requirements, labels=table.ids if table else None)
+        
+        chain = self.conflict_compact_chain if table else self.conflict_chain
+        
+        results = await chain.abatch(
+            [{"parsed_requirements": text} for text in inputs],
+            config={"max_concurrency": CONFLICT_PAIR_PARALLELISM}
+        )
+        return merge_results([
+            {"conflicts": self._expand(table, "conflicts", self._parse_json_response(result, "conflicts"))}
+            for result in results
+        ])["conflicts"]
+    
+    async def _aconflict_prompt(self, requirements_text: str) -> List[Dict]:
+        """Một conflict prompt trên input đã format sẵn (danh sách requirement hoặc batch cặp ứng viên)"""
+        result = await self.conflict_chain.ainvoke({"parsed_requirements": requirements_text})
+        return self._parse_json_response(result, "conflicts")
+    
+    @staticmethod
+    def _expand(table: Optional[RequirementTable], section: str, items: List[Dict]) -> List[Dict]:
+        """Output compact -> schema gốc (không đổi nếu call dùng schema gốc)"""
+        return table.expand(section, items) if table else items
+    
+    def _pre_analyze(self, input_text: str) -> RulePreAnalysis:
+        """Rule-based ambiguity pre-analysis cho fast path (rỗng nếu rules bị tắt)"""
+        if not self.ambiguity_rules:
+            return RulePreAnalysis()
+        pre = self.ambiguity_rules.analyze(input_text)
+        if pre.settled:
+            logger.info(f"Rules flagged {len(pre.settled)} ambiguous requirements locally")
+        return pre
+    
+    def _fast_memo_plan(self, input_text: str, pre: RulePreAnalysis) -> FastMemoPlan:
+        """Verdict đã memo của fast path cho các requirement rule chưa kết luận"""
+        requirements = pre.unsettled if self.ambiguity_rules else split_requirements(input_text)
+        version = self._prompt_versions.get("analyze_all", "")
+        return FastMemoPlan(requirements, self.memo.lookup(KIND_FAST, requirements, self.model, version))
+    
+    def _normalize_fast_output(self, result_text: str) -> Tuple[Dict[str, Any], ExtractionReport]:
+        """
+        Parse raw LLM output của fast analysis thành dict conflicts/ambiguities/suggestions,
+        kèm ExtractionReport (output có phải salvage / thiếu section không)
+        """
+        result, report = extract_findings(result_text)
+        self._log_extraction(report)
+        
+        # Ensure all keys exist
+        if not isinstance(result, dict):
+            result = self._empty_result()
+        
+        # Normalize to expected format
+        normalized_result = {
+            "conflicts": result.get("conflicts", []),
+            "ambiguities": result.get("ambiguities", []),
+            "suggestions": result.get("suggestions", [])
+        }
+        
+        logger.info(f"FAST analysis completed: {len(normalized_result.get('conflicts', []))} conflicts, "
+                   f"{len(normalized_result.get('ambiguities', []))} ambiguities, "
+                   f"{len(normalized_result.get('suggestions', []))} suggestions")
+        
+        return normalized_result, report
+    
+    @staticmethod
+    def _empty_result() -> Dict[str, Any]:
+        """Empty analysis result"""
+        return {
+            "conflicts": [],
+            "ambiguities": [],
+            "suggestions": []
+        }
@@ -0,0 +1,304 @@
+"""
+LLM backend có thể thay thế: live (Gemini), record (gọi Gemini + ghi cassette), replay (offline)
+
+Chọn bằng LLM_BACKEND:
+- live: ChatGoogleGenerativeAI như bình thường
+- record: gọi Gemini và ghi (model, prompt) -> response + latency vào cassette
+- replay: trả response từ cassette, không cần network / API key, với latency giả lập:
+    LLM_REPLAY_LATENCY = recorded | fixed:<s> | uniform:<min>,<max> | lognormal:<median>,<sigma>
+    LLM_REPLAY_TOKENS_PER_SECOND = tốc độ sinh token output (0 = trả hết một lần)
+  recorded dùng latency đã ghi; các distribution khác là time-to-first-token, cộng thêm
+  output_tokens / tokens_per_second.
+
+Cassette là file JSONL (LLM_CASSETTE_DIR/LLM_CASSETTE.jsonl), mỗi dòng một response.
+Prompt không có trong cassette khi replay: LLM_REPLAY_MISSING=error raise
+CassetteMissError, =synthetic trả một response rỗng hợp lệ (dùng cho benchmark).
+"""
+
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_google_genai import ChatGoogleGenerativeAI
+from app.utils.logger import logger
+
+BACKEND_LIVE = "live"
+BACKEND_RECORD = "record"
+BACKEND_REPLAY = "replay"
+BACKENDS = (BACKEND_LIVE, BACKEND_RECORD, BACKEND_REPLAY)
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", BACKEND_LIVE).lower()
+LLM_CASSETTE_DIR = Path(os.getenv("LLM_CASSETTE_DIR", str(Path(__file__).resolve().parents[2] / "cassettes")))
+LLM_CASSETTE = os.getenv("LLM_CASSETTE", "default")
+LLM_REPLAY_MISSING = os.getenv("LLM_REPLAY_MISSING", "error").lower()
+LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "recorded")
+LLM_REPLAY_TOKENS_PER_SECOND = float(os.getenv("LLM_REPLAY_TOKENS_PER_SECOND", "0"))
+LLM_REPLAY_SEED = os.getenv("LLM_REPLAY_SEED")
+
+# Response khi replay không có trong cassette (LLM_REPLAY_MISSING=synthetic)
+SYNTHETIC_RESPONSE = json.dumps({"conflicts": [], "ambiguities": [], "suggestions": []})
+
+_CHARS_PER_TOKEN = 4
+# Số ký tự mỗi chunk khi replay stream
+_STREAM_CHUNK_CHARS = 64
+
+
+class CassetteMissError(LookupError):
+    """Prompt không có trong cassette (replay mode)"""
+    code = 404  # Không retry (xem resilience.is_retryable)
+
+
+def backend_mode() -> str:
+    if LLM_BACKEND not in BACKENDS:
+        raise ValueError(f"Unsupported LLM_BACKEND: {LLM_BACKEND}. Supported: {', '.join(BACKENDS)}")
+    return LLM_BACKEND
+
+
+def requires_api_key() -> bool:
+    """Replay chạy offline nên không cần GEMINI_API_KEY"""
+    return backend_mode() != BACKEND_REPLAY
+
+
+def _message_text(message: BaseMessage) -> str:
+    return message.content if isinstance(message.content, str) else message.text
+
+
+def _prompt_text(messages: List[BaseMessage]) -> str:
+    return "\n".join(_message_text(message) for message in messages)
+
+
+class Cassette:
+    """Response đã ghi, key theo (model, prompt); append-only JSONL"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry
+
+    @staticmethod
+    def key(model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, prompt: str) -> Optional[dict]:
+        return self._entries.get(self.key(model, prompt))
+
+    def record(self, model: str, prompt: str, response: str, latency_seconds: float) -> None:
+        entry = {
+            "key": self.key(model, prompt),
+            "model": model,
+            "prompt_chars": len(prompt),
+            "response": response,
+            "latency_seconds": round(latency_seconds, 3),
+            "recorded_at": datetime.now().isoformat()
+        }
+        with self._lock:
+            self._entries[entry["key"]] = entry
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@dataclass
+class LatencyModel:
+    """Latency giả lập khi replay: time-to-first-token + thời gian sinh token output"""
+    distribution: str = "recorded"
+    params: Tuple[float, ...] = ()
+    tokens_per_second: float = 0.0
+    seed: Optional[int] = None
+    _rng: random.Random = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+        expected = {"recorded": 0, "fixed": 1, "uniform": 2, "lognormal": 2}
+        if self.distribution not in expected:
+            raise ValueError(f"Unsupported latency distribution: {self.distribution}. "
+                             f"Supported: {', '.join(expected)}")
+        if len(self.params) != expected[self.distribution]:
+            raise ValueError(f"Latency distribution {self.distribution} needs {expected[self.distribution]} parameters")
+
+    @classmethod
+    def parse(cls, spec: str, tokens_per_second: float = 0.0, seed: Optional[int] = None) -> "LatencyModel":
+        """Parse spec, vd: lognormal:1.5,0.4 / fixed:2 / recorded"""
+        name, _, args = spec.strip().partition(":")
+        params = tuple(float(value) for value in args.split(",") if value.strip())
+        return cls(name.strip().lower(), params, tokens_per_second, seed)
+
+    @classmethod
+    def from_env(cls) -> "LatencyModel":
+        seed = int(LLM_REPLAY_SEED) if LLM_REPLAY_SEED else None
+        return cls.parse(LLM_REPLAY_LATENCY, LLM_REPLAY_TOKENS_PER_SECOND, seed)
+
+    def first_token(self, recorded: Optional[float]) -> float:
+        if self.distribution == "recorded":
+            return recorded or 0.0
+        if self.distribution == "fixed":
+            return self.params[0]
+        if self.distribution == "uniform":
+            return self._rng.uniform(*self.params)
+        median, sigma = self.params
+        return self._rng.lognormvariate(math.log(max(median, 1e-6)), sigma)
+
+    def per_token(self) -> float:
+        """Thời gian sinh một token output (0 với recorded - latency đã ghi gồm cả phần này)"""
+        if self.distribution == "recorded" or self.tokens_per_second <= 0:
+            return 0.0
+        return 1.0 / self.tokens_per_second
+
+    def total(self, output_chars: int, recorded: Optional[float]) -> float:
+        return self.first_token(recorded) + self.per_token() * output_chars / _CHARS_PER_TOKEN
+
+
+class ReplayChatModel(BaseChatModel):
+    """Chat model trả response từ cassette với latency giả lập (không gọi network)"""
+
+    model: str
+    cassette: Any
+    latency: Any
+    missing: str = "error"
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette-replay"
+
+    def _respond(self, messages: List[BaseMessage]) -> Tuple[str, Optional[float]]:
+        return replay_response(self.cassette, self.model, _prompt_text(messages), self.missing)
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text, recorded = self._respond(messages)
+        time.sleep(self.latency.total(len(text), recorded))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text, recorded = self._respond(messages)
+        await asyncio.sleep(self.latency.total(len(text), recorded))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _astream(
+        self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        text, recorded = self._respond(messages)
+        await asyncio.sleep(self.latency.first_token(recorded))
+        chunk_delay = self.latency.per_token() * _STREAM_CHUNK_CHARS / _CHARS_PER_TOKEN
+        for start in range(0, len(text), _STREAM_CHUNK_CHARS):
+            if start and chunk_delay:
+                await asyncio.sleep(chunk_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text[start:start + _STREAM_CHUNK_CHARS]))
+
+
+class RecordingChatModel(BaseChatModel):
+    """Gọi chat model thật và ghi mọi response vào cassette"""
+
+    model: str
+    inner: Any
+    cassette: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette-record"
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        start = time.monotonic()
+        message = self.inner.invoke(messages)
+        self.cassette.record(self.model, _prompt_text(messages), _message_text(message), time.monotonic() - start)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=_message_text(message)))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        start = time.monotonic()
+        message = await self.inner.ainvoke(messages)
+        self.cassette.record(self.model, _prompt_text(messages), _message_text(message), time.monotonic() - start)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=_message_text(message)))])
+
+    async def _astream(
+        self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        start = time.monotonic()
+        parts = []
+        async for chunk in self.inner.astream(messages):
+            text = _message_text(chunk)
+            parts.append(text)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+        self.cassette.record(self.model, _prompt_text(messages), "".join(parts), time.monotonic() - start)
+
+
+def replay_response(cassette: Cassette, model: str, prompt: str, missing: str = LLM_REPLAY_MISSING) -> Tuple[str, Optional[float]]:
+    """(response, latency đã ghi) của prompt; raise CassetteMissError nếu không có và missing=error"""
+    entry = cassette.get(model, prompt)
+    if entry is not None:
+        return entry["response"], entry.get("latency_seconds")
+    if missing == "synthetic":
+        return SYNTHETIC_RESPONSE, None
+    raise CassetteMissError(f"No recorded response for this prompt ({model}) in cassette {cassette.path}")
+
+
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+_latency_model: Optional[LatencyModel] = None
+
+
+def get_cassette(name: Optional[str] = None) -> Cassette:
+    """Get or create cassette theo tên (mặc định LLM_CASSETTE)"""
+    name = name or LLM_CASSETTE
+    with _cassettes_lock:
+        if name not in _cassettes:
+            _cassettes[name] = Cassette(LLM_CASSETTE_DIR / f"{name}.jsonl")
+            logger.info(f"LLM cassette {name}: {len(_cassettes[name])} recorded responses")
+        return _cassettes[name]
+
+
+def get_latency_model() -> LatencyModel:
+    """Latency model dùng chung (một RNG cho cả process để seed cho kết quả lặp lại được)"""
+    global _latency_model
+    with _cassettes_lock:
+        if _latency_model is None:
+            _latency_model = LatencyModel.from_env()
+        return _latency_model
+
+
+def create_chat_model(api_key: Optional[str], model: str, timeout: float) -> BaseChatModel:
+    """Chat model cho agent theo LLM_BACKEND (client live không tự retry - xem resilience)"""
+    mode = backend_mode()
+    if mode == BACKEND_REPLAY:
+        return ReplayChatModel(model=model, cassette=get_cassette(), latency=get_latency_model(), missing=LLM_REPLAY_MISSING)
+    live = ChatGoogleGenerativeAI(google_api_key=api_key, model=model, timeout=timeout, max_retries=0)
+    if mode == BACKEND_RECORD:
+        return RecordingChatModel(model=model, inner=live, cassette=get_cassette())
+    return live
+
+
+def complete(model: str, prompt: str, live_call: Callable[[], str]) -> str:
+    """
+    Một completion sync theo LLM_BACKEND cho code gọi SDK trực tiếp (analyzer.py)
+
+    Args:
+        live_call: Gọi model thật, trả về text (dùng ở live và record mode)
+    """
+    mode = backend_mode()
+    if mode == BACKEND_REPLAY:
+        text, recorded = replay_response(get_cassette(), model, prompt)
+        time.sleep(get_latency_model().total(len(text), recorded))
+        return text
+    start = time.monotonic()
+    text = live_call()
+    if mode == BACKEND_RECORD:
+        get_cassette().record(model, prompt, text, time.monotonic() - start)
+    return text
@@ -0,0 +1,170 @@
+"""
+Local CPU inference cho các bước nhẹ của pipeline (parse, phân loại đơn giản)
+
+Tách requirement không cần một round trip Gemini: text được tách thành các unit ứng viên
+(segment_requirements) và một model nhỏ trên CPU (zero-shot classifier của transformers)
+lọc bỏ các dòng không phải requirement (tiêu đề, ghi chú, lời dẫn). Model load một lần,
+inference chạy theo batch trong thread pool riêng nên không block event loop.
+
+Backend chọn theo node qua NODE_BACKENDS, vd: "parse=local" (mặc định) hoặc "parse=llm".
+Không cài transformers / không tải được model: bước lọc bị bỏ qua và parse vẫn chạy
+local bằng segmentation thuần Python.
+"""
+
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+from app.utils.logger import logger
+from app.utils.requirements_text import RequirementRecord, segment_requirements
+
+BACKEND_LLM = "llm"
+BACKEND_LOCAL = "local"
+
+# "node=backend,..." - node không có trong danh sách dùng LLM
+NODE_BACKENDS = os.getenv("NODE_BACKENDS", "parse=local")
+LOCAL_CLASSIFIER_MODEL = os.getenv("LOCAL_CLASSIFIER_MODEL", "typeform/distilbert-base-uncased-mnli")
+# "auto" = dùng classifier nếu transformers có sẵn, "off" = chỉ segmentation
+LOCAL_CLASSIFIER = os.getenv("LOCAL_CLASSIFIER", "auto").lower()
+LOCAL_INFERENCE_BATCH_SIZE = int(os.getenv("LOCAL_INFERENCE_BATCH_SIZE", "32"))
+LOCAL_INFERENCE_WORKERS = int(os.getenv("LOCAL_INFERENCE_WORKERS", "2"))
+# Unit chỉ bị bỏ khi classifier chắc chắn nó không phải requirement
+LOCAL_PARSE_DROP_CONFIDENCE = float(os.getenv("LOCAL_PARSE_DROP_CONFIDENCE", "0.8"))
+
+REQUIREMENT_LABEL = "software requirement"
+NON_REQUIREMENT_LABEL = "heading, title or explanatory note"
+
+
+def parse_node_backends(spec: str) -> Dict[str, str]:
+    """"parse=local, ambiguity=llm" -> {"parse": "local", "ambiguity": "llm"}"""
+    backends = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        node, backend = (part.strip().lower() for part in item.split("=", 1))
+        if backend not in (BACKEND_LLM, BACKEND_LOCAL):
+            raise ValueError(f"Unknown backend '{backend}' for node '{node}' (expected llm or local)")
+        backends[node] = backend
+    return backends
+
+
+_node_backends = parse_node_backends(NODE_BACKENDS)
+
+
+def node_backend(node: str) -> str:
+    """Backend được cấu hình cho node (mặc định: LLM)"""
+    return _node_backends.get(node, BACKEND_LLM)
+
+
+class LocalClassifier:
+    """
+    Zero-shot text classifier trên CPU, load lazily một lần cho cả process
+
+    Usage:
+        classifier = get_local_classifier()
+        labels = await classifier.aclassify(texts, ["requirement", "note"])  # [(label, score), ...]
+    """
+
+    def __init__(
+        self,
+        model_name: str = LOCAL_CLASSIFIER_MODEL,
+        batch_size: int = LOCAL_INFERENCE_BATCH_SIZE,
+        workers: int = LOCAL_INFERENCE_WORKERS,
+        enabled: bool = LOCAL_CLASSIFIER == "auto"
+    ):
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.enabled = enabled
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="local-inference")
+        self._lock = threading.Lock()
+        self._pipeline = None
+        self._failed = False
+        self._stats = {"batches": 0, "texts": 0}
+
+    @property
+    def available(self) -> bool:
+        return self._load() is not None
+
+    def _load(self):
+        """Load pipeline một lần (None nếu bị tắt / thiếu package / không tải được model)"""
+        if not self.enabled or self._failed:
+            return None
+        with self._lock:
+            if self._pipeline is None and not self._failed:
+                try:
+                    from transformers import pipeline
+                    self._pipeline = pipeline("zero-shot-classification", model=self.model_name, device=-1)
+                    logger.info(f"Loaded local classifier {self.model_name} on CPU")
+                except Exception as e:
+                    self._failed = True
+                    logger.info(f"Local classifier unavailable ({str(e)}) - using segmentation only")
+            return self._pipeline
+
+    def classify(self, texts: Sequence[str], labels: Sequence[str]) -> Optional[List[Tuple[str, float]]]:
+        """Label có score cao nhất của từng text (None nếu classifier không có)"""
+        classifier = self._load()
+        if classifier is None:
+            return None
+        results: List[Tuple[str, float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = list(texts[start:start + self.batch_size])
+            outputs = classifier(batch, candidate_labels=list(labels), batch_size=self.batch_size)
+            if isinstance(outputs, dict):
+                outputs = [outputs]
+            results.extend((output["labels"][0], float(output["scores"][0])) for output in outputs)
+            self._stats["batches"] += 1
+            self._stats["texts"] += len(batch)
+        return results
+
+    async def aclassify(self, texts: Sequence[str], labels: Sequence[str]) -> Optional[List[Tuple[str, float]]]:
+        """classify trong inference thread pool (không block event loop)"""
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.classify, texts, labels)
+
+    def get_stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "loaded": self._pipeline is not None,
+            "failed": self._failed,
+            **self._stats
+        }
+
+
+class LocalParser:
+    """ParseNode không cần LLM: segmentation + lọc unit không phải requirement bằng classifier"""
+
+    def __init__(self, classifier: Optional[LocalClassifier] = None, drop_confidence: float = LOCAL_PARSE_DROP_CONFIDENCE):
+        self.classifier = classifier or get_local_classifier()
+        self.drop_confidence = drop_confidence
+
+    async def asegment(self, text: str) -> List[RequirementRecord]:
+        """Requirement record (ID + offset) sau khi lọc"""
+        candidates = segment_requirements(text)
+        if not candidates:
+            return []
+        labels = await self.classifier.aclassify([record.text for record in candidates], (REQUIREMENT_LABEL, NON_REQUIREMENT_LABEL))
+        if labels is None:
+            return candidates
+        # Bỏ sót requirement tệ hơn giữ thừa một dòng: chỉ bỏ unit classifier rất chắc chắn.
+        # Record có ID trong text luôn được giữ.
+        return [
+            record for record, (label, score) in zip(candidates, labels)
+            if record.explicit_id or label == REQUIREMENT_LABEL or score < self.drop_confidence
+        ]
+
+    async def aparse(self, text: str) -> List[str]:
+        return [record.text for record in await self.asegment(text)]
+
+
+_local_classifier: Optional[LocalClassifier] = None
+
+
+def get_local_classifier() -> LocalClassifier:
+    """Get or create local classifier instance (model load lazily ở lần classify đầu tiên)"""
+    global _local_classifier
+    if _local_classifier is None:
+        _local_classifier = LocalClassifier()
+    return _local_classifier
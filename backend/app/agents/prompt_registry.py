@@ -0,0 +1,172 @@
+"""
+Registry cho prompt files của agent (hot-reload, versioned)
+
+Prompt được load một lần thành một PromptSet bất biến, có version là content hash.
+Registry kiểm tra thư mục prompts (mtime / size, tối đa một lần mỗi
+PROMPT_RELOAD_INTERVAL giây) và swap sang PromptSet mới khi file thay đổi - không cần
+restart process, agent warm trong ModelPool chỉ compile lại chains của nó một lần.
+Bộ prompt lỗi (thiếu file, template không hợp lệ) bị bỏ qua, version cũ vẫn được dùng.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+from langchain_core.prompts import PromptTemplate
+from app.utils.logger import logger
+
+DEFAULT_PROMPTS_DIR = Path(__file__).parent / "prompts"
+PROMPTS_DIR = Path(os.getenv("PROMPTS_DIR", str(DEFAULT_PROMPTS_DIR)))
+# Khoảng thời gian tối thiểu giữa 2 lần kiểm tra thư mục prompts (0 = tắt hot reload)
+PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", "2"))
+
+# Tên prompt -> file
+PROMPT_FILES: Dict[str, str] = {
+    "parse": "parse_requirements.txt",
+    "conflict": "detect_conflict.txt",
+    "ambiguity": "check_ambiguity.txt",
+    "improve": "suggest_improve.txt",
+    "analyze_all": "analyze_all_in_one.txt",
+}
+
+
+def content_hash(*parts: str) -> str:
+    """sha256 rút gọn của các đoạn text (dùng làm version)"""
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass(frozen=True)
+class PromptSet:
+    """Một phiên bản bất biến của toàn bộ prompt"""
+    texts: Dict[str, str]
+    versions: Dict[str, str]  # Version của từng prompt
+    version: str  # Version của cả bộ
+    loaded_at: float
+
+    def __getitem__(self, name: str) -> str:
+        return self.texts[name]
+
+
+class PromptRegistry:
+    """
+    Load, version và hot-reload bộ prompt của agent
+
+    Usage:
+        registry = PromptRegistry()
+        prompts = registry.current()   # Kiểm tra thay đổi (throttled) rồi trả về PromptSet
+        prompts["parse"], prompts.version
+    """
+
+    def __init__(
+        self,
+        prompts_dir: Optional[Path] = None,
+        files: Optional[Dict[str, str]] = None,
+        reload_interval: float = PROMPT_RELOAD_INTERVAL,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.prompts_dir = Path(prompts_dir) if prompts_dir is not None else PROMPTS_DIR
+        self.files = dict(files if files is not None else PROMPT_FILES)
+        self.reload_interval = reload_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._fingerprint = self._stat()
+        self._prompts = self._load()  # Raise FileNotFoundError nếu thiếu prompt ở lần load đầu
+        self._last_check = clock()
+        self._reloads = 0
+        self._failed_reloads = 0
+
+    def current(self) -> PromptSet:
+        """PromptSet hiện tại (reload trước nếu file đã đổi và đã tới lúc kiểm tra)"""
+        if self.reload_interval > 0 and self._clock() - self._last_check >= self.reload_interval:
+            self.check_for_updates()
+        return self._prompts
+
+    @property
+    def version(self) -> str:
+        return self.current().version
+
+    def check_for_updates(self) -> bool:
+        """Reload nếu có file thay đổi; True nếu đã swap sang version mới"""
+        with self._lock:
+            self._last_check = self._clock()
+            fingerprint = self._stat()
+            if fingerprint == self._fingerprint:
+                return False
+            self._fingerprint = fingerprint
+            return self._reload_locked()
+
+    def reload(self) -> bool:
+        """Reload ngay (bỏ qua throttle); True nếu version thay đổi"""
+        with self._lock:
+            self._last_check = self._clock()
+            self._fingerprint = self._stat()
+            return self._reload_locked()
+
+    def get_stats(self) -> dict:
+        prompts = self._prompts
+        return {
+            "prompts_dir": str(self.prompts_dir),
+            "version": prompts.version,
+            "prompts": dict(prompts.versions),
+            "reload_interval_seconds": self.reload_interval,
+            "reloads": self._reloads,
+            "failed_reloads": self._failed_reloads
+        }
+
+    def _reload_locked(self) -> bool:
+        try:
+            prompts = self._load()
+        except Exception as e:
+            self._failed_reloads += 1
+            logger.warning(f"Prompt reload failed, keeping version {self._prompts.version}: {str(e)}")
+            return False
+        if prompts.version == self._prompts.version:
+            return False
+        previous = self._prompts
+        changed = [name for name, version in prompts.versions.items() if previous.versions.get(name) != version]
+        self._prompts = prompts  # Swap một reference - reader luôn thấy một bộ prompt trọn vẹn
+        self._reloads += 1
+        logger.info(f"Prompts reloaded: {previous.version} -> {prompts.version} (changed: {', '.join(changed)})")
+        return True
+
+    def _stat(self) -> Tuple:
+        fingerprint = []
+        for name, filename in sorted(self.files.items()):
+            try:
+                stat = (self.prompts_dir / filename).stat()
+                fingerprint.append((name, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                fingerprint.append((name, None, None))
+        return tuple(fingerprint)
+
+    def _load(self) -> PromptSet:
+        texts = {}
+        for name, filename in self.files.items():
+            path = self.prompts_dir / filename
+            if not path.exists():
+                raise FileNotFoundError(f"Prompt file not found: {path}")
+            texts[name] = path.read_text(encoding="utf-8")
+            PromptTemplate.from_template(texts[name])  # Template lỗi -> không swap
+        versions = {name: content_hash(text) for name, text in texts.items()}
+        return PromptSet(
+            texts=texts,
+            versions=versions,
+            version=content_hash(*(f"{name}={versions[name]}" for name in sorted(versions))),
+            loaded_at=time.time()
+        )
+
+
+_prompt_registry: Optional[PromptRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry() -> PromptRegistry:
+    """Get or create prompt registry instance (dùng chung cho mọi agent)"""
+    global _prompt_registry
+    with _registry_lock:
+        if _prompt_registry is None:
+            _prompt_registry = PromptRegistry()
+        return _prompt_registry
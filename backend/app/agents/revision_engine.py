@@ -0,0 +1,259 @@
+"""
+Incremental re-analysis cho document đã được phân tích trước đó
+
+1. Diff: tách requirement của bản cũ và bản mới, phân loại unchanged / changed / added / removed
+2. Gửi LLM: chỉ requirement changed + added, kèm một vài requirement unchanged liên quan
+   (counterpart) để model vẫn thấy được mâu thuẫn giữa phần mới và phần cũ
+3. Carry forward: finding cũ chỉ liên quan tới requirement unchanged được giữ nguyên
+4. Merge: finding cũ được giữ + finding mới liên quan tới requirement thay đổi
+
+Chi phí và latency tỉ lệ với kích thước diff thay vì kích thước document.
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple, TYPE_CHECKING
+from app.agents.chunked_engine import CHUNKED_MIN_CHARS, merge_results
+from app.utils.logger import logger
+from app.utils.requirements_text import (
+    best_match,
+    content_tokens,
+    normalize_key,
+    split_requirements
+)
+
+if TYPE_CHECKING:
+    from app.agents.langgraph_agent import RequirementsAnalysisAgent
+
+# Số requirement unchanged liên quan được gửi kèm mỗi requirement thay đổi
+REVISION_COUNTERPARTS = int(os.getenv("REVISION_COUNTERPARTS", "3"))
+# Ngưỡng similarity để coi requirement mới là bản sửa của requirement cũ
+REVISION_MATCH_THRESHOLD = float(os.getenv("REVISION_MATCH_THRESHOLD", "0.6"))
+# Khi tỉ lệ requirement thay đổi vượt ngưỡng này, phân tích lại toàn bộ document
+REVISION_MAX_CHANGED_RATIO = float(os.getenv("REVISION_MAX_CHANGED_RATIO", "0.6"))
+
+
+@dataclass
+class RequirementDiff:
+    """Kết quả diff 2 phiên bản document ở mức requirement"""
+    unchanged: List[str] = field(default_factory=list)
+    changed: List[Tuple[str, str]] = field(default_factory=list)  # (bản cũ, bản mới)
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+
+    @property
+    def targets(self) -> List[str]:
+        """Requirement cần gửi LLM (bản mới của changed + added)"""
+        return [new for _, new in self.changed] + self.added
+
+    @property
+    def changed_ratio(self) -> float:
+        total = len(self.unchanged) + len(self.changed) + len(self.added)
+        return len(self.targets) / total if total else 0.0
+
+
+def diff_requirements(
+    old_requirements: List[str],
+    new_requirements: List[str],
+    threshold: float = REVISION_MATCH_THRESHOLD
+) -> RequirementDiff:
+    """
+    Diff 2 danh sách requirement
+
+    Requirement trùng sau normalize là unchanged; requirement mới giống một requirement
+    cũ còn lại (>= threshold) là changed; còn lại là added / removed.
+    """
+    diff = RequirementDiff()
+    new_keys = {normalize_key(req) for req in new_requirements}
+    old_keys = {normalize_key(req) for req in old_requirements}
+    remaining_old = [req for req in old_requirements if normalize_key(req) not in new_keys]
+
+    for req in new_requirements:
+        if normalize_key(req) in old_keys:
+            diff.unchanged.append(req)
+            continue
+        index = best_match(req, remaining_old, threshold)
+        if index is None:
+            diff.added.append(req)
+        else:
+            diff.changed.append((remaining_old.pop(index), req))
+    diff.removed = remaining_old
+    return diff
+
+
+def _finding_refs(section: str, item: Dict[str, Any]) -> List[str]:
+    """Các requirement mà một finding tham chiếu tới"""
+    if section == "conflicts":
+        return [item.get("req1", ""), item.get("req2", "")]
+    return [item.get("req", "")]
+
+
+def find_counterparts(
+    diff: RequirementDiff,
+    previous_result: Dict[str, Any],
+    limit: int = REVISION_COUNTERPARTS
+) -> List[str]:
+    """
+    Requirement unchanged có khả năng liên quan tới phần thay đổi
+
+    - Requirement từng conflict với bản cũ của một requirement changed
+    - `limit` requirement unchanged có nhiều từ chung nhất với mỗi requirement thay đổi
+    """
+    selected: List[str] = []
+    seen: Set[str] = set()
+
+    def add(req: str):
+        key = normalize_key(req)
+        if key not in seen:
+            seen.add(key)
+            selected.append(req)
+
+    old_versions = [old for old, _ in diff.changed]
+    for conflict in previous_result.get("conflicts", []) or []:
+        if not isinstance(conflict, dict):
+            continue
+        req1, req2 = conflict.get("req1", ""), conflict.get("req2", "")
+        for ref, other in ((req1, req2), (req2, req1)):
+            if best_match(ref, old_versions) is not None:
+                index = best_match(other, diff.unchanged)
+                if index is not None:
+                    add(diff.unchanged[index])
+
+    unchanged_tokens = [(req, content_tokens(req)) for req in diff.unchanged]
+    for target in diff.targets:
+        tokens = content_tokens(target)
+        if not tokens:
+            continue
+        scored = []
+        for req, req_tokens in unchanged_tokens:
+            overlap = len(tokens & req_tokens)
+            if overlap:
+                scored.append((overlap / len(tokens | req_tokens), req))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        for _, req in scored[:limit]:
+            add(req)
+    return selected
+
+
+def carry_forward(
+    previous_result: Dict[str, Any],
+    old_requirements: List[str],
+    diff: RequirementDiff,
+    input_text: str
+) -> Dict[str, List[Dict]]:
+    """
+    Giữ lại finding cũ chỉ liên quan tới requirement unchanged
+
+    Requirement mà finding tham chiếu được khớp với requirement của bản cũ; nếu không khớp
+    được (LLM diễn đạt lại), finding chỉ được giữ khi text đó vẫn còn nguyên trong bản mới.
+    """
+    unchanged_keys = {normalize_key(req) for req in diff.unchanged}
+    normalized_text = normalize_key(input_text)
+
+    def is_unchanged(ref: str) -> bool:
+        index = best_match(ref, old_requirements)
+        if index is not None:
+            return normalize_key(old_requirements[index]) in unchanged_keys
+        key = normalize_key(ref)
+        return bool(key) and key in normalized_text
+
+    carried: Dict[str, List[Dict]] = {"conflicts": [], "ambiguities": [], "suggestions": []}
+    for section in carried:
+        for item in previous_result.get(section, []) or []:
+            if isinstance(item, dict) and all(is_unchanged(ref) for ref in _finding_refs(section, item)):
+                carried[section].append(item)
+    return carried
+
+
+def _touches_targets(section: str, item: Dict[str, Any], targets: List[str], counterparts: List[str]) -> bool:
+    """Finding mới có liên quan tới ít nhất một requirement thay đổi không"""
+    candidates = targets + counterparts
+    for ref in _finding_refs(section, item):
+        index = best_match(ref, candidates)
+        if index is None or index < len(targets):
+            return True  # Khớp requirement thay đổi, hoặc không rõ requirement nào -> giữ lại
+    return False
+
+
+class RevisionAnalysisEngine:
+    """
+    Incremental analysis chạy trên một RequirementsAnalysisAgent
+
+    Subset gửi cho LLM đi qua fast path (có result cache), nên cùng một bản sửa
+    được phân tích lại sẽ không gọi LLM lần nữa.
+    """
+
+    def __init__(
+        self,
+        agent: "RequirementsAnalysisAgent",
+        counterparts: int = REVISION_COUNTERPARTS,
+        max_changed_ratio: float = REVISION_MAX_CHANGED_RATIO
+    ):
+        self.agent = agent
+        self.counterparts = counterparts
+        self.max_changed_ratio = max_changed_ratio
+
+    async def aanalyze(
+        self,
+        previous_text: str,
+        previous_result: Dict[str, Any],
+        input_text: str,
+        cache_mode: str = None
+    ) -> Dict[str, Any]:
+        """
+        Phân tích bản mới của document dựa trên kết quả của bản trước
+
+        Args:
+            previous_text: Text của bản đã phân tích
+            previous_result: Kết quả của bản đó (conflicts, ambiguities, suggestions)
+            input_text: Text bản mới
+            cache_mode: None, "bypass" hoặc "refresh"
+
+        Returns:
+            Dict với keys: conflicts, ambiguities, suggestions, revision (thống kê diff)
+        """
+        old_requirements = split_requirements(previous_text)
+        diff = diff_requirements(old_requirements, split_requirements(input_text))
+        stats = {
+            "mode": "incremental",
+            "unchanged": len(diff.unchanged),
+            "changed": len(diff.changed),
+            "added": len(diff.added),
+            "removed": len(diff.removed),
+            "sent_requirements": 0,
+            "carried_forward": 0
+        }
+
+        if diff.changed_ratio > self.max_changed_ratio:
+            logger.info(f"Revision changes {diff.changed_ratio:.0%} of requirements - running full analysis")
+            result = await self._analyze_text(input_text, cache_mode)
+            stats.update(mode="full", sent_requirements=len(diff.unchanged) + len(diff.targets))
+            return {**result, "revision": stats}
+
+        carried = carry_forward(previous_result, old_requirements, diff, input_text)
+        stats["carried_forward"] = sum(len(items) for items in carried.values())
+
+        targets = diff.targets
+        if not targets:
+            logger.info("Revision has no added or changed requirements - reusing previous findings")
+            return {**carried, "revision": stats}
+
+        counterparts = find_counterparts(diff, previous_result, self.counterparts)
+        stats["sent_requirements"] = len(targets) + len(counterparts)
+        logger.info(f"Incremental analysis: {len(targets)} changed/added requirements, "
+                    f"{len(counterparts)} counterparts, {len(diff.unchanged)} unchanged")
+
+        result = await self._analyze_text("\n".join(counterparts + targets), cache_mode)
+        fresh = {
+            section: [
+                item for item in result.get(section, []) or []
+                if isinstance(item, dict) and _touches_targets(section, item, targets, counterparts)
+            ]
+            for section in ("conflicts", "ambiguities", "suggestions")
+        }
+        return {**merge_results([fresh, carried]), "revision": stats}
+
+    async def _analyze_text(self, text: str, cache_mode: Optional[str]) -> Dict[str, Any]:
+        if len(text) >= CHUNKED_MIN_CHARS:
+            return await self.agent.aanalyze_chunked(text, cache_mode=cache_mode)
+        return await self.agent._acached_fast(text, cache_mode)
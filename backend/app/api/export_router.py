@@ -21,7 +21,7 @@ router = APIRouter(prefix="/api/export", tags=["Export"])
 
 
 @router.get("/json/{analysis_id}")
-async def export_json(
+def export_json(
     analysis_id: int,
     db: Session = Depends(get_db)
 ):
@@ -70,7 +70,7 @@ async def export_json(
 
 
 @router.get("/docx/{analysis_id}")
-async def export_docx(
+def export_docx(
     analysis_id: int,
     db: Session = Depends(get_db)
 ):
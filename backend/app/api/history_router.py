@@ -44,7 +44,7 @@ class HistoryListResponse(BaseModel):
 
 
 @router.get("", response_model=HistoryListResponse)
-async def get_history(
+def get_history(
     limit: int = Query(50, ge=1, le=100),
     offset: int = Query(0, ge=0),
     order_by: str = Query("desc", regex="^(asc|desc)$"),
@@ -74,7 +74,7 @@ async def get_history(
 
 
 @router.get("/{analysis_id}", response_model=AnalysisHistoryResponse)
-async def get_history_by_id(
+def get_history_by_id(
     analysis_id: int,
     db: Session = Depends(get_db)
 ):
@@ -96,7 +96,7 @@ async def get_history_by_id(
 
 
 @router.delete("/{analysis_id}")
-async def delete_history(
+def delete_history(
     analysis_id: int,
     db: Session = Depends(get_db)
 ):
@@ -120,7 +120,7 @@ async def delete_history(
 
 
 @router.get("/search", response_model=List[AnalysisHistoryResponse])
-async def search_history(
+def search_history(
     q: str = Query(..., min_length=1, description="Search query"),
     limit: int = Query(50, ge=1, le=100),
     db: Session = Depends(get_db)
@@ -0,0 +1,123 @@
+"""
+API endpoints cho analysis jobs (bất đồng bộ)
+
+Client submit job, nhận job id ngay lập tức, sau đó poll GET /api/jobs/{id}.
+HTTP latency không còn phụ thuộc vào LLM latency.
+"""
+
+import os
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from typing import List, Optional
+from app.services.analysis_cache import CACHE_BYPASS, CACHE_REFRESH
+from app.services.model_pool import get_model_pool, UnsupportedModelError
+from app.services.job_service import get_job_manager, FINAL_STATUSES, STATUS_CANCELLED
+from app.utils.file_handler import extract_text_from_file, save_uploaded_file, cleanup_file
+from app.utils.logger import logger
+
+router = APIRouter(prefix="/api/jobs", tags=["Jobs"])
+
+
+class JobResult(BaseModel):
+    """Kết quả của job đã xong"""
+    conflicts: List[dict]
+    ambiguities: List[dict]
+    suggestions: List[dict]
+
+
+class JobResponse(BaseModel):
+    """Response model cho job"""
+    id: str
+    status: str  # queued / running / succeeded / failed / cancelled
+    progress: int  # 0-100
+    file_name: Optional[str] = None
+    model_used: Optional[str] = None
+    result: Optional[JobResult] = None
+    error: Optional[str] = None
+    analysis_id: Optional[int] = None
+    created_at: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+
+@router.post("/analyze", response_model=JobResponse, status_code=202)
+async def submit_analysis_job(
+    text: Optional[str] = Form(None),
+    file: Optional[UploadFile] = File(None),
+    model: str = Form("gemini-2.5-flash"),
+    cache: Optional[str] = Form(None)
+):
+    """
+    Tạo job phân tích từ text hoặc file (.txt, .docx)
+
+    - **text**: Nội dung SRS/User Stories (nếu không upload file)
+    - **file**: File .txt hoặc .docx
+    - **model**: Model Gemini để sử dụng
+    - **cache**: "bypass" hoặc "refresh" (mặc định: dùng result cache)
+
+    Returns job id và trạng thái "queued"; poll GET /api/jobs/{id} để lấy kết quả
+    """
+    if cache and cache not in (CACHE_BYPASS, CACHE_REFRESH):
+        raise HTTPException(status_code=400, detail=f"Invalid cache option: {cache}. Supported: bypass, refresh")
+    try:
+        model = get_model_pool().resolve(model)
+    except UnsupportedModelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    file_name = None
+    if file is not None and file.filename:
+        file_ext = os.path.splitext(file.filename)[1].lower()
+        if file_ext not in ['.txt', '.docx']:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported file type: {file_ext}. Supported types: .txt, .docx"
+            )
+        # Extract text ngay khi submit để job có thể recover sau restart mà không cần file tạm
+        saved_file_path = await run_in_threadpool(save_uploaded_file, file)
+        try:
+            text = await run_in_threadpool(extract_text_from_file, saved_file_path)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        finally:
+            await run_in_threadpool(cleanup_file, saved_file_path)
+        file_name = file.filename
+
+    if not text or not text.strip():
+        raise HTTPException(status_code=400, detail="Text input or a non-empty file is required")
+
+    job = await get_job_manager().submit(text, file_name=file_name, model=model, cache_mode=cache)
+    return JobResponse(**job)
+
+
+@router.get("/stats")
+async def get_job_stats():
+    """Thống kê worker pool: số worker, queue size, số job theo trạng thái"""
+    return get_job_manager().get_stats()
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """
+    Lấy trạng thái, progress và kết quả (khi đã xong) của job
+    """
+    job = await get_job_manager().get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return JobResponse(**job)
+
+
+@router.delete("/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str):
+    """
+    Hủy job đang đợi hoặc đang chạy
+    """
+    job = await get_job_manager().get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    if job["status"] in FINAL_STATUSES and job["status"] != STATUS_CANCELLED:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} already {job['status']}")
+
+    job = await get_job_manager().cancel(job_id)
+    logger.info(f"Job {job_id} cancel requested")
+    return JobResponse(**job)
@@ -1,30 +1,82 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from app.api.schema import AnalyzeRequest, AnalyzeResponse, ConflictItem, AmbiguityItem, SuggestionItem
-from app.agents.langgraph_agent import RequirementsAnalysisAgent
+from app.api.schema import (
+    AnalyzeRequest,
+    AnalyzeResponse,
+    RevisionAnalyzeRequest,
+    ConflictItem,
+    AmbiguityItem,
+    SuggestionItem,
+    BatchAnalyzeRequest,
+    BatchAnalyzeResponse,
+    BatchDocumentResult
+)
+from app.agents.local_backend import get_local_classifier
+from app.agents.checkpoint_store import RunMismatchError, new_run_id
 from app.utils.file_handler import extract_text_from_file, save_uploaded_file, cleanup_file
 from app.database.db import get_db
-from app.services.history_service import save_analysis
+from app.services.analysis_service import (
+    get_agent,
+    load_analysis,
+    prepare_analysis,
+    resolve_model,
+    resume_mode,
+    run_analysis,
+    run_batch,
+    run_revision_analysis,
+    save_analysis_result,
+    stream_analysis,
+    save_analysis_results,
+    valid_items
+)
+from app.services.analysis_cache import get_analysis_cache, CACHE_BYPASS, CACHE_REFRESH
+from app.agents.prompt_registry import get_prompt_registry
+from app.services.execution_planner import MODES as EXECUTION_MODES, MODE_FULL, get_planner
+from app.services.model_pool import get_model_pool, UnsupportedModelError
+from app.services.requirement_memo import get_requirement_memo
+from app.agents.ambiguity_classifier import (
+    ClassifierTrainingError,
+    ClassifierUnavailableError,
+    get_ambiguity_classifier,
+)
+from app.utils.rate_limiter import get_rate_limiter
+from app.utils.resilience import CircuitOpenError, get_resilience_stats
+from app.utils.text_normalizer import get_input_normalizer
+from app.utils.streaming import (
+    FORMAT_NDJSON,
+    HEARTBEAT,
+    MEDIA_TYPES,
+    STREAM_HEADERS,
+    format_event,
+    format_heartbeat,
+    pick_stream_format,
+    with_heartbeat
+)
 from app.utils.logger import logger
 import os
-from typing import Optional
+from typing import List, Optional, Tuple
 import time
 
 router = APIRouter(prefix="/api", tags=["Analysis"])
 
-# Initialize agent singleton
-_agent: Optional[RequirementsAnalysisAgent] = None
 
-def get_agent() -> RequirementsAnalysisAgent:
-    """Get or create agent instance"""
-    global _agent
-    if _agent is None:
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found in environment variables")
-        _agent = RequirementsAnalysisAgent(api_key=api_key)
-    return _agent
+RUN_ID_HEADER = "X-Analysis-Run-Id"
+
+
+def _circuit_open(error: CircuitOpenError, run_id: Optional[str] = None) -> HTTPException:
+    """503 + Retry-After khi circuit breaker của model đang mở"""
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(max(1, int(error.retry_after))), **(_run_headers(run_id) or {})}
+    )
+
+
+def _run_headers(run_id: Optional[str]) -> Optional[dict]:
+    """Header mang run id của full pipeline bị lỗi - client retry với resume_run_id"""
+    return {RUN_ID_HEADER: run_id} if run_id else None
 
 
 @router.post("/analyze", response_model=AnalyzeResponse)
@@ -41,26 +93,40 @@ async def analyze_requirements(request: AnalyzeRequest):
     
     - **text**: Nội dung SRS/User Stories (text hoặc paste)
     - **model**: Model Gemini để sử dụng (mặc định: gemini-1.5-pro)
+    - **cache**: "bypass" (không dùng cache) hoặc "refresh" (chạy lại và ghi đè cache)
+    - **resume_run_id**: Run id (header X-Analysis-Run-Id của response lỗi) - chạy tiếp full
+      pipeline từ node cuối cùng đã xong thay vì gọi lại mọi LLM call
     
     Returns:
     - conflicts: Danh sách các mâu thuẫn giữa requirements
     - ambiguities: Danh sách các requirement mơ hồ
     - suggestions: Đề xuất cải thiện requirements
+    - run_id: Run id của full pipeline (nếu planner chọn full)
     """
+    run_id = None
     try:
         if not request.text or not request.text.strip():
             raise HTTPException(status_code=400, detail="Text input is required")
         
-        # Get agent instance
-        agent = get_agent()
+        # Get warm agent của model được yêu cầu
+        model = resolve_model(request.model)
+        agent = get_agent(model)
         
-        # Analyze using FAST method (single API call) instead of full pipeline
-        # Giảm thời gian từ 3 phút xuống ~30-60 giây
-        logger.info(f"Starting FAST analysis with model: {request.model}")
+        # Planner chọn fast (single API call) / full pipeline / chunked theo kích thước input
+        # và latency budget; async call: event loop vẫn phục vụ /health, /api/history
+        mode = request.mode
+        if request.resume_run_id:
+            mode = await run_in_threadpool(resume_mode, agent, request.resume_run_id, mode)
+        # Chuẩn hóa / bỏ bản trùng trước: planner tính trên text mà model thực sự nhận
+        prepared = await run_in_threadpool(prepare_analysis, request.text, request.latency_budget_seconds, mode)
+        plan = prepared.plan
+        if plan.mode == MODE_FULL:
+            run_id = request.resume_run_id or new_run_id()
+        logger.info(f"Starting {plan.mode} analysis with model: {model}")
         start_time = time.time()
-        result = agent.analyze_fast(request.text)  # Use fast method instead of full pipeline
+        result = await run_analysis(agent, request.text, request.cache, prepared=prepared, run_id=run_id)
         processing_time = int(time.time() - start_time)
-        logger.info(f"FAST analysis completed in {processing_time} seconds")
+        logger.info(f"{plan.mode} analysis completed in {processing_time} seconds")
         
         # Convert to response model
         conflicts = [ConflictItem(**item) for item in result.get("conflicts", [])]
@@ -69,52 +135,56 @@ async def analyze_requirements(request: AnalyzeRequest):
         
         logger.info(f"Found: {len(conflicts)} conflicts, {len(ambiguities)} ambiguities, {len(suggestions)} suggestions")
         
-        # Lưu vào database (optional, không fail nếu DB không available)
-        analysis_id = None
-        try:
-            from app.database.db import get_engine
-            engine = get_engine()
-            if engine:
-                from app.database.db import SessionLocal
-                db = SessionLocal()
-                try:
-                    saved_analysis = save_analysis(
-                        db=db,
-                        conflicts=[item.dict() for item in conflicts],
-                        ambiguities=[item.dict() for item in ambiguities],
-                        suggestions=[item.dict() for item in suggestions],
-                        text_input=request.text,
-                        file_name=None,
-                        model_used=request.model,
-                        processing_time_seconds=processing_time
-                    )
-                    analysis_id = saved_analysis.id
-                    logger.info(f"Analysis saved to database with ID: {analysis_id}")
-                finally:
-                    db.close()
-        except Exception as e:
-            # Log error nhưng không fail request
-            logger.warning(f"Failed to save to database: {str(e)}")
+        # Lưu vào database trong threadpool (optional, không fail nếu DB không available)
+        analysis_id = await run_in_threadpool(
+            save_analysis_result,
+            conflicts=[item.dict(exclude_none=True) for item in conflicts],
+            ambiguities=[item.dict(exclude_none=True) for item in ambiguities],
+            suggestions=[item.dict(exclude_none=True) for item in suggestions],
+            text_input=request.text,
+            file_name=None,
+            model_used=model,
+            prompt_version=getattr(agent, "prompt_version", None),
+            processing_time_seconds=processing_time,
+            plan=result.get("plan")
+        )
         
         return AnalyzeResponse(
             conflicts=conflicts,
             ambiguities=ambiguities,
             suggestions=suggestions,
-            analysis_id=analysis_id
+            analysis_id=analysis_id,
+            stats={
+                "plan": result.get("plan"),
+                "memo": result.get("memo"),
+                "normalization": result.get("normalization"),
+                "dedup": result.get("dedup")
+            },
+            run_id=run_id
         )
         
+    except UnsupportedModelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RunMismatchError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except CircuitOpenError as e:
+        raise _circuit_open(e, run_id)
     except ValueError as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e), headers=_run_headers(run_id))
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}", headers=_run_headers(run_id))
 
 
 @router.post("/analyze/file", response_model=AnalyzeResponse)
 async def analyze_requirements_from_file(
     file: UploadFile = File(...),
-    model: str = Form("gemini-2.5-flash")
+    model: str = Form("gemini-2.5-flash"),
+    cache: Optional[str] = Form(None),
+    mode: Optional[str] = Form(None),
+    latency_budget_seconds: Optional[float] = Form(None),
+    resume_run_id: Optional[str] = Form(None)
 ):
     """
     Phân tích SRS/User Stories từ uploaded file
@@ -128,12 +198,24 @@ async def analyze_requirements_from_file(
     Args:
         file: Uploaded file (.txt or .docx)
         model: Model Gemini để sử dụng (mặc định: gemini-2.5-flash)
+        cache: "bypass" hoặc "refresh" (mặc định: dùng result cache)
+        mode: Ép execution mode "fast" / "full" / "chunked" (mặc định: planner tự chọn)
+        latency_budget_seconds: Latency budget cho planner (mặc định: PLANNER_LATENCY_BUDGET_SECONDS)
+        resume_run_id: Run id của lần chạy lỗi trước (header X-Analysis-Run-Id) - chạy tiếp từ checkpoint
     
     Returns:
         AnalyzeResponse với conflicts, ambiguities, suggestions
     """
     saved_file_path = None
+    run_id = None
     try:
+        if cache and cache not in (CACHE_BYPASS, CACHE_REFRESH):
+            raise HTTPException(status_code=400, detail=f"Invalid cache option: {cache}. Supported: bypass, refresh")
+        if mode and mode not in EXECUTION_MODES:
+            raise HTTPException(status_code=400, detail=f"Invalid mode: {mode}. Supported: {', '.join(EXECUTION_MODES)}")
+        
+        model = resolve_model(model)
+        
         # Validate file type
         if not file.filename:
             raise HTTPException(status_code=400, detail="No file provided")
@@ -145,24 +227,29 @@ async def analyze_requirements_from_file(
                 detail=f"Unsupported file type: {file_ext}. Supported types: .txt, .docx"
             )
         
-        # Save uploaded file
-        saved_file_path = save_uploaded_file(file)
-        
-        # Extract text from file
-        text_content = extract_text_from_file(saved_file_path)
+        # Save uploaded file và extract text trong threadpool (file I/O + parse .docx là sync)
+        saved_file_path = await run_in_threadpool(save_uploaded_file, file)
+        text_content = await run_in_threadpool(extract_text_from_file, saved_file_path)
         
         if not text_content or not text_content.strip():
             raise HTTPException(status_code=400, detail="File is empty or could not extract text")
         
-        # Get agent instance
-        agent = get_agent()
+        # Get warm agent của model được yêu cầu
+        agent = get_agent(model)
         
-        # Analyze using FAST method (single API call) for faster response
-        logger.info(f"Starting FAST file analysis: {file.filename} with model: {model}")
+        # Planner chọn fast / full / chunked theo kích thước file và latency budget
+        if resume_run_id:
+            mode = await run_in_threadpool(resume_mode, agent, resume_run_id, mode or None)
+        # Chuẩn hóa / bỏ bản trùng trước: planner tính trên text mà model thực sự nhận
+        prepared = await run_in_threadpool(prepare_analysis, text_content, latency_budget_seconds, mode or None)
+        plan = prepared.plan
+        if plan.mode == MODE_FULL:
+            run_id = resume_run_id or new_run_id()
+        logger.info(f"Starting {plan.mode} file analysis: {file.filename} with model: {model}")
         start_time = time.time()
-        result = agent.analyze_fast(text_content)  # Use fast method instead of full pipeline
+        result = await run_analysis(agent, text_content, cache, prepared=prepared, run_id=run_id)
         processing_time = int(time.time() - start_time)
-        logger.info(f"FAST file analysis completed in {processing_time} seconds")
+        logger.info(f"{plan.mode} file analysis completed in {processing_time} seconds")
         
         # Convert to response model
         conflicts = [ConflictItem(**item) for item in result.get("conflicts", [])]
@@ -171,48 +258,543 @@ async def analyze_requirements_from_file(
         
         logger.info(f"Found: {len(conflicts)} conflicts, {len(ambiguities)} ambiguities, {len(suggestions)} suggestions")
         
-        # Lưu vào database (optional, không fail nếu DB không available)
-        analysis_id = None
-        try:
-            from app.database.db import get_engine
-            engine = get_engine()
-            if engine:
-                from app.database.db import SessionLocal
-                db = SessionLocal()
-                try:
-                    saved_analysis = save_analysis(
-                        db=db,
-                        conflicts=[item.dict() for item in conflicts],
-                        ambiguities=[item.dict() for item in ambiguities],
-                        suggestions=[item.dict() for item in suggestions],
-                        text_input=None,
-                        file_name=file.filename,
-                        model_used=model,
-                        processing_time_seconds=processing_time
-                    )
-                    analysis_id = saved_analysis.id
-                    logger.info(f"Analysis saved to database with ID: {analysis_id}")
-                finally:
-                    db.close()
-        except Exception as e:
-            # Log error nhưng không fail request
-            logger.warning(f"Failed to save to database: {str(e)}")
+        # Lưu vào database trong threadpool (optional, không fail nếu DB không available)
+        analysis_id = await run_in_threadpool(
+            save_analysis_result,
+            conflicts=[item.dict(exclude_none=True) for item in conflicts],
+            ambiguities=[item.dict(exclude_none=True) for item in ambiguities],
+            suggestions=[item.dict(exclude_none=True) for item in suggestions],
+            text_input=None,
+            file_name=file.filename,
+            model_used=model,
+            prompt_version=getattr(agent, "prompt_version", None),
+            processing_time_seconds=processing_time,
+            plan=result.get("plan")
+        )
         
         return AnalyzeResponse(
             conflicts=conflicts,
             ambiguities=ambiguities,
             suggestions=suggestions,
-            analysis_id=analysis_id
+            analysis_id=analysis_id,
+            stats={
+                "plan": result.get("plan"),
+                "memo": result.get("memo"),
+                "normalization": result.get("normalization"),
+                "dedup": result.get("dedup")
+            },
+            run_id=run_id
         )
         
     except HTTPException:
         raise
+    except UnsupportedModelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RunMismatchError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except CircuitOpenError as e:
+        raise _circuit_open(e, run_id)
     except ValueError as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e), headers=_run_headers(run_id))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}", headers=_run_headers(run_id))
     finally:
         # Cleanup uploaded file
         if saved_file_path:
-            cleanup_file(saved_file_path)
+            await run_in_threadpool(cleanup_file, saved_file_path)
+
+
+
+@router.post("/analyze/revision", response_model=AnalyzeResponse)
+async def analyze_requirements_revision(request: RevisionAnalyzeRequest):
+    """
+    Phân tích bản sửa của một document đã phân tích trước đó
+    
+    Diff bản mới với text của `previous_analysis_id` ở mức requirement: chỉ requirement
+    thêm mới / thay đổi (kèm requirement liên quan) được gửi cho model, finding cũ chỉ
+    liên quan tới requirement không đổi được giữ nguyên.
+    
+    - **previous_analysis_id**: ID analysis của bản trước (analysis từ text input)
+    - **text**: Nội dung bản mới
+    - **model**: Model Gemini để sử dụng
+    - **cache**: "bypass" hoặc "refresh" (mặc định: dùng result cache)
+    
+    Returns:
+    - AnalyzeResponse của bản mới (được lưu thành analysis mới)
+    - stats: unchanged / changed / added / removed, số requirement đã gửi và số finding được giữ
+    """
+    if not request.text or not request.text.strip():
+        raise HTTPException(status_code=400, detail="Text input is required")
+    
+    try:
+        model = resolve_model(request.model)
+        agent = get_agent(model)
+    except UnsupportedModelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    try:
+        previous = await run_in_threadpool(load_analysis, request.previous_analysis_id)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Could not load previous analysis: {str(e)}")
+    if previous is None:
+        raise HTTPException(status_code=404, detail=f"Analysis {request.previous_analysis_id} not found")
+    if not previous.get("text_input"):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Analysis {request.previous_analysis_id} has no stored text to diff against"
+        )
+    
+    try:
+        start_time = time.time()
+        result = await run_revision_analysis(agent, previous, request.text, request.cache)
+        processing_time = int(time.time() - start_time)
+    except CircuitOpenError as e:
+        raise _circuit_open(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+    
+    stats = {"previous_analysis_id": request.previous_analysis_id, **result.get("revision", {})}
+    logger.info(f"Revision analysis completed in {processing_time} seconds: {stats}")
+    
+    conflicts = valid_items(ConflictItem, result.get("conflicts", []))
+    ambiguities = valid_items(AmbiguityItem, result.get("ambiguities", []))
+    suggestions = valid_items(SuggestionItem, result.get("suggestions", []))
+    analysis_id = await run_in_threadpool(
+        save_analysis_result,
+        conflicts=conflicts,
+        ambiguities=ambiguities,
+        suggestions=suggestions,
+        text_input=request.text,
+        file_name=None,
+        model_used=model,
+        prompt_version=getattr(agent, "prompt_version", None),
+        processing_time_seconds=processing_time
+    )
+    
+    return AnalyzeResponse(
+        conflicts=conflicts,
+        ambiguities=ambiguities,
+        suggestions=suggestions,
+        analysis_id=analysis_id,
+        stats=stats
+    )
 
+
+_STREAM_ITEM_MODELS = {
+    "conflicts": ("conflict", ConflictItem),
+    "ambiguities": ("ambiguity", AmbiguityItem),
+    "suggestions": ("suggestion", SuggestionItem),
+}
+
+
+@router.post("/analyze/stream")
+async def analyze_requirements_stream(
+    request: AnalyzeRequest,
+    http_request: Request,
+    fmt: Optional[str] = Query(None, alias="format", pattern="^(ndjson|sse)$")
+):
+    """
+    Phân tích SRS/User Stories và stream từng finding ngay khi model sinh xong
+    
+    - **format**: "ndjson" (mặc định) hoặc "sse" (hoặc gửi `Accept: text/event-stream`)
+    
+    Events:
+    - started: bắt đầu phân tích
+    - conflict / ambiguity / suggestion: một finding (`data` theo schema ConflictItem/AmbiguityItem/SuggestionItem)
+    - heartbeat: giữ kết nối khi model chưa trả token
+    - done: analysis_id đã lưu, processing_time_ms, số lượng findings, stats (plan, memo,
+      normalization, dedup như /analyze) và run_id (full pipeline)
+    - error: lỗi trong quá trình phân tích (kèm run_id để chạy tiếp với resume_run_id)
+    
+    Fast path stream từng finding; full pipeline / chunked gửi findings khi có kết quả.
+    """
+    if not request.text or not request.text.strip():
+        raise HTTPException(status_code=400, detail="Text input is required")
+    
+    try:
+        model = resolve_model(request.model)
+        agent = get_agent(model)
+    except UnsupportedModelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    stream_format = pick_stream_format(fmt, http_request.headers.get("accept"))
+    
+    # Cùng pipeline với /analyze: chuẩn hóa, bỏ bản trùng, planner, memo
+    mode = request.mode
+    if request.resume_run_id:
+        mode = await run_in_threadpool(resume_mode, agent, request.resume_run_id, mode)
+    # Chuẩn hóa / bỏ bản trùng trước: planner tính trên text mà model thực sự nhận
+    prepared = await run_in_threadpool(prepare_analysis, request.text, request.latency_budget_seconds, mode)
+    plan = prepared.plan
+    run_id = (request.resume_run_id or new_run_id()) if plan.mode == MODE_FULL else None
+    
+    async def body():
+        start_time = time.time()
+        counts = {"conflicts": 0, "ambiguities": 0, "suggestions": 0}
+        result = None
+        yield format_event("started", {"model": model}, stream_format)
+        
+        try:
+            async for event in with_heartbeat(stream_analysis(agent, request.text, request.cache, prepared=prepared, run_id=run_id)):
+                if event is HEARTBEAT:
+                    yield format_heartbeat(stream_format)
+                    continue
+                section, payload = event
+                if section == "result":
+                    result = payload
+                    continue
+                event_name, item_model = _STREAM_ITEM_MODELS[section]
+                try:
+                    item = item_model(**payload)
+                except Exception:
+                    logger.warning(f"Skipping malformed {event_name} from stream: {str(payload)[:200]}")
+                    continue
+                counts[section] += 1
+                yield format_event(event_name, {"data": item.dict(exclude_none=True)}, stream_format)
+        except Exception as e:
+            logger.error(f"Streaming analysis failed: {str(e)}")
+            yield format_event("error", {"detail": str(e), "run_id": run_id}, stream_format)
+            return
+        
+        processing_time = time.time() - start_time
+        result = result or {}
+        analysis_id = await run_in_threadpool(
+            save_analysis_result,
+            conflicts=valid_items(ConflictItem, result.get("conflicts", [])),
+            ambiguities=valid_items(AmbiguityItem, result.get("ambiguities", [])),
+            suggestions=valid_items(SuggestionItem, result.get("suggestions", [])),
+            text_input=request.text,
+            file_name=None,
+            model_used=model,
+            prompt_version=getattr(agent, "prompt_version", None),
+            processing_time_seconds=int(processing_time),
+            plan=result.get("plan")
+        )
+        logger.info(f"Streaming {plan.mode} analysis completed in {processing_time:.1f} seconds")
+        yield format_event("done", {
+            "analysis_id": analysis_id,
+            "processing_time_ms": int(processing_time * 1000),
+            "counts": counts,
+            "stats": {key: result.get(key) for key in ("plan", "memo", "normalization", "dedup")},
+            "run_id": run_id
+        }, stream_format)
+    
+    return StreamingResponse(body(), media_type=MEDIA_TYPES[stream_format], headers=STREAM_HEADERS)
+
+
+# Số document tối đa trong một batch request
+MAX_BATCH_DOCUMENTS = int(os.getenv("MAX_BATCH_DOCUMENTS", "100"))
+
+
+def _build_batch_result(index: int, name: Optional[str], result: Optional[dict], error: Optional[str], elapsed: float) -> BatchDocumentResult:
+    """Convert output của run_batch sang BatchDocumentResult (item sai schema bị bỏ qua)"""
+    if result is None:
+        return BatchDocumentResult(
+            index=index,
+            name=name,
+            status="failed",
+            error=error,
+            processing_time_ms=int(elapsed * 1000)
+        )
+    return BatchDocumentResult(
+        index=index,
+        name=name,
+        status="succeeded",
+        conflicts=valid_items(ConflictItem, result.get("conflicts", [])),
+        ambiguities=valid_items(AmbiguityItem, result.get("ambiguities", [])),
+        suggestions=valid_items(SuggestionItem, result.get("suggestions", [])),
+        processing_time_ms=int(elapsed * 1000),
+        plan=result.get("plan")
+    )
+
+
+def _history_record(
+    document: BatchDocumentResult,
+    text: str,
+    is_file: bool,
+    model: Optional[str],
+    prompt_version: Optional[str] = None
+) -> dict:
+    """Record cho save_analysis_results từ một document đã phân tích xong"""
+    return {
+        "conflicts": [item.dict(exclude_none=True) for item in document.conflicts],
+        "ambiguities": [item.dict(exclude_none=True) for item in document.ambiguities],
+        "suggestions": [item.dict(exclude_none=True) for item in document.suggestions],
+        "text_input": None if is_file else text,
+        "file_name": document.name if is_file else None,
+        "model_used": model,
+        "prompt_version": prompt_version,
+        "processing_time_seconds": document.processing_time_ms // 1000,
+        "plan": document.plan
+    }
+
+
+async def _batch_response(
+    documents: List[Tuple[Optional[str], Optional[str], Optional[str]]],
+    model: Optional[str],
+    cache: Optional[str],
+    stream_format: Optional[str],
+    is_file: bool = False
+):
+    """
+    Chạy batch và trả về BatchAnalyzeResponse hoặc NDJSON stream
+    
+    Args:
+        documents: List (name, text, error) - error != None nghĩa là document lỗi từ trước
+            (text rỗng, file không đọc được) và không được gửi tới agent
+        stream_format: FORMAT_NDJSON để stream, None để trả một JSON response
+        is_file: True nếu documents là file upload (lưu file_name thay vì text_input)
+    """
+    try:
+        model = resolve_model(model)
+        agent = get_agent(model)
+    except UnsupportedModelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    runnable = [index for index, (_, text, error) in enumerate(documents) if error is None]
+    
+    async def results():
+        """Yield BatchDocumentResult theo thứ tự hoàn thành (document lỗi từ trước yield ngay)"""
+        for index, (name, _, error) in enumerate(documents):
+            if error is not None:
+                yield _build_batch_result(index, name, None, error, 0.0)
+        async for position, result, error, elapsed in run_batch(
+            agent, [documents[index][1] for index in runnable], cache_mode=cache
+        ):
+            index = runnable[position]
+            yield _build_batch_result(index, documents[index][0], result, error, elapsed)
+    
+    async def save(completed: List[BatchDocumentResult]) -> None:
+        """Lưu tất cả document thành công trong một transaction, gán analysis_id"""
+        succeeded = [document for document in completed if document.status == "succeeded"]
+        prompt_version = getattr(agent, "prompt_version", None)
+        records = [
+            _history_record(document, documents[document.index][1], is_file, model, prompt_version)
+            for document in succeeded
+        ]
+        analysis_ids = await run_in_threadpool(save_analysis_results, records)
+        for document, analysis_id in zip(succeeded, analysis_ids):
+            document.analysis_id = analysis_id
+    
+    def summary(completed: List[BatchDocumentResult], start_time: float) -> dict:
+        succeeded = sum(1 for document in completed if document.status == "succeeded")
+        return {
+            "succeeded": succeeded,
+            "failed": len(completed) - succeeded,
+            "processing_time_ms": int((time.time() - start_time) * 1000)
+        }
+    
+    if stream_format is None:
+        start_time = time.time()
+        completed = [document async for document in results()]
+        await save(completed)
+        completed.sort(key=lambda document: document.index)
+        logger.info(f"Batch analysis of {len(documents)} documents completed in {time.time() - start_time:.1f} seconds")
+        return BatchAnalyzeResponse(results=completed, **summary(completed, start_time))
+    
+    async def body():
+        start_time = time.time()
+        completed: List[BatchDocumentResult] = []
+        yield format_event("started", {"model": model, "documents": len(documents)}, stream_format)
+        async for event in with_heartbeat(results()):
+            if event is HEARTBEAT:
+                yield format_heartbeat(stream_format)
+                continue
+            completed.append(event)
+            payload = event.dict()
+            payload.pop("analysis_id")  # Chỉ có sau khi lưu cả batch, gửi trong event done
+            yield format_event("document", {"data": payload}, stream_format)
+        await save(completed)
+        yield format_event("done", {
+            "analysis_ids": {str(document.index): document.analysis_id for document in completed if document.analysis_id is not None},
+            **summary(completed, start_time)
+        }, stream_format)
+    
+    return StreamingResponse(body(), media_type=MEDIA_TYPES[stream_format], headers=STREAM_HEADERS)
+
+
+def _check_batch_size(count: int) -> None:
+    if count == 0:
+        raise HTTPException(status_code=400, detail="At least one document is required")
+    if count > MAX_BATCH_DOCUMENTS:
+        raise HTTPException(status_code=400, detail=f"Too many documents: {count}. Maximum: {MAX_BATCH_DOCUMENTS}")
+
+
+@router.post("/analyze/batch", response_model=BatchAnalyzeResponse)
+async def analyze_requirements_batch(
+    request: BatchAnalyzeRequest,
+    fmt: Optional[str] = Query(None, alias="format", pattern="^(json|ndjson)$")
+):
+    """
+    Phân tích nhiều document trong một request
+    
+    Các document được phân tích đồng thời (tối đa BATCH_CONCURRENCY), tất cả
+    AnalysisHistory rows được lưu trong một transaction. Document lỗi không làm
+    hỏng cả batch - lỗi được trả về trong `results[i].error`.
+    
+    - **documents**: List {text, name}
+    - **model**: Model Gemini để sử dụng
+    - **cache**: "bypass" hoặc "refresh" (mặc định: dùng result cache)
+    - **format**: "json" (mặc định) hoặc "ndjson" để stream từng document ngay khi xong
+    
+    NDJSON events: started, document (một BatchDocumentResult), heartbeat,
+    done (analysis_ids theo index, succeeded, failed, processing_time_ms)
+    """
+    _check_batch_size(len(request.documents))
+    documents = [
+        (document.name, document.text, None if document.text and document.text.strip() else "Text input is required")
+        for document in request.documents
+    ]
+    return await _batch_response(
+        documents, request.model, request.cache,
+        FORMAT_NDJSON if fmt == FORMAT_NDJSON else None
+    )
+
+
+@router.post("/analyze/batch/files", response_model=BatchAnalyzeResponse)
+async def analyze_requirements_batch_files(
+    files: List[UploadFile] = File(...),
+    model: str = Form("gemini-2.5-flash"),
+    cache: Optional[str] = Form(None),
+    fmt: Optional[str] = Query(None, alias="format", pattern="^(json|ndjson)$")
+):
+    """
+    Phân tích nhiều file (.txt, .docx) trong một request
+    
+    Giống /api/analyze/batch; file sai định dạng hoặc rỗng được trả về như
+    document lỗi thay vì reject cả request.
+    """
+    if cache and cache not in (CACHE_BYPASS, CACHE_REFRESH):
+        raise HTTPException(status_code=400, detail=f"Invalid cache option: {cache}. Supported: bypass, refresh")
+    _check_batch_size(len(files))
+    
+    documents = []
+    for file in files:
+        file_ext = os.path.splitext(file.filename or "")[1].lower()
+        if file_ext not in ['.txt', '.docx']:
+            documents.append((file.filename, None, f"Unsupported file type: {file_ext}. Supported types: .txt, .docx"))
+            continue
+        saved_file_path = await run_in_threadpool(save_uploaded_file, file)
+        try:
+            text_content = await run_in_threadpool(extract_text_from_file, saved_file_path)
+        except ValueError as e:
+            documents.append((file.filename, None, str(e)))
+            continue
+        finally:
+            await run_in_threadpool(cleanup_file, saved_file_path)
+        if not text_content or not text_content.strip():
+            documents.append((file.filename, None, "File is empty or could not extract text"))
+        else:
+            documents.append((file.filename, text_content, None))
+    
+    return await _batch_response(
+        documents, model, cache,
+        FORMAT_NDJSON if fmt == FORMAT_NDJSON else None,
+        is_file=True
+    )
+
+
+@router.get("/models")
+async def get_models():
+    """
+    Model pool: các model được hỗ trợ, model mặc định, agent đang warm và slot theo model
+    """
+    return get_model_pool().get_stats()
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Thống kê analysis result cache: hit/miss counters, số entry và dung lượng memory tier
+    (kèm requirement memo dùng chung giữa các document)
+    """
+    return {**get_analysis_cache().get_stats(), "requirement_memo": get_requirement_memo().get_stats()}
+
+
+@router.get("/planner/stats")
+async def get_planner_stats():
+    """
+    Thống kê execution planner: thresholds, số plan và hệ số hiệu chỉnh latency theo mode
+    """
+    return get_planner().get_stats()
+
+
+@router.get("/llm/stats")
+async def get_llm_stats():
+    """
+    Resilience của LLM calls: trạng thái circuit breaker theo model, số retry / hedge,
+    latency percentiles theo loại call, rate limiter (quota, queue depth, wait time theo lane),
+    local CPU classifier và token tiết kiệm được nhờ chuẩn hóa input (theo stage)
+    """
+    return {
+        **get_resilience_stats(),
+        "rate_limit": get_rate_limiter().get_stats(),
+        "local": get_local_classifier().get_stats(),
+        "normalization": get_input_normalizer().get_stats()
+    }
+
+
+def _prompt_registry():
+    try:
+        return get_prompt_registry()
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@router.get("/prompts")
+async def get_prompts():
+    """
+    Version hiện tại của bộ prompt (content hash) và của từng prompt, số lần hot reload
+    """
+    return _prompt_registry().get_stats()
+
+
+@router.post("/prompts/reload")
+async def reload_prompts():
+    """
+    Reload prompt files ngay (không đợi lần kiểm tra định kỳ); bộ prompt lỗi bị bỏ qua
+    """
+    registry = _prompt_registry()
+    changed = await run_in_threadpool(registry.reload)
+    return {"reloaded": changed, **registry.get_stats()}
+
+
+@router.get("/ambiguity-classifier")
+async def get_ambiguity_classifier_status():
+    """
+    Ambiguity classifier (pre-screen của clarity check): version đang dùng, dải không chắc
+    chắn, số requirement được kết luận local và các version đã train
+    """
+    classifier = get_ambiguity_classifier()
+    return {**classifier.get_stats(), "versions": await run_in_threadpool(classifier.versions)}
+
+
+@router.post("/ambiguity-classifier/retrain")
+async def retrain_ambiguity_classifier():
+    """
+    Train version mới từ lịch sử phân tích và dùng ngay (các process khác tự load lại)
+    
+    - 409: đang có training khác / không đủ dữ liệu có nhãn
+    - 503: thiếu scikit-learn hoặc database không available
+    """
+    try:
+        return await run_in_threadpool(get_ambiguity_classifier().train)
+    except ClassifierUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ClassifierTrainingError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.post("/ambiguity-classifier/versions/{version}/activate")
+async def activate_ambiguity_classifier(version: str):
+    """Dùng lại một version đã train (rollback)"""
+    try:
+        return await run_in_threadpool(get_ambiguity_classifier().activate, version)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
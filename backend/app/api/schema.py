@@ -1,25 +1,39 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Literal
 
 # Request schemas
 class AnalyzeRequest(BaseModel):
     """Request schema for text analysis"""
     text: str
     model: Optional[str] = "gemini-2.5-flash"  # Gemini 2.5 Flash (default)
+    cache: Optional[Literal["bypass", "refresh"]] = None  # None = dùng result cache
+    mode: Optional[Literal["fast", "full", "chunked"]] = None  # None = execution planner tự chọn
+    latency_budget_seconds: Optional[float] = None  # None = PLANNER_LATENCY_BUDGET_SECONDS
+    resume_run_id: Optional[str] = None  # Run lỗi / timeout trước đó (X-Analysis-Run-Id) - chạy tiếp từ checkpoint
+
+class RevisionAnalyzeRequest(BaseModel):
+    """Request schema for incremental analysis of an edited document"""
+    previous_analysis_id: int  # Analysis của bản trước (phải có text_input)
+    text: str  # Text bản mới
+    model: Optional[str] = "gemini-2.5-flash"
+    cache: Optional[Literal["bypass", "refresh"]] = None
 
 # Response schemas
 class ConflictItem(BaseModel):
     req1: str
     req2: str
     description: str
+    duplicates: Optional[List[str]] = None  # Requirement gần trùng với req1 / req2 (cùng finding)
 
 class AmbiguityItem(BaseModel):
     req: str
     issue: str
+    duplicates: Optional[List[str]] = None  # Requirement gần trùng với req (cùng finding)
 
 class SuggestionItem(BaseModel):
     req: str
     new_version: str
+    duplicates: Optional[List[str]] = None
 
 class AnalyzeResponse(BaseModel):
     conflicts: List[ConflictItem]
@@ -27,4 +41,36 @@ class AnalyzeResponse(BaseModel):
     suggestions: List[SuggestionItem]
     analysis_id: Optional[int] = None  # ID của analysis trong database (nếu đã lưu)
     raw_response: Optional[str] = None
+    stats: Optional[dict] = None  # Thống kê thêm (vd: diff của revision analysis)
+    run_id: Optional[str] = None  # Run id của full pipeline (checkpoint)
+
+
+# Batch schemas
+class BatchDocument(BaseModel):
+    """Một document trong batch"""
+    text: str
+    name: Optional[str] = None  # Tên hiển thị (vd: đường dẫn file trong repo)
+
+class BatchAnalyzeRequest(BaseModel):
+    """Request schema for batch analysis"""
+    documents: List[BatchDocument]
+    model: Optional[str] = "gemini-2.5-flash"
+    cache: Optional[Literal["bypass", "refresh"]] = None
+
+class BatchDocumentResult(BaseModel):
+    index: int  # Vị trí trong request
+    name: Optional[str] = None
+    status: Literal["succeeded", "failed"]
+    conflicts: List[ConflictItem] = []
+    ambiguities: List[AmbiguityItem] = []
+    suggestions: List[SuggestionItem] = []
+    analysis_id: Optional[int] = None
+    error: Optional[str] = None
+    processing_time_ms: int = 0
+    plan: Optional[dict] = None  # Execution plan đã dùng (mode, predicted / actual latency)
 
+class BatchAnalyzeResponse(BaseModel):
+    results: List[BatchDocumentResult]  # Theo thứ tự documents trong request
+    succeeded: int
+    failed: int
+    processing_time_ms: int
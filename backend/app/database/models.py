@@ -2,7 +2,7 @@
 SQLAlchemy models cho analysis history
 """
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, LargeBinary
 from sqlalchemy.sql import func
 from app.database.db import Base
 
@@ -24,6 +24,14 @@ class AnalysisHistory(Base):
     # Metadata
     model_used = Column(String(50), nullable=True)  # Model đã dùng (gemini-1.5-pro)
     processing_time_seconds = Column(Integer, nullable=True)  # Thời gian xử lý (optional)
+    prompt_version = Column(String(64), nullable=True)  # Version (content hash) của bộ prompt đã dùng
+    
+    # Execution plan (xem execution_planner) - dữ liệu để tune thresholds của planner
+    execution_plan = Column(String(20), nullable=True)  # fast / full / chunked
+    estimated_tokens = Column(Integer, nullable=True)
+    requirement_count = Column(Integer, nullable=True)
+    predicted_latency_ms = Column(Integer, nullable=True)
+    actual_latency_ms = Column(Integer, nullable=True)
     
     def to_dict(self):
         """Convert model to dictionary"""
@@ -36,6 +44,119 @@ class AnalysisHistory(Base):
             "ambiguities": self.ambiguities_json or [],
             "suggestions": self.suggestions_json or [],
             "model_used": self.model_used,
-            "processing_time_seconds": self.processing_time_seconds
+            "processing_time_seconds": self.processing_time_seconds,
+            "prompt_version": self.prompt_version,
+            "execution_plan": self.execution_plan,
+            "estimated_tokens": self.estimated_tokens,
+            "requirement_count": self.requirement_count,
+            "predicted_latency_ms": self.predicted_latency_ms,
+            "actual_latency_ms": self.actual_latency_ms
         }
 
+
+
+class AnalysisCacheEntry(Base):
+    """Persistent tier của analysis result cache (content-addressed theo cache_key)"""
+    __tablename__ = "analysis_cache"
+    
+    cache_key = Column(String(64), primary_key=True)  # sha256(normalized text + mode + model + prompt version)
+    model_used = Column(String(50), nullable=True)
+    prompt_version = Column(String(64), nullable=True)
+    result_json = Column(JSON, nullable=False)  # {"conflicts": [...], "ambiguities": [...], "suggestions": [...]}
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_hit_at = Column(DateTime(timezone=True), nullable=True)
+    hit_count = Column(Integer, nullable=False, default=0)
+
+
+class RequirementMemoEntry(Base):
+    """Verdict đã tính cho một requirement (dùng lại giữa các document, LRU theo last_used_at)"""
+    __tablename__ = "requirement_memo"
+    
+    memo_key = Column(String(64), primary_key=True)  # sha256(kind + model + prompt version + requirement fingerprint)
+    kind = Column(String(20), nullable=False)  # ambiguity / improve / fast
+    model_used = Column(String(50), nullable=True)
+    prompt_version = Column(String(64), nullable=True)
+    requirement = Column(Text, nullable=False)  # Requirement gốc (để debug / audit)
+    verdict_json = Column(JSON, nullable=False)  # {"ambiguous": ..., "issue": ..., "new_version": ...}
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    hit_count = Column(Integer, nullable=False, default=0)
+
+
+class ClassifierSettlement(Base):
+    """Requirement mà ambiguity classifier kết luận local (không được dùng làm nhãn khi train lại)"""
+    __tablename__ = "ambiguity_classifier_settlements"
+
+    settlement_key = Column(String(64), primary_key=True)  # sha256(requirement fingerprint)
+    requirement = Column(Text, nullable=False)  # Requirement gốc (để debug / audit)
+    verdict = Column(String(20), nullable=False)  # ambiguous / clear
+    model_version = Column(String(64), nullable=True)
+    settled_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class GraphCheckpoint(Base):
+    """Checkpoint của LangGraph run sau mỗi superstep (resume run lỗi / timeout, xem checkpoint_store)"""
+    __tablename__ = "graph_checkpoints"
+    
+    thread_id = Column(String(64), primary_key=True)  # Run id
+    checkpoint_ns = Column(String(255), primary_key=True, default="")  # "" = graph chính, khác = subgraph
+    checkpoint_id = Column(String(64), primary_key=True)
+    parent_checkpoint_id = Column(String(64), nullable=True)
+    checkpoint_type = Column(String(32), nullable=False)
+    checkpoint = Column(LargeBinary, nullable=False)  # Serialized bởi serde của LangGraph
+    metadata_type = Column(String(32), nullable=False)
+    checkpoint_metadata = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+
+class GraphCheckpointWrite(Base):
+    """Output của node đã xong trong superstep chưa hoàn tất (pending writes)"""
+    __tablename__ = "graph_checkpoint_writes"
+    
+    thread_id = Column(String(64), primary_key=True)
+    checkpoint_ns = Column(String(255), primary_key=True, default="")
+    checkpoint_id = Column(String(64), primary_key=True)
+    task_id = Column(String(64), primary_key=True)
+    idx = Column(Integer, primary_key=True)
+    channel = Column(String(255), nullable=False)
+    value_type = Column(String(32), nullable=False)
+    value = Column(LargeBinary, nullable=False)
+    task_path = Column(String(255), nullable=False, default="")
+
+
+class AnalysisJob(Base):
+    """Job phân tích bất đồng bộ (POST /api/jobs/analyze)"""
+    __tablename__ = "analysis_jobs"
+    
+    id = Column(String(36), primary_key=True)  # UUID
+    status = Column(String(20), nullable=False, index=True)  # queued / running / succeeded / failed / cancelled
+    progress = Column(Integer, nullable=False, default=0)  # 0-100
+    input_text = Column(Text, nullable=False)  # Text đã extract (file được đọc ngay khi submit)
+    file_name = Column(String(255), nullable=True)
+    model_used = Column(String(50), nullable=True)
+    cache_mode = Column(String(10), nullable=True)
+    result_json = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    analysis_id = Column(Integer, nullable=True)  # ID trong analysis_history sau khi xong
+    owner = Column(String(100), nullable=True)  # Process đang giữ job (queued / running)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)  # Lần cuối owner báo còn sống
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            "id": self.id,
+            "status": self.status,
+            "progress": self.progress,
+            "file_name": self.file_name,
+            "model_used": self.model_used,
+            "cache_mode": self.cache_mode,
+            "result": self.result_json,
+            "error": self.error,
+            "analysis_id": self.analysis_id,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
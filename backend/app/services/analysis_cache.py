@@ -0,0 +1,309 @@
+"""
+Content-addressed cache cho kết quả phân tích
+
+Key = sha256(normalized text + analysis mode + model + prompt version), nên cùng một
+SRS gửi lại (refresh, timeout, từ Streamlit hay Gradio) không phải trả thêm một lần gọi Gemini.
+
+2 tầng:
+- Memory: LRU trong process, có TTL và giới hạn số entry / tổng dung lượng
+- Persistent: bảng analysis_cache trong analysis DB, sống qua restart
+"""
+
+import os
+import copy
+import json
+import time
+import asyncio
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+from app.database.db import session_scope
+from app.database.models import AnalysisCacheEntry
+from app.utils.logger import logger
+
+# Config qua .env
+CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() == "true"
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "512"))
+CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL_SECONDS = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "3600"))
+CACHE_PERSISTENT_TTL_SECONDS = int(os.getenv("ANALYSIS_CACHE_PERSISTENT_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Cache modes (AnalyzeRequest.cache)
+CACHE_BYPASS = "bypass"    # Không đọc, không ghi cache
+CACHE_REFRESH = "refresh"  # Không đọc cache, chạy lại và ghi đè kết quả mới
+
+_WHITESPACE_RE = re.compile(r"[ \t\u00a0]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Chuẩn hóa text trước khi hash: Unicode NFC, gộp khoảng trắng, bỏ dòng trống thừa
+
+    Hai bản SRS chỉ khác nhau về whitespace sẽ có cùng cache key
+    """
+    text = unicodedata.normalize("NFC", text or "")
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    lines = [_WHITESPACE_RE.sub(" ", line).strip() for line in text.split("\n")]
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+
+def make_cache_key(text: str, mode: str, model: str, prompt_version: str) -> str:
+    """Tạo cache key từ normalized text, analysis mode, model và prompt version"""
+    payload = "\x00".join([mode or "", model or "", prompt_version or "", normalize_text(text)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    2-tier result cache (memory LRU + analysis DB)
+
+    Thread-safe: các method sync được gọi từ cả event loop lẫn threadpool
+    """
+
+    def __init__(
+        self,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_bytes: int = CACHE_MAX_BYTES,
+        ttl_seconds: int = CACHE_TTL_SECONDS,
+        persistent_ttl_seconds: int = CACHE_PERSISTENT_TTL_SECONDS,
+        persistent: bool = True,
+        session_factory: Callable = session_scope
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.persistent_ttl_seconds = persistent_ttl_seconds
+        self.persistent = persistent
+        self._session_factory = session_factory
+
+        # key -> (expires_at, size_bytes, result)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0,
+            "persistent_hits": 0,
+            "misses": 0,
+            "bypassed": 0,
+            "refreshed": 0,
+            "stores": 0,
+            "evictions": 0
+        }
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def lookup(self, key: str, cache_mode: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Tìm kết quả trong cache (memory trước, rồi persistent)
+
+        Returns:
+            Kết quả đã cache hoặc None (miss / bypass / refresh)
+        """
+        if self._skip_read(cache_mode):
+            return None
+
+        result = self._memory_get(key)
+        if result is not None:
+            self._count("memory_hits")
+            return result
+
+        result = self._persistent_get(key)
+        if result is not None:
+            self._count("persistent_hits")
+            self._memory_put(key, result)
+            return result
+
+        self._count("misses")
+        return None
+
+    async def alookup(self, key: str, cache_mode: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Async lookup - persistent tier chạy trong thread để không block event loop"""
+        if self._skip_read(cache_mode):
+            return None
+
+        result = self._memory_get(key)
+        if result is not None:
+            self._count("memory_hits")
+            return result
+
+        result = await asyncio.to_thread(self._persistent_get, key)
+        if result is not None:
+            self._count("persistent_hits")
+            self._memory_put(key, result)
+            return result
+
+        self._count("misses")
+        return None
+
+    def store(
+        self,
+        key: str,
+        result: Dict[str, Any],
+        cache_mode: Optional[str] = None,
+        model: Optional[str] = None,
+        prompt_version: Optional[str] = None
+    ):
+        """Lưu kết quả vào cả 2 tầng (trừ khi cache_mode = bypass)"""
+        if not self._should_store(result, cache_mode):
+            return
+        self._memory_put(key, result)
+        self._persistent_put(key, result, model, prompt_version)
+        self._count("stores")
+
+    async def astore(
+        self,
+        key: str,
+        result: Dict[str, Any],
+        cache_mode: Optional[str] = None,
+        model: Optional[str] = None,
+        prompt_version: Optional[str] = None
+    ):
+        """Async store - persistent tier chạy trong thread"""
+        if not self._should_store(result, cache_mode):
+            return
+        self._memory_put(key, result)
+        await asyncio.to_thread(self._persistent_put, key, result, model, prompt_version)
+        self._count("stores")
+
+    def clear_memory(self):
+        """Xóa memory tier (persistent tier giữ nguyên)"""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters và kích thước hiện tại của memory tier"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._entries)
+            stats["memory_bytes"] = self._total_bytes
+        hits = stats["memory_hits"] + stats["persistent_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        stats["enabled"] = CACHE_ENABLED
+        return stats
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+    def _skip_read(self, cache_mode: Optional[str]) -> bool:
+        if not CACHE_ENABLED:
+            return True
+        if cache_mode == CACHE_BYPASS:
+            self._count("bypassed")
+            return True
+        if cache_mode == CACHE_REFRESH:
+            self._count("refreshed")
+            return True
+        return False
+
+    @staticmethod
+    def _should_store(result: Dict[str, Any], cache_mode: Optional[str]) -> bool:
+        if not CACHE_ENABLED or cache_mode == CACHE_BYPASS:
+            return False
+        # Không cache kết quả rỗng hoàn toàn: thường là do LLM lỗi / parse fail
+        return any(result.get(k) for k in ("conflicts", "ambiguities", "suggestions"))
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _memory_get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, size, result = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._total_bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            # Trả về bản copy để caller có thể sửa kết quả mà không làm hỏng cache
+            return copy.deepcopy(result)
+
+    def _memory_put(self, key: str, result: Dict[str, Any]):
+        size = len(json.dumps(result, ensure_ascii=False).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, size, result)
+            self._total_bytes += size
+            # Evict LRU entries cho tới khi nằm trong giới hạn
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+                self._stats["evictions"] += 1
+
+    def _persistent_get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.persistent:
+            return None
+        try:
+            with self._session_factory() as db:
+                if db is None:
+                    return None
+                entry = db.query(AnalysisCacheEntry).filter(AnalysisCacheEntry.cache_key == key).first()
+                if entry is None:
+                    return None
+                now = datetime.now(timezone.utc)
+                created_at = entry.created_at
+                if created_at is not None and created_at.tzinfo is None:
+                    created_at = created_at.replace(tzinfo=timezone.utc)
+                if created_at and created_at + timedelta(seconds=self.persistent_ttl_seconds) < now:
+                    db.delete(entry)
+                    db.commit()
+                    return None
+                entry.hit_count = (entry.hit_count or 0) + 1
+                entry.last_hit_at = now
+                result = entry.result_json
+                db.commit()
+                return result
+        except Exception as e:
+            logger.warning(f"Analysis cache persistent lookup failed: {str(e)}")
+            return None
+
+    def _persistent_put(
+        self,
+        key: str,
+        result: Dict[str, Any],
+        model: Optional[str],
+        prompt_version: Optional[str]
+    ):
+        if not self.persistent:
+            return
+        try:
+            with self._session_factory() as db:
+                if db is None:
+                    return
+                entry = db.query(AnalysisCacheEntry).filter(AnalysisCacheEntry.cache_key == key).first()
+                if entry is None:
+                    entry = AnalysisCacheEntry(cache_key=key, hit_count=0)
+                    db.add(entry)
+                entry.model_used = model
+                entry.prompt_version = prompt_version
+                entry.result_json = result
+                entry.created_at = datetime.now(timezone.utc)
+                db.commit()
+        except Exception as e:
+            logger.warning(f"Analysis cache persistent store failed: {str(e)}")
+
+
+# Cache singleton (dùng chung cho agent và router)
+_cache: Optional[AnalysisCache] = None
+
+
+def get_analysis_cache() -> AnalysisCache:
+    """Get or create analysis cache instance"""
+    global _cache
+    if _cache is None:
+        _cache = AnalysisCache()
+    return _cache
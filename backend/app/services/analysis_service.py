@@ -0,0 +1,359 @@
+"""
+Service dùng chung cho các luồng phân tích (sync API, streaming, job, batch)
+"""
+
+import os
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+from app.agents.langgraph_agent import RequirementsAnalysisAgent
+from app.database.db import session_scope
+from app.services.execution_planner import ExecutionPlan, MODE_CHUNKED, MODE_FULL, get_planner
+from app.services.history_service import save_analysis, save_analyses, get_analysis_by_id
+from app.services.model_pool import get_model_pool
+from app.services.requirement_memo import memo_usage
+from app.utils.concurrency import analysis_slot
+from app.utils.near_duplicates import CollapsedText, collapse_near_duplicates
+from app.utils.text_normalizer import NormalizationResult, get_input_normalizer
+from app.utils.rate_limiter import LANE_BATCH, priority_lane
+from app.utils.logger import logger
+
+# Số document của một batch được phân tích đồng thời (vẫn bị giới hạn bởi analysis slots)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+def resolve_model(model: Optional[str]) -> str:
+    """Tên model thực sự được dùng (None -> DEFAULT_MODEL); raise UnsupportedModelError"""
+    return get_model_pool().resolve(model)
+
+
+def get_agent(model: Optional[str] = None) -> RequirementsAnalysisAgent:
+    """Get agent warm cho model từ ModelPool (tạo lazily ở lần đầu)"""
+    return get_model_pool().get(model)
+
+
+def resume_mode(agent: RequirementsAnalysisAgent, run_id: Optional[str], mode: Optional[str]) -> Optional[str]:
+    """
+    Execution mode khi client gửi resume_run_id: run có checkpoint là run của full pipeline
+    nên phải chạy tiếp bằng full pipeline, bất kể planner chọn gì lần này (hàm sync - DB)
+    """
+    if run_id and agent.has_run(run_id):
+        return MODE_FULL
+    return mode
+
+
+def plan_analysis(
+    text: str,
+    latency_budget: Optional[float] = None,
+    mode: Optional[str] = None
+) -> ExecutionPlan:
+    """Execution plan cho text (xem ExecutionPlanner.plan)"""
+    return get_planner().plan(text, latency_budget=latency_budget, mode=mode)
+
+
+def prepare_input(text: str) -> Tuple[NormalizationResult, CollapsedText]:
+    """
+    Text thực sự gửi cho model: chuẩn hóa (whitespace, header / footer, mục lục, lịch sử
+    thay đổi...) rồi bỏ requirement gần trùng - hàm sync (CPU), gọi qua asyncio.to_thread
+    """
+    normalized = get_input_normalizer().normalize(text)
+    return normalized, collapse_near_duplicates(normalized.text)
+
+
+@dataclass
+class PreparedAnalysis:
+    """Input đã chuẩn hóa / bỏ bản trùng + execution plan tính trên chính text gửi cho model"""
+    normalized: NormalizationResult
+    collapsed: CollapsedText
+    plan: ExecutionPlan
+
+    @property
+    def text(self) -> str:
+        return self.collapsed.text
+
+
+def prepare_analysis(
+    text: str,
+    latency_budget: Optional[float] = None,
+    mode: Optional[str] = None
+) -> PreparedAnalysis:
+    """
+    prepare_input rồi plan_analysis trên text đã chuẩn hóa (token / requirement mà model
+    thực sự nhận) - hàm sync (CPU), gọi qua run_in_threadpool / asyncio.to_thread
+
+    Args:
+        mode: Mode bị ép (request / resume_mode), None = planner tự chọn
+    """
+    normalized, collapsed = prepare_input(text)
+    return PreparedAnalysis(normalized, collapsed, plan_analysis(collapsed.text, latency_budget, mode))
+
+
+async def run_analysis(
+    agent: RequirementsAnalysisAgent,
+    text: str,
+    cache_mode: Optional[str] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    prepared: Optional[PreparedAnalysis] = None,
+    run_id: Optional[str] = None,
+    on_finding: Optional[Callable[[str, dict], Any]] = None
+) -> dict:
+    """
+    Chạy analysis theo execution plan, trong một analysis slot và một slot của model của agent
+    
+    Planner chọn FAST method (single API call) cho input nhỏ, full LangGraph pipeline cho
+    input nhiều requirement, chunked map-reduce engine cho input lớn (tránh timeout của
+    single call). Latency thực tế được báo lại cho planner để hiệu chỉnh dự đoán.
+    
+    Text được chuẩn hóa trước (xem prepare_input) và plan được tính trên text đã chuẩn hóa.
+    Requirement gần trùng chỉ được gửi cho model một lần (bản đầu tiên); finding được map
+    lại cho các bản trùng qua field `duplicates` và finding trùng bị bỏ.
+    
+    Args:
+        agent: RequirementsAnalysisAgent
+        text: SRS/User Stories text
+        cache_mode: None, "bypass" hoặc "refresh"
+        on_progress: callback(done, total) - chỉ được gọi bởi chunked engine
+        prepared: Kết quả prepare_analysis(text, ...) (None = chuẩn hóa và để planner tự chọn)
+        run_id: Run id cho checkpoint của full pipeline (run lỗi cùng id được chạy tiếp)
+        on_finding: async callback(section, item) cho từng finding (đã map `duplicates`) -
+            fast path gọi ngay khi model sinh xong finding, chunked / full gọi khi có kết quả
+    
+    Returns:
+        Kết quả analysis + key "plan" (ExecutionPlan.to_dict() kèm actual latency),
+        key "memo" (hit / miss của requirement memo theo kind), key "normalization"
+        (token trước / sau từng stage chuẩn hóa) và key "dedup" (số bản trùng đã bỏ)
+    """
+    prepared = prepared or await asyncio.to_thread(prepare_analysis, text)
+    normalized, collapsed, plan = prepared.normalized, prepared.collapsed, prepared.plan
+    text = collapsed.text
+    async with analysis_slot(), get_model_pool().model_slot(getattr(agent, "model", None)):
+        start_time = time.monotonic()
+        with memo_usage(cache_mode) as usage:
+            if plan.mode == MODE_CHUNKED:
+                result = await agent.aanalyze_chunked(text, cache_mode=cache_mode, on_progress=on_progress)
+            elif plan.mode == MODE_FULL:
+                result = await agent.aanalyze(text, cache_mode=cache_mode, run_id=run_id)
+            elif on_finding:
+                result = None
+                async for section, item in agent.astream_fast(text, cache_mode=cache_mode):
+                    if section == "result":
+                        result = item
+                        continue
+                    for expanded in collapsed.expand({section: [item]}).get(section, []):
+                        await on_finding(section, expanded)
+                result = result or {}
+            else:
+                result = await agent.aanalyze_fast(text, cache_mode=cache_mode)
+        get_planner().observe(plan, time.monotonic() - start_time)
+    result = collapsed.expand(result)
+    if on_finding and plan.mode in (MODE_CHUNKED, MODE_FULL):
+        for section in ("conflicts", "ambiguities", "suggestions"):
+            for item in result.get(section, []) or []:
+                await on_finding(section, item)
+    return {
+        **result,
+        "plan": plan.to_dict(),
+        "memo": usage.to_dict(),
+        "normalization": normalized.to_dict(),
+        "dedup": collapsed.to_dict()
+    }
+
+
+async def stream_analysis(
+    agent: RequirementsAnalysisAgent,
+    text: str,
+    cache_mode: Optional[str] = None,
+    prepared: Optional[PreparedAnalysis] = None,
+    run_id: Optional[str] = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Streaming version của run_analysis (cùng chuẩn hóa, bỏ bản trùng, execution plan, memo)
+    
+    run_analysis chạy trong một task riêng (memo usage / slot giữ nguyên context), findings
+    được chuyển qua queue nên consumer có thể đọc từ task khác (vd: with_heartbeat).
+    
+    Yields:
+        ("conflicts" | "ambiguities" | "suggestions", item), cuối cùng ("result", dict như
+        run_analysis); exception của analysis được raise lại cho consumer
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def on_finding(section: str, item: dict) -> None:
+        await queue.put((section, item))
+    
+    async def produce() -> None:
+        result = await run_analysis(agent, text, cache_mode, prepared=prepared, run_id=run_id, on_finding=on_finding)
+        await queue.put(("result", result))
+    
+    task = asyncio.ensure_future(produce())
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                getter.cancel()
+                task.result()  # Analysis lỗi -> raise
+                continue  # Item cuối cùng vẫn còn trong queue
+            section, item = getter.result()
+            yield section, item
+            if section == "result":
+                return
+    finally:
+        task.cancel()
+
+
+def save_analysis_result(
+    conflicts: list,
+    ambiguities: list,
+    suggestions: list,
+    text_input: Optional[str],
+    file_name: Optional[str],
+    model_used: Optional[str],
+    processing_time_seconds: int,
+    plan: Optional[dict] = None,
+    prompt_version: Optional[str] = None
+) -> Optional[int]:
+    """
+    Lưu kết quả vào database (optional, không fail nếu DB không available)
+    
+    Hàm sync - gọi qua run_in_threadpool để không block event loop
+    
+    Returns:
+        analysis_id hoặc None nếu không lưu được
+    """
+    try:
+        with session_scope() as db:
+            if db is None:
+                return None
+            saved_analysis = save_analysis(
+                db=db,
+                conflicts=conflicts,
+                ambiguities=ambiguities,
+                suggestions=suggestions,
+                text_input=text_input,
+                file_name=file_name,
+                model_used=model_used,
+                processing_time_seconds=processing_time_seconds,
+                plan=plan,
+                prompt_version=prompt_version
+            )
+            logger.info(f"Analysis saved to database with ID: {saved_analysis.id}")
+            return saved_analysis.id
+    except Exception as e:
+        # Log error nhưng không fail request
+        logger.warning(f"Failed to save to database: {str(e)}")
+        return None
+
+
+async def run_revision_analysis(
+    agent: RequirementsAnalysisAgent,
+    previous: dict,
+    text: str,
+    cache_mode: Optional[str] = None
+) -> dict:
+    """
+    Incremental analysis của `text` so với một analysis đã lưu (xem load_analysis)
+    
+    Cả hai bản được chuẩn hóa và bỏ bản trùng như run_analysis (analysis trước đó được
+    tính trên text đã chuẩn hóa), chạy trong analysis slot và slot của model
+    """
+    (_, previous_collapsed), (_, collapsed) = await asyncio.gather(
+        asyncio.to_thread(prepare_input, previous["text_input"]),
+        asyncio.to_thread(prepare_input, text)
+    )
+    async with analysis_slot(), get_model_pool().model_slot(getattr(agent, "model", None)):
+        result = await agent.aanalyze_revision(
+            previous_collapsed.text,
+            {
+                "conflicts": previous.get("conflicts", []),
+                "ambiguities": previous.get("ambiguities", []),
+                "suggestions": previous.get("suggestions", [])
+            },
+            collapsed.text,
+            cache_mode=cache_mode
+        )
+    return collapsed.expand(result)
+
+
+def load_analysis(analysis_id: int) -> Optional[dict]:
+    """
+    Load một analysis đã lưu (to_dict) - hàm sync, gọi qua run_in_threadpool
+    
+    Raises:
+        RuntimeError: nếu database không available
+    """
+    with session_scope() as db:
+        if db is None:
+            raise RuntimeError("Database not available")
+        analysis = get_analysis_by_id(db, analysis_id)
+        return analysis.to_dict() if analysis else None
+
+
+async def run_batch(
+    agent: RequirementsAnalysisAgent,
+    texts: List[str],
+    cache_mode: Optional[str] = None,
+    concurrency: int = BATCH_CONCURRENCY
+) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str], float]]:
+    """
+    Phân tích nhiều document đồng thời, yield kết quả theo thứ tự hoàn thành
+    
+    Tối đa `concurrency` document chạy cùng lúc; lỗi của một document không
+    làm hỏng cả batch.
+    
+    Yields:
+        (index, result, error, processing_time_seconds) - result là None nếu lỗi
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    
+    async def analyze_one(index: int, text: str):
+        async with semaphore:
+            start_time = time.time()
+            try:
+                with priority_lane(LANE_BATCH):  # Request interactive được lấy LLM quota trước
+                    result = await run_analysis(agent, text, cache_mode)
+                return index, result, None, time.time() - start_time
+            except Exception as e:
+                logger.warning(f"Batch document {index} failed: {str(e)}")
+                return index, None, str(e) or type(e).__name__, time.time() - start_time
+    
+    tasks = [asyncio.ensure_future(analyze_one(index, text)) for index, text in enumerate(texts)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def save_analysis_results(records: List[dict]) -> List[Optional[int]]:
+    """
+    Lưu nhiều kết quả vào database trong một transaction (optional, không fail nếu DB không available)
+    
+    Hàm sync - gọi qua run_in_threadpool để không block event loop
+    
+    Returns:
+        List analysis_id theo thứ tự records (None nếu không lưu được)
+    """
+    if not records:
+        return []
+    try:
+        with session_scope() as db:
+            if db is None:
+                return [None] * len(records)
+            saved = save_analyses(db, records)
+            return [analysis.id for analysis in saved]
+    except Exception as e:
+        logger.warning(f"Failed to save batch to database: {str(e)}")
+        return [None] * len(records)
+
+
+def valid_items(item_model, items: list) -> list:
+    """Validate list finding theo schema item, bỏ qua item sai format"""
+    valid = []
+    for payload in items:
+        try:
+            valid.append(item_model(**payload).dict(exclude_none=True))
+        except Exception:
+            continue
+    return valid
@@ -1,7 +1,10 @@
 import os
-import json
 from dotenv import load_dotenv
 import google.generativeai as genai
+from app.agents.llm_backend import complete
+from app.utils.json_stream import extract_findings
+from app.utils.rate_limiter import estimate_tokens, get_rate_limiter
+from app.utils.resilience import get_resilient_caller
 
 # Load environment variables
 load_dotenv()
@@ -61,34 +64,27 @@ Text to analyze:
 
 JSON Response:"""
 
-        # Gọi Gemini API
+        # Gọi Gemini API (hedging, retry có deadline và circuit breaker theo model);
+        # mỗi request lấy quota từ rate limiter dùng chung trước khi gửi
         model_instance = genai.GenerativeModel(model)
-        response = model_instance.generate_content(prompt)
+        caller = get_resilient_caller(f"{model}:analyzer", breaker_key=model)
+        limiter = get_rate_limiter()
         
-        # Lấy text response
-        response_text = response.text.strip()
+        def generate() -> str:
+            limiter.acquire_sync(estimate_tokens(prompt))
+            # LLM_BACKEND: live / record gọi Gemini, replay trả response từ cassette
+            text = complete(model, prompt, lambda: model_instance.generate_content(prompt).text)
+            limiter.settle(estimate_tokens(text))
+            return text
         
-        # Tìm JSON trong response (có thể có markdown code block)
-        if "```json" in response_text:
-            json_start = response_text.find("```json") + 7
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-        elif "```" in response_text:
-            json_start = response_text.find("```") + 3
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
+        # Lấy text response
+        response_text = caller.call(generate).strip()
         
-        # Parse JSON
-        try:
-            result = json.loads(response_text)
-        except json.JSONDecodeError:
-            # Nếu không parse được JSON, thử tìm JSON object trong text
-            import re
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                result = json.loads(json_match.group())
-            else:
-                # Fallback: trả về structure rỗng với raw response
+        # Lấy JSON trong response (code fence, trailing comma, output bị cắt đều được xử lý)
+        result, report = extract_findings(response_text)
+        if not report.strict:
+            if not any(result.values()):
+                # Không salvage được gì: trả về structure rỗng với raw response
                 return {
                     "conflicts": [],
                     "ambiguities": [],
@@ -96,11 +92,7 @@ JSON Response:"""
                     "raw_response": response_text,
                     "error": "Could not parse JSON from response"
                 }
-        
-        # Đảm bảo structure đúng
-        result.setdefault("conflicts", [])
-        result.setdefault("ambiguities", [])
-        result.setdefault("suggestions", [])
+            result["warning"] = f"Partially parsed malformed response: {report.summary()}"
         
         return result
         
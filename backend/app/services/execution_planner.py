@@ -0,0 +1,218 @@
+"""
+Execution planner: chọn cách chạy analysis cho từng input
+
+Ước lượng số token và số requirement của text, dự đoán latency của từng mode rồi chọn:
+- fast: một LLM call (input nhỏ)
+- full: LangGraph pipeline (parse -> conflict/clarity -> improve), nhiều requirement
+  nhưng vẫn vừa một parse call
+- chunked: map-reduce song song theo chunk (input lớn, tránh timeout của single call)
+
+Mode được chọn là mode ưu tiên đầu tiên có latency dự đoán nằm trong latency budget
+của request; nếu không mode nào vừa, chọn mode nhanh nhất. Latency thực tế được dùng
+để hiệu chỉnh dự đoán (EWMA theo mode) và được lưu cùng plan vào analysis_history để
+tune thresholds từ dữ liệu thật.
+"""
+
+import os
+import math
+import threading
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+from app.agents.chunked_engine import CHUNK_MAX_CHARS, CHUNK_PARALLELISM, CHUNKED_MIN_CHARS
+from app.utils.logger import logger
+from app.utils.requirements_text import split_requirements
+
+MODE_FAST = "fast"
+MODE_FULL = "full"
+MODE_CHUNKED = "chunked"
+MODES = (MODE_FAST, MODE_FULL, MODE_CHUNKED)
+
+# Ước lượng token: số ký tự / PLANNER_CHARS_PER_TOKEN
+PLANNER_CHARS_PER_TOKEN = float(os.getenv("PLANNER_CHARS_PER_TOKEN", "4"))
+# Input từ ngưỡng này trở lên luôn chạy chunked
+PLANNER_CHUNKED_MIN_TOKENS = int(os.getenv("PLANNER_CHUNKED_MIN_TOKENS", str(int(CHUNKED_MIN_CHARS / 4))))
+# Full graph cho input có nhiều requirement nhưng parse call vẫn nhỏ
+PLANNER_FULL_MIN_REQUIREMENTS = int(os.getenv("PLANNER_FULL_MIN_REQUIREMENTS", "12"))
+PLANNER_FULL_MAX_TOKENS = int(os.getenv("PLANNER_FULL_MAX_TOKENS", "6000"))
+# Latency budget mặc định của một request
+PLANNER_LATENCY_BUDGET_SECONDS = float(os.getenv("PLANNER_LATENCY_BUDGET_SECONDS", "90"))
+
+# Latency model tuyến tính: overhead + seconds_per_1k_tokens * tokens / 1000
+PLANNER_FAST_OVERHEAD_SECONDS = float(os.getenv("PLANNER_FAST_OVERHEAD_SECONDS", "8"))
+PLANNER_FAST_SECONDS_PER_1K_TOKENS = float(os.getenv("PLANNER_FAST_SECONDS_PER_1K_TOKENS", "6"))
+PLANNER_FULL_OVERHEAD_SECONDS = float(os.getenv("PLANNER_FULL_OVERHEAD_SECONDS", "20"))
+PLANNER_FULL_SECONDS_PER_1K_TOKENS = float(os.getenv("PLANNER_FULL_SECONDS_PER_1K_TOKENS", "10"))
+PLANNER_CHUNKED_OVERHEAD_SECONDS = float(os.getenv("PLANNER_CHUNKED_OVERHEAD_SECONDS", "4"))
+
+# Trọng số của mỗi quan sát trong EWMA hiệu chỉnh (0 = tắt hiệu chỉnh)
+PLANNER_CALIBRATION_ALPHA = float(os.getenv("PLANNER_CALIBRATION_ALPHA", "0.2"))
+# Latency thực tế nhỏ hơn tỉ lệ này của dự đoán coi như cache hit -> không dùng để hiệu chỉnh
+_CACHE_HIT_RATIO = 0.1
+_MIN_CORRECTION, _MAX_CORRECTION = 0.25, 4.0
+
+
+@dataclass
+class ExecutionPlan:
+    """Plan đã chọn cho một input"""
+    mode: str
+    estimated_tokens: int
+    requirement_count: int
+    predicted_latency_seconds: float
+    latency_budget_seconds: float
+    reason: str
+    actual_latency_seconds: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class ExecutionPlanner:
+    """
+    Chọn mode fast / full / chunked theo kích thước input và latency budget
+
+    Usage:
+        planner = ExecutionPlanner()
+        plan = planner.plan(text, latency_budget=60)
+        ...chạy theo plan.mode...
+        planner.observe(plan, elapsed_seconds)
+    """
+
+    def __init__(
+        self,
+        chunked_min_tokens: int = PLANNER_CHUNKED_MIN_TOKENS,
+        full_min_requirements: int = PLANNER_FULL_MIN_REQUIREMENTS,
+        full_max_tokens: int = PLANNER_FULL_MAX_TOKENS,
+        latency_budget: float = PLANNER_LATENCY_BUDGET_SECONDS,
+        chars_per_token: float = PLANNER_CHARS_PER_TOKEN,
+        calibration_alpha: float = PLANNER_CALIBRATION_ALPHA
+    ):
+        self.chunked_min_tokens = chunked_min_tokens
+        self.full_min_requirements = full_min_requirements
+        self.full_max_tokens = full_max_tokens
+        self.latency_budget = latency_budget
+        self.chars_per_token = max(chars_per_token, 1.0)
+        self.calibration_alpha = calibration_alpha
+        self._lock = threading.Lock()
+        # Hệ số nhân cho dự đoán của mỗi mode (actual / predicted, EWMA)
+        self._correction: Dict[str, float] = {mode: 1.0 for mode in MODES}
+        self._observations: Dict[str, int] = {mode: 0 for mode in MODES}
+        self._planned: Dict[str, int] = {mode: 0 for mode in MODES}
+
+    def estimate_tokens(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def predict_latency(self, mode: str, estimated_tokens: int) -> float:
+        """Latency dự đoán (giây) của một mode cho input có `estimated_tokens` token"""
+        if mode == MODE_FULL:
+            base = PLANNER_FULL_OVERHEAD_SECONDS + PLANNER_FULL_SECONDS_PER_1K_TOKENS * estimated_tokens / 1000
+        elif mode == MODE_CHUNKED:
+            # Các chunk chạy theo đợt CHUNK_PARALLELISM call, thêm một đợt cross-chunk pass
+            chunk_tokens = min(estimated_tokens, CHUNK_MAX_CHARS / self.chars_per_token)
+            chunks = max(1, math.ceil(estimated_tokens / max(chunk_tokens, 1)))
+            waves = math.ceil(chunks / max(CHUNK_PARALLELISM, 1)) + (1 if chunks > 1 else 0)
+            per_call = PLANNER_FAST_OVERHEAD_SECONDS + PLANNER_FAST_SECONDS_PER_1K_TOKENS * chunk_tokens / 1000
+            base = PLANNER_CHUNKED_OVERHEAD_SECONDS + waves * per_call
+        else:
+            base = PLANNER_FAST_OVERHEAD_SECONDS + PLANNER_FAST_SECONDS_PER_1K_TOKENS * estimated_tokens / 1000
+        with self._lock:
+            return round(base * self._correction[mode], 2)
+
+    def plan(self, text: str, latency_budget: Optional[float] = None, mode: Optional[str] = None) -> ExecutionPlan:
+        """
+        Chọn plan cho text
+
+        Args:
+            text: Input text
+            latency_budget: Latency budget (giây) của request, None = mặc định
+            mode: Ép mode (fast / full / chunked), None = planner tự chọn
+        """
+        budget = latency_budget if latency_budget and latency_budget > 0 else self.latency_budget
+        tokens = self.estimate_tokens(text)
+        requirements = len(split_requirements(text))
+
+        if mode is not None:
+            if mode not in MODES:
+                raise ValueError(f"Unsupported execution mode: {mode}. Supported: {', '.join(MODES)}")
+            chosen, reason = mode, "requested"
+        else:
+            chosen, reason = self._choose(tokens, requirements, budget)
+
+        plan = ExecutionPlan(
+            mode=chosen,
+            estimated_tokens=tokens,
+            requirement_count=requirements,
+            predicted_latency_seconds=self.predict_latency(chosen, tokens),
+            latency_budget_seconds=budget,
+            reason=reason
+        )
+        with self._lock:
+            self._planned[chosen] += 1
+        logger.info(f"Execution plan: {chosen} ({reason}) - ~{tokens} tokens, {requirements} requirements, "
+                    f"predicted {plan.predicted_latency_seconds:.1f}s / budget {budget:.0f}s")
+        return plan
+
+    def _preferred_modes(self, tokens: int, requirements: int) -> List[str]:
+        if tokens >= self.chunked_min_tokens:
+            return [MODE_CHUNKED]
+        if requirements >= self.full_min_requirements and tokens <= self.full_max_tokens:
+            return [MODE_FULL, MODE_FAST, MODE_CHUNKED]
+        return [MODE_FAST, MODE_CHUNKED]
+
+    def _choose(self, tokens: int, requirements: int, budget: float):
+        preferred = self._preferred_modes(tokens, requirements)
+        if preferred == [MODE_CHUNKED]:
+            return MODE_CHUNKED, f"input >= {self.chunked_min_tokens} tokens"
+        predictions = {mode: self.predict_latency(mode, tokens) for mode in preferred}
+        for mode in preferred:
+            if predictions[mode] <= budget:
+                if mode == preferred[0]:
+                    return mode, "preferred mode fits the latency budget"
+                return mode, f"{preferred[0]} predicted {predictions[preferred[0]]:.0f}s > budget"
+        fastest = min(preferred, key=lambda mode: predictions[mode])
+        return fastest, "no mode fits the latency budget - using the fastest"
+
+    def observe(self, plan: ExecutionPlan, actual_seconds: float) -> None:
+        """Ghi latency thực tế vào plan và hiệu chỉnh dự đoán của mode đó"""
+        plan.actual_latency_seconds = round(actual_seconds, 2)
+        if self.calibration_alpha <= 0 or plan.predicted_latency_seconds <= 0:
+            return
+        if actual_seconds < plan.predicted_latency_seconds * _CACHE_HIT_RATIO:
+            return  # Cache hit: không phản ánh latency của model
+        with self._lock:
+            current = self._correction[plan.mode]
+            # predicted đã nhân correction hiện tại -> ratio so với latency model gốc
+            ratio = current * actual_seconds / plan.predicted_latency_seconds
+            updated = (1 - self.calibration_alpha) * current + self.calibration_alpha * ratio
+            self._correction[plan.mode] = min(_MAX_CORRECTION, max(_MIN_CORRECTION, updated))
+            self._observations[plan.mode] += 1
+
+    def get_stats(self) -> dict:
+        """Thresholds, hệ số hiệu chỉnh và số plan theo mode"""
+        with self._lock:
+            return {
+                "thresholds": {
+                    "chunked_min_tokens": self.chunked_min_tokens,
+                    "full_min_requirements": self.full_min_requirements,
+                    "full_max_tokens": self.full_max_tokens,
+                    "latency_budget_seconds": self.latency_budget
+                },
+                "modes": {
+                    mode: {
+                        "planned": self._planned[mode],
+                        "observations": self._observations[mode],
+                        "latency_correction": round(self._correction[mode], 3)
+                    }
+                    for mode in MODES
+                }
+            }
+
+
+_planner: Optional[ExecutionPlanner] = None
+
+
+def get_planner() -> ExecutionPlanner:
+    """Get or create execution planner instance"""
+    global _planner
+    if _planner is None:
+        _planner = ExecutionPlanner()
+    return _planner
@@ -9,6 +9,7 @@ from datetime import datetime
 from docx import Document
 from docx.shared import Pt, RGBColor, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+from app.utils.near_duplicates import dedupe_findings
 
 
 def export_to_json(
@@ -33,6 +34,9 @@ def export_to_json(
     # Tạo thư mục nếu chưa có
     Path(output_path).parent.mkdir(parents=True, exist_ok=True)
     
+    # Finding trùng (requirement gần trùng nhau) chỉ xuất một lần
+    analysis_data = dedupe_findings(analysis_data)
+    
     # Format data
     export_data = {
         "exported_at": datetime.now().isoformat(),
@@ -77,6 +81,9 @@ def export_to_docx(
     # Tạo thư mục nếu chưa có
     Path(output_path).parent.mkdir(parents=True, exist_ok=True)
     
+    # Finding trùng (requirement gần trùng nhau) chỉ xuất một lần
+    analysis_data = dedupe_findings(analysis_data)
+    
     # Tạo document
     doc = Document()
     
@@ -119,6 +126,7 @@ def export_to_docx(
             desc_para = doc.add_paragraph()
             desc_para.add_run('Description: ').bold = True
             desc_para.add_run(conflict.get("description", ""))
+            _add_duplicates(doc, conflict)
             
             doc.add_paragraph()  # Blank line
     else:
@@ -140,6 +148,7 @@ def export_to_docx(
             issue_para = doc.add_paragraph()
             issue_para.add_run('Issue: ').bold = True
             issue_para.add_run(ambiguity.get("issue", ""))
+            _add_duplicates(doc, ambiguity)
             
             doc.add_paragraph()  # Blank line
     else:
@@ -161,6 +170,7 @@ def export_to_docx(
             new_para = doc.add_paragraph()
             new_para.add_run('Improved Version: ').bold = True
             new_para.add_run(suggestion.get("new_version", ""))
+            _add_duplicates(doc, suggestion)
             
             doc.add_paragraph()  # Blank line
     else:
@@ -174,6 +184,15 @@ def export_to_docx(
     return output_path
 
 
+def _add_duplicates(doc, item: Dict) -> None:
+    """Các requirement gần trùng mà finding cũng áp dụng (nếu có)"""
+    duplicates = item.get("duplicates") or []
+    if duplicates:
+        dup_para = doc.add_paragraph()
+        dup_para.add_run('Also applies to: ').bold = True
+        dup_para.add_run("; ".join(duplicates))
+
+
 def cleanup_export_file(file_path: str):
     """Delete temporary export file"""
     try:
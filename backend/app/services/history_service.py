@@ -9,6 +9,23 @@ from app.utils.logger import logger
 from datetime import datetime
 
 
+def _plan_columns(plan: Optional[dict]) -> dict:
+    """Các cột execution plan của AnalysisHistory từ ExecutionPlan.to_dict()"""
+    if not plan:
+        return {}
+
+    def to_ms(seconds):
+        return int(round(seconds * 1000)) if seconds is not None else None
+
+    return {
+        "execution_plan": plan.get("mode"),
+        "estimated_tokens": plan.get("estimated_tokens"),
+        "requirement_count": plan.get("requirement_count"),
+        "predicted_latency_ms": to_ms(plan.get("predicted_latency_seconds")),
+        "actual_latency_ms": to_ms(plan.get("actual_latency_seconds"))
+    }
+
+
 def save_analysis(
     db: Session,
     conflicts: list,
@@ -17,7 +34,9 @@ def save_analysis(
     text_input: Optional[str] = None,
     file_name: Optional[str] = None,
     model_used: Optional[str] = None,
-    processing_time_seconds: Optional[int] = None
+    processing_time_seconds: Optional[int] = None,
+    plan: Optional[dict] = None,
+    prompt_version: Optional[str] = None
 ) -> AnalysisHistory:
     """
     Lưu kết quả phân tích vào database
@@ -31,6 +50,8 @@ def save_analysis(
         file_name: File name (nếu là upload)
         model_used: Model đã sử dụng
         processing_time_seconds: Thời gian xử lý
+        plan: ExecutionPlan.to_dict() của lần chạy (optional)
+        prompt_version: Version của bộ prompt đã dùng (optional)
     
     Returns:
         AnalysisHistory object
@@ -42,7 +63,9 @@ def save_analysis(
         ambiguities_json=ambiguities,
         suggestions_json=suggestions,
         model_used=model_used,
-        processing_time_seconds=processing_time_seconds
+        processing_time_seconds=processing_time_seconds,
+        prompt_version=prompt_version,
+        **_plan_columns(plan)
     )
     
     db.add(analysis)
@@ -53,6 +76,46 @@ def save_analysis(
     return analysis
 
 
+def save_analyses(db: Session, records: List[dict]) -> List[AnalysisHistory]:
+    """
+    Lưu nhiều kết quả phân tích trong một transaction (dùng cho batch analysis)
+    
+    Args:
+        db: Database session
+        records: List các dict cùng keyword với save_analysis (conflicts, ambiguities,
+            suggestions, text_input, file_name, model_used, processing_time_seconds, plan, prompt_version)
+    
+    Returns:
+        List AnalysisHistory theo đúng thứ tự của records
+    """
+    analyses = [
+        AnalysisHistory(
+            text_input=record.get("text_input"),
+            file_name=record.get("file_name"),
+            conflicts_json=record.get("conflicts", []),
+            ambiguities_json=record.get("ambiguities", []),
+            suggestions_json=record.get("suggestions", []),
+            model_used=record.get("model_used"),
+            processing_time_seconds=record.get("processing_time_seconds"),
+            prompt_version=record.get("prompt_version"),
+            **_plan_columns(record.get("plan"))
+        )
+        for record in records
+    ]
+    
+    try:
+        db.add_all(analyses)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    for analysis in analyses:
+        db.refresh(analysis)
+    
+    logger.info(f"Saved {len(analyses)} analyses in one transaction")
+    return analyses
+
+
 def get_analysis_by_id(db: Session, analysis_id: int) -> Optional[AnalysisHistory]:
     """Lấy kết quả phân tích theo ID"""
     return db.query(AnalysisHistory).filter(AnalysisHistory.id == analysis_id).first()
@@ -0,0 +1,524 @@
+"""
+Job subsystem cho phân tích bất đồng bộ
+
+POST /api/jobs/analyze trả về job id ngay lập tức; một worker pool có giới hạn
+(JOB_WORKERS) chạy job trong background. Trạng thái job được lưu ở bảng analysis_jobs
+(cạnh analysis_history) nên client có thể poll từ bất kỳ request nào và job chưa xong
+sẽ được chạy lại sau khi server restart.
+
+Mỗi job có owner (process đã nhận job) và heartbeat_at; owner cập nhật heartbeat mỗi
+JOB_HEARTBEAT_SECONDS. Process khác chỉ nhận lại job có heartbeat cũ hơn
+JOB_STALE_SECONDS (owner đã chết), nên job đang chạy ở worker còn sống không bị chạy hai
+lần. Cancel từ process khác chỉ ghi DB; owner thấy ở heartbeat kế tiếp và dừng task, kết
+quả của task bị hủy không ghi đè trạng thái cancelled.
+
+Nếu database không available, job chỉ được giữ trong memory của process hiện tại.
+"""
+
+import os
+import time
+import uuid
+import socket
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+from app.api.schema import ConflictItem, AmbiguityItem, SuggestionItem
+from app.database.db import session_scope
+from app.database.models import AnalysisJob
+from app.services.analysis_service import get_agent, run_analysis, save_analysis_result, valid_items
+from app.utils.rate_limiter import LANE_BATCH, priority_lane
+from app.utils.logger import logger
+
+# Config qua .env
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(24 * 3600)))  # Giữ job đã xong trong memory
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+# Job có heartbeat cũ hơn ngưỡng này được coi là của process đã chết và được nhận lại
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "60"))
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+FINAL_STATUSES = {STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED}
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+_PERSISTED_FIELDS = (
+    "status", "progress", "input_text", "file_name", "model_used", "cache_mode",
+    "result_json", "error", "analysis_id", "owner", "heartbeat_at", "started_at", "finished_at"
+)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _age_seconds(value: datetime) -> float:
+    """Số giây từ `value` tới hiện tại (DB có thể trả về datetime không có timezone)"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (_now() - value).total_seconds()
+
+
+class JobManager:
+    """
+    Queue + worker pool cho analysis jobs
+
+    Job state ở memory là nguồn chính cho job process này đang giữ (owner); mọi thay đổi
+    trạng thái được ghi xuống DB (trong thread) để poll từ process khác và recover sau
+    restart. Job của process khác luôn được đọc từ DB.
+    """
+
+    def __init__(
+        self,
+        worker_count: int = JOB_WORKERS,
+        session_factory: Callable = session_scope,
+        agent_factory: Callable = get_agent
+    ):
+        self.worker_count = max(1, worker_count)
+        self._session_factory = session_factory
+        self._agent_factory = agent_factory
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._heartbeat: Optional[asyncio.Task] = None
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    @property
+    def started(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self, recover: bool = True):
+        """
+        Khởi động worker pool và heartbeat (idempotent)
+
+        recover: nhận lại job chưa xong của process đã chết (heartbeat cũ), lúc start và
+        ở mỗi heartbeat sau đó
+        """
+        if self.started:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.worker_count)]
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop(recover))
+        logger.info(f"Job worker pool started with {self.worker_count} workers (owner {self.owner_id})")
+
+        if recover:
+            await self._recover_stale()
+
+    async def stop(self):
+        """Dừng worker pool (job đang chạy giữ trạng thái running, được nhận lại khi heartbeat cũ)"""
+        tasks = list(self._running.values()) + self._workers + ([self._heartbeat] if self._heartbeat else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._heartbeat = None
+        self._queue = None
+
+    async def submit(
+        self,
+        text: str,
+        file_name: Optional[str] = None,
+        model: Optional[str] = None,
+        cache_mode: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Tạo job mới và đưa vào queue"""
+        await self.start()
+        self._prune_finished()
+
+        job = {
+            "id": str(uuid.uuid4()),
+            "status": STATUS_QUEUED,
+            "progress": 0,
+            "input_text": text,
+            "file_name": file_name,
+            "model_used": model,
+            "cache_mode": cache_mode,
+            "result_json": None,
+            "error": None,
+            "analysis_id": None,
+            "owner": self.owner_id,
+            "heartbeat_at": _now(),
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None
+        }
+        self._jobs[job["id"]] = job
+        await asyncio.to_thread(self._persist, job)
+        self._queue.put_nowait(job["id"])
+        logger.info(f"Job {job['id']} queued (queue size: {self._queue.qsize()})")
+        return self.to_public(job)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Lấy trạng thái job (memory nếu process này giữ job hoặc job đã xong, còn lại DB)"""
+        job = self._jobs.get(job_id)
+        if job is None or not self._is_local(job):
+            job = await asyncio.to_thread(self._load, job_id) or job
+        return self.to_public(job) if job else None
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Hủy job: job đang đợi bị bỏ khỏi queue, job đang chạy bị cancel task
+
+        Job do process khác giữ chỉ được đánh dấu cancelled trong DB; owner dừng task ở
+        heartbeat kế tiếp.
+
+        Returns:
+            Trạng thái job sau khi hủy, None nếu không tìm thấy
+        """
+        job = self._jobs.get(job_id)
+        if job is None or not self._is_local(job):
+            job = await asyncio.to_thread(self._load, job_id) or job
+            if job is None:
+                return None
+
+        if job["status"] in FINAL_STATUSES:
+            return self.to_public(job)
+
+        if not self._is_local(job):
+            await asyncio.to_thread(self._cancel_remote, job_id)
+            logger.info(f"Job {job_id} (owner {job.get('owner')}) marked cancelled")
+            job = await asyncio.to_thread(self._load, job_id) or job
+            return self.to_public(job)
+
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+            await asyncio.wait({task})
+        await self._update(job, status=STATUS_CANCELLED, finished_at=_now())
+        logger.info(f"Job {job_id} cancelled")
+        return self.to_public(job)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Thống kê worker pool"""
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {
+            "workers": self.worker_count,
+            "queue_size": self._queue.qsize() if self._queue else 0,
+            "running": len(self._running),
+            "jobs": counts,
+            "owner": self.owner_id
+        }
+
+    @staticmethod
+    def to_public(job: Dict[str, Any]) -> Dict[str, Any]:
+        """Job dict trả về cho client (không kèm input text)"""
+        def iso(value):
+            return value.isoformat() if isinstance(value, datetime) else value
+
+        return {
+            "id": job["id"],
+            "status": job["status"],
+            "progress": job["progress"],
+            "file_name": job.get("file_name"),
+            "model_used": job.get("model_used"),
+            "result": job.get("result_json"),
+            "error": job.get("error"),
+            "analysis_id": job.get("analysis_id"),
+            "created_at": iso(job.get("created_at")),
+            "started_at": iso(job.get("started_at")),
+            "finished_at": iso(job.get("finished_at"))
+        }
+
+    # ------------------------------------------------------------------
+    # Worker
+    # ------------------------------------------------------------------
+    async def _worker(self, index: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = self._jobs.get(job_id)
+                if job is None or job["status"] != STATUS_QUEUED:
+                    continue  # Đã bị cancel khi còn trong queue
+                if not await asyncio.to_thread(self._claim, job_id):
+                    # Bị cancel / process khác đã nhận job này - đọc lại trạng thái từ DB
+                    await self._reload(job)
+                    continue
+                task = asyncio.create_task(self._run_job(job))
+                self._running[job_id] = task
+                await asyncio.wait({task})
+                if task.cancelled():
+                    await self._update(job, status=STATUS_CANCELLED, finished_at=_now())
+            except Exception as e:
+                logger.error(f"Job worker {index} error: {str(e)}")
+            finally:
+                self._running.pop(job_id, None)
+                self._queue.task_done()
+
+    async def _run_job(self, job: Dict[str, Any]):
+        await self._update(job, status=STATUS_RUNNING, progress=5, started_at=_now())
+        start_time = time.time()
+
+        def on_progress(done: int, total: int):
+            # Chỉ cập nhật memory; DB được cập nhật ở các mốc running / xong
+            job["progress"] = min(95, 5 + int(90 * done / max(total, 1)))
+
+        try:
+            agent = self._agent_factory(job.get("model_used"))
+            with priority_lane(LANE_BATCH):  # Job chạy nền: nhường LLM quota cho request interactive
+                result = await run_analysis(agent, job["input_text"], job.get("cache_mode"), on_progress=on_progress)
+            plan = result.get("plan")
+            result = {
+                "conflicts": valid_items(ConflictItem, result.get("conflicts", [])),
+                "ambiguities": valid_items(AmbiguityItem, result.get("ambiguities", [])),
+                "suggestions": valid_items(SuggestionItem, result.get("suggestions", []))
+            }
+            processing_time = int(time.time() - start_time)
+            analysis_id = await asyncio.to_thread(
+                save_analysis_result,
+                conflicts=result["conflicts"],
+                ambiguities=result["ambiguities"],
+                suggestions=result["suggestions"],
+                text_input=None if job.get("file_name") else job["input_text"],
+                file_name=job.get("file_name"),
+                model_used=job.get("model_used"),
+                prompt_version=getattr(agent, "prompt_version", None),
+                processing_time_seconds=processing_time,
+                plan=plan
+            )
+            await self._update(
+                job,
+                status=STATUS_SUCCEEDED,
+                progress=100,
+                result_json=result,
+                analysis_id=analysis_id,
+                finished_at=_now()
+            )
+            logger.info(f"Job {job['id']} succeeded in {processing_time} seconds")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {str(e)}")
+            await self._update(job, status=STATUS_FAILED, error=str(e), finished_at=_now())
+
+    async def _update(self, job: Dict[str, Any], **fields):
+        """
+        Cập nhật job process này đang giữ; nếu trong DB job đã bị cancel / được process
+        khác nhận thì không ghi đè và memory được đọc lại từ DB
+        """
+        job.update(fields)
+        if not await asyncio.to_thread(self._persist_owned, job):
+            logger.info(f"Job {job['id']} is no longer owned by this process - keeping stored state")
+            await self._reload(job)
+
+    async def _reload(self, job: Dict[str, Any]):
+        """Thay state ở memory bằng state trong DB (giữ nguyên dict - worker đang tham chiếu)"""
+        loaded = await asyncio.to_thread(self._load, job["id"])
+        if loaded:
+            job.clear()
+            job.update(loaded)
+
+    def _is_local(self, job: Dict[str, Any]) -> bool:
+        """Memory của process này là nguồn đúng cho job (owner hoặc job đã xong)"""
+        return job.get("owner") == self.owner_id or job["status"] in FINAL_STATUSES
+
+    async def _heartbeat_loop(self, recover: bool):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                active = [job_id for job_id, job in self._jobs.items()
+                          if job["status"] in ACTIVE_STATUSES and job.get("owner") == self.owner_id]
+                lost = await asyncio.to_thread(self._touch, active)
+                for job_id in lost:
+                    # Bị cancel từ process khác (hoặc đã được nhận lại): dừng task, không ghi đè DB
+                    await self._reload(self._jobs[job_id])
+                    task = self._running.get(job_id)
+                    if task is not None:
+                        task.cancel()
+                    logger.info(f"Job {job_id} cancelled or taken over elsewhere - stopping")
+                if recover:
+                    await self._recover_stale()
+            except Exception as e:
+                logger.warning(f"Job heartbeat failed: {str(e)}")
+
+    async def _recover_stale(self):
+        """Nhận lại job chưa xong có heartbeat cũ (process giữ job đã chết) và đưa vào queue"""
+        recovered = await asyncio.to_thread(self._take_over_stale)
+        for job in recovered:
+            self._jobs[job["id"]] = job
+            self._queue.put_nowait(job["id"])
+        if recovered:
+            logger.info(f"Recovered {len(recovered)} unfinished jobs")
+
+    def _prune_finished(self):
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["status"] in FINAL_STATUSES
+            and job.get("finished_at")
+            and _age_seconds(job["finished_at"]) > JOB_RETENTION_SECONDS
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    # ------------------------------------------------------------------
+    # Persistence (sync - gọi qua asyncio.to_thread)
+    # ------------------------------------------------------------------
+    def _persist(self, job: Dict[str, Any]):
+        try:
+            with self._session_factory() as db:
+                if db is None:
+                    return
+                row = db.query(AnalysisJob).filter(AnalysisJob.id == job["id"]).first()
+                if row is None:
+                    row = AnalysisJob(id=job["id"], created_at=job.get("created_at"))
+                    db.add(row)
+                for field in _PERSISTED_FIELDS:
+                    setattr(row, field, job.get(field))
+                db.commit()
+        except Exception as e:
+            logger.warning(f"Failed to persist job {job['id']}: {str(e)}")
+
+    def _persist_owned(self, job: Dict[str, Any]) -> bool:
+        """
+        Ghi job chỉ khi process này vẫn là owner và job chưa xong trong DB (atomic)
+
+        Returns:
+            False nếu job đã bị cancel / được process khác nhận (True khi không có DB)
+        """
+        try:
+            with self._session_factory() as db:
+                if db is None:
+                    return True
+                updated = db.query(AnalysisJob).filter(
+                    AnalysisJob.id == job["id"],
+                    AnalysisJob.owner == self.owner_id,
+                    AnalysisJob.status.in_(ACTIVE_STATUSES)
+                ).update({field: job.get(field) for field in _PERSISTED_FIELDS}, synchronize_session=False)
+                db.commit()
+                return updated == 1
+        except Exception as e:
+            logger.warning(f"Failed to persist job {job['id']}: {str(e)}")
+            return True
+
+    def _claim(self, job_id: str) -> bool:
+        """Chuyển job queued -> running trong DB một cách atomic (tránh 2 process chạy cùng job)"""
+        try:
+            with self._session_factory() as db:
+                if db is None:
+                    return True
+                updated = db.query(AnalysisJob).filter(
+                    AnalysisJob.id == job_id,
+                    AnalysisJob.owner == self.owner_id,
+                    AnalysisJob.status == STATUS_QUEUED
+                ).update({"status": STATUS_RUNNING, "heartbeat_at": _now()}, synchronize_session=False)
+                db.commit()
+                return updated == 1
+        except Exception as e:
+            logger.warning(f"Failed to claim job {job_id}: {str(e)}")
+            return True
+
+    def _cancel_remote(self, job_id: str) -> bool:
+        """Đánh dấu cancelled job chưa xong do process khác giữ"""
+        try:
+            with self._session_factory() as db:
+                if db is None:
+                    return False
+                updated = db.query(AnalysisJob).filter(
+                    AnalysisJob.id == job_id,
+                    AnalysisJob.status.in_(ACTIVE_STATUSES)
+                ).update({"status": STATUS_CANCELLED, "finished_at": _now()}, synchronize_session=False)
+                db.commit()
+                return updated == 1
+        except Exception as e:
+            logger.warning(f"Failed to cancel job {job_id}: {str(e)}")
+            return False
+
+    def _touch(self, job_ids: List[str]) -> List[str]:
+        """
+        Cập nhật heartbeat của các job process này đang giữ
+
+        Returns:
+            Job id không còn thuộc process này trong DB (bị cancel / được nhận lại)
+        """
+        if not job_ids:
+            return []
+        try:
+            with self._session_factory() as db:
+                if db is None:
+                    return []
+                db.query(AnalysisJob).filter(
+                    AnalysisJob.id.in_(job_ids),
+                    AnalysisJob.owner == self.owner_id,
+                    AnalysisJob.status.in_(ACTIVE_STATUSES)
+                ).update({"heartbeat_at": _now()}, synchronize_session=False)
+                db.commit()
+                rows = db.query(AnalysisJob.id, AnalysisJob.owner, AnalysisJob.status).filter(
+                    AnalysisJob.id.in_(job_ids)
+                ).all()
+                return [
+                    row.id for row in rows
+                    if row.owner != self.owner_id or row.status not in ACTIVE_STATUSES
+                ]
+        except Exception as e:
+            logger.warning(f"Failed to update job heartbeat: {str(e)}")
+            return []
+
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with self._session_factory() as db:
+                if db is None:
+                    return None
+                row = db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+                return self._row_to_job(row) if row else None
+        except Exception as e:
+            logger.warning(f"Failed to load job {job_id}: {str(e)}")
+            return None
+
+    def _take_over_stale(self) -> List[Dict[str, Any]]:
+        """
+        Nhận các job chưa xong có heartbeat cũ hơn JOB_STALE_SECONDS (queued lại, owner =
+        process này); update có điều kiện nên hai process recover cùng lúc không cùng nhận
+        """
+        try:
+            with self._session_factory() as db:
+                if db is None:
+                    return []
+                rows = db.query(AnalysisJob).filter(
+                    AnalysisJob.status.in_(ACTIVE_STATUSES),
+                    (AnalysisJob.owner != self.owner_id) | AnalysisJob.owner.is_(None)
+                ).order_by(AnalysisJob.created_at.asc()).all()
+                recovered = []
+                for row in rows:
+                    if row.heartbeat_at is not None and _age_seconds(row.heartbeat_at) <= JOB_STALE_SECONDS:
+                        continue  # Owner còn sống
+                    unchanged = [
+                        AnalysisJob.id == row.id,
+                        AnalysisJob.status == row.status,
+                        AnalysisJob.owner.is_(None) if row.owner is None else AnalysisJob.owner == row.owner,
+                        AnalysisJob.heartbeat_at.is_(None) if row.heartbeat_at is None
+                        else AnalysisJob.heartbeat_at == row.heartbeat_at
+                    ]
+                    fields = {"status": STATUS_QUEUED, "progress": 0, "started_at": None,
+                              "owner": self.owner_id, "heartbeat_at": _now()}
+                    if db.query(AnalysisJob).filter(*unchanged).update(fields, synchronize_session=False) == 1:
+                        db.commit()
+                        recovered.append({**self._row_to_job(row), **fields})
+                    else:
+                        db.rollback()
+                return recovered
+        except Exception as e:
+            logger.warning(f"Failed to recover unfinished jobs: {str(e)}")
+            return []
+
+    @staticmethod
+    def _row_to_job(row: AnalysisJob) -> Dict[str, Any]:
+        job = {field: getattr(row, field) for field in _PERSISTED_FIELDS}
+        job["id"] = row.id
+        job["created_at"] = row.created_at
+        return job
+
+
+# Job manager singleton
+_job_manager: Optional[JobManager] = None
+
+
+def get_job_manager() -> JobManager:
+    """Get or create job manager instance"""
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = JobManager()
+    return _job_manager
@@ -0,0 +1,249 @@
+"""
+Pool các agent (LLM clients + compiled chains) theo model
+
+Mỗi model được yêu cầu (AnalyzeRequest.model / form field `model`) có một
+RequirementsAnalysisAgent riêng, tạo lazily ở request đầu tiên và giữ warm cho
+các request sau. Agent không dùng quá MODEL_POOL_IDLE_SECONDS bị evict; mỗi model
+có giới hạn số call đồng thời riêng (model chậm / đắt không chiếm hết analysis slots).
+"""
+
+import os
+import time
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+from app.utils.logger import logger
+
+DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "gemini-2.5-flash")
+
+# Danh sách model được phép (comma-separated)
+ALLOWED_MODELS = [
+    name.strip()
+    for name in os.getenv(
+        "ALLOWED_MODELS",
+        "gemini-2.5-flash,gemini-2.5-flash-lite,gemini-2.5-pro,gemini-1.5-pro,gemini-1.5-flash"
+    ).split(",")
+    if name.strip()
+]
+
+# Agent không được dùng trong khoảng này sẽ bị evict
+MODEL_POOL_IDLE_SECONDS = float(os.getenv("MODEL_POOL_IDLE_SECONDS", "900"))
+# Số agent tối đa giữ trong pool (evict agent idle lâu nhất khi vượt)
+MODEL_POOL_MAX_MODELS = int(os.getenv("MODEL_POOL_MAX_MODELS", "4"))
+# Số call đồng thời mặc định cho mỗi model
+MODEL_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", "16"))
+# Override theo model, vd: "gemini-2.5-pro=4,gemini-2.5-flash-lite=32"
+MODEL_CONCURRENCY_LIMITS = os.getenv("MODEL_CONCURRENCY_LIMITS", "")
+
+
+class UnsupportedModelError(ValueError):
+    """Model không nằm trong ALLOWED_MODELS"""
+
+
+def parse_concurrency_limits(value: str) -> Dict[str, int]:
+    """Parse "model=limit,model=limit" thành dict"""
+    limits = {}
+    for part in value.split(","):
+        if "=" not in part:
+            continue
+        name, limit = part.split("=", 1)
+        try:
+            limits[name.strip()] = max(1, int(limit))
+        except ValueError:
+            logger.warning(f"Ignoring invalid model concurrency limit: {part}")
+    return limits
+
+
+@dataclass
+class _PoolEntry:
+    agent: Any
+    created_at: float
+    last_used: float
+    requests: int = 0
+
+
+@dataclass
+class _ModelSlots:
+    semaphore: asyncio.Semaphore
+    limit: int
+    in_flight: int = 0
+    waiting: int = 0
+    peak: int = 0
+
+
+class ModelPool:
+    """
+    Pool agent theo model: lazy creation, idle eviction, per-model concurrency limit
+
+    Usage:
+        pool = ModelPool(agent_factory=lambda model: RequirementsAnalysisAgent(model=model))
+        agent = pool.get("gemini-2.5-pro")
+        async with pool.model_slot(agent.model):
+            result = await agent.aanalyze_fast(text)
+    """
+
+    def __init__(
+        self,
+        agent_factory: Callable[[str], Any],
+        allowed_models: Optional[List[str]] = None,
+        default_model: str = DEFAULT_MODEL,
+        idle_seconds: float = MODEL_POOL_IDLE_SECONDS,
+        max_models: int = MODEL_POOL_MAX_MODELS,
+        default_limit: int = MODEL_MAX_CONCURRENCY,
+        limits: Optional[Dict[str, int]] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self._agent_factory = agent_factory
+        self.allowed_models = list(allowed_models if allowed_models is not None else ALLOWED_MODELS)
+        self.default_model = default_model
+        self.idle_seconds = idle_seconds
+        self.max_models = max(1, max_models)
+        self.default_limit = max(1, default_limit)
+        self.limits = limits if limits is not None else parse_concurrency_limits(MODEL_CONCURRENCY_LIMITS)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _PoolEntry] = {}
+        # Slots không bị evict cùng agent để giới hạn luôn đúng với request đang chạy
+        self._slots: Dict[str, _ModelSlots] = {}
+        self._created = 0
+        self._evicted = 0
+
+    def resolve(self, model: Optional[str]) -> str:
+        """Chuẩn hóa tên model (None -> default); raise UnsupportedModelError nếu không hỗ trợ"""
+        name = (model or "").strip() or self.default_model
+        if self.allowed_models and name not in self.allowed_models:
+            raise UnsupportedModelError(
+                f"Unsupported model: {name}. Supported: {', '.join(self.allowed_models)}"
+            )
+        return name
+
+    def get(self, model: Optional[str] = None) -> Any:
+        """Lấy agent warm cho model, tạo mới nếu chưa có"""
+        name = self.resolve(model)
+        with self._lock:
+            now = self._clock()
+            self._evict_idle_locked(now)
+            entry = self._entries.get(name)
+            if entry is None:
+                logger.info(f"Creating agent for model {name}")
+                entry = _PoolEntry(agent=self._agent_factory(name), created_at=now, last_used=now)
+                self._entries[name] = entry
+                self._created += 1
+                self._evict_overflow_locked(keep=name)
+            entry.last_used = now
+            entry.requests += 1
+            return entry.agent
+
+    @asynccontextmanager
+    async def model_slot(self, model: Optional[str] = None):
+        """Giữ một slot của model trong block `async with` (đợi nếu model đã đạt giới hạn)"""
+        slots = self._get_slots(self.resolve(model))
+        slots.waiting += 1
+        try:
+            await slots.semaphore.acquire()
+        finally:
+            slots.waiting -= 1
+
+        slots.in_flight += 1
+        slots.peak = max(slots.peak, slots.in_flight)
+        try:
+            yield
+        finally:
+            slots.in_flight -= 1
+            slots.semaphore.release()
+
+    def evict_idle(self) -> List[str]:
+        """Evict các agent idle quá idle_seconds; trả về tên model đã evict"""
+        with self._lock:
+            return self._evict_idle_locked(self._clock())
+
+    def get_stats(self) -> dict:
+        """Thống kê pool: agent đang warm, số request và slot theo model"""
+        with self._lock:
+            now = self._clock()
+            models = {}
+            for name in sorted(set(self._entries) | set(self._slots)):
+                entry = self._entries.get(name)
+                slots = self._slots.get(name)
+                models[name] = {
+                    "warm": entry is not None,
+                    "requests": entry.requests if entry else 0,
+                    "idle_seconds": round(now - entry.last_used, 1) if entry else None,
+                    "limit": slots.limit if slots else self._limit_for(name),
+                    "in_flight": slots.in_flight if slots else 0,
+                    "waiting": slots.waiting if slots else 0,
+                    "peak_in_flight": slots.peak if slots else 0
+                }
+            return {
+                "default_model": self.default_model,
+                "allowed_models": self.allowed_models,
+                "warm_models": len(self._entries),
+                "max_models": self.max_models,
+                "created": self._created,
+                "evicted": self._evicted,
+                "models": models
+            }
+
+    def _limit_for(self, name: str) -> int:
+        return self.limits.get(name, self.default_limit)
+
+    def _get_slots(self, name: str) -> _ModelSlots:
+        with self._lock:
+            slots = self._slots.get(name)
+            if slots is None:
+                limit = self._limit_for(name)
+                slots = _ModelSlots(semaphore=asyncio.Semaphore(limit), limit=limit)
+                self._slots[name] = slots
+            return slots
+
+    def _is_busy(self, name: str) -> bool:
+        slots = self._slots.get(name)
+        return slots is not None and (slots.in_flight > 0 or slots.waiting > 0)
+
+    def _evict_locked(self, name: str, reason: str) -> None:
+        del self._entries[name]
+        self._evicted += 1
+        logger.info(f"Evicted agent for model {name} ({reason})")
+
+    def _evict_idle_locked(self, now: float) -> List[str]:
+        evicted = [
+            name for name, entry in self._entries.items()
+            if now - entry.last_used > self.idle_seconds and not self._is_busy(name)
+        ]
+        for name in evicted:
+            self._evict_locked(name, "idle")
+        return evicted
+
+    def _evict_overflow_locked(self, keep: str) -> None:
+        while len(self._entries) > self.max_models:
+            candidates = [
+                (entry.last_used, name) for name, entry in self._entries.items()
+                if name != keep and not self._is_busy(name)
+            ]
+            if not candidates:
+                return
+            _, name = min(candidates)
+            self._evict_locked(name, "pool full")
+
+
+_model_pool: Optional[ModelPool] = None
+
+
+def _build_agent(model: str):
+    from app.agents.langgraph_agent import RequirementsAnalysisAgent
+    from app.agents.llm_backend import requires_api_key
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key and requires_api_key():
+        raise ValueError("GEMINI_API_KEY not found in environment variables")
+    return RequirementsAnalysisAgent(api_key=api_key, model=model)
+
+
+def get_model_pool() -> ModelPool:
+    """Get or create model pool instance"""
+    global _model_pool
+    if _model_pool is None:
+        _model_pool = ModelPool(agent_factory=_build_agent)
+    return _model_pool
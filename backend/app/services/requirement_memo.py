@@ -0,0 +1,420 @@
+"""
+Memoization theo từng requirement, dùng chung giữa các document
+
+Requirement boilerplate (security, logging, performance NFR) lặp lại trong nhiều SRS.
+Verdict của model cho một requirement (mơ hồ hay không + issue, bản rewrite) được lưu
+theo key = sha256(kind + model + prompt version + requirement fingerprint), nên document
+mới chỉ gửi cho model các requirement chưa có verdict.
+
+Kinds:
+- ambiguity: verdict của clarity_check_node {"ambiguous": bool, "issue": str | None}
+- improve: rewrite của improve node cho requirement mơ hồ {"new_version": str}
+- fast: verdict của fast path {"ambiguous": bool, "issue": ..., "new_version": ...}
+
+Conflict phụ thuộc vào cả document nên không được memo; requirement dính conflict trong
+một lần chạy không được lưu verdict từ lần đó.
+
+2 tầng như AnalysisCache: memory LRU + bảng requirement_memo (LRU theo last_used_at,
+tối đa REQUIREMENT_MEMO_MAX_ROWS dòng). Hit rate của từng analysis được đếm qua
+memo_usage() (contextvar) và trả về trong AnalyzeResponse.stats["memo"].
+"""
+
+import os
+import copy
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from app.database.db import session_scope
+from app.database.models import RequirementMemoEntry
+from app.services.analysis_cache import CACHE_BYPASS, CACHE_REFRESH
+from app.utils.logger import logger
+from app.utils.requirements_text import best_match, requirement_fingerprint
+
+REQUIREMENT_MEMO_ENABLED = os.getenv("REQUIREMENT_MEMO_ENABLED", "true").lower() in ("1", "true", "yes")
+REQUIREMENT_MEMO_MEMORY_ENTRIES = int(os.getenv("REQUIREMENT_MEMO_MEMORY_ENTRIES", "5000"))
+REQUIREMENT_MEMO_MAX_ROWS = int(os.getenv("REQUIREMENT_MEMO_MAX_ROWS", "50000"))
+# Kiểm tra số dòng / evict sau mỗi N lần ghi (không đếm bảng ở mọi lần ghi)
+REQUIREMENT_MEMO_EVICT_EVERY = int(os.getenv("REQUIREMENT_MEMO_EVICT_EVERY", "200"))
+
+KIND_AMBIGUITY = "ambiguity"
+KIND_IMPROVE = "improve"
+KIND_FAST = "fast"
+KINDS = (KIND_AMBIGUITY, KIND_IMPROVE, KIND_FAST)
+
+# Dòng note thêm vào input của fast prompt cho requirement đã có verdict
+MEMO_ASSESSED_HEADER = "[Requirements already assessed - do not report ambiguities or suggestions for them]"
+
+
+def make_memo_key(kind: str, model: str, prompt_version: str, requirement: str) -> str:
+    payload = "\x00".join([kind, model or "", prompt_version or "", requirement_fingerprint(requirement)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class MemoUsage:
+    """Hit / miss của memo trong một analysis"""
+    cache_mode: Optional[str] = None
+    counts: Dict[str, Dict[str, int]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, hits: int, misses: int) -> None:
+        with self._lock:
+            counts = self.counts.setdefault(kind, {"hits": 0, "misses": 0})
+            counts["hits"] += hits
+            counts["misses"] += misses
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            result: Dict[str, Any] = {}
+            total_hits = total = 0
+            for kind, counts in self.counts.items():
+                lookups = counts["hits"] + counts["misses"]
+                result[kind] = {**counts, "hit_rate": round(counts["hits"] / lookups, 4) if lookups else 0.0}
+                total_hits += counts["hits"]
+                total += lookups
+        result["hit_rate"] = round(total_hits / total, 4) if total else 0.0
+        return result
+
+
+_current_usage: ContextVar[Optional[MemoUsage]] = ContextVar("requirement_memo_usage", default=None)
+
+
+@contextmanager
+def memo_usage(cache_mode: Optional[str] = None) -> Iterator[MemoUsage]:
+    """
+    Đếm memo hit / miss của các LLM call trong block (kể cả task con)
+
+    cache_mode: "bypass" = không đọc / ghi memo, "refresh" = không đọc, ghi verdict mới
+    Lồng nhau (run_analysis -> agent method) thì dùng lại usage của block ngoài cùng.
+    """
+    outer = _current_usage.get()
+    if outer is not None:
+        yield outer
+        return
+    usage = MemoUsage(cache_mode=cache_mode)
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_usage.reset(token)
+
+
+def current_memo_usage() -> MemoUsage:
+    """Usage của analysis hiện tại (ngoài memo_usage(): một usage tạm không ai đọc)"""
+    return _current_usage.get() or MemoUsage()
+
+
+class RequirementMemo:
+    """
+    Memo 2 tầng: memory LRU + bảng requirement_memo
+
+    Usage:
+        memo = get_requirement_memo()
+        cached = await memo.alookup(KIND_AMBIGUITY, requirements, model, version)  # {index: verdict}
+        ...gọi model cho các requirement còn lại...
+        await memo.astore(KIND_AMBIGUITY, [(requirement, verdict), ...], model, version)
+    """
+
+    def __init__(
+        self,
+        max_memory_entries: int = REQUIREMENT_MEMO_MEMORY_ENTRIES,
+        max_rows: int = REQUIREMENT_MEMO_MAX_ROWS,
+        evict_every: int = REQUIREMENT_MEMO_EVICT_EVERY,
+        persistent: bool = True,
+        session_factory: Callable = session_scope,
+        enabled: bool = REQUIREMENT_MEMO_ENABLED
+    ):
+        self.max_memory_entries = max_memory_entries
+        self.max_rows = max_rows
+        self.evict_every = max(1, evict_every)
+        self.persistent = persistent
+        self.enabled = enabled
+        self._session_factory = session_factory
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stores_since_evict = 0
+        self._stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def lookup(self, kind: str, requirements: Sequence[str], model: str, prompt_version: str) -> Dict[int, dict]:
+        """Verdict đã memo của các requirement: {index trong `requirements`: verdict}"""
+        keys = self._keys(kind, requirements, model, prompt_version)
+        if keys is None:
+            return {}
+        found = self._memory_get_many(keys)
+        missing = [key for key in set(keys) if key not in found]
+        if missing:
+            found.update(self._remember(self._persistent_get_many(missing)))
+        return self._resolve(kind, keys, found)
+
+    async def alookup(self, kind: str, requirements: Sequence[str], model: str, prompt_version: str) -> Dict[int, dict]:
+        """Async lookup - persistent tier chạy trong thread"""
+        keys = self._keys(kind, requirements, model, prompt_version)
+        if keys is None:
+            return {}
+        found = self._memory_get_many(keys)
+        missing = [key for key in set(keys) if key not in found]
+        if missing:
+            found.update(self._remember(await asyncio.to_thread(self._persistent_get_many, missing)))
+        return self._resolve(kind, keys, found)
+
+    def store(self, kind: str, verdicts: List[Tuple[str, dict]], model: str, prompt_version: str) -> None:
+        rows = self._prepare_store(kind, verdicts, model, prompt_version)
+        if rows:
+            self._persistent_put_many(rows)
+
+    async def astore(self, kind: str, verdicts: List[Tuple[str, dict]], model: str, prompt_version: str) -> None:
+        rows = self._prepare_store(kind, verdicts, model, prompt_version)
+        if rows:
+            await asyncio.to_thread(self._persistent_put_many, rows)
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._entries)
+        hits = stats["memory_hits"] + stats["persistent_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        stats["enabled"] = self.enabled
+        return stats
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+    def _keys(self, kind: str, requirements: Sequence[str], model: str, prompt_version: str) -> Optional[List[str]]:
+        """Memo key của từng requirement; None nếu memo bị tắt / analysis bypass hoặc refresh"""
+        usage = current_memo_usage()
+        if not self.enabled or not requirements or usage.cache_mode in (CACHE_BYPASS, CACHE_REFRESH):
+            return None
+        return [make_memo_key(kind, model, prompt_version, requirement) for requirement in requirements]
+
+    def _resolve(self, kind: str, keys: List[str], found: Dict[str, dict]) -> Dict[int, dict]:
+        result = {index: copy.deepcopy(found[key]) for index, key in enumerate(keys) if key in found}
+        current_memo_usage().record(kind, len(result), len(keys) - len(result))
+        with self._lock:
+            self._stats["misses"] += len(keys) - len(result)
+        return result
+
+    def _prepare_store(
+        self, kind: str, verdicts: List[Tuple[str, dict]], model: str, prompt_version: str
+    ) -> List[dict]:
+        if not self.enabled or not verdicts or current_memo_usage().cache_mode == CACHE_BYPASS:
+            return []
+        rows = []
+        for requirement, verdict in verdicts:
+            key = make_memo_key(kind, model, prompt_version, requirement)
+            self._memory_put(key, verdict)
+            rows.append({
+                "memo_key": key, "kind": kind, "model_used": model, "prompt_version": prompt_version,
+                "requirement": requirement, "verdict_json": verdict
+            })
+        with self._lock:
+            self._stats["stores"] += len(rows)
+        return rows
+
+    def _memory_get_many(self, keys: List[str]) -> Dict[str, dict]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                verdict = self._entries.get(key)
+                if verdict is not None and key not in found:
+                    self._entries.move_to_end(key)
+                    found[key] = verdict
+                    self._stats["memory_hits"] += 1
+        return found
+
+    def _remember(self, found: Dict[str, dict]) -> Dict[str, dict]:
+        """Đưa verdict lấy từ DB vào memory tier"""
+        for key, verdict in found.items():
+            self._memory_put(key, verdict)
+        with self._lock:
+            self._stats["persistent_hits"] += len(found)
+        return found
+
+    def _memory_put(self, key: str, verdict: dict) -> None:
+        with self._lock:
+            self._entries[key] = verdict
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_memory_entries:
+                self._entries.popitem(last=False)
+
+    def _persistent_get_many(self, keys: List[str]) -> Dict[str, dict]:
+        if not self.persistent:
+            return {}
+        try:
+            with self._session_factory() as db:
+                if db is None:
+                    return {}
+                entries = db.query(RequirementMemoEntry).filter(RequirementMemoEntry.memo_key.in_(keys)).all()
+                now = datetime.now(timezone.utc)
+                found = {}
+                for entry in entries:
+                    entry.hit_count = (entry.hit_count or 0) + 1
+                    entry.last_used_at = now
+                    found[entry.memo_key] = entry.verdict_json
+                if entries:
+                    db.commit()
+                return found
+        except Exception as e:
+            logger.warning(f"Requirement memo lookup failed: {str(e)}")
+            return {}
+
+    def _persistent_put_many(self, rows: List[dict]) -> None:
+        if not self.persistent:
+            return
+        try:
+            with self._session_factory() as db:
+                if db is None:
+                    return
+                now = datetime.now(timezone.utc)
+                existing = {
+                    entry.memo_key: entry
+                    for entry in db.query(RequirementMemoEntry).filter(
+                        RequirementMemoEntry.memo_key.in_([row["memo_key"] for row in rows])
+                    ).all()
+                }
+                for row in rows:
+                    entry = existing.get(row["memo_key"])
+                    if entry is None:
+                        entry = RequirementMemoEntry(memo_key=row["memo_key"], hit_count=0)
+                        db.add(entry)
+                        existing[row["memo_key"]] = entry
+                    entry.kind = row["kind"]
+                    entry.model_used = row["model_used"]
+                    entry.prompt_version = row["prompt_version"]
+                    entry.requirement = row["requirement"]
+                    entry.verdict_json = row["verdict_json"]
+                    entry.last_used_at = now
+                db.commit()
+                self._maybe_evict(db, len(rows))
+        except Exception as e:
+            logger.warning(f"Requirement memo store failed: {str(e)}")
+
+    def _maybe_evict(self, db, stored: int) -> None:
+        """Xóa các dòng ít được dùng gần đây nhất khi bảng vượt max_rows"""
+        with self._lock:
+            self._stores_since_evict += stored
+            if self._stores_since_evict < self.evict_every:
+                return
+            self._stores_since_evict = 0
+        excess = db.query(RequirementMemoEntry).count() - self.max_rows
+        if excess <= 0:
+            return
+        stale = [
+            key for (key,) in db.query(RequirementMemoEntry.memo_key)
+            .order_by(RequirementMemoEntry.last_used_at.asc())
+            .limit(excess)
+            .all()
+        ]
+        db.query(RequirementMemoEntry).filter(RequirementMemoEntry.memo_key.in_(stale)).delete(synchronize_session=False)
+        db.commit()
+        with self._lock:
+            self._stats["evictions"] += len(stale)
+        logger.info(f"Requirement memo evicted {len(stale)} least recently used entries")
+
+
+def ambiguity_verdicts(requirements: Sequence[str], ambiguities: List[dict]) -> List[Tuple[str, dict]]:
+    """Verdict (mơ hồ + issue / rõ ràng) cho từng requirement từ ambiguities của model"""
+    issues: Dict[int, str] = {}
+    for item in ambiguities:
+        if isinstance(item, dict):
+            index = best_match(item.get("req", ""), requirements)
+            if index is not None and index not in issues:
+                issues[index] = item.get("issue", "")
+    return [
+        (requirement, {"ambiguous": index in issues, "issue": issues.get(index)})
+        for index, requirement in enumerate(requirements)
+    ]
+
+
+def improve_verdicts(requirements: Sequence[str], suggestions: List[dict]) -> List[Tuple[str, dict]]:
+    """Rewrite của model cho từng requirement (requirement không có suggestion thì không lưu)"""
+    verdicts: Dict[int, dict] = {}
+    for item in suggestions:
+        if isinstance(item, dict) and item.get("new_version"):
+            index = best_match(item.get("req", ""), requirements)
+            if index is not None and index not in verdicts:
+                verdicts[index] = {"new_version": item["new_version"]}
+    return [(requirements[index], verdict) for index, verdict in sorted(verdicts.items())]
+
+
+@dataclass
+class FastMemoPlan:
+    """Memo của fast path cho một document: requirement đã có verdict và requirement còn lại"""
+    requirements: List[str]
+    cached: Dict[int, dict]
+
+    def annotate(self, input_text: str) -> str:
+        """Thêm danh sách requirement đã có verdict để model không đánh giá lại"""
+        if not self.cached:
+            return input_text
+        lines = "\n".join(f"- {self.requirements[index]}" for index in sorted(self.cached))
+        return f"{input_text}\n\n{MEMO_ASSESSED_HEADER}\n{lines}"
+
+    def is_cached(self, item: Any) -> bool:
+        """Ambiguity / suggestion của model cho requirement đã có verdict (bị thay bằng verdict)"""
+        if not self.cached:
+            return False
+        cached_requirements = [self.requirements[index] for index in sorted(self.cached)]
+        return isinstance(item, dict) and best_match(item.get("req", ""), cached_requirements) is not None
+
+    def merge(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Thay ambiguity / suggestion của model cho requirement đã memo bằng verdict đã lưu"""
+        if not self.cached:
+            return result
+        ambiguities = [item for item in result.get("ambiguities", []) or [] if not self.is_cached(item)]
+        suggestions = [item for item in result.get("suggestions", []) or [] if not self.is_cached(item)]
+        for index in sorted(self.cached):
+            verdict, requirement = self.cached[index], self.requirements[index]
+            if verdict.get("ambiguous"):
+                ambiguities.append({"req": requirement, "issue": verdict.get("issue") or ""})
+            if verdict.get("new_version"):
+                suggestions.append({"req": requirement, "new_version": verdict["new_version"]})
+        return {**result, "ambiguities": ambiguities, "suggestions": suggestions}
+
+    def verdicts(self, result: Dict[str, Any]) -> List[Tuple[str, dict]]:
+        """Verdict mới cho requirement chưa memo (bỏ requirement dính conflict trong document này)"""
+        pending = [(index, req) for index, req in enumerate(self.requirements) if index not in self.cached]
+        if not pending:
+            return []
+        requirements = [req for _, req in pending]
+        in_conflict = set()
+        for item in result.get("conflicts", []) or []:
+            if isinstance(item, dict):
+                for key in ("req1", "req2"):
+                    index = best_match(item.get(key, ""), requirements)
+                    if index is not None:
+                        in_conflict.add(index)
+        rewrites = dict(improve_verdicts(requirements, result.get("suggestions", []) or []))
+        verdicts = []
+        for (requirement, verdict) in ambiguity_verdicts(requirements, result.get("ambiguities", []) or []):
+            if requirements.index(requirement) in in_conflict:
+                continue
+            verdict["new_version"] = rewrites.get(requirement, {}).get("new_version")
+            verdicts.append((requirement, verdict))
+        return verdicts
+
+
+_requirement_memo: Optional[RequirementMemo] = None
+
+
+def get_requirement_memo() -> RequirementMemo:
+    """Get or create requirement memo instance"""
+    global _requirement_memo
+    if _requirement_memo is None:
+        _requirement_memo = RequirementMemo()
+    return _requirement_memo
@@ -0,0 +1,61 @@
+"""
+Giới hạn số analysis chạy đồng thời (in-flight) trên một worker
+
+Mỗi analysis giữ một slot trong suốt thời gian gọi LLM. Khi hết slot, request mới
+sẽ đợi (không block event loop) cho tới khi có slot trống.
+"""
+
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+
+# Số analysis tối đa chạy đồng thời trên một worker (config qua .env)
+MAX_CONCURRENT_ANALYSES = int(os.getenv("MAX_CONCURRENT_ANALYSES", "32"))
+
+_analysis_slots: Optional[asyncio.Semaphore] = None
+_in_flight = 0
+_waiting = 0
+
+
+def get_analysis_slots() -> asyncio.Semaphore:
+    """Get or create semaphore giới hạn số analysis in-flight"""
+    global _analysis_slots
+    if _analysis_slots is None:
+        _analysis_slots = asyncio.Semaphore(MAX_CONCURRENT_ANALYSES)
+    return _analysis_slots
+
+
+@asynccontextmanager
+async def analysis_slot():
+    """
+    Giữ một slot analysis trong block `async with`
+
+    Usage:
+        async with analysis_slot():
+            result = await agent.aanalyze_fast(text)
+    """
+    global _in_flight, _waiting
+    slots = get_analysis_slots()
+
+    _waiting += 1
+    try:
+        await slots.acquire()
+    finally:
+        _waiting -= 1
+
+    _in_flight += 1
+    try:
+        yield
+    finally:
+        _in_flight -= 1
+        slots.release()
+
+
+def get_concurrency_stats() -> dict:
+    """Thống kê số analysis đang chạy / đang đợi slot"""
+    return {
+        "max_concurrent_analyses": MAX_CONCURRENT_ANALYSES,
+        "in_flight": _in_flight,
+        "waiting": _waiting
+    }
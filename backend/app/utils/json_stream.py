@@ -0,0 +1,322 @@
+"""
+Incremental JSON parser cho output streaming của LLM
+
+Nhận từng đoạn token, emit mỗi phần tử của mảng "conflicts" / "ambiguities" / "suggestions"
+ngay khi object đó đóng ngoặc - không cần đợi model sinh xong toàn bộ JSON.
+
+Text ngoài JSON root (markdown code fence, lời dẫn của model) được bỏ qua.
+
+extract_findings dùng chung parser này cho output đã hoàn chỉnh: parse strict trước,
+nếu output lệch format / bị cắt ở max tokens thì salvage mọi element đã đóng ngoặc
+và báo cáo những gì bị bỏ (ExtractionReport) thay vì trả về list rỗng.
+"""
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_SECTIONS = ("conflicts", "ambiguities", "suggestions")
+
+_DECODER = json.JSONDecoder()
+_TRAILING_COMMA_RE = re.compile(r",(\s*[}\]])")
+# Đoạn ký tự không làm đổi trạng thái parser: trong string / ngoài string
+_STRING_RUN_RE = re.compile(r'[^"\\]+')
+_PLAIN_RUN_RE = re.compile(r'[^"{}\[\]:,]+')
+
+
+def loads_lenient(text: str):
+    """json.loads nhưng chấp nhận trailing comma (lỗi hay gặp ở output của LLM)"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return json.loads(_TRAILING_COMMA_RE.sub(r"\1", text))
+
+
+class FindingsStreamParser:
+    """
+    Streaming parser cho JSON dạng {"conflicts": [{...}], "ambiguities": [...], ...}
+
+    Usage:
+        parser = FindingsStreamParser()
+        for token in tokens:
+            for section, item in parser.feed(token):
+                ...
+    """
+
+    def __init__(self, sections: Iterable[str] = DEFAULT_SECTIONS, list_section: Optional[str] = None):
+        """
+        Args:
+            sections: Các key của JSON root có element cần emit
+            list_section: Nếu set, JSON root là một mảng trần ([{...}, ...]) được coi là section này
+        """
+        self.sections = set(sections)
+        self.list_section = list_section
+        self._stack: List[str] = []  # '{' hoặc '['
+        self._in_string = False
+        self._escape = False
+        self._string_buffer: List[str] = []
+        self._last_key: Optional[str] = None
+        self._pending_key: Optional[str] = None
+        self._current_section: Optional[str] = None
+        self._capture: Optional[List[str]] = None
+        self._root_closed = False
+        self._list_root = False
+        self.errors: List[str] = []  # Các element không parse được
+        self.dropped: List["DroppedItem"] = []
+
+    @property
+    def finished(self) -> bool:
+        """True khi JSON root đã đóng"""
+        return self._root_closed
+
+    def feed(self, chunk: str) -> List[Tuple[str, Dict]]:
+        """
+        Đưa thêm text vào parser
+
+        Returns:
+            List các (section, item) vừa hoàn chỉnh
+        """
+        completed: List[Tuple[str, Dict]] = []
+        index, length = 0, len(chunk)
+        while index < length and not self._root_closed:
+            # Nhảy qua cả đoạn ký tự không đổi trạng thái (nội dung string, whitespace, số)
+            if self._escape:
+                run = None
+            elif self._in_string:
+                run = _STRING_RUN_RE.match(chunk, index)
+            else:
+                run = _PLAIN_RUN_RE.match(chunk, index)
+            if run is not None:
+                self._skip(run.group())
+                index = run.end()
+                continue
+            if chunk[index] == "{" and self._at_element_start():
+                # Element đã có đủ trong chunk: decode một lần thay vì quét từng ký tự
+                try:
+                    item, end = _DECODER.raw_decode(chunk, index)
+                except json.JSONDecodeError:
+                    item = None
+                if isinstance(item, dict):
+                    completed.append((self._current_section, item))
+                    index = end
+                    continue
+            item = self._consume(chunk[index])
+            index += 1
+            if item is not None:
+                completed.append(item)
+        return completed
+
+    def _at_element_start(self) -> bool:
+        return (not self._in_string and self._capture is None
+                and len(self._stack) == 2 and self._current_section is not None)
+
+    def _skip(self, text: str) -> None:
+        if self._capture is not None:
+            self._capture.append(text)
+        elif self._in_string and len(self._stack) == 1:
+            self._string_buffer.append(text)
+
+    def _consume(self, char: str) -> Optional[Tuple[str, Dict]]:
+        capturing = self._capture is not None
+        if capturing:
+            self._capture.append(char)
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if len(self._stack) == 1 and not capturing:
+                    self._last_key = "".join(self._string_buffer)
+                return None
+            if len(self._stack) == 1 and not capturing:
+                self._string_buffer.append(char)
+            return None
+
+        if not self._stack:
+            # Bỏ qua mọi thứ trước JSON root
+            if char == "{":
+                self._stack.append("{")
+            elif char == "[" and self.list_section:
+                # Mảng trần: giả lập root {"<list_section>": [...]}
+                self._list_root = True
+                self._current_section = self.list_section
+                self._stack.extend("{[")
+            return None
+
+        if char == '"':
+            self._in_string = True
+            self._string_buffer = []
+        elif char == ":" and len(self._stack) == 1:
+            self._pending_key = self._last_key
+        elif char == "," and len(self._stack) == 1:
+            self._pending_key = None
+        elif char in "{[":
+            if char == "[" and len(self._stack) == 1:
+                self._current_section = self._pending_key if self._pending_key in self.sections else None
+            elif char == "{" and len(self._stack) == 2 and self._current_section and not capturing:
+                self._capture = ["{"]
+            self._stack.append(char)
+        elif char in "}]":
+            self._stack.pop()
+            if self._list_root and len(self._stack) == 1:
+                self._stack.pop()
+            if not self._stack:
+                self._root_closed = True
+            elif len(self._stack) == 2 and capturing and char == "}":
+                return self._finish_capture()
+            elif len(self._stack) == 1 and char == "]":
+                self._current_section = None
+        return None
+
+    def _finish_capture(self) -> Optional[Tuple[str, Dict]]:
+        raw = "".join(self._capture)
+        self._capture = None
+        try:
+            item = loads_lenient(raw)
+        except json.JSONDecodeError as e:
+            self.errors.append(f"{self._current_section}: {str(e)}")
+            self.dropped.append(DroppedItem(self._current_section, f"invalid JSON: {e.msg}", _snippet(raw)))
+            return None
+        if not isinstance(item, dict):
+            return None
+        return self._current_section, item
+
+    def close(self) -> List["DroppedItem"]:
+        """
+        Kết thúc input: element đang mở dở (output bị cắt) được ghi vào dropped
+
+        Returns:
+            Toàn bộ element bị bỏ
+        """
+        if self._capture is not None:
+            self.dropped.append(DroppedItem(self._current_section, "truncated", _snippet("".join(self._capture))))
+            self._capture = None
+        return self.dropped
+
+
+@dataclass
+class DroppedItem:
+    """Một element không lấy được từ output của model"""
+    section: Optional[str]
+    reason: str
+    snippet: str
+
+
+@dataclass
+class ExtractionReport:
+    """Kết quả của extract_findings: output có phải salvage không và những gì bị bỏ"""
+    strict: bool = True  # Parse được toàn bộ output (sau khi bỏ code fence / trailing comma)
+    truncated: bool = False  # JSON root không đóng (output bị cắt)
+    counts: Dict[str, int] = field(default_factory=dict)
+    dropped: List[DroppedItem] = field(default_factory=list)
+    missing: List[str] = field(default_factory=list)  # Section không có trong output strict (vd: "{}")
+
+    @property
+    def salvaged(self) -> bool:
+        return not self.strict
+
+    def has_section(self, section: str) -> bool:
+        """Output parse strict và thật sự có mảng `section` (mảng rỗng mới có nghĩa là không có finding)"""
+        return self.strict and section not in self.missing
+
+    def summary(self) -> str:
+        parts = [f"{section}={count}" for section, count in self.counts.items()]
+        text = f"{'strict' if self.strict else 'salvaged'} ({', '.join(parts)})"
+        if self.truncated:
+            text += ", truncated"
+        if self.dropped:
+            text += f", dropped {len(self.dropped)}: " + "; ".join(
+                f"{item.section}: {item.reason}" for item in self.dropped[:5]
+            )
+        return text
+
+
+def _snippet(text: str, limit: int = 80) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def _json_span(text: str) -> str:
+    """Đoạn từ ký tự mở JSON đầu tiên tới ký tự đóng cuối cùng (bỏ code fence, lời dẫn)"""
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    if not starts:
+        return ""
+    start = min(starts)
+    end = max(text.rfind("}"), text.rfind("]"))
+    return text[start:end + 1] if end > start else text[start:]
+
+
+def _from_strict(
+    data: Any,
+    sections: Tuple[str, ...],
+    list_section: Optional[str],
+    report: ExtractionReport
+) -> Optional[Dict[str, List[Dict]]]:
+    if isinstance(data, list) and list_section:
+        data = {list_section: data}
+    if not isinstance(data, dict):
+        return None
+    findings: Dict[str, List[Dict]] = {}
+    for section in sections:
+        if section not in data:
+            report.missing.append(section)
+        value = data.get(section, [])
+        if not isinstance(value, list):
+            report.dropped.append(DroppedItem(section, "section is not an array", _snippet(json.dumps(value, ensure_ascii=False))))
+            report.missing.append(section)
+            value = []
+        findings[section] = []
+        for item in value:
+            if isinstance(item, dict):
+                findings[section].append(item)
+            else:
+                report.dropped.append(DroppedItem(section, "element is not an object", _snippet(json.dumps(item, ensure_ascii=False))))
+    return findings
+
+
+def extract_findings(
+    text: str,
+    sections: Iterable[str] = DEFAULT_SECTIONS,
+    list_section: Optional[str] = None
+) -> Tuple[Dict[str, List[Dict]], ExtractionReport]:
+    """
+    Lấy các mảng finding từ output (đã hoàn chỉnh) của LLM
+
+    1. Strict: JSON giữa ký tự mở đầu tiên và ký tự đóng cuối cùng, chấp nhận trailing comma
+    2. Salvage: chạy FindingsStreamParser trên toàn bộ output - lấy mọi element đã đóng
+       ngoặc, kể cả khi output bị cắt hoặc có element lỗi ở giữa
+
+    Args:
+        text: Raw output của model (có thể có code fence, lời dẫn)
+        sections: Các key cần lấy
+        list_section: Section nhận element khi output là một mảng trần
+
+    Returns:
+        (findings theo section - luôn đủ các key, ExtractionReport)
+    """
+    sections = tuple(sections)
+    report = ExtractionReport()
+    span = _json_span(text or "")
+    if span:
+        try:
+            findings = _from_strict(loads_lenient(span), sections, list_section, report)
+        except (json.JSONDecodeError, RecursionError):
+            findings = None
+        if findings is not None:
+            report.counts = {section: len(items) for section, items in findings.items()}
+            return findings, report
+
+    report.strict = False
+    report.dropped = []
+    findings = {section: [] for section in sections}
+    parser = FindingsStreamParser(sections, list_section=list_section)
+    for section, item in parser.feed(text or ""):
+        findings[section].append(item)
+    report.dropped = parser.close()
+    report.truncated = bool(span) and not parser.finished
+    report.counts = {section: len(items) for section, items in findings.items()}
+    return findings, report
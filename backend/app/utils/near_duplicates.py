@@ -0,0 +1,266 @@
+"""
+Gom requirement gần trùng (near-duplicate) bằng shingling + MinHash/LSH
+
+SRS export (nhất là dòng table của .docx) hay lặp lại cùng một requirement với khác biệt
+nhỏ về câu chữ; mỗi bản sao được phân tích riêng và sinh finding trùng. Mỗi requirement
+được biểu diễn bằng tập shingle ký tự của fingerprint, MinHash signature được chia band
+(LSH) nên chỉ các requirement rơi cùng bucket mới được so sánh - gần tuyến tính theo số
+requirement thay vì so từng cặp.
+
+Cặp ứng viên chỉ được gom khi Jaccard của shingle >= NEAR_DUPLICATE_THRESHOLD, hai
+requirement có cùng các con số và cùng phủ định ("3 attempts" / "5 attempts", "shall" /
+"shall not" không bao giờ bị gom) và cùng content word - chỉ cho phép thêm tối đa
+NEAR_DUPLICATE_MAX_EXTRA_WORDS từ bổ nghĩa ("failed login attempts"), không bao giờ thay
+từ ("delete" / "create", "email" / "SMS"). Chỉ representative (bản xuất hiện đầu tiên) của mỗi
+cụm được gửi cho LLM; finding được map lại cho cả cụm qua field `duplicates`.
+"""
+
+import os
+import re
+import zlib
+import random
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
+from app.utils.requirements_text import (
+    RequirementRecord,
+    best_match,
+    normalize_key,
+    requirement_fingerprint,
+    split_units,
+)
+
+NEAR_DUPLICATE_DEDUP_ENABLED = os.getenv("NEAR_DUPLICATE_DEDUP_ENABLED", "true").lower() == "true"
+# Jaccard tối thiểu của tập shingle để 2 requirement được coi là một
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.7"))
+SHINGLE_SIZE = int(os.getenv("NEAR_DUPLICATE_SHINGLE_SIZE", "5"))
+# Số content word tối đa mà một bản có thêm so với bản kia (không có từ nào bị thay)
+NEAR_DUPLICATE_MAX_EXTRA_WORDS = int(os.getenv("NEAR_DUPLICATE_MAX_EXTRA_WORDS", "1"))
+# MINHASH_PERMUTATIONS = LSH_BANDS * số row mỗi band (16 x 4: cặp có Jaccard ~0.5 trở lên gần như luôn thành ứng viên)
+MINHASH_PERMUTATIONS = int(os.getenv("MINHASH_PERMUTATIONS", "64"))
+LSH_BANDS = int(os.getenv("LSH_BANDS", "16"))
+
+_MERSENNE_PRIME = (1 << 61) - 1
+# Chạy trên fingerprint (đã lowercase, dấu câu thành khoảng trắng: "don't" -> "don t")
+_NUMBER_RE = re.compile(r"\d+")
+_NEGATION_RE = re.compile(r"\b(not|no|never|cannot|without)\b|\wn t\b")
+# "must" và "shall" cùng nghĩa trong SRS - không tính là khác biệt câu chữ
+_SYNONYMS_RE = re.compile(r"\bmust\b")
+_WORD_RE = re.compile(r"[^\W\d_]+")
+_STOPWORDS = frozenset({
+    "a", "an", "the", "of", "to", "for", "in", "on", "at", "by", "with", "from", "and", "or", "be",
+    "is", "are", "shall", "will", "able", "all", "any", "each", "its", "their", "this", "that",
+})
+_FINDING_KEYS = {"conflicts": ("req1", "req2"), "ambiguities": ("req",), "suggestions": ("req",)}
+# Nội dung của finding: hai finding khác nội dung trên cùng requirement đều được giữ
+_FINDING_DETAIL = {"conflicts": "description", "ambiguities": "issue"}
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[str]:
+    """Tập shingle ký tự của fingerprint (bỏ ID, bullet, dấu câu, hoa / thường)"""
+    key = _SYNONYMS_RE.sub("shall", requirement_fingerprint(text))
+    if len(key) <= size:
+        return {key} if key else set()
+    return {key[start:start + size] for start in range(len(key) - size + 1)}
+
+
+def _invariants(text: str) -> Tuple[FrozenSet[str], bool]:
+    """Phần không được khác nhau giữa 2 bản trùng: các con số và có phủ định hay không"""
+    key = requirement_fingerprint(text)
+    return frozenset(_NUMBER_RE.findall(key)), bool(_NEGATION_RE.search(key))
+
+
+def _content_words(text: str) -> FrozenSet[str]:
+    """Content word của fingerprint (bỏ stopword, "must" -> "shall", bỏ "s" số nhiều)"""
+    words = _WORD_RE.findall(_SYNONYMS_RE.sub("shall", requirement_fingerprint(text)))
+    return frozenset(
+        word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+        for word in words if word not in _STOPWORDS
+    )
+
+
+def _same_content(a: FrozenSet[str], b: FrozenSet[str], max_extra: int = NEAR_DUPLICATE_MAX_EXTRA_WORDS) -> bool:
+    """Chỉ khác nhau ở vài từ bổ nghĩa được thêm vào một bản - không có từ nào bị thay"""
+    smaller, larger = sorted((a, b), key=len)
+    return smaller <= larger and len(larger - smaller) <= max_extra
+
+
+class MinHasher:
+    """MinHash signature với họ hàm băm (a*x + b) mod p, seed cố định (deterministic)"""
+
+    def __init__(self, permutations: int = MINHASH_PERMUTATIONS, seed: int = 1):
+        rng = random.Random(seed)
+        self.params = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(permutations)]
+
+    def signature(self, shingle_set: Set[str]) -> Tuple[int, ...]:
+        if not shingle_set:
+            return tuple(_MERSENNE_PRIME for _ in self.params)
+        hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingle_set]
+        return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self.params)
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def find_near_duplicates(
+    texts: Sequence[str],
+    threshold: float = NEAR_DUPLICATE_THRESHOLD,
+    bands: int = LSH_BANDS,
+    hasher: Optional[MinHasher] = None
+) -> Dict[int, List[int]]:
+    """
+    Cụm near-duplicate: {index representative: [index các bản trùng]} (chỉ cụm >= 2 phần tử)
+
+    Representative là bản xuất hiện đầu tiên; một bản chỉ được gom khi nó đủ giống chính
+    representative (không gom bắc cầu A~B~C khi A và C khác nhau).
+    """
+    hasher = hasher or MinHasher()
+    rows = max(1, len(hasher.params) // max(1, bands))
+    shingle_sets = [shingles(text) for text in texts]
+    invariants = [_invariants(text) for text in texts]
+    content = [_content_words(text) for text in texts]
+    buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = defaultdict(list)
+    for index, shingle_set in enumerate(shingle_sets):
+        if not shingle_set:
+            continue
+        signature = hasher.signature(shingle_set)
+        for band in range(len(signature) // rows):
+            buckets[(band, signature[band * rows:(band + 1) * rows])].append(index)
+
+    candidates: Dict[int, Set[int]] = defaultdict(set)
+    for members in buckets.values():
+        for position, i in enumerate(members):
+            for j in members[position + 1:]:
+                candidates[i].add(j)
+
+    groups: Dict[int, List[int]] = {}
+    assigned: Set[int] = set()
+    for i in range(len(texts)):
+        if i in assigned or not candidates.get(i):
+            continue
+        for j in sorted(candidates[i]):
+            if j in assigned:
+                continue
+            if (invariants[i] == invariants[j] and _jaccard(shingle_sets[i], shingle_sets[j]) >= threshold
+                    and _same_content(content[i], content[j])):
+                groups.setdefault(i, []).append(j)
+                assigned.add(j)
+        if i in groups:
+            assigned.add(i)
+    return groups
+
+
+@dataclass
+class CollapsedText:
+    """Text đã bỏ các bản trùng (gửi cho LLM) + cách map finding lại cho cả cụm"""
+    text: str
+    requirements: int = 0  # Số requirement của text gốc
+    duplicates: Dict[str, List[str]] = field(default_factory=dict)  # Representative -> các bản trùng
+
+    @property
+    def removed(self) -> int:
+        return sum(len(members) for members in self.duplicates.values())
+
+    def expand(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Gắn `duplicates` (các bản trùng của requirement trong finding) rồi bỏ finding trùng"""
+        if not self.duplicates:
+            return result
+        representatives = list(self.duplicates)
+        sections = {}
+        for section, keys in _FINDING_KEYS.items():
+            items = []
+            for item in result.get(section, []) or []:
+                if not isinstance(item, dict):
+                    continue
+                members = []
+                for key in keys:
+                    # Finding trích (gần) nguyên văn representative - ngưỡng cao để không map nhầm
+                    index = best_match(item.get(key, ""), representatives, threshold=0.85)
+                    if index is not None:
+                        members.extend(self.duplicates[representatives[index]])
+                items.append(_with_duplicates(item, members) if members else item)
+            sections[section] = items
+        return dedupe_findings({**result, **sections})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"requirements": self.requirements, "collapsed": self.removed, "clusters": len(self.duplicates)}
+
+
+def collapse_near_duplicates(text: str) -> CollapsedText:
+    """
+    Bỏ khỏi text các requirement trùng với một requirement xuất hiện trước đó
+
+    Bản trùng bị cắt theo offset của unit (cả dòng table "ID | mô tả | ..."), heading và
+    phần còn lại của text giữ nguyên.
+    """
+    units = [unit for unit in split_units(text) if unit.record is not None]
+    if not NEAR_DUPLICATE_DEDUP_ENABLED or len(units) < 2:
+        return CollapsedText(text=text, requirements=len(units))
+    groups = find_near_duplicates([unit.record.text for unit in units])
+    if not groups:
+        return CollapsedText(text=text, requirements=len(units))
+
+    duplicates: Dict[str, List[str]] = {}
+    removed_spans = []
+    for representative, members in groups.items():
+        duplicates[units[representative].record.text] = [_display(units[index].record) for index in members]
+        removed_spans.extend((units[index].start, units[index].end) for index in members)
+
+    parts, cursor = [], 0
+    for start, end in sorted(removed_spans):
+        parts.append(text[cursor:start])
+        cursor = end + 1 if text[end:end + 1] == "\n" else end  # Bỏ luôn xuống dòng của unit
+    parts.append(text[cursor:])
+    return CollapsedText(text="".join(parts), requirements=len(units), duplicates=duplicates)
+
+
+def _display(record: RequirementRecord) -> str:
+    """Text của bản trùng trong `duplicates` (kèm ID của dòng table - text của record chỉ là cell mô tả)"""
+    if record.kind in ("table_row", "user_story") and record.explicit_id and not record.text.upper().startswith(record.id):
+        return f"{record.id} {record.text}"
+    return record.text
+
+
+def _with_duplicates(item: Dict[str, Any], members: Sequence[str]) -> Dict[str, Any]:
+    merged = list(item.get("duplicates") or [])
+    for member in members:
+        if member not in merged:
+            merged.append(member)
+    return {**item, "duplicates": merged}
+
+
+def dedupe_findings(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Bỏ finding trùng: cùng section, cùng nội dung (issue / description) và requirement
+    (hoặc cặp requirement) gần trùng nhau
+
+    Finding bị bỏ đóng góp requirement của nó vào `duplicates` của finding được giữ, nên
+    không mất thông tin requirement nào bị ảnh hưởng. Dùng cho response và export.
+    """
+    deduped = dict(result)
+    for section, keys in _FINDING_KEYS.items():
+        items = [item for item in result.get(section, []) or [] if isinstance(item, dict)]
+        if len(items) < 2:
+            continue
+        references = list(dict.fromkeys(item.get(key) for item in items for key in keys if item.get(key)))
+        cluster = {reference: reference for reference in references}
+        for representative, members in find_near_duplicates(references).items():
+            for index in members:
+                cluster[references[index]] = references[representative]
+
+        kept: Dict[Any, Dict[str, Any]] = {}
+        for item in items:
+            clusters = [cluster.get(item.get(key, ""), item.get(key, "")) for key in keys]
+            key = (frozenset(normalize_key(value) for value in clusters),
+                   normalize_key(str(item.get(_FINDING_DETAIL.get(section), "") or "")))
+            if key not in kept:
+                kept[key] = item
+                continue
+            extra = [item.get(k) for k in keys if item.get(k) and item.get(k) not in [kept[key].get(x) for x in keys]]
+            if extra or item.get("duplicates"):
+                kept[key] = _with_duplicates(kept[key], extra + list(item.get("duplicates") or []))
+        deduped[section] = list(kept.values())
+    return deduped
@@ -0,0 +1,325 @@
+"""
+Token-bucket rate limiter dùng chung cho mọi process gọi Gemini (RPM + TPM)
+
+Các uvicorn worker, Streamlit app và Gradio app cùng chia một quota. State của bucket
+nằm trong một file SQLite (LLM_RATE_LIMIT_DB); mỗi lần lấy quota là một transaction
+`BEGIN IMMEDIATE` nên các process không vượt quota khi chạy song song.
+
+Priority lanes: request có lane ưu tiên cao hơn đang đợi (ở bất kỳ process nào) thì
+lane thấp hơn không được lấy quota. Lane của request hiện tại là một contextvar
+(mặc định interactive); batch / job set lane batch:
+
+    with priority_lane(LANE_BATCH):
+        result = await run_analysis(agent, text)
+
+Số token của một call là ước lượng (số ký tự / 4 + LLM_OUTPUT_TOKEN_RESERVE), được
+quyết toán theo output thật sau khi call xong.
+"""
+
+import os
+import time
+import uuid
+import sqlite3
+import asyncio
+import tempfile
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Tuple
+from app.utils.logger import logger
+
+# Quota của project (0 = không giới hạn)
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "150"))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "1000000"))
+LLM_RATE_LIMIT_DB = os.getenv(
+    "LLM_RATE_LIMIT_DB",
+    os.path.join(tempfile.gettempdir(), "requirements_analyzer_llm_quota.sqlite3")
+)
+# Số token output dự trữ cho mỗi call (quyết toán lại sau khi có output)
+LLM_OUTPUT_TOKEN_RESERVE = int(os.getenv("LLM_OUTPUT_TOKEN_RESERVE", "1024"))
+# Thời gian đợi quota tối đa trước khi fail
+LLM_RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("LLM_RATE_LIMIT_MAX_WAIT_SECONDS", "120"))
+
+LANE_INTERACTIVE = "interactive"
+LANE_BATCH = "batch"
+# Thứ tự ưu tiên: số nhỏ hơn được lấy quota trước
+LANES: Dict[str, int] = {LANE_INTERACTIVE: 0, LANE_BATCH: 1}
+
+_CHARS_PER_TOKEN = 4
+_POLL_SECONDS = 0.25
+# Waiter không cập nhật heartbeat sau khoảng này (process đã chết) bị bỏ qua
+_WAITER_STALE_SECONDS = 10.0
+
+_current_lane: ContextVar[str] = ContextVar("llm_priority_lane", default=LANE_INTERACTIVE)
+
+
+class RateLimitTimeoutError(TimeoutError):
+    """Đợi quota quá LLM_RATE_LIMIT_MAX_WAIT_SECONDS"""
+
+
+@contextmanager
+def priority_lane(lane: str) -> Iterator[None]:
+    """Set priority lane cho các LLM call trong block (và các task tạo trong block)"""
+    if lane not in LANES:
+        raise ValueError(f"Unknown priority lane: {lane}. Supported: {', '.join(LANES)}")
+    token = _current_lane.set(lane)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+def current_lane() -> str:
+    return _current_lane.get()
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // _CHARS_PER_TOKEN)
+
+
+class RateLimiter:
+    """
+    Hai token bucket (requests, tokens) trong SQLite, refill liên tục theo RPM / TPM
+
+    Usage:
+        limiter = get_rate_limiter()
+        await limiter.acquire(prompt_tokens)     # Đợi quota (theo lane hiện tại)
+        output = await llm.ainvoke(prompt)
+        limiter.settle(estimate_tokens(output))  # Quyết toán token output thật
+    """
+
+    def __init__(
+        self,
+        db_path: str = LLM_RATE_LIMIT_DB,
+        rpm: int = LLM_RPM_LIMIT,
+        tpm: int = LLM_TPM_LIMIT,
+        output_reserve: int = LLM_OUTPUT_TOKEN_RESERVE,
+        max_wait: float = LLM_RATE_LIMIT_MAX_WAIT_SECONDS,
+        clock=time.time
+    ):
+        self.db_path = db_path
+        self.rpm = rpm
+        self.tpm = tpm
+        self.output_reserve = output_reserve
+        self.max_wait = max_wait
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._lane_stats = {lane: {"waiting": 0, "acquired": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0} for lane in LANES}
+        if self.enabled:
+            self._init_db()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm > 0 or self.tpm > 0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    async def acquire(self, prompt_tokens: int, lane: Optional[str] = None) -> float:
+        """Đợi (không block event loop) tới khi có quota; trả về thời gian đã đợi"""
+        if not self.enabled:
+            return 0.0
+        lane = lane or current_lane()
+        tokens = prompt_tokens + self.output_reserve
+        waiter_id, start = uuid.uuid4().hex, time.monotonic()
+        self._enter(lane)
+        acquired = False
+        try:
+            while True:
+                wait = await asyncio.to_thread(self._try_acquire, waiter_id, lane, tokens)
+                if wait <= 0:
+                    acquired = True
+                    return self._acquired(lane, start)
+                self._check_timeout(lane, start)
+                await asyncio.sleep(min(wait, _POLL_SECONDS))
+        finally:
+            self._leave(lane, None if acquired else waiter_id)
+
+    def acquire_sync(self, prompt_tokens: int, lane: Optional[str] = None) -> float:
+        """Bản sync của acquire (cho code gọi SDK sync)"""
+        if not self.enabled:
+            return 0.0
+        lane = lane or current_lane()
+        tokens = prompt_tokens + self.output_reserve
+        waiter_id, start = uuid.uuid4().hex, time.monotonic()
+        self._enter(lane)
+        acquired = False
+        try:
+            while True:
+                wait = self._try_acquire(waiter_id, lane, tokens)
+                if wait <= 0:
+                    acquired = True
+                    return self._acquired(lane, start)
+                self._check_timeout(lane, start)
+                time.sleep(min(wait, _POLL_SECONDS))
+        finally:
+            self._leave(lane, None if acquired else waiter_id)
+
+    def settle(self, output_tokens: int) -> None:
+        """Trừ thêm phần token output vượt quá phần đã dự trữ (bucket có thể âm)"""
+        extra = output_tokens - self.output_reserve
+        if not self.enabled or self.tpm <= 0 or extra <= 0:
+            return
+        try:
+            with self._transaction() as conn:
+                conn.execute("UPDATE buckets SET level = level - ? WHERE name = 'tokens'", (extra,))
+        except sqlite3.Error as e:
+            logger.warning(f"Rate limiter settle failed: {str(e)}")
+
+    def get_stats(self) -> dict:
+        """Quota, mức bucket, queue depth (mọi process) và wait time theo lane (process này)"""
+        with self._lock:
+            lanes = {
+                lane: {
+                    "waiting": stats["waiting"],
+                    "acquired": stats["acquired"],
+                    "avg_wait_seconds": round(stats["wait_seconds"] / stats["acquired"], 3) if stats["acquired"] else 0.0,
+                    "max_wait_seconds": round(stats["max_wait_seconds"], 3)
+                }
+                for lane, stats in self._lane_stats.items()
+            }
+        result = {"enabled": self.enabled, "rpm": self.rpm, "tpm": self.tpm, "lanes": lanes}
+        if not self.enabled:
+            return result
+        try:
+            with self._transaction() as conn:
+                now = self._clock()
+                result["buckets"] = {
+                    name: round(self._refilled(conn, name, now)[0], 1)
+                    for name in ("requests", "tokens") if self._capacity(name) > 0
+                }
+                rows = conn.execute(
+                    "SELECT lane, COUNT(*) FROM waiters WHERE heartbeat > ? GROUP BY lane",
+                    (now - _WAITER_STALE_SECONDS,)
+                ).fetchall()
+            result["queue_depth"] = {lane: 0 for lane in LANES}
+            for rank, count in rows:
+                result["queue_depth"][self._lane_name(rank)] = count
+        except sqlite3.Error as e:
+            result["error"] = str(e)
+        return result
+
+    # ------------------------------------------------------------------
+    # SQLite state
+    # ------------------------------------------------------------------
+    def _init_db(self) -> None:
+        with self._transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL, updated REAL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS waiters (id TEXT PRIMARY KEY, lane INTEGER, heartbeat REAL)"
+            )
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")  # Khóa ghi cho cả transaction: serialize giữa các process
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _capacity(self, name: str) -> float:
+        return float(self.rpm if name == "requests" else self.tpm)
+
+    def _refilled(self, conn: sqlite3.Connection, name: str, now: float) -> Tuple[float, float]:
+        """(mức bucket sau khi refill tới `now`, tốc độ refill mỗi giây)"""
+        capacity = self._capacity(name)
+        rate = capacity / 60.0
+        row = conn.execute("SELECT level, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return capacity, rate
+        level, updated = row
+        return min(capacity, level + max(0.0, now - updated) * rate), rate
+
+    def _try_acquire(self, waiter_id: str, lane: str, tokens: int) -> float:
+        """Lấy quota nếu đủ và không có lane ưu tiên hơn đang đợi; trả về số giây nên đợi (0 = đã lấy)"""
+        rank = LANES[lane]
+        with self._transaction() as conn:
+            now = self._clock()
+            conn.execute(
+                "INSERT OR REPLACE INTO waiters (id, lane, heartbeat) VALUES (?, ?, ?)",
+                (waiter_id, rank, now)
+            )
+            blocked = conn.execute(
+                "SELECT COUNT(*) FROM waiters WHERE lane < ? AND heartbeat > ?",
+                (rank, now - _WAITER_STALE_SECONDS)
+            ).fetchone()[0]
+            if blocked:
+                return _POLL_SECONDS
+
+            wanted = {"requests": 1.0, "tokens": float(tokens)}
+            levels, wait = {}, 0.0
+            for name, amount in wanted.items():
+                capacity = self._capacity(name)
+                if capacity <= 0:
+                    continue
+                amount = min(amount, capacity)  # Call lớn hơn cả quota: đợi bucket đầy
+                level, rate = self._refilled(conn, name, now)
+                levels[name] = level - amount
+                if level < amount:
+                    wait = max(wait, (amount - level) / rate)
+            if wait > 0:
+                return wait
+            for name, level in levels.items():
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)",
+                    (name, level, now)
+                )
+            conn.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+            return 0.0
+
+    # ------------------------------------------------------------------
+    # Stats
+    # ------------------------------------------------------------------
+    def _enter(self, lane: str) -> None:
+        with self._lock:
+            self._lane_stats[lane]["waiting"] += 1
+
+    def _leave(self, lane: str, waiter_id: Optional[str]) -> None:
+        """Bỏ waiter khỏi queue (waiter_id None: đã bị xóa khi lấy được quota)"""
+        with self._lock:
+            self._lane_stats[lane]["waiting"] -= 1
+        if waiter_id is None:
+            return
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+        except sqlite3.Error:
+            pass  # Waiter hết hạn sau _WAITER_STALE_SECONDS
+
+    def _acquired(self, lane: str, start: float) -> float:
+        waited = time.monotonic() - start
+        with self._lock:
+            stats = self._lane_stats[lane]
+            stats["acquired"] += 1
+            stats["wait_seconds"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+        if waited >= 1:
+            logger.info(f"LLM call ({lane}) waited {waited:.1f}s for rate limit quota")
+        return waited
+
+    def _check_timeout(self, lane: str, start: float) -> None:
+        if time.monotonic() - start >= self.max_wait:
+            raise RateLimitTimeoutError(f"Waited more than {self.max_wait:.0f}s for LLM quota ({lane} lane)")
+
+    @staticmethod
+    def _lane_name(rank: int) -> str:
+        return next((lane for lane, value in LANES.items() if value == rank), str(rank))
+
+
+_rate_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Get or create rate limiter instance (dùng chung cho mọi LLM call trong process)"""
+    global _rate_limiter
+    with _limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
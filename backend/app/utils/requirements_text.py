@@ -0,0 +1,312 @@
+"""
+Tách và so khớp requirement trong text SRS / User Stories
+
+Dùng chung cho parse node (segmenter local thay cho LLM), chunked engine (đóng gói chunk)
+và revision engine (diff theo requirement).
+"""
+
+import re
+import hashlib
+from dataclasses import asdict, dataclass
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+_HEADING_PATTERNS = [
+    re.compile(r"^#{1,6}\s+\S"),  # Markdown heading
+    re.compile(r"^(section|chapter|appendix|phần|chương|mục)\b", re.IGNORECASE),
+    re.compile(r"^\d+(\.\d+)+\.?\s+\S"),  # 3.1 Functional Requirements
+]
+_NUMBERED_HEADING_RE = re.compile(r"^\d+\.?\s+\S")
+_MODAL_RE = re.compile(r"\b(shall|must|should|will|may|can|phải|cần|nên)\b", re.IGNORECASE)
+_REQUIREMENT_START_RE = re.compile(
+    r"^("
+    r"(REQ|FR|NFR|UR|SR|BR|US)[-_ ]?\d+"  # REQ-001, FR-12, NFR 3
+    r"|[-*•]\s+"                           # Bullet
+    r"|\(?\d+(\.\d+)*[.)]?\s+"             # 1. / 1) / 2.3.1
+    r"|\(?[a-z][.)]\s+"                    # a. / a)
+    r"|as an?\s"                           # User story: As a ...
+    r")",
+    re.IGNORECASE
+)
+_NORMALIZE_RE = re.compile(r"[\W_]+", re.UNICODE)
+_TOKEN_RE = re.compile(r"\w{3,}", re.UNICODE)
+_ID_PREFIX_RE = re.compile(r"^\s*(REQ|FR|NFR|UR|SR|BR|US)[-_ ]?\d+(\.\d+)*[.:)]?", re.IGNORECASE)
+_LIST_MARKER_RE = re.compile(r"^\s*([-*•]|\(?\d+(\.\d+)*[.)]|\(?[a-z][.)])\s+", re.IGNORECASE)
+_BULLET_RE = re.compile(r"^[-*•]\s+")
+_ID_ONLY_RE = re.compile(r"(REQ|FR|NFR|UR|SR|BR|US)[-_ ]?\d+(\.\d+)*", re.IGNORECASE)
+_USER_STORY_RE = re.compile(r"\bas an?\b.+\bi (want|need|can)\b", re.IGNORECASE | re.DOTALL)
+_STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "shall", "must", "should", "will",
+    "can", "may", "system", "user", "users", "from", "when", "into", "are", "all", "able"
+}
+
+
+@dataclass
+class TextUnit:
+    """Một đơn vị text: section heading hoặc một requirement (có thể nhiều dòng)"""
+    text: str
+    is_heading: bool = False
+    start: int = 0  # Offset ký tự trong text gốc
+    end: int = 0
+    record: Optional["RequirementRecord"] = None  # None với heading
+
+
+@dataclass
+class RequirementRecord:
+    """
+    Requirement đã tách: ID ổn định + vị trí trong text gốc
+
+    id là ID có trong text (REQ-001, FR-2, NFR-3.1) hoặc ID sinh từ nội dung
+    ("R-" + hash của fingerprint) - cùng requirement luôn có cùng ID giữa các lần
+    phân tích / các bản sửa, kể cả khi thứ tự requirement thay đổi.
+    """
+    id: str
+    text: str
+    start: Optional[int]  # None: không tìm thấy nguyên văn trong text gốc (output của LLM)
+    end: Optional[int]
+    kind: str  # id / numbered / bullet / user_story / table_row / paragraph
+    explicit_id: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _is_heading(line: str) -> bool:
+    """Heuristic nhận diện section heading"""
+    if len(line) > 100 or line.endswith((".", ";", ",")):
+        return False
+    if _MODAL_RE.search(line):
+        return False
+    if any(pattern.match(line) for pattern in _HEADING_PATTERNS):
+        return True
+    if _NUMBERED_HEADING_RE.match(line) and len(line) <= 60:
+        return True
+    letters = [c for c in line if c.isalpha()]
+    return len(letters) >= 3 and all(c.isupper() for c in letters)
+
+
+def has_requirement_id(line: str) -> bool:
+    """Dòng bắt đầu bằng requirement ID (REQ-1, FR-2.1...)"""
+    return bool(_ID_PREFIX_RE.match(line))
+
+
+def is_requirement_line(line: str) -> bool:
+    """Dòng có dấu hiệu của requirement (ID, modal verb, user story) - không được coi là nhiễu"""
+    return bool(_ID_PREFIX_RE.match(line) or _MODAL_RE.search(line) or _USER_STORY_RE.search(line))
+
+
+def _starts_new_requirement(line: str, previous: str) -> bool:
+    """
+    Dòng không có marker nhưng là một requirement riêng: dòng trước đã kết thúc câu và
+    dòng này là một câu requirement hoàn chỉnh (vd: mỗi paragraph của .docx là một dòng)
+    """
+    return previous.endswith((".", "!", "?", ";")) and line[:1].isupper() and bool(_MODAL_RE.search(line))
+
+
+def _unit_kind(text: str) -> str:
+    if _USER_STORY_RE.search(text):
+        return "user_story"
+    if _ID_PREFIX_RE.match(text):
+        return "id"
+    if _BULLET_RE.match(text):
+        return "bullet"
+    if _LIST_MARKER_RE.match(text):
+        return "numbered"
+    return "paragraph"
+
+
+def _explicit_id(text: str) -> Optional[str]:
+    """ID ở đầu requirement, chuẩn hóa "req_001:" -> "REQ-001" """
+    match = _ID_PREFIX_RE.match(text)
+    if not match:
+        return None
+    return f"{match.group(1).upper()}-{match.group(0).strip().rstrip('.:)')[len(match.group(1)):].lstrip('-_ ')}"
+
+
+def _table_unit(line: str, start: int) -> TextUnit:
+    """
+    Một dòng table của _read_docx_file ("cell | cell | ..."): cell ID (nếu có) là ID,
+    cell có modal verb (hoặc dài nhất) là nội dung requirement. Dòng header (chỉ có
+    cell ngắn, không modal verb, không ID) được coi là heading.
+    """
+    cells, offset = [], 0
+    for cell in line.split(" | "):
+        stripped = cell.strip()
+        cell_start = start + offset + (len(cell) - len(cell.lstrip()))
+        cells.append((stripped, cell_start, cell_start + len(stripped)))
+        offset += len(cell) + 3
+    cells = [cell for cell in cells if cell[0]]
+    ids = [cell for cell in cells if _ID_ONLY_RE.fullmatch(cell[0])]
+    texts = [cell for cell in cells if cell not in ids]
+    modal = [cell for cell in texts if _MODAL_RE.search(cell[0])]
+    if not ids and not modal and all(len(cell[0].split()) <= 4 for cell in cells):
+        return TextUnit(text=line, is_heading=True, start=start, end=start + len(line))
+    body = modal[0] if modal else max(texts or cells, key=lambda cell: len(cell[0]))
+    record = RequirementRecord(
+        id=_explicit_id(ids[0][0]) if ids else "",
+        text=body[0],
+        start=body[1],
+        end=body[2],
+        kind="user_story" if _USER_STORY_RE.search(body[0]) else "table_row",
+        explicit_id=bool(ids)
+    )
+    return TextUnit(text=line, start=start, end=start + len(line), record=record)
+
+
+def _assign_ids(records: Sequence[RequirementRecord]) -> None:
+    """ID cho requirement không có ID trong text; ID trùng được thêm hậu tố -2, -3..."""
+    seen: Dict[str, int] = {}
+    for record in records:
+        if not record.id:
+            digest = hashlib.sha1(requirement_fingerprint(record.text).encode("utf-8")).hexdigest()
+            record.id = f"R-{digest[:6]}"
+        seen[record.id] = seen.get(record.id, 0) + 1
+        if seen[record.id] > 1:
+            record.id = f"{record.id}-{seen[record.id]}"
+
+
+def split_units(text: str) -> List[TextUnit]:
+    """
+    Tách text thành các unit theo section heading và ranh giới requirement (deterministic)
+
+    Ranh giới requirement: ID (REQ-x, FR-x, NFR-x...), bullet, số thứ tự, user story
+    "As a ...", dòng table của .docx ("cell | cell"), hoặc một câu requirement hoàn chỉnh
+    sau một câu đã kết thúc. Dòng còn lại được coi là phần tiếp theo của requirement
+    trước đó. Dòng trống kết thúc một unit. Mỗi unit mang offset trong text gốc.
+    """
+    units: List[TextUnit] = []
+    current: List[Tuple[str, int, int]] = []  # (dòng đã strip, start, end)
+
+    def flush():
+        if current:
+            unit_text = "\n".join(line for line, _, _ in current)
+            start, end = current[0][1], current[-1][2]
+            record = RequirementRecord(
+                id=_explicit_id(unit_text) or "",
+                text=unit_text,
+                start=start,
+                end=end,
+                kind=_unit_kind(unit_text),
+                explicit_id=bool(_ID_PREFIX_RE.match(unit_text))
+            )
+            units.append(TextUnit(text=unit_text, start=start, end=end, record=record))
+            current.clear()
+
+    position = 0
+    for raw_line in (text or "").splitlines(keepends=True):
+        line_start = position
+        position += len(raw_line)
+        line = raw_line.strip()
+        if not line:
+            flush()
+            continue
+        start = line_start + len(raw_line) - len(raw_line.lstrip())
+        end = start + len(line)
+        if " | " in line:
+            flush()
+            units.append(_table_unit(line, start))
+            continue
+        if _is_heading(line):
+            flush()
+            units.append(TextUnit(text=line, is_heading=True, start=start, end=end))
+            continue
+        if _REQUIREMENT_START_RE.match(line) or (current and _starts_new_requirement(line, current[-1][0])):
+            flush()
+        current.append((line, start, end))
+    flush()
+    _assign_ids([unit.record for unit in units if unit.record is not None])
+    return units
+
+
+def segment_requirements(text: str) -> List[RequirementRecord]:
+    """Requirement record (ID, text, offset, loại) theo thứ tự xuất hiện"""
+    return [unit.record for unit in split_units(text) if unit.record is not None]
+
+
+def split_requirements(text: str) -> List[str]:
+    """Danh sách requirement (bỏ heading) theo thứ tự xuất hiện"""
+    return [record.text for record in segment_requirements(text)]
+
+
+def locate_requirements(text: str, requirements: Sequence[str]) -> List[RequirementRecord]:
+    """
+    Record cho requirement đã tách ở nơi khác (vd: output của LLM parse): offset là vị trí
+    xuất hiện nguyên văn đầu tiên trong text gốc sau requirement trước đó (None nếu LLM đã viết lại)
+    """
+    records, cursor = [], 0
+    for requirement in requirements:
+        start = text.find(requirement, cursor)
+        if start < 0:
+            start = text.find(requirement)
+        end = start + len(requirement) if start >= 0 else None
+        if end is not None:
+            cursor = end
+        records.append(RequirementRecord(
+            id=_explicit_id(requirement) or "",
+            text=requirement,
+            start=start if start >= 0 else None,
+            end=end,
+            kind=_unit_kind(requirement),
+            explicit_id=bool(_ID_PREFIX_RE.match(requirement))
+        ))
+    _assign_ids(records)
+    return records
+
+
+def strip_list_marker(line: str) -> str:
+    """Bỏ bullet / số thứ tự ở đầu dòng ("- ", "2. ", "a) "), giữ nguyên số thuộc nội dung"""
+    return _LIST_MARKER_RE.sub("", line, count=1).strip()
+
+
+def normalize_key(text: str) -> str:
+    """Key để so sánh 2 requirement/finding (bỏ hoa thường, dấu câu, khoảng trắng)"""
+    return _NORMALIZE_RE.sub(" ", (text or "").lower()).strip()
+
+
+def requirement_fingerprint(text: str) -> str:
+    """
+    Key của nội dung requirement, độc lập với document chứa nó
+
+    Bỏ ID (REQ-12, NFR-3), bullet / số thứ tự rồi normalize - cùng một requirement
+    boilerplate trong nhiều SRS có cùng fingerprint.
+    """
+    text = _LIST_MARKER_RE.sub("", text or "", count=1)
+    return normalize_key(_ID_PREFIX_RE.sub("", text, count=1))
+
+
+def content_tokens(text: str) -> Set[str]:
+    """Các từ mang nội dung (>= 3 ký tự, bỏ ID requirement, số và stopword) - dùng để tìm requirement liên quan"""
+    text = _ID_PREFIX_RE.sub("", text or "")
+    return {
+        token for token in _TOKEN_RE.findall(text.lower())
+        if token not in _STOPWORDS and not token.isdigit()
+    }
+
+
+def similarity(a: str, b: str) -> float:
+    """
+    Độ giống nhau 0..1 của 2 đoạn text đã normalize
+
+    Một đoạn nằm trọn trong đoạn kia (LLM hay trích một phần requirement) được tính là 1.0.
+    """
+    key_a, key_b = normalize_key(a), normalize_key(b)
+    if not key_a or not key_b:
+        return 0.0
+    if key_a == key_b:
+        return 1.0
+    shorter, longer = sorted((key_a, key_b), key=len)
+    if len(shorter) >= 15 and shorter in longer:
+        return 1.0
+    return SequenceMatcher(None, key_a, key_b, autojunk=False).ratio()
+
+
+def best_match(text: str, candidates: Sequence[str], threshold: float = 0.6) -> Optional[int]:
+    """Index của candidate giống `text` nhất (>= threshold), None nếu không có"""
+    best_index, best_score = None, threshold
+    for index, candidate in enumerate(candidates):
+        score = similarity(text, candidate)
+        if score >= best_score:
+            best_index, best_score = index, score
+            if score == 1.0:
+                break
+    return best_index
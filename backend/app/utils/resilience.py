@@ -0,0 +1,572 @@
+"""
+Resilience cho LLM calls: hedged requests, jittered retries với deadline, circuit breaker
+
+- Hedging: nếu call chưa xong sau độ trễ bằng percentile latency (LLM_HEDGE_PERCENTILE)
+  của các call trước, gửi thêm một request trùng và lấy kết quả về trước
+- Retry: full-jitter exponential backoff, tối đa LLM_MAX_ATTEMPTS lần, không vượt
+  deadline của cả lần gọi (LLM_DEADLINE_SECONDS)
+- Circuit breaker (theo model): khi tỉ lệ lỗi trong cửa sổ gần nhất vượt ngưỡng, call
+  mới fail ngay với CircuitOpenError thay vì đợi timeout; sau CIRCUIT_OPEN_SECONDS cho
+  một call thử (half-open) để kiểm tra upstream đã hồi phục chưa
+
+Usage:
+    caller = get_resilient_caller("gemini-2.5-flash:fast", breaker_key="gemini-2.5-flash")
+    result = await caller.acall(lambda: chain.ainvoke(inputs))
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+import concurrent.futures
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+from app.utils.logger import logger
+from app.utils.rate_limiter import RateLimitTimeoutError, estimate_tokens
+
+T = TypeVar("T")
+
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+LLM_HEDGE_ENABLED = _env_bool("LLM_HEDGE_ENABLED", "true")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "3"))
+# Độ trễ hedge khi chưa đủ mẫu latency để tính percentile
+LLM_HEDGE_INITIAL_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_INITIAL_DELAY_SECONDS", "30"))
+# Tỉ lệ tối đa số call được hedge (giới hạn chi phí gọi trùng)
+LLM_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.2"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+# Tổng thời gian tối đa của một lần gọi (mọi attempt + hedge)
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "150"))
+
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "8"))
+CIRCUIT_WINDOW_SECONDS = float(os.getenv("CIRCUIT_WINDOW_SECONDS", "60"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+
+# Số mẫu latency giữ lại cho mỗi caller
+_LATENCY_SAMPLES = 200
+_MIN_SAMPLES_FOR_PERCENTILE = 20
+# HTTP status của lỗi không nên retry (request sai, không có quyền)
+_NON_RETRYABLE_CODES = {400, 401, 403, 404}
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Upstream đang lỗi nhiều - call bị từ chối ngay (circuit breaker đang mở)"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"LLM upstream {name} is failing, circuit open - retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(TimeoutError):
+    """Hết deadline của lần gọi trước khi có kết quả"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Lỗi tạm thời (timeout, mất kết nối, 429, 5xx) - không retry lỗi của request / code"""
+    if isinstance(error, (CircuitOpenError, RateLimitTimeoutError, ValueError, TypeError, LookupError,
+                          AttributeError, NotImplementedError)):
+        return False
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if callable(code):
+        try:
+            code = code()
+        except Exception:
+            code = None
+    try:
+        return int(code) not in _NON_RETRYABLE_CODES
+    except (TypeError, ValueError):
+        return True
+
+
+def _is_upstream_failure(error: BaseException) -> bool:
+    """
+    Lỗi được tính vào circuit breaker: upstream lỗi tạm thời hoặc hết deadline
+
+    Lỗi của request / code (400 input quá lớn, lỗi format prompt, cassette thiếu) và hết
+    quota local không nói gì về sức khỏe của upstream - không được làm mở breaker.
+    """
+    if isinstance(error, RateLimitTimeoutError):
+        return False
+    return isinstance(error, (DeadlineExceededError, asyncio.TimeoutError)) or is_retryable(error)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker theo tỉ lệ lỗi trong cửa sổ thời gian
+
+    closed -> open khi >= min_calls call trong window_seconds và tỉ lệ lỗi >= failure_rate;
+    open -> half_open sau open_seconds (cho một call thử); call thử thành công -> closed,
+    lỗi -> open lại.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = CIRCUIT_FAILURE_RATE,
+        min_calls: int = CIRCUIT_MIN_CALLS,
+        window_seconds: float = CIRCUIT_WINDOW_SECONDS,
+        open_seconds: float = CIRCUIT_OPEN_SECONDS,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = max(1, min_calls)
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._calls: Deque[Tuple[float, bool]] = deque()
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._rejected = 0
+        self._trips = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state_locked()
+
+    def before_call(self) -> bool:
+        """
+        Raise CircuitOpenError nếu breaker đang mở (hoặc đang có call thử)
+
+        Returns:
+            True nếu call này là call thử (half-open) - nếu call kết thúc mà không
+            record() được (bị cancel, hết quota local, stream dừng sớm) phải release_probe()
+        """
+        with self._lock:
+            state = self._current_state_locked()
+            if state == STATE_CLOSED:
+                return False
+            if state == STATE_HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self._rejected += 1
+            retry_after = max(0.0, self._opened_at + self.open_seconds - self._clock())
+            raise CircuitOpenError(self.name, retry_after)
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            now = self._clock()
+            if self._state != STATE_CLOSED:
+                if self._current_state_locked() == STATE_HALF_OPEN and self._probe_in_flight:
+                    self._probe_in_flight = False
+                    if success:
+                        self._state = STATE_CLOSED
+                        self._calls.clear()
+                        logger.info(f"Circuit {self.name} closed - upstream recovered")
+                    else:
+                        self._open_locked(now)
+                return
+            self._calls.append((now, success))
+            self._prune_locked(now)
+            failures = sum(1 for _, ok in self._calls if not ok)
+            if len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.failure_rate:
+                self._open_locked(now)
+
+    def release_probe(self) -> None:
+        """Trả lại lượt call thử không có kết quả - breaker giữ half-open cho call kế tiếp"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            self._prune_locked(self._clock())
+            failures = sum(1 for _, ok in self._calls if not ok)
+            return {
+                "state": self._current_state_locked(),
+                "window_calls": len(self._calls),
+                "window_failures": failures,
+                "trips": self._trips,
+                "rejected": self._rejected
+            }
+
+    def _current_state_locked(self) -> str:
+        if self._state == STATE_OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            return STATE_HALF_OPEN
+        return self._state
+
+    def _open_locked(self, now: float) -> None:
+        self._state = STATE_OPEN
+        self._opened_at = now
+        self._probe_in_flight = False
+        self._trips += 1
+        logger.warning(f"Circuit {self.name} opened - failing fast for {self.open_seconds:.0f}s")
+
+    def _prune_locked(self, now: float) -> None:
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+
+@dataclass
+class ResiliencePolicy:
+    """Tham số hedging / retry / deadline"""
+    hedge_enabled: bool = LLM_HEDGE_ENABLED
+    hedge_percentile: float = LLM_HEDGE_PERCENTILE
+    hedge_min_delay: float = LLM_HEDGE_MIN_DELAY_SECONDS
+    hedge_initial_delay: float = LLM_HEDGE_INITIAL_DELAY_SECONDS
+    hedge_max_ratio: float = LLM_HEDGE_MAX_RATIO
+    max_attempts: int = LLM_MAX_ATTEMPTS
+    retry_base: float = LLM_RETRY_BASE_SECONDS
+    retry_max: float = LLM_RETRY_MAX_SECONDS
+    deadline: float = LLM_DEADLINE_SECONDS
+
+
+class ResilientCaller:
+    """
+    Gọi một loại LLM call (vd: fast prompt của một model) với hedging, retry và breaker
+
+    Latency của các call thành công được giữ lại để tính độ trễ hedge.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        breaker: Optional[CircuitBreaker] = None,
+        policy: Optional[ResiliencePolicy] = None
+    ):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker(name)
+        self.policy = policy or ResiliencePolicy()
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self._calls = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._retries = 0
+
+    def hedge_delay(self) -> float:
+        """Độ trễ trước khi gửi request trùng: percentile latency của các call gần nhất"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < _MIN_SAMPLES_FOR_PERCENTILE:
+            return self.policy.hedge_initial_delay
+        index = min(len(samples) - 1, int(len(samples) * self.policy.hedge_percentile / 100))
+        return max(self.policy.hedge_min_delay, samples[index])
+
+    def _may_hedge(self) -> bool:
+        with self._lock:
+            return self.policy.hedge_enabled and self._hedges < self.policy.hedge_max_ratio * self._calls + 1
+
+    def _record_success(self, elapsed: float) -> None:
+        with self._lock:
+            self._latencies.append(elapsed)
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.policy.retry_max, self.policy.retry_base * (2 ** attempt)))
+
+    async def acall(self, factory: Callable[[], Awaitable[T]], deadline: Optional[float] = None) -> T:
+        """
+        Chạy coroutine do `factory` tạo (mỗi attempt / hedge gọi factory một lần)
+
+        Raises:
+            CircuitOpenError: breaker đang mở
+            DeadlineExceededError: hết deadline
+            Exception của call cuối cùng nếu hết số lần retry / lỗi không retry được
+        """
+        loop = asyncio.get_running_loop()
+        end = loop.time() + (deadline or self.policy.deadline)
+        with self._lock:
+            self._calls += 1
+        attempt = 0
+        while True:
+            remaining = end - loop.time()
+            if remaining <= 0:
+                raise DeadlineExceededError(f"{self.name}: deadline exceeded after {attempt} attempts")
+            probe = self.breaker.before_call()
+            start = loop.time()
+            try:
+                result = await asyncio.wait_for(self._ahedged(factory), timeout=remaining)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError) and not isinstance(e, RateLimitTimeoutError):
+                    e = DeadlineExceededError(f"{self.name}: deadline exceeded after {attempt + 1} attempts")
+                if _is_upstream_failure(e):
+                    self.breaker.record(False)
+                elif probe:
+                    self.breaker.release_probe()
+                attempt += 1
+                delay = self._backoff(attempt)
+                if (not is_retryable(e) or isinstance(e, DeadlineExceededError)
+                        or attempt >= self.policy.max_attempts or loop.time() + delay >= end):
+                    raise e
+                with self._lock:
+                    self._retries += 1
+                logger.warning(f"LLM call {self.name} failed ({type(e).__name__}: {str(e)[:100]}), "
+                               f"retry {attempt}/{self.policy.max_attempts - 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:  # Bị cancel: không có kết quả để record
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            self.breaker.record(True)
+            self._record_success(loop.time() - start)
+            return result
+
+    async def _ahedged(self, factory: Callable[[], Awaitable[T]]) -> T:
+        primary = asyncio.ensure_future(factory())
+        if not self._may_hedge():
+            return await primary
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+            if not done:
+                with self._lock:
+                    self._hedges += 1
+                logger.info(f"LLM call {self.name} slower than p{self.policy.hedge_percentile:.0f} - sending hedged request")
+                tasks.append(asyncio.ensure_future(factory()))
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            with self._lock:
+                                self._hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def call(self, func: Callable[[], T], deadline: Optional[float] = None) -> T:
+        """
+        Bản sync của acall cho code gọi SDK sync (vd: analyzer.analyze_text)
+
+        Hedge chạy trên thread pool; request thua không thể hủy nên được để chạy nốt.
+        """
+        end = time.monotonic() + (deadline or self.policy.deadline)
+        with self._lock:
+            self._calls += 1
+        attempt = 0
+        while True:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceededError(f"{self.name}: deadline exceeded after {attempt} attempts")
+            probe = self.breaker.before_call()
+            start = time.monotonic()
+            try:
+                result = self._hedged(func, remaining)
+            except Exception as e:
+                if _is_upstream_failure(e):
+                    self.breaker.record(False)
+                elif probe:
+                    self.breaker.release_probe()
+                attempt += 1
+                delay = self._backoff(attempt)
+                if (not is_retryable(e) or isinstance(e, DeadlineExceededError)
+                        or attempt >= self.policy.max_attempts or time.monotonic() + delay >= end):
+                    raise
+                with self._lock:
+                    self._retries += 1
+                logger.warning(f"LLM call {self.name} failed ({type(e).__name__}), retry in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            except BaseException:
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            self.breaker.record(True)
+            self._record_success(time.monotonic() - start)
+            return result
+
+    def _hedged(self, func: Callable[[], T], timeout: float) -> T:
+        executor = _get_executor()
+        futures = [executor.submit(func)]
+        end = time.monotonic() + timeout
+        if self._may_hedge():
+            done, _ = concurrent.futures.wait(futures, timeout=min(self.hedge_delay(), timeout))
+            if not done and time.monotonic() < end:
+                with self._lock:
+                    self._hedges += 1
+                futures.append(executor.submit(func))
+        pending = set(futures)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, timeout=max(0.0, end - time.monotonic()), return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            if not done:
+                raise DeadlineExceededError(f"{self.name}: deadline exceeded")
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        with self._lock:
+                            self._hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            samples = sorted(self._latencies)
+            calls, hedges, wins, retries = self._calls, self._hedges, self._hedge_wins, self._retries
+
+        def percentile(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(len(samples) * p / 100))], 3)
+
+        return {
+            "calls": calls,
+            "retries": retries,
+            "hedges": hedges,
+            "hedge_wins": wins,
+            "latency_p50": percentile(50),
+            "latency_p95": percentile(95),
+            "hedge_delay": round(self.hedge_delay(), 3),
+            "breaker": self.breaker.name
+        }
+
+
+class ResilientChain:
+    """
+    Bọc một LangChain runnable: ainvoke / invoke / abatch đi qua ResilientCaller
+
+    Nếu có `limiter`, mỗi request thật gửi lên upstream (kể cả retry và hedge) lấy quota
+    từ RateLimiter trước khi gửi. `prompt_tokens` là số token của phần template cố định,
+    phần input được ước lượng từ giá trị của các biến.
+
+    astream không hedge (kết quả đã emit không lấy lại được); breaker vẫn áp dụng và
+    lỗi trước token đầu tiên được retry.
+    """
+
+    def __init__(self, runnable: Any, caller: ResilientCaller, limiter: Any = None, prompt_tokens: int = 0):
+        self.runnable = runnable
+        self.caller = caller
+        self.limiter = limiter
+        self.prompt_tokens = prompt_tokens
+
+    def _input_tokens(self, inputs: Any) -> int:
+        values = inputs.values() if isinstance(inputs, dict) else [inputs]
+        return self.prompt_tokens + estimate_tokens("".join(str(value) for value in values))
+
+    async def _ainvoke_once(self, inputs: Any, config: Optional[dict]) -> Any:
+        if self.limiter is None:
+            return await self.runnable.ainvoke(inputs, config)
+        await self.limiter.acquire(self._input_tokens(inputs))
+        result = await self.runnable.ainvoke(inputs, config)
+        self.limiter.settle(estimate_tokens(str(result)))
+        return result
+
+    def _invoke_once(self, inputs: Any, config: Optional[dict]) -> Any:
+        if self.limiter is None:
+            return self.runnable.invoke(inputs, config)
+        self.limiter.acquire_sync(self._input_tokens(inputs))
+        result = self.runnable.invoke(inputs, config)
+        self.limiter.settle(estimate_tokens(str(result)))
+        return result
+
+    async def ainvoke(self, inputs: Any, config: Optional[dict] = None) -> Any:
+        return await self.caller.acall(lambda: self._ainvoke_once(inputs, config))
+
+    def invoke(self, inputs: Any, config: Optional[dict] = None) -> Any:
+        return self.caller.call(lambda: self._invoke_once(inputs, config))
+
+    async def abatch(self, inputs: List[Any], config: Optional[dict] = None) -> List[Any]:
+        limit = (config or {}).get("max_concurrency") or len(inputs) or 1
+        semaphore = asyncio.Semaphore(limit)
+
+        async def run(item: Any) -> Any:
+            async with semaphore:
+                return await self.ainvoke(item)
+
+        return list(await asyncio.gather(*(run(item) for item in inputs)))
+
+    async def astream(self, inputs: Any, config: Optional[dict] = None) -> AsyncIterator[Any]:
+        attempt = 0
+        while True:
+            probe = self.caller.breaker.before_call()
+            if self.limiter is not None:
+                try:
+                    await self.limiter.acquire(self._input_tokens(inputs))
+                except BaseException:  # Hết quota local / bị cancel
+                    if probe:
+                        self.caller.breaker.release_probe()
+                    raise
+            recorded = False
+            started = False
+            output_chars = 0
+            try:
+                async for chunk in self.runnable.astream(inputs, config):
+                    started = True
+                    output_chars += len(str(chunk))
+                    yield chunk
+                self.caller.breaker.record(True)
+                recorded = True
+            except Exception as e:
+                if _is_upstream_failure(e):
+                    self.caller.breaker.record(False)
+                    recorded = True
+                attempt += 1
+                if started or not is_retryable(e) or attempt >= self.caller.policy.max_attempts:
+                    raise
+                await asyncio.sleep(self.caller._backoff(attempt))
+                continue
+            finally:
+                # Consumer dừng sớm (GeneratorExit), bị cancel hoặc lỗi của request: không có kết quả để record
+                if probe and not recorded:
+                    self.caller.breaker.release_probe()
+                if self.limiter is not None:
+                    self.limiter.settle(output_chars // 4)
+            return
+
+
+_registry_lock = threading.Lock()
+_breakers: Dict[str, CircuitBreaker] = {}
+_callers: Dict[str, ResilientCaller] = {}
+_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+
+def get_circuit_breaker(key: str) -> CircuitBreaker:
+    """Breaker dùng chung cho mọi call tới cùng upstream (thường là một model)"""
+    with _registry_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(key)
+        return _breakers[key]
+
+
+def get_resilient_caller(name: str, breaker_key: Optional[str] = None) -> ResilientCaller:
+    """Get or create caller theo tên (latency được theo dõi riêng cho mỗi loại call)"""
+    breaker = get_circuit_breaker(breaker_key or name)
+    with _registry_lock:
+        if name not in _callers:
+            _callers[name] = ResilientCaller(name, breaker)
+        return _callers[name]
+
+
+def _get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _executor
+    with _registry_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+        return _executor
+
+
+def get_resilience_stats() -> dict:
+    """Thống kê breakers và callers (hedge / retry / latency percentiles)"""
+    with _registry_lock:
+        breakers = dict(_breakers)
+        callers = dict(_callers)
+    return {
+        "breakers": {key: breaker.get_stats() for key, breaker in breakers.items()},
+        "calls": {name: caller.get_stats() for name, caller in callers.items()}
+    }
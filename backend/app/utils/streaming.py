@@ -0,0 +1,77 @@
+"""
+Helpers cho streaming response (NDJSON / Server-Sent Events)
+"""
+
+import os
+import json
+import asyncio
+from typing import Any, AsyncIterator, Dict, Optional
+
+# Gửi heartbeat nếu không có event nào trong khoảng này (giữ kết nối qua proxy)
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "10"))
+
+FORMAT_NDJSON = "ndjson"
+FORMAT_SSE = "sse"
+
+MEDIA_TYPES = {
+    FORMAT_NDJSON: "application/x-ndjson",
+    FORMAT_SSE: "text/event-stream",
+}
+
+# Header để nginx / proxy không buffer response
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+HEARTBEAT = object()
+
+
+def pick_stream_format(requested: Optional[str], accept_header: Optional[str]) -> str:
+    """Chọn format: query param `format` ưu tiên, sau đó tới Accept header, mặc định NDJSON"""
+    if requested in (FORMAT_NDJSON, FORMAT_SSE):
+        return requested
+    if accept_header and "text/event-stream" in accept_header:
+        return FORMAT_SSE
+    return FORMAT_NDJSON
+
+
+def format_event(event: str, payload: Dict[str, Any], fmt: str) -> str:
+    """Serialize một event theo format NDJSON hoặc SSE"""
+    if fmt == FORMAT_SSE:
+        return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    return json.dumps({"event": event, **payload}, ensure_ascii=False) + "\n"
+
+
+def format_heartbeat(fmt: str) -> str:
+    """Heartbeat: SSE comment hoặc NDJSON event"""
+    if fmt == FORMAT_SSE:
+        return ": keep-alive\n\n"
+    return json.dumps({"event": "heartbeat"}) + "\n"
+
+
+async def with_heartbeat(source: AsyncIterator[Any], interval: float = STREAM_HEARTBEAT_SECONDS) -> AsyncIterator[Any]:
+    """
+    Wrap một async iterator: yield HEARTBEAT mỗi khi source im lặng quá `interval` giây
+
+    Model có thể mất vài giây trước token đầu tiên; heartbeat giữ cho proxy và client
+    không đóng kết nối vì idle timeout.
+    """
+    iterator = source.__aiter__()
+    pending: Optional[asyncio.Task] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            done, _ = await asyncio.wait({pending}, timeout=interval)
+            if not done:
+                yield HEARTBEAT
+                continue
+            task, pending = pending, None
+            try:
+                yield task.result()
+            except StopAsyncIteration:
+                return
+    finally:
+        if pending is not None:
+            pending.cancel()
@@ -0,0 +1,409 @@
+"""
+Chuẩn hóa input trước khi đưa vào prompt (bỏ phần tốn token nhưng không mang requirement)
+
+Text của request / file upload đi thẳng vào prompt, kèm khoảng trắng lặp, header / footer
+của từng trang, mục lục, bảng lịch sử thay đổi và boilerplate. Pipeline gồm các stage
+chạy theo thứ tự cấu hình (INPUT_NORMALIZATION_STAGES):
+
+- whitespace:  Unicode NFKC, bỏ ký tự zero-width / control, gộp khoảng trắng và dòng trống
+- headers:     bỏ header / footer của trang (dòng lặp lại sát ngắt trang / số trang, hoặc
+               lặp lại đều theo khoảng cách cỡ một trang) và dòng số trang (số trơn chỉ khi sát
+               ngắt trang / header hoặc tăng dần theo trang - "500" sau "Max users:" được giữ)
+- toc:         bỏ mục lục (dòng có dot leader + số trang, section "Table of Contents")
+- changelog:   bỏ section lịch sử thay đổi ("Revision History", "Change Log"...) tới heading
+               đánh số tiếp theo
+- boilerplate: (tùy chọn) bỏ dòng khớp pattern boilerplate (confidential, copyright...)
+
+Mỗi stage được ghi lại số token trước / sau. Dòng có dấu hiệu requirement (ID, modal
+verb, user story) không bao giờ bị bỏ bởi headers / toc / changelog.
+
+INPUT_NORMALIZATION_MODE: "deterministic" (mặc định) - output chỉ phụ thuộc text và cấu
+hình nên cache key ổn định; "adaptive" - boilerplate stage học thêm các dòng lặp lại ở
+nhiều document khác nhau (state của process, output có thể đổi theo thời gian).
+"""
+
+import os
+import re
+import bisect
+import threading
+import unicodedata
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+from app.utils.rate_limiter import estimate_tokens
+from app.utils.requirements_text import has_requirement_id, is_requirement_line, normalize_key
+
+MODE_DETERMINISTIC = "deterministic"
+MODE_ADAPTIVE = "adaptive"
+
+INPUT_NORMALIZATION_ENABLED = os.getenv("INPUT_NORMALIZATION_ENABLED", "true").lower() == "true"
+INPUT_NORMALIZATION_STAGES = os.getenv("INPUT_NORMALIZATION_STAGES", "whitespace,headers,toc,changelog")
+INPUT_NORMALIZATION_MODE = os.getenv("INPUT_NORMALIZATION_MODE", MODE_DETERMINISTIC).lower()
+# Dòng ngắn lặp lại từ chừng này lần trở lên được coi là header / footer
+HEADER_MIN_REPEATS = int(os.getenv("HEADER_MIN_REPEATS", "3"))
+HEADER_MAX_CHARS = int(os.getenv("HEADER_MAX_CHARS", "100"))
+# Header / footer nằm trong chừng này dòng (khác rỗng) tính từ ngắt trang, số trang hoặc đầu / cuối document
+HEADER_PAGE_WINDOW = int(os.getenv("HEADER_PAGE_WINDOW", "2"))
+# Document không có ngắt trang: dòng lặp lại đều với khoảng cách >= chừng này dòng (cỡ một trang)
+HEADER_MIN_PAGE_LINES = int(os.getenv("HEADER_MIN_PAGE_LINES", "20"))
+# Pattern boilerplate thêm (regex, phân tách bởi "||")
+BOILERPLATE_PATTERNS = os.getenv("BOILERPLATE_PATTERNS", "")
+# Adaptive mode: dòng xuất hiện trong chừng này document khác nhau được coi là boilerplate
+BOILERPLATE_MIN_DOCUMENTS = int(os.getenv("BOILERPLATE_MIN_DOCUMENTS", "5"))
+
+_ZERO_WIDTH_RE = re.compile(r"[\u200b-\u200f\u2060\ufeff\u00ad]")
+_CONTROL_RE = re.compile(r"[\x00-\x08\x0b\x0e-\x1f\x7f]")
+_PAGE_BREAK = "\f"
+_SPACES_RE = re.compile(r"[ \t]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+_PUNCTUATION = str.maketrans({
+    "‘": "'", "’": "'", "“": '"', "”": '"',
+    "–": "-", "—": "-", "•": "-",
+})
+_PAGE_NUMBER_RE = re.compile(r"^(page\s+\d+(\s+of\s+\d+)?|-\s*\d+\s*-|\d+\s*/\s*\d+)$", re.IGNORECASE)
+# Số trơn ("12") chỉ là số trang khi sát ngắt trang / header, hoặc tăng dần cách nhau cỡ một trang
+_BARE_NUMBER_RE = re.compile(r"^\d+$")
+_DIGITS_RE = re.compile(r"\d+")
+# Dòng "Nhãn: giá trị" của template (Actor: Customer, Priority: High) - mang nội dung, không phải header
+_KEY_VALUE_RE = re.compile(r"^[^:]{1,40}:\s*\S")
+_TOC_HEADING_RE = re.compile(r"^(table of contents|contents|mục lục)$", re.IGNORECASE)
+_TOC_LINE_RE = re.compile(r"^.{2,}?(\s*\.{3,}|\s*…+|\s)\s*\d+$")
+_CHANGELOG_HEADING_RE = re.compile(
+    r"^(\d+(\.\d+)*\.?\s+)?(revision history|change ?log|change history|document history|version history"
+    r"|lịch sử (thay đổi|phiên bản))$",
+    re.IGNORECASE
+)
+_CHANGELOG_LINE_RE = re.compile(r"^(v?\d+(\.\d+)+|\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{2,4}|version\b|date\b|rev\b)", re.IGNORECASE)
+# Heading đánh số ("1.1 Purpose", "2. Scope") - kết thúc section lịch sử thay đổi
+_NUMBERED_HEADING_RE = re.compile(r"^\d+(\.\d+)*\.?\s+[^\W\d_]")
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{2,4}")
+_DEFAULT_BOILERPLATE = (
+    r"\bconfidential\b",
+    r"\bcopyright\b|©",
+    r"\ball rights reserved\b",
+    r"\bproprietary\b",
+    r"\bprinted copies are uncontrolled\b",
+    r"\bfor internal use only\b",
+)
+
+
+@dataclass
+class StageReport:
+    """Token trước / sau của một stage"""
+    stage: str
+    tokens_before: int
+    tokens_after: int
+    lines_removed: int
+
+
+@dataclass
+class NormalizationResult:
+    text: str
+    stages: List[StageReport] = field(default_factory=list)
+    mode: str = MODE_DETERMINISTIC
+
+    @property
+    def tokens_before(self) -> int:
+        return self.stages[0].tokens_before if self.stages else estimate_tokens(self.text)
+
+    @property
+    def tokens_after(self) -> int:
+        return estimate_tokens(self.text)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "stages": [asdict(stage) for stage in self.stages]
+        }
+
+
+def normalize_whitespace(text: str) -> str:
+    """
+    Unicode NFKC, dấu câu "thông minh" -> ASCII, gộp khoảng trắng và dòng trống
+
+    Ngắt trang (form feed) được giữ thành một dòng riêng cho headers stage (stage đó bỏ nó).
+    """
+    text = unicodedata.normalize("NFKC", text).translate(_PUNCTUATION)
+    text = _CONTROL_RE.sub("", _ZERO_WIDTH_RE.sub("", text.replace("\r\n", "\n").replace("\r", "\n")))
+    text = text.replace(_PAGE_BREAK, f"\n{_PAGE_BREAK}\n")
+    lines = [line if line == _PAGE_BREAK else _SPACES_RE.sub(" ", line).strip(" \t\n") for line in text.split("\n")]
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip(" \t\n")
+
+
+def strip_headers_footers(
+    text: str,
+    min_repeats: int = HEADER_MIN_REPEATS,
+    max_chars: int = HEADER_MAX_CHARS,
+    page_window: int = HEADER_PAGE_WINDOW,
+    min_page_lines: int = HEADER_MIN_PAGE_LINES
+) -> str:
+    """
+    Bỏ header / footer của trang, dòng số trang và ngắt trang
+
+    Header / footer: dòng ngắn lặp lại >= min_repeats lần (so sánh sau khi bỏ chữ số -
+    "Page 3 of 10" và "Page 4 of 10" là một) và
+    - mọi lần xuất hiện đều nằm sát (page_window dòng) ngắt trang, dòng số trang hoặc
+      đầu / cuối document, hoặc
+    - document không có ngắt trang / số trang và dòng lặp lại đều, cách nhau >= min_page_lines
+
+    Nhãn của template ("Preconditions:") và dòng "Nhãn: giá trị" ("Priority: High") lặp lại
+    theo từng use case nên luôn được giữ. Dòng chỉ có một số ("500" sau "Max users:") là giá
+    trị, chỉ bị coi là số trang khi nằm sát ngắt trang / header, hoặc khi các số tăng dần
+    từng đơn vị, cách nhau >= min_page_lines dòng.
+    """
+    lines = text.split("\n")
+    content = [index for index, line in enumerate(lines) if line.strip() and line != _PAGE_BREAK]
+    position = {index: number for number, index in enumerate(content)}  # Thứ tự trong các dòng khác rỗng
+    shape = [_DIGITS_RE.sub("#", line.strip().lower()) for line in lines]
+    bare_numbers = [index for index in content if _BARE_NUMBER_RE.match(lines[index].strip())]
+
+    # Dòng khác rỗng (kể cả ngắt trang) để tìm dòng liền trước / sau của một số trơn
+    nonblank = [index for index, line in enumerate(lines) if line.strip() or line == _PAGE_BREAK]
+    rank = {index: number for number, index in enumerate(nonblank)}
+
+    def next_to_page_break(index: int) -> bool:
+        number = rank[index]
+        return any(0 <= other < len(nonblank) and lines[nonblank[other]] == _PAGE_BREAK for other in (number - 1, number + 1))
+
+    def numbered_pages() -> Set[int]:
+        """Số trơn tạo thành dãy 1, 2, 3... cách nhau cỡ một trang (>= min_repeats số)"""
+        chains: List[List[int]] = []
+        for index in bare_numbers:
+            value = int(lines[index].strip())
+            for chain in chains:
+                last = chain[-1]
+                if int(lines[last].strip()) == value - 1 and position[index] - position[last] >= min_page_lines:
+                    chain.append(index)
+                    break
+            else:
+                chains.append([index])
+        return {index for chain in chains if len(chain) >= min_repeats for index in chain}
+
+    markers = {index for index in content if _PAGE_NUMBER_RE.match(lines[index].strip())}
+    # Số sát ngắt trang: là số trang khi chỉ có một, hoặc khi nối tiếp nhau (giá trị lặp lại ở
+    # mọi trang như "500" là nội dung)
+    at_breaks = [index for index in bare_numbers if next_to_page_break(index)]
+    break_values = {int(lines[index].strip()) for index in at_breaks}
+    markers.update(
+        index for index in at_breaks
+        if len(at_breaks) == 1 or break_values & {int(lines[index].strip()) - 1, int(lines[index].strip()) + 1}
+    )
+    # Số trang của trang đầu / cuối (không có ngắt trang ở phía ngoài) nối tiếp số trang sát ngắt trang
+    page_values = {int(lines[index].strip()) for index in markers if index in bare_numbers}
+    markers.update(
+        index for index in bare_numbers
+        if position[index] in (0, len(content) - 1) and page_values & {int(lines[index].strip()) - 1, int(lines[index].strip()) + 1}
+    )
+    markers.update(numbered_pages())
+
+    def is_candidate(index: int) -> bool:
+        stripped = lines[index].strip()
+        return (len(stripped) <= max_chars and not stripped.endswith(":") and not _KEY_VALUE_RE.match(stripped)
+                and not is_requirement_line(stripped) and not _BARE_NUMBER_RE.match(stripped) and index not in markers)
+
+    occurrences: Dict[str, List[int]] = {}
+    for index in content:
+        if is_candidate(index):
+            occurrences.setdefault(shape[index], []).append(index)
+
+    # Vị trí (trong các dòng khác rỗng) của ranh giới trang, kể cả đầu / cuối document
+    boundaries = [-1, len(content)]
+    for index, line in enumerate(lines):
+        if line == _PAGE_BREAK:
+            boundaries.append(bisect.bisect_left(content, index) - 0.5)
+        elif index in markers:
+            boundaries.append(position[index])
+    has_pages = len(boundaries) > 2
+
+    def near_boundary(index: int) -> bool:
+        return any(abs(position[index] - boundary) <= page_window for boundary in boundaries)
+
+    def regular(indexes: List[int]) -> bool:
+        gaps = [position[b] - position[a] for a, b in zip(indexes, indexes[1:])]
+        return min(gaps) >= min_page_lines and max(gaps) - min(gaps) <= max(2, min(gaps) // 5)
+
+    headers: Set[int] = set()
+    for indexes in occurrences.values():
+        if len(indexes) < min_repeats:
+            continue
+        if all(near_boundary(index) for index in indexes) or (not has_pages and regular(indexes)):
+            headers.update(indexes)
+
+    # Số trơn ngay trước / sau header ("ACME SRS" rồi "12", không cách bởi ngắt trang) là số trang
+    markers.update(
+        index for index in bare_numbers
+        if any(0 <= other < len(nonblank) and nonblank[other] in headers for other in (rank[index] - 1, rank[index] + 1))
+    )
+
+    return "\n".join(
+        line for index, line in enumerate(lines)
+        if index not in headers and index not in markers and line != _PAGE_BREAK
+    )
+
+
+def strip_toc(text: str) -> str:
+    """Bỏ mục lục: heading "Table of Contents" và các dòng "1.2 Scope ....... 5" """
+    kept, in_toc = [], False
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if _TOC_HEADING_RE.match(stripped):
+            in_toc = True
+            continue
+        is_entry = bool(_TOC_LINE_RE.match(stripped)) and not is_requirement_line(stripped)
+        if in_toc and stripped and not is_entry:
+            in_toc = False
+        if is_entry and (in_toc or "..." in stripped or "…" in stripped):
+            continue
+        if in_toc and not stripped:
+            continue
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def _is_numbered_heading(line: str) -> bool:
+    """Heading đánh số ("1.1 Purpose") - khác dòng phiên bản ("1.1 | 2024-01-02 | ...", "1.1 2024-01-02 An")"""
+    return bool(_NUMBERED_HEADING_RE.match(line)) and " | " not in line and not _DATE_RE.search(line)
+
+
+def strip_changelog(text: str) -> str:
+    """
+    Bỏ section lịch sử thay đổi: heading + các dòng phiên bản / ngày / dòng table ngay sau nó
+
+    Section kết thúc ở dòng đầu tiên không phải dòng của table hoặc là heading đánh số.
+    """
+    kept, in_log = [], False
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if _CHANGELOG_HEADING_RE.match(stripped):
+            in_log = True
+            continue
+        if in_log:
+            is_entry = " | " in stripped or _CHANGELOG_LINE_RE.match(stripped)
+            if not stripped or (is_entry and not is_requirement_line(stripped) and not _is_numbered_heading(stripped)):
+                continue
+            in_log = False
+        kept.append(line)
+    return "\n".join(kept)
+
+
+class BoilerplateFilter:
+    """
+    Bỏ dòng boilerplate theo pattern cấu hình (trừ dòng bắt đầu bằng requirement ID)
+
+    Adaptive mode: đếm số document khác nhau chứa từng dòng (fingerprint) và bỏ cả các
+    dòng đã gặp ở >= min_documents document - state của process nên không deterministic.
+    """
+
+    def __init__(self, patterns: Sequence[str] = (), adaptive: bool = False, min_documents: int = BOILERPLATE_MIN_DOCUMENTS):
+        self.patterns = [re.compile(pattern, re.IGNORECASE) for pattern in (*_DEFAULT_BOILERPLATE, *patterns) if pattern]
+        self.adaptive = adaptive
+        self.min_documents = min_documents
+        self._seen: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, text: str) -> str:
+        lines = text.split("\n")
+        learned: Set[str] = set()
+        if self.adaptive:
+            keys = {normalize_key(line) for line in lines if line.strip() and not is_requirement_line(line)}
+            with self._lock:
+                self._seen.update(keys)
+                learned = {key for key in keys if self._seen[key] >= self.min_documents}
+        return "\n".join(line for line in lines if not self._is_boilerplate(line, learned))
+
+    def _is_boilerplate(self, line: str, learned: Set[str]) -> bool:
+        if not line.strip() or has_requirement_id(line):
+            return False
+        if any(pattern.search(line) for pattern in self.patterns):
+            return True
+        return normalize_key(line) in learned
+
+
+class InputNormalizer:
+    """
+    Chạy các stage chuẩn hóa theo thứ tự, ghi token trước / sau của từng stage
+
+    Usage:
+        result = get_input_normalizer().normalize(text)
+        prompt_text, report = result.text, result.to_dict()
+    """
+
+    def __init__(
+        self,
+        stages: Optional[Sequence[str]] = None,
+        mode: str = INPUT_NORMALIZATION_MODE,
+        boilerplate_patterns: Sequence[str] = (),
+        enabled: bool = INPUT_NORMALIZATION_ENABLED
+    ):
+        if mode not in (MODE_DETERMINISTIC, MODE_ADAPTIVE):
+            raise ValueError(f"Unknown normalization mode '{mode}' (expected deterministic or adaptive)")
+        names = [name.strip().lower() for name in (stages if stages is not None else INPUT_NORMALIZATION_STAGES.split(","))]
+        available: Dict[str, Callable[[str], str]] = {
+            "whitespace": normalize_whitespace,
+            "headers": strip_headers_footers,
+            "toc": strip_toc,
+            "changelog": strip_changelog,
+            "boilerplate": BoilerplateFilter(
+                boilerplate_patterns or [pattern for pattern in BOILERPLATE_PATTERNS.split("||") if pattern.strip()],
+                adaptive=mode == MODE_ADAPTIVE
+            ),
+        }
+        unknown = [name for name in names if name and name not in available]
+        if unknown:
+            raise ValueError(f"Unknown normalization stages: {', '.join(unknown)}")
+        self.stages = [(name, available[name]) for name in names if name]
+        self.mode = mode
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {"documents": 0, "tokens_before": 0, "tokens_after": 0}
+        self._stage_saved: Counter = Counter()
+
+    def normalize(self, text: str) -> NormalizationResult:
+        """Text đã chuẩn hóa + báo cáo token theo stage (text giữ nguyên nếu normalizer bị tắt)"""
+        text = text or ""
+        if not self.enabled:
+            return NormalizationResult(text=text, mode=self.mode)
+        reports = []
+        for name, stage in self.stages:
+            before = estimate_tokens(text)
+            normalized = stage(text)
+            reports.append(StageReport(
+                stage=name,
+                tokens_before=before,
+                tokens_after=estimate_tokens(normalized),
+                lines_removed=max(0, text.count("\n") - normalized.count("\n"))
+            ))
+            text = normalized
+        if _PAGE_BREAK in text:  # Ngắt trang do whitespace stage giữ lại mà headers stage không chạy
+            text = "\n".join(line for line in text.split("\n") if line != _PAGE_BREAK)
+        result = NormalizationResult(text=text, stages=reports, mode=self.mode)
+        with self._lock:
+            self._stats["documents"] += 1
+            self._stats["tokens_before"] += result.tokens_before
+            self._stats["tokens_after"] += result.tokens_after
+            for report in reports:
+                self._stage_saved[report.stage] += report.tokens_before - report.tokens_after
+        return result
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "mode": self.mode,
+                "stages": [name for name, _ in self.stages],
+                **self._stats,
+                "tokens_saved_by_stage": dict(self._stage_saved)
+            }
+
+
+_input_normalizer: Optional[InputNormalizer] = None
+
+
+def get_input_normalizer() -> InputNormalizer:
+    """Get or create input normalizer instance"""
+    global _input_normalizer
+    if _input_normalizer is None:
+        _input_normalizer = InputNormalizer()
+    return _input_normalizer
@@ -0,0 +1,4 @@
+"""
+Micro-benchmarks offline (không gọi LLM) - chạy từ thư mục backend:
+    python -m benchmarks.bench_json_extract
+"""
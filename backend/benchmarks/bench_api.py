@@ -0,0 +1,213 @@
+"""
+End-to-end benchmark của API, chạy hoàn toàn offline
+
+App FastAPI chạy in-process (httpx ASGITransport), LLM là replay backend (cassette +
+latency giả lập, prompt chưa ghi trả response rỗng), database là SQLite tạm. Đo
+throughput và p50/p95/p99 latency của /api/analyze, /api/analyze/file, history và export
+với concurrency cấu hình được. Chạy từ thư mục backend:
+    python -m benchmarks.bench_api --requests 200 --concurrency 16 \\
+        --latency lognormal:1.2,0.4 --tokens-per-second 120
+
+Dùng response thật: ghi cassette bằng LLM_BACKEND=record rồi chạy với --cassette <tên>.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional
+
+SCENARIOS = ("analyze", "analyze_file", "history", "export")
+SAMPLES_DIR = Path(__file__).resolve().parents[2]  # TEST_REQUIREMENTS_*.txt ở root repo
+
+FALLBACK_SAMPLE = """REQ-1 The system shall allow users to log in with email and password.
+REQ-2 The system should respond quickly to search requests.
+REQ-3 The account shall be locked after 3 failed login attempts.
+REQ-4 The account shall never be locked.
+REQ-5 Reports shall be exported in PDF, DOCX etc."""
+
+
+def percentile(samples: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * p // 100))  # ceil
+    return ordered[int(rank) - 1]
+
+
+def summarize(name: str, latencies: List[float], errors: int, elapsed: float) -> dict:
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 1) if value is not None else None
+
+    total = len(latencies) + errors
+    return {
+        "scenario": name,
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 2) if elapsed > 0 else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99))
+    }
+
+
+def load_samples() -> List[str]:
+    samples = [
+        path.read_text(encoding="utf-8")
+        for path in sorted(SAMPLES_DIR.glob("TEST_REQUIREMENTS_*.txt"))
+    ]
+    return [sample for sample in samples if sample.strip()] or [FALLBACK_SAMPLE]
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """Env phải được set trước khi import app (config đọc lúc import module)"""
+    os.environ["LLM_BACKEND"] = "replay"
+    os.environ["LLM_REPLAY_LATENCY"] = args.latency
+    os.environ["LLM_REPLAY_TOKENS_PER_SECOND"] = str(args.tokens_per_second)
+    os.environ["LLM_REPLAY_MISSING"] = "synthetic"
+    os.environ["LLM_REPLAY_SEED"] = str(args.seed)
+    if args.cassette:
+        os.environ["LLM_CASSETTE"] = args.cassette
+    if not args.rate_limit:
+        os.environ["LLM_RPM_LIMIT"] = "0"
+        os.environ["LLM_TPM_LIMIT"] = "0"
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tempfile.mkdtemp(prefix='bench-')}/bench.db"
+
+    from app.agents import prompt_registry
+
+    if args.prompts_dir:
+        prompt_registry.PROMPTS_DIR = Path(args.prompts_dir)
+    elif not all((prompt_registry.PROMPTS_DIR / name).exists() for name in prompt_registry.PROMPT_FILES.values()):
+        prompt_registry.PROMPTS_DIR = _placeholder_prompts_dir()
+
+
+def _placeholder_prompts_dir() -> Path:
+    """Prompt tối giản khi repo không có prompt files (benchmark không đo nội dung prompt)"""
+    from app.agents.prompt_registry import PROMPT_FILES
+
+    directory = Path(tempfile.mkdtemp(prefix="bench-prompts-"))
+    variables = {
+        "parse": "{input_text}",
+        "conflict": "{parsed_requirements}",
+        "ambiguity": "{parsed_requirements}",
+        "improve": "{parsed_requirements} {conflicts} {ambiguities}",
+        "analyze_all": "{input_text}",
+    }
+    for name, filename in PROMPT_FILES.items():
+        (directory / filename).write_text(f"{name}: {variables[name]}", encoding="utf-8")
+    return directory
+
+
+async def run_scenario(
+    name: str,
+    request: Callable[[int], Awaitable[object]],
+    total: int,
+    concurrency: int
+) -> dict:
+    """Chạy `total` request với tối đa `concurrency` request đồng thời"""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(index: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await request(index)
+                if response.status_code >= 400:
+                    errors += 1
+                    return
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(total)))
+    return summarize(name, latencies, errors, time.perf_counter() - start)
+
+
+async def run_benchmark(args: argparse.Namespace) -> List[dict]:
+    import httpx
+    from main import app
+
+    samples = load_samples()
+    analysis_ids: List[int] = []
+
+    def document(index: int) -> str:
+        # Mỗi request một document khác nhau: không đo result cache
+        return f"{samples[index % len(samples)]}\nREQ-BENCH-{index} The system shall record benchmark event {index}."
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def analyze(index: int):
+            response = await client.post("/api/analyze", json={"text": document(index), "mode": args.mode})
+            if response.status_code == 200 and response.json().get("analysis_id"):
+                analysis_ids.append(response.json()["analysis_id"])
+            return response
+
+        async def analyze_file(index: int):
+            files = {"file": (f"srs-{index}.txt", document(index).encode("utf-8"), "text/plain")}
+            data = {"mode": args.mode} if args.mode else {}
+            return await client.post("/api/analyze/file", files=files, data=data)
+
+        async def history(index: int):
+            return await client.get("/api/history", params={"limit": 20, "offset": (index * 20) % 100})
+
+        async def export(index: int):
+            if not analysis_ids:
+                raise RuntimeError("No saved analysis to export (run the analyze scenario first)")
+            fmt = "docx" if index % 2 else "json"
+            return await client.get(f"/api/export/{fmt}/{analysis_ids[index % len(analysis_ids)]}")
+
+        handlers = {"analyze": analyze, "analyze_file": analyze_file, "history": history, "export": export}
+        results = []
+        for name in args.scenarios:
+            result = await run_scenario(name, handlers[name], args.requests, args.concurrency)
+            results.append(result)
+            print(_format_row(result), flush=True)
+        return results
+
+
+def _format_row(result: dict) -> str:
+    def cell(value) -> str:
+        return "-" if value is None else str(value)
+
+    return (f"{result['scenario']:<14}{result['requests']:>9}{result['errors']:>8}"
+            f"{cell(result['throughput_rps']):>10}{cell(result['p50_ms']):>10}"
+            f"{cell(result['p95_ms']):>10}{cell(result['p99_ms']):>10}")
+
+
+def main(argv: Optional[List[str]] = None) -> List[dict]:
+    parser = argparse.ArgumentParser(description="Offline end-to-end API benchmark (replay LLM backend)")
+    parser.add_argument("--requests", type=int, default=100, help="Số request mỗi scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--latency", default="lognormal:1.0,0.5", help="LLM_REPLAY_LATENCY, vd: fixed:0.5")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mode", choices=("fast", "full", "chunked"), default=None)
+    parser.add_argument("--cassette", default=None, help="Replay response thật đã ghi (LLM_CASSETTE)")
+    parser.add_argument("--database-url", default=None, help="Mặc định: SQLite tạm")
+    parser.add_argument("--prompts-dir", default=None)
+    parser.add_argument("--rate-limit", action="store_true", help="Bật rate limiter (mặc định tắt)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Ghi kết quả ra file JSON")
+    args = parser.parse_args(argv)
+
+    configure_environment(args)
+    print(f"{'scenario':<14}{'requests':>9}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    results = asyncio.run(run_benchmark(args))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
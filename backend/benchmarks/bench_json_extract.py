@@ -0,0 +1,94 @@
+"""
+Micro-benchmark cho extract_findings trên corpus output lệch format của model
+
+So sánh với cách parse cũ (cắt theo ``` + regex) về số finding lấy được và thời gian
+parse mỗi response. Chạy từ thư mục backend:
+    python -m benchmarks.bench_json_extract [--repeat 200]
+"""
+
+import os
+import re
+import json
+import time
+import argparse
+from app.utils.json_stream import DEFAULT_SECTIONS, extract_findings
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "..", "tests", "data", "malformed_llm_responses.json")
+
+
+def legacy_parse(text: str) -> dict:
+    """Cách parse trước extract_findings (code fence slicing + regex fallback)"""
+    if "```json" in text:
+        start = text.find("```json") + 7
+        text = text[start:text.find("```", start)].strip()
+    elif "```" in text:
+        start = text.find("```") + 3
+        end = text.find("```", start)
+        if end > start:
+            text = text[start:end].strip()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        match = re.search(r"\{.*\}", text, re.DOTALL)
+        try:
+            data = json.loads(match.group()) if match else {}
+        except json.JSONDecodeError:
+            data = {}
+    if isinstance(data, list):
+        return {"items": data}
+    return data if isinstance(data, dict) else {}
+
+
+def _count(findings: dict) -> int:
+    return sum(len(items) for items in findings.values() if isinstance(items, list))
+
+
+def _time_per_call(func, text: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(text)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def _large_response(items: int = 300) -> str:
+    """Response lớn (~items finding mỗi section) bị cắt ở cuối"""
+    data = {
+        section: [{"req": f"REQ-{i:04d} The system shall do thing {i}", "issue": "vague", "new_version": "x" * 60}
+                  for i in range(items)]
+        for section in DEFAULT_SECTIONS
+    }
+    text = json.dumps(data, indent=2)
+    return "```json\n" + text[:-200]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    corpus.append({"name": "large_truncated", "response": _large_response()})
+
+    print(f"{'case':34} {'legacy items':>12} {'new items':>10} {'dropped':>8} {'legacy us':>10} {'new us':>10}")
+    totals = [0, 0]
+    for case in corpus:
+        text = case["response"]
+        options = {}
+        if case.get("list_section"):
+            options = {"sections": (case["list_section"],), "list_section": case["list_section"]}
+        findings, report = extract_findings(text, **options)
+        legacy_items = _count(legacy_parse(text))
+        new_items = _count(findings)
+        totals[0] += legacy_items
+        totals[1] += new_items
+        repeat = max(1, args.repeat // 20) if case["name"] == "large_truncated" else args.repeat
+        legacy_us = _time_per_call(legacy_parse, text, repeat)
+        new_us = _time_per_call(lambda value: extract_findings(value, **options), text, repeat)
+        print(f"{case['name']:34} {legacy_items:>12} {new_items:>10} {len(report.dropped):>8} "
+              f"{legacy_us:>10.1f} {new_us:>10.1f}")
+    print(f"\nFindings recovered: legacy {totals[0]}, extract_findings {totals[1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,11 @@ from dotenv import load_dotenv
 from app.api.router import router
 from app.api.history_router import router as history_router
 from app.api.export_router import router as export_router
+from app.api.job_router import router as job_router
 from app.database.db import init_db, get_engine
+from app.services.job_service import get_job_manager
+from app.services.model_pool import get_model_pool
+from app.utils.concurrency import get_concurrency_stats
 from app.utils.logger import logger
 
 # Load environment variables
@@ -39,6 +43,20 @@ app.add_middleware(
 app.include_router(router)
 app.include_router(history_router)
 app.include_router(export_router)
+app.include_router(job_router)
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    """Khởi động job worker pool và chạy lại các job chưa xong từ lần chạy trước"""
+    await get_job_manager().start(recover=True)
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    """Dừng job worker pool"""
+    await get_job_manager().stop()
+
 
 @app.get("/")
 async def root():
@@ -50,7 +68,7 @@ async def root():
     }
 
 @app.get("/health")
-async def health_check():
+def health_check():
     """Health check endpoint - kiểm tra status của API, Gemini, và Database"""
     gemini_key_set = bool(os.getenv("GEMINI_API_KEY"))
     
@@ -76,6 +94,8 @@ async def health_check():
         "api": "running",
         "gemini_api_key_configured": gemini_key_set,
         "database": db_status,
+        "analyses": get_concurrency_stats(),
+        "warm_models": get_model_pool().get_stats()["warm_models"],
         "timestamp": datetime.now().isoformat()
     }
 
@@ -0,0 +1,33 @@
+"""
+Shared fixtures cho backend tests
+"""
+
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database.db import Base
+import app.database.models  # noqa: F401 - đăng ký tables với Base
+
+
+@pytest.fixture
+def sqlite_session_factory():
+    """Session factory dùng SQLite in-memory thay cho SQL Server"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    @contextmanager
+    def factory():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    return factory
@@ -0,0 +1,140 @@
+"""
+Unit tests cho ambiguity classifier (pre-screen học từ lịch sử phân tích)
+"""
+
+import asyncio
+import json
+import pytest
+from langchain_core.runnables import RunnableLambda
+from app.agents import ambiguity_classifier
+from app.agents.ambiguity_classifier import (
+    CLASSIFIER_ISSUE_PREFIX,
+    AmbiguityClassifier,
+    ClassifierUnavailableError,
+    build_training_set,
+    calibrate_thresholds,
+    settlement_key,
+)
+from app.database.models import AnalysisHistory
+
+
+def test_training_set_labels_requirements_from_history():
+    rows = [
+        ("REQ-1 The system shall respond fast.\nREQ-2 Passwords shall be hashed.",
+         [{"req": "REQ-1 The system shall respond fast.", "issue": "how fast?"}]),
+        # Bản cũ hơn của cùng requirement (nhãn khác) bị bỏ; finding của classifier không làm nhãn
+        ("FR-9 The system shall respond fast.\nFR-3 Reports shall be user friendly.",
+         [{"req": "FR-3 Reports shall be user friendly.", "issue": f"{CLASSIFIER_ISSUE_PREFIX} ..."}]),
+    ]
+    texts, labels = build_training_set(rows)
+    assert list(zip(texts, labels)) == [
+        ("REQ-1 The system shall respond fast.", 1),
+        ("REQ-2 Passwords shall be hashed.", 0),
+    ]
+
+
+def test_thresholds_bound_the_uncertain_band(monkeypatch):
+    monkeypatch.setattr(ambiguity_classifier, "AMBIGUITY_TRAINING_MIN_PER_CLASS", 2)
+    scores = [0.05, 0.1, 0.2, 0.4, 0.5, 0.6, 0.8, 0.9, 0.95]
+    labels = [0, 0, 0, 1, 0, 1, 1, 1, 1]
+    assert calibrate_thresholds(scores, labels, target=0.95) == (0.2, 0.6)
+    assert calibrate_thresholds([0.5, 0.5], [0, 1], target=0.95) == (0.0, 1.0)
+
+
+class _FakeModel:
+    def predict_proba(self, texts):
+        return [[1 - score, score] for score in (0.9 if "fast" in text else 0.5 if "soon" in text else 0.1 for text in texts)]
+
+
+def _loaded(tmp_path, **kwargs):
+    classifier = AmbiguityClassifier(model_dir=tmp_path, reload_interval=3600, clock=lambda: 0.0, **kwargs)
+    classifier._model = _FakeModel()
+    classifier._metadata = {"version": "v1", "thresholds": [0.2, 0.8]}
+    classifier._last_check = 0.0
+    return classifier
+
+
+def test_screen_settles_confident_scores_locally(tmp_path):
+    classifier = _loaded(tmp_path)
+    screen = classifier.screen(["A shall respond fast.", "B shall ship soon.", "C shall hash passwords."])
+    assert [req for req, _ in screen.ambiguous] == ["A shall respond fast."]
+    assert screen.clear == ["C shall hash passwords."] and screen.uncertain == ["B shall ship soon."]
+    assert screen.findings()[0]["issue"].startswith(CLASSIFIER_ISSUE_PREFIX)
+    assert classifier.get_stats()["uncertain"] == 1
+    assert AmbiguityClassifier(model_dir=tmp_path).screen(["A"]) is None  # Chưa có model
+
+
+def test_locally_settled_requirements_are_not_training_labels(tmp_path, sqlite_session_factory):
+    classifier = _loaded(tmp_path, session_factory=sqlite_session_factory)
+    classifier._metadata["thresholds"] = [0.2, 0.4]
+    classifier.screen(["A shall respond fast.", "B shall ship soon.", "C shall hash passwords."])
+    assert classifier._settled_keys() == {
+        settlement_key(req) for req in ("A shall respond fast.", "B shall ship soon.", "C shall hash passwords.")
+    }
+    # Version sau đưa B vào dải không chắc chắn -> B gửi LLM, nhãn trong history là nhãn thật
+    classifier._metadata["thresholds"] = [0.2, 0.8]
+    classifier.screen(["REQ-7 B shall ship soon."])
+
+    rows = [("A shall respond fast.\nB shall ship soon.\nC shall hash passwords.\nD shall log out idle users.", [])]
+    texts, labels = build_training_set(rows, classifier._settled_keys())
+    assert list(zip(texts, labels)) == [("B shall ship soon.", 0), ("D shall log out idle users.", 0)]
+
+
+def test_clarity_node_sends_only_uncertain_band(tmp_path, monkeypatch):
+    from app.agents.langgraph_agent import RequirementsAnalysisAgent
+    from app.agents.prompt_registry import PROMPT_FILES, PromptRegistry
+    from app.services import requirement_memo
+
+    for filename in PROMPT_FILES.values():
+        (tmp_path / filename).write_text(f"{filename} {{input_text}}", encoding="utf-8")
+    monkeypatch.setattr(ambiguity_classifier, "_ambiguity_classifier", _loaded(tmp_path))
+    monkeypatch.setattr(requirement_memo.RequirementMemo, "alookup", lambda self, *args: asyncio.sleep(0, {}))
+    monkeypatch.setattr(requirement_memo.RequirementMemo, "astore", lambda self, *args: asyncio.sleep(0))
+    agent = RequirementsAnalysisAgent(api_key="test-key", prompt_registry=PromptRegistry(tmp_path, reload_interval=0))
+    agent.ambiguity_rules = None
+    sent = []
+
+    async def ambiguity(inputs):
+        sent.append(inputs["parsed_requirements"])
+        return json.dumps({"ambiguities": []})
+
+    agent.ambiguity_chain = RunnableLambda(ambiguity)
+    requirements = ["A shall respond fast.", "B shall ship soon.", "C shall hash passwords."]
+    update = asyncio.run(agent.clarity_check_node({"parsed_requirements": requirements}))
+    assert sent == ["- B shall ship soon."]
+    assert [item["req"] for item in update["ambiguities"]] == ["A shall respond fast."]
+
+
+def test_versions_activate_and_missing_dependencies(tmp_path, sqlite_session_factory):
+    classifier = AmbiguityClassifier(model_dir=tmp_path, session_factory=sqlite_session_factory)
+    with pytest.raises(FileNotFoundError):
+        classifier.activate("../../etc/passwd")
+    (tmp_path / "ambiguity-v1.json").write_text(json.dumps({"version": "v1"}), encoding="utf-8")
+    (tmp_path / "ambiguity-v1.joblib").write_bytes(b"")
+    assert classifier.activate("v1") == {"version": "v1"}
+    assert json.loads((tmp_path / "current.json").read_text()) == {"version": "v1"}
+    assert classifier.versions() == [{"version": "v1"}]
+
+    try:
+        import sklearn  # noqa: F401
+    except ImportError:
+        with pytest.raises(ClassifierUnavailableError):
+            classifier.train()
+
+
+def test_train_from_history_creates_active_version(tmp_path, sqlite_session_factory, monkeypatch):
+    pytest.importorskip("sklearn")
+    monkeypatch.setattr(ambiguity_classifier, "AMBIGUITY_TRAINING_MIN_SAMPLES", 40)
+    monkeypatch.setattr(ambiguity_classifier, "AMBIGUITY_TRAINING_MIN_PER_CLASS", 10)
+    with sqlite_session_factory() as db:
+        for i in range(30):
+            vague, clear = f"REQ-{i} The screen {i} shall load fast and be user friendly.", f"REQ-{i + 100} Field {i} shall accept {i} digits."
+            db.add(AnalysisHistory(text_input=f"{vague}\n{clear}", ambiguities_json=[{"req": vague, "issue": "vague"}]))
+        db.commit()
+
+    classifier = AmbiguityClassifier(model_dir=tmp_path, session_factory=sqlite_session_factory, reload_interval=0)
+    metadata = classifier.train()
+    assert metadata["samples"] == 60 and metadata["ambiguous_samples"] == 30
+    assert classifier.version == metadata["version"]
+    screen = classifier.screen(["REQ-900 The report page shall load fast and be user friendly."])
+    assert not screen.clear
@@ -0,0 +1,82 @@
+"""
+Unit tests cho rule-based ambiguity pre-analyzer
+"""
+
+import json
+from app.agents.ambiguity_rules import PRE_FLAGGED_HEADER, AmbiguityRuleEngine, load_lexicon
+
+
+SAMPLE_SRS = """REQ-001 The system shall respond fast.
+REQ-002 The UI shall be user-friendly, support PDF, DOCX etc.
+REQ-003 The system shall lock the account after 3 failed login attempts.
+REQ-004 Reports should be exported as appropriate.
+"""
+
+
+def test_scan_matches_terms_and_punctuation():
+    """Term có dấu câu ("etc.", "user-friendly") và multi-word term đều khớp"""
+    engine = AmbiguityRuleEngine()
+    terms = [m.term for m in engine.scan("The UI shall be User-Friendly, support PDF etc. as appropriate")]
+    assert terms == ["User-Friendly", "etc.", "as appropriate"]
+
+
+def test_scan_respects_word_boundaries():
+    """Không khớp một phần của từ khác (breakfast, mayor, somewhere)"""
+    engine = AmbiguityRuleEngine()
+    assert engine.scan("Breakfast orders go to the mayor somewhere") == []
+
+
+def test_analyze_splits_settled_and_unsettled():
+    """Requirement có weak word được flag local theo schema AmbiguityItem"""
+    pre = AmbiguityRuleEngine().analyze(SAMPLE_SRS)
+
+    assert [req[:7] for req in pre.settled] == ["REQ-001", "REQ-002", "REQ-004"]
+    assert [req[:7] for req in pre.unsettled] == ["REQ-003"]
+    assert set(pre.ambiguities[0]) == {"req", "issue"}
+    assert "'fast'" in pre.ambiguities[0]["issue"]
+    assert "'should'" in pre.ambiguities[2]["issue"] and "'as appropriate'" in pre.ambiguities[2]["issue"]
+
+
+def test_merge_keeps_rule_items_for_settled_requirements():
+    """Ambiguity của model cho requirement đã flag bị bỏ, các finding khác giữ nguyên"""
+    pre = AmbiguityRuleEngine().analyze(SAMPLE_SRS)
+    llm_result = {
+        "conflicts": [{"req1": "a", "req2": "b", "description": "c"}],
+        "ambiguities": [
+            {"req": "REQ-001 The system shall respond fast.", "issue": "duplicate"},
+            {"req": "REQ-003 The system shall lock the account after 3 failed login attempts.", "issue": "lock duration"}
+        ],
+        "suggestions": []
+    }
+
+    merged = pre.merge(llm_result)
+    issues = [a["issue"] for a in merged["ambiguities"]]
+    assert "duplicate" not in issues
+    assert issues[-1] == "lock duration"
+    assert len(merged["ambiguities"]) == 4
+    assert merged["conflicts"] == llm_result["conflicts"]
+
+
+def test_annotate_lists_settled_requirements():
+    """Input của model được thêm danh sách requirement đã flag"""
+    pre = AmbiguityRuleEngine().analyze(SAMPLE_SRS)
+    annotated = pre.annotate(SAMPLE_SRS)
+    assert annotated.startswith(SAMPLE_SRS)
+    assert PRE_FLAGGED_HEADER in annotated
+
+    clean = AmbiguityRuleEngine().analyze("REQ-003 The system shall lock the account after 3 failed login attempts.")
+    assert clean.annotate("x") == "x"
+
+
+def test_lexicon_override(tmp_path):
+    """File lexicon có thể tắt category mặc định và thêm category mới"""
+    path = tmp_path / "lexicon.json"
+    path.write_text(json.dumps({
+        "weak_modal": None,
+        "tbd": {"issue": "placeholder", "terms": ["TBD"], "patterns": [r"to be (defined|determined)"]}
+    }), encoding="utf-8")
+
+    engine = AmbiguityRuleEngine(load_lexicon(str(path)))
+    assert engine.scan("Users should log in") == []
+    assert [m.category for m in engine.scan("Timeout is TBD, limits to be determined")] == ["tbd", "tbd"]
+    assert engine.version != AmbiguityRuleEngine().version
@@ -0,0 +1,131 @@
+"""
+Unit tests cho analysis result cache
+"""
+
+import time
+from app.services.analysis_cache import AnalysisCache, make_cache_key, normalize_text
+
+
+SAMPLE_RESULT = {
+    "conflicts": [{"req1": "A", "req2": "B", "description": "conflict"}],
+    "ambiguities": [],
+    "suggestions": []
+}
+
+
+def test_cache_key_ignores_whitespace_differences():
+    """Test 2 text chỉ khác whitespace có cùng cache key"""
+    key1 = make_cache_key("REQ-1  The system\tshall login.\r\n\r\n\r\nREQ-2 ...", "fast", "m", "v1")
+    key2 = make_cache_key("REQ-1 The system shall login.\n\nREQ-2 ...  ", "fast", "m", "v1")
+    assert key1 == key2
+    assert normalize_text(" a \n\n\n\n b ") == "a\n\nb"
+
+
+def test_cache_key_depends_on_model_and_prompt_version():
+    """Test cache key thay đổi theo model / prompt version / mode"""
+    base = make_cache_key("text", "fast", "gemini-2.5-flash", "v1")
+    assert base != make_cache_key("text", "fast", "gemini-2.5-pro", "v1")
+    assert base != make_cache_key("text", "fast", "gemini-2.5-flash", "v2")
+    assert base != make_cache_key("text", "full", "gemini-2.5-flash", "v1")
+
+
+def test_memory_hit_and_miss_counters():
+    """Test hit/miss counters của memory tier"""
+    cache = AnalysisCache(persistent=False)
+    assert cache.lookup("k1") is None
+    cache.store("k1", SAMPLE_RESULT)
+    assert cache.lookup("k1") == SAMPLE_RESULT
+
+    stats = cache.get_stats()
+    assert stats["misses"] == 1
+    assert stats["memory_hits"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_lru_eviction_by_entry_count():
+    """Test LRU eviction khi vượt max_entries"""
+    cache = AnalysisCache(max_entries=2, persistent=False)
+    cache.store("k1", SAMPLE_RESULT)
+    cache.store("k2", SAMPLE_RESULT)
+    cache.lookup("k1")  # k1 mới được dùng -> k2 là LRU
+    cache.store("k3", SAMPLE_RESULT)
+
+    assert cache.lookup("k2") is None
+    assert cache.lookup("k1") is not None
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_eviction_by_size():
+    """Test eviction khi vượt max_bytes"""
+    cache = AnalysisCache(max_bytes=150, persistent=False)
+    cache.store("k1", SAMPLE_RESULT)
+    cache.store("k2", SAMPLE_RESULT)
+    assert cache.get_stats()["memory_bytes"] <= 150
+    assert cache.lookup("k1") is None
+
+
+def test_ttl_expiry():
+    """Test entry hết hạn theo TTL"""
+    cache = AnalysisCache(ttl_seconds=0, persistent=False)
+    cache.store("k1", SAMPLE_RESULT)
+    time.sleep(0.01)
+    assert cache.lookup("k1") is None
+
+
+def test_bypass_and_refresh_modes():
+    """Test cache_mode bypass/refresh"""
+    cache = AnalysisCache(persistent=False)
+    cache.store("k1", SAMPLE_RESULT)
+    assert cache.lookup("k1", cache_mode="bypass") is None
+    assert cache.lookup("k1", cache_mode="refresh") is None
+
+    cache.store("k2", SAMPLE_RESULT, cache_mode="bypass")
+    assert cache.lookup("k2") is None
+
+    stats = cache.get_stats()
+    assert stats["bypassed"] == 1
+    assert stats["refreshed"] == 1
+
+
+def test_empty_result_not_cached():
+    """Test không cache kết quả rỗng (thường do LLM lỗi)"""
+    cache = AnalysisCache(persistent=False)
+    cache.store("k1", {"conflicts": [], "ambiguities": [], "suggestions": []})
+    assert cache.lookup("k1") is None
+
+
+def test_cached_result_is_a_copy():
+    """Test sửa kết quả trả về không làm hỏng cache"""
+    cache = AnalysisCache(persistent=False)
+    cache.store("k1", SAMPLE_RESULT)
+    cache.lookup("k1")["conflicts"].clear()
+    assert len(cache.lookup("k1")["conflicts"]) == 1
+
+
+def test_persistent_tier_survives_restart(sqlite_session_factory):
+    """Test persistent tier: cache mới (sau restart) vẫn đọc được kết quả"""
+    cache = AnalysisCache(session_factory=sqlite_session_factory)
+    cache.store("k1", SAMPLE_RESULT, model="gemini-2.5-flash", prompt_version="v1")
+
+    restarted = AnalysisCache(session_factory=sqlite_session_factory)
+    assert restarted.lookup("k1") == SAMPLE_RESULT
+    assert restarted.get_stats()["persistent_hits"] == 1
+
+    # Lần sau lấy từ memory tier
+    assert restarted.lookup("k1") == SAMPLE_RESULT
+    assert restarted.get_stats()["memory_hits"] == 1
+
+
+def test_async_lookup_and_store(sqlite_session_factory):
+    """Test async API của cache"""
+    import asyncio
+
+    cache = AnalysisCache(session_factory=sqlite_session_factory)
+
+    async def run():
+        assert await cache.alookup("k1") is None
+        await cache.astore("k1", SAMPLE_RESULT)
+        cache.clear_memory()
+        return await cache.alookup("k1")
+
+    assert asyncio.run(run()) == SAMPLE_RESULT
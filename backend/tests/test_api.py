@@ -66,6 +66,309 @@ def test_file_upload_no_file():
     assert response.status_code in [400, 422]
 
 
+class _FakeAsyncAgent:
+    """Fake agent chỉ có async path - nếu router gọi sync analyze_fast thì test fail"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def aanalyze_fast(self, text, cache_mode=None):
+        self.calls.append(text)
+        return {
+            "conflicts": [{"req1": "A", "req2": "B", "description": "conflict"}],
+            "ambiguities": [{"req": "fast", "issue": "vague"}],
+            "suggestions": []
+        }
+
+
+def test_analyze_uses_async_agent(monkeypatch):
+    """Test /api/analyze dùng async path của agent"""
+    from app.api import router as router_module
+
+    fake_agent = _FakeAsyncAgent()
+    monkeypatch.setattr(router_module, "get_agent", lambda model=None: fake_agent)
+
+    response = client.post("/api/analyze", json={"text": "REQ-1 The system shall be fast"})
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["conflicts"]) == 1
+    assert data["ambiguities"][0]["req"] == "fast"
+    assert fake_agent.calls == ["REQ-1 The system shall be fast"]
+    assert data["stats"]["plan"]["mode"] == "fast"
+    assert data["stats"]["plan"]["actual_latency_seconds"] is not None
+
+
+def test_analyze_invalid_mode():
+    """Test /api/analyze với execution mode không hỗ trợ"""
+    response = client.post("/api/analyze", json={"text": "REQ-1 ...", "mode": "turbo"})
+    assert response.status_code == 422
+
+
+class _FakeStreamingAgent:
+    """Fake agent cho streaming endpoint"""
+
+    async def astream_fast(self, text, cache_mode=None):
+        yield "conflicts", {"req1": "A", "req2": "B", "description": "conflict"}
+        yield "ambiguities", {"req": "fast"}  # Sai schema -> bị bỏ qua
+        yield "suggestions", {"req": "fast", "new_version": "< 2s"}
+        yield "result", {
+            "conflicts": [{"req1": "A", "req2": "B", "description": "conflict"}],
+            "ambiguities": [],
+            "suggestions": [{"req": "fast", "new_version": "< 2s"}]
+        }
+
+
+def test_analyze_stream_ndjson(monkeypatch):
+    """Test /api/analyze/stream trả về NDJSON events"""
+    import json
+    from app.api import router as router_module
+
+    monkeypatch.setattr(router_module, "get_agent", lambda model=None: _FakeStreamingAgent())
+
+    response = client.post("/api/analyze/stream", json={"text": "REQ-1 The system shall be fast"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    events = [json.loads(line) for line in response.text.splitlines() if line]
+    assert [e["event"] for e in events] == ["started", "conflict", "suggestion", "done"]
+    assert events[1]["data"]["req1"] == "A"
+    assert events[-1]["counts"] == {"conflicts": 1, "ambiguities": 0, "suggestions": 1}
+    assert "processing_time_ms" in events[-1]
+
+
+def test_analyze_stream_uses_shared_pipeline(monkeypatch):
+    """Test /api/analyze/stream đi qua run_analysis: bỏ bản trùng, planner, stats"""
+    import json
+    from app.api import router as router_module
+
+    class _RecordingAgent(_FakeStreamingAgent):
+        texts = []
+
+        async def astream_fast(self, text, cache_mode=None):
+            self.texts.append(text)
+            async for event in super().astream_fast(text, cache_mode):
+                yield event
+
+    monkeypatch.setattr(router_module, "get_agent", lambda model=None: _RecordingAgent())
+    text = ("REQ-1 The system shall lock the account after 3 failed attempts.\n"
+            "REQ-2 The system must lock the account after 3 failed login attempts.")
+    response = client.post("/api/analyze/stream", json={"text": text})
+
+    done = [json.loads(line) for line in response.text.splitlines() if line][-1]
+    assert _RecordingAgent.texts == ["REQ-1 The system shall lock the account after 3 failed attempts.\n"]
+    assert done["event"] == "done"
+    assert done["stats"]["plan"]["mode"] == "fast" and done["stats"]["dedup"]["collapsed"] == 1
+    assert done["stats"]["plan"]["requirement_count"] == 1  # Plan tính trên text đã bỏ bản trùng
+
+
+def test_analyze_stream_sse(monkeypatch):
+    """Test /api/analyze/stream với Accept: text/event-stream"""
+    from app.api import router as router_module
+
+    monkeypatch.setattr(router_module, "get_agent", lambda model=None: _FakeStreamingAgent())
+
+    response = client.post(
+        "/api/analyze/stream",
+        json={"text": "REQ-1 The system shall be fast"},
+        headers={"Accept": "text/event-stream"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert "event: conflict\ndata: " in response.text
+    assert "event: done" in response.text
+
+
+def test_analyze_stream_empty_text():
+    """Test streaming endpoint với text rỗng"""
+    response = client.post("/api/analyze/stream", json={"text": "  "})
+    assert response.status_code == 400
+
+
+def test_job_api_lifecycle(monkeypatch):
+    """Test submit job -> poll -> kết quả qua /api/jobs"""
+    import time
+    from app.services import job_service
+    from app.services.job_service import JobManager
+
+    manager = JobManager(worker_count=1, agent_factory=lambda model: _FakeAsyncAgent())
+    monkeypatch.setattr(job_service, "_job_manager", manager)
+
+    with TestClient(app) as job_client:
+        response = job_client.post("/api/jobs/analyze", data={"text": "REQ-1 The system shall be fast"})
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+
+        for _ in range(100):
+            job = job_client.get(f"/api/jobs/{job_id}").json()
+            if job["status"] == "succeeded":
+                break
+            time.sleep(0.02)
+
+        assert job["status"] == "succeeded"
+        assert job["result"]["conflicts"][0]["req1"] == "A"
+        assert job_client.delete(f"/api/jobs/{job_id}").status_code == 409
+
+
+def test_job_api_validation():
+    """Test submit job không có text / file"""
+    response = client.post("/api/jobs/analyze", data={"model": "gemini-2.5-flash"})
+    assert response.status_code == 400
+    assert client.get("/api/jobs/does-not-exist").status_code == 404
+
+
+def test_health_reports_analysis_slots():
+    """Test health check trả về thống kê analysis in-flight"""
+    response = client.get("/health")
+    data = response.json()
+    assert data["analyses"]["in_flight"] == 0
+    assert data["analyses"]["max_concurrent_analyses"] >= 1
+
+
+def test_analyze_invalid_cache_option():
+    """Test analyze với cache option không hợp lệ"""
+    response = client.post("/api/analyze", json={"text": "REQ-1", "cache": "always"})
+    assert response.status_code == 422
+
+
+class _FakeRevisionAgent:
+    """Fake agent cho revision endpoint"""
+
+    async def aanalyze_revision(self, previous_text, previous_result, input_text, cache_mode=None):
+        assert previous_text == "REQ-1 old" and input_text == "REQ-1 new"  # Đã chuẩn hóa như run_analysis
+        return {**previous_result, "revision": {"mode": "incremental", "changed": 1}}
+
+
+def test_analyze_revision(monkeypatch):
+    """Test /api/analyze/revision dùng analysis cũ và trả về thống kê diff"""
+    from app.api import router as router_module
+
+    previous = {
+        "id": 3,
+        "text_input": "REQ-1 old",
+        "conflicts": [],
+        "ambiguities": [{"req": "REQ-1 old", "issue": "vague"}],
+        "suggestions": []
+    }
+    monkeypatch.setattr(router_module, "get_agent", lambda model=None: _FakeRevisionAgent())
+    monkeypatch.setattr(router_module, "load_analysis", lambda analysis_id: previous if analysis_id == 3 else None)
+    monkeypatch.setattr(router_module, "save_analysis_result", lambda **kwargs: 4)
+
+    response = client.post("/api/analyze/revision", json={"previous_analysis_id": 3, "text": "  REQ-1   new\n\n\n"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["analysis_id"] == 4
+    assert data["ambiguities"][0]["issue"] == "vague"
+    assert data["stats"] == {"previous_analysis_id": 3, "mode": "incremental", "changed": 1}
+
+    response = client.post("/api/analyze/revision", json={"previous_analysis_id": 99, "text": "REQ-1 new"})
+    assert response.status_code == 404
+
+
+def test_analyze_unsupported_model():
+    """Test analyze với model không được hỗ trợ"""
+    response = client.post("/api/analyze", json={"text": "REQ-1", "model": "not-a-model"})
+    assert response.status_code == 400
+    assert "Unsupported model" in response.json()["detail"]
+
+
+def test_models_endpoint():
+    """Test /api/models trả về model mặc định và danh sách model"""
+    response = client.get("/api/models")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["default_model"] in data["allowed_models"]
+
+
+def test_cache_stats_endpoint():
+    """Test cache stats endpoint"""
+    response = client.get("/api/cache/stats")
+    assert response.status_code == 200
+    data = response.json()
+    assert "hit_rate" in data
+    assert "misses" in data
+
+
+class _FakeBatchAgent(_FakeAsyncAgent):
+    """Fake agent: document chứa "boom" bị lỗi"""
+
+    async def aanalyze_fast(self, text, cache_mode=None):
+        if "boom" in text:
+            raise RuntimeError("model error")
+        return await super().aanalyze_fast(text, cache_mode)
+
+
+def test_analyze_batch(monkeypatch):
+    """Test /api/analyze/batch trả kết quả và lỗi theo từng document, lưu một lần"""
+    from app.api import router as router_module
+
+    saved = []
+    monkeypatch.setattr(router_module, "get_agent", lambda model=None: _FakeBatchAgent())
+    monkeypatch.setattr(router_module, "save_analysis_results", lambda records: saved.append(records) or list(range(1, len(records) + 1)))
+
+    response = client.post("/api/analyze/batch", json={"documents": [
+        {"text": "REQ-1 The system shall be fast", "name": "a.txt"},
+        {"text": "boom"},
+        {"text": "   "},
+        {"text": "REQ-2 The system shall be secure"}
+    ]})
+    assert response.status_code == 200
+    data = response.json()
+    assert [r["status"] for r in data["results"]] == ["succeeded", "failed", "failed", "succeeded"]
+    assert data["results"][0]["name"] == "a.txt"
+    assert data["results"][0]["conflicts"][0]["req1"] == "A"
+    assert data["results"][1]["error"] == "model error"
+    assert [r["analysis_id"] for r in data["results"]] == [1, None, None, 2]
+    assert (data["succeeded"], data["failed"]) == (2, 2)
+    assert len(saved) == 1 and len(saved[0]) == 2
+
+
+def test_analyze_batch_ndjson(monkeypatch):
+    """Test /api/analyze/batch?format=ndjson stream từng document"""
+    import json
+    from app.api import router as router_module
+
+    monkeypatch.setattr(router_module, "get_agent", lambda model=None: _FakeBatchAgent())
+    monkeypatch.setattr(router_module, "save_analysis_results", lambda records: [7] * len(records))
+
+    response = client.post(
+        "/api/analyze/batch?format=ndjson",
+        json={"documents": [{"text": "REQ-1 fast"}, {"text": "boom"}]}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    events = [json.loads(line) for line in response.text.splitlines() if line]
+    assert events[0] == {"event": "started", "model": "gemini-2.5-flash", "documents": 2}
+    documents = sorted((e["data"] for e in events if e["event"] == "document"), key=lambda d: d["index"])
+    assert [d["status"] for d in documents] == ["succeeded", "failed"]
+    assert events[-1]["event"] == "done"
+    assert events[-1]["analysis_ids"] == {"0": 7}
+
+
+def test_analyze_batch_files(monkeypatch):
+    """Test /api/analyze/batch/files: file sai định dạng là document lỗi, không reject cả batch"""
+    from app.api import router as router_module
+
+    monkeypatch.setattr(router_module, "get_agent", lambda model=None: _FakeBatchAgent())
+    monkeypatch.setattr(router_module, "save_analysis_results", lambda records: [None] * len(records))
+
+    response = client.post("/api/analyze/batch/files", files=[
+        ("files", ("srs.txt", b"REQ-1 The system shall be fast", "text/plain")),
+        ("files", ("srs.pdf", b"%PDF", "application/pdf"))
+    ])
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results[0]["status"] == "succeeded"
+    assert results[1]["status"] == "failed"
+    assert "Unsupported file type" in results[1]["error"]
+
+
+def test_analyze_batch_validation():
+    """Test batch rỗng"""
+    response = client.post("/api/analyze/batch", json={"documents": []})
+    assert response.status_code == 400
+
+
 # Note: Tests thực sự với Gemini API cần API key thật và tốn phí
 # Nên chỉ test với mock data hoặc skip tests cần API key
 
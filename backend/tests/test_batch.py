@@ -0,0 +1,55 @@
+"""
+Unit tests cho batch analysis helpers (run_batch, save_analyses)
+"""
+
+import asyncio
+from app.database.models import AnalysisHistory
+from app.services import analysis_service
+from app.services.history_service import save_analyses
+
+
+class _SlowAgent:
+    """Fake agent đếm số call chạy đồng thời"""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    async def aanalyze_fast(self, text, cache_mode=None):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        if text == "bad":
+            raise ValueError("bad input")
+        return {"conflicts": [], "ambiguities": [{"req": text, "issue": "vague"}], "suggestions": []}
+
+
+def test_run_batch_bounded_concurrency():
+    """run_batch không chạy quá `concurrency` document cùng lúc và giữ lỗi theo document"""
+    agent = _SlowAgent()
+    texts = [f"REQ-{i}" for i in range(10)] + ["bad"]
+
+    async def collect():
+        return [item async for item in analysis_service.run_batch(agent, texts, concurrency=3)]
+
+    results = asyncio.run(collect())
+    assert agent.peak == 3
+    by_index = {index: (result, error) for index, result, error, _ in results}
+    assert len(by_index) == 11
+    assert by_index[0][0]["ambiguities"][0]["req"] == "REQ-0"
+    assert by_index[10] == (None, "bad input")
+
+
+def test_save_analyses_single_transaction(sqlite_session_factory):
+    """save_analyses lưu tất cả records và trả id theo thứ tự"""
+    records = [
+        {"conflicts": [], "ambiguities": [], "suggestions": [], "text_input": "REQ-1", "model_used": "m"},
+        {"conflicts": [], "ambiguities": [], "suggestions": [], "file_name": "b.docx", "model_used": "m"},
+    ]
+    with sqlite_session_factory() as db:
+        saved = save_analyses(db, records)
+        assert [a.text_input for a in saved] == ["REQ-1", None]
+        assert saved[1].file_name == "b.docx"
+        assert saved[0].id < saved[1].id
+        assert db.query(AnalysisHistory).count() == 2
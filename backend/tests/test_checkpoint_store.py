@@ -0,0 +1,100 @@
+"""
+Unit tests cho checkpoint của full pipeline (resume run lỗi từ node cuối đã xong)
+"""
+
+import asyncio
+import json
+import pytest
+from langchain_core.runnables import RunnableLambda
+from app.agents import langgraph_agent, local_backend
+from app.agents.checkpoint_store import AnalysisCheckpointSaver, RunMismatchError
+from app.agents.langgraph_agent import RequirementsAnalysisAgent
+from app.agents.prompt_registry import PROMPT_FILES, PromptRegistry
+from app.database.models import GraphCheckpoint
+
+REQUIREMENTS = [
+    "REQ-1 The account shall be locked after 3 failed attempts.",
+    "REQ-2 The account shall never be locked.",
+    "REQ-3 Passwords shall contain at least 12 characters.",
+]
+TEXT = "\n".join(REQUIREMENTS)
+
+
+@pytest.fixture
+def saver(sqlite_session_factory):
+    return AnalysisCheckpointSaver(session_factory=sqlite_session_factory)
+
+
+@pytest.fixture
+def agent(tmp_path, saver, monkeypatch):
+    for filename in PROMPT_FILES.values():
+        (tmp_path / filename).write_text(f"{filename} {{input_text}}", encoding="utf-8")
+    monkeypatch.setattr(langgraph_agent, "get_checkpoint_saver", lambda: saver)
+    monkeypatch.setattr(local_backend, "_node_backends", {})  # Parse qua LLM (fake chain)
+    return RequirementsAnalysisAgent(api_key="test-key", prompt_registry=PromptRegistry(tmp_path, reload_interval=0))
+
+
+def _install_chains(agent, calls, improve_failures):
+    async def parse(inputs):
+        calls.append("parse")
+        return TEXT
+
+    async def conflict(inputs):
+        calls.append("conflict")
+        return json.dumps({"conflicts": [{"req1": REQUIREMENTS[0], "req2": REQUIREMENTS[1], "description": "lock"}]})
+
+    async def ambiguity(inputs):
+        calls.append("ambiguity")
+        return json.dumps({"ambiguities": [{"req": REQUIREMENTS[2], "issue": "which characters"}]})
+
+    async def improve(inputs):
+        calls.append("improve")
+        if improve_failures:
+            improve_failures.pop()
+            raise TimeoutError("improve timed out")
+        reqs = [line[2:] for line in inputs["parsed_requirements"].splitlines()]
+        return json.dumps({"suggestions": [{"req": req, "new_version": f"{req} (clear)"} for req in reqs]})
+
+    agent.parse_chain = RunnableLambda(parse)
+    agent.conflict_chain = RunnableLambda(conflict)
+    agent.ambiguity_chain = RunnableLambda(ambiguity)
+    agent.improve_chain = RunnableLambda(improve)
+
+
+def test_failed_run_resumes_from_last_completed_node(agent, saver, sqlite_session_factory):
+    calls = []
+    _install_chains(agent, calls, improve_failures=[1, 1])  # Cả 2 improve call lần đầu đều lỗi
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(agent.aanalyze(TEXT, cache_mode="bypass", run_id="run-1"))
+    assert agent.has_run("run-1")
+    assert calls.count("parse") == 1 and calls.count("conflict") == 1 and calls.count("ambiguity") == 1
+
+    calls.clear()
+    result = asyncio.run(agent.aanalyze(TEXT, cache_mode="bypass", run_id="run-1"))
+    # Chỉ improve của nhánh bị lỗi được chạy lại, không parse / check lại
+    assert "parse" not in calls and "conflict" not in calls and "ambiguity" not in calls
+    assert calls.count("improve") >= 1
+    assert len(result["conflicts"]) == 1 and len(result["ambiguities"]) == 1
+    assert {s["req"] for s in result["suggestions"]} == set(REQUIREMENTS)
+
+    # Run thành công: checkpoint bị xóa
+    assert not agent.has_run("run-1")
+    with sqlite_session_factory() as db:
+        assert db.query(GraphCheckpoint).count() == 0
+    assert saver.get_stats()["resumed"] == 1
+
+
+def test_resume_with_different_input_is_rejected(agent):
+    _install_chains(agent, [], improve_failures=[1, 1])
+    with pytest.raises(TimeoutError):
+        asyncio.run(agent.aanalyze(TEXT, cache_mode="bypass", run_id="run-2"))
+    with pytest.raises(RunMismatchError):
+        asyncio.run(agent.aanalyze(TEXT + "\nREQ-4 New.", cache_mode="bypass", run_id="run-2"))
+
+
+def test_unknown_run_id_starts_fresh(agent):
+    calls = []
+    _install_chains(agent, calls, improve_failures=[])
+    result = asyncio.run(agent.aanalyze(TEXT, cache_mode="bypass", run_id="never-seen"))
+    assert calls.count("parse") == 1 and len(result["conflicts"]) == 1
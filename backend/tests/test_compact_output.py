@@ -0,0 +1,87 @@
+"""
+Unit tests cho compact output schema (LLM trả về ID requirement, backend mở rộng lại)
+"""
+
+import asyncio
+import json
+import pytest
+from langchain_core.runnables import RunnableLambda
+from app.agents import compact_output
+from app.agents.compact_output import RequirementTable
+from app.agents.conflict_candidates import build_conflict_inputs
+from app.agents.langgraph_agent import RequirementsAnalysisAgent
+from app.agents.prompt_registry import PROMPT_FILES, PromptRegistry
+from app.utils.requirements_text import segment_requirements
+
+TEXT = """REQ-1 The account shall be locked after 3 failed attempts.
+REQ-2 The account shall never be locked.
+Passwords shall contain at least 12 characters.
+"""
+RECORDS = [record.to_dict() for record in segment_requirements(TEXT)]
+REQUIREMENTS = [record["text"] for record in RECORDS]
+
+
+def test_table_uses_record_ids_and_expands_findings():
+    table = RequirementTable(REQUIREMENTS, RECORDS)
+    assert table.ids[:2] == ["REQ-1", "REQ-2"] and table.ids[2].startswith("R-")
+    assert table.lines().splitlines()[0] == f"- [REQ-1] {REQUIREMENTS[0]}"
+
+    conflicts = table.expand("conflicts", [
+        {"ids": ["REQ-1", "[req-2]"], "code": "NEG", "why": ""},
+        {"ids": ["REQ-1", "REQ-9"], "code": "VAL"},  # ID lạ: bị bỏ
+        {"req1": REQUIREMENTS[0], "req2": REQUIREMENTS[1], "description": "full schema"},
+    ])
+    assert conflicts[0] == {"req1": REQUIREMENTS[0], "req2": REQUIREMENTS[1], "description": compact_output.CONFLICT_CODES["NEG"]}
+    assert conflicts[1]["description"] == "full schema" and table.unresolved == 1
+
+    ambiguities = table.expand("ambiguities", [{"id": table.ids[2], "code": "VAGUE", "why": "which characters"}])
+    assert ambiguities == [{"req": REQUIREMENTS[2], "issue": "which characters"}]
+    suggestions = table.expand("suggestions", [{"id": "REQ-2", "new": "Lock after 5 attempts."}, {"id": "REQ-1"}])
+    assert suggestions == [{"req": REQUIREMENTS[1], "new_version": "Lock after 5 attempts."}]
+
+
+def test_ids_without_records_are_generated_and_unique():
+    table = RequirementTable(["Reports shall be signed.", "Reports shall be signed."])
+    assert len(set(table.ids)) == 2
+    assert table.compact("ambiguities", [{"req": "Reports shall be signed.", "issue": "by whom"}]) == [
+        {"id": table.ids[0], "why": "by whom"}
+    ]
+
+
+def test_conflict_inputs_carry_labels():
+    inputs = build_conflict_inputs(REQUIREMENTS, labels=["REQ-1", "REQ-2", "R-1"])
+    assert inputs == ["\n".join(f"- [{label}] {req}" for label, req in zip(["REQ-1", "REQ-2", "R-1"], REQUIREMENTS))]
+
+
+@pytest.fixture
+def agent(tmp_path, monkeypatch):
+    for filename in PROMPT_FILES.values():
+        (tmp_path / filename).write_text(f"{filename} {{parsed_requirements}}", encoding="utf-8")
+    monkeypatch.setattr(compact_output, "LLM_OUTPUT_SCHEMA", compact_output.SCHEMA_COMPACT)
+    agent = RequirementsAnalysisAgent(api_key="test-key", prompt_registry=PromptRegistry(tmp_path, reload_interval=0))
+    agent.ambiguity_rules = None
+    return agent
+
+
+def test_nodes_send_ids_and_return_full_schema(agent):
+    sent = []
+
+    async def conflict(inputs):
+        sent.append(inputs["parsed_requirements"])
+        return json.dumps({"conflicts": [{"ids": ["REQ-1", "REQ-2"], "code": "NEG", "why": "lock vs never lock"}]})
+
+    async def improve(inputs):
+        sent.append(inputs["conflicts"])
+        return json.dumps({"suggestions": [{"id": "REQ-2", "new": "The account shall be locked after 5 failed attempts."}]})
+
+    agent.conflict_compact_chain = RunnableLambda(conflict)
+    agent.improve_compact_chain = RunnableLambda(improve)
+    state = {"parsed_requirements": REQUIREMENTS, "requirement_records": RECORDS}
+
+    conflicts = asyncio.run(agent.conflict_check_node(state))["conflicts"]
+    assert "[REQ-1]" in sent[0]
+    assert conflicts == [{"req1": REQUIREMENTS[0], "req2": REQUIREMENTS[1], "description": "lock vs never lock"}]
+
+    suggestions = asyncio.run(agent.improve_conflicts_node({**state, "conflicts": conflicts}))["conflict_suggestions"]
+    assert json.loads(sent[1]) == [{"ids": ["REQ-1", "REQ-2"], "why": "lock vs never lock"}]
+    assert suggestions == [{"req": REQUIREMENTS[1], "new_version": "The account shall be locked after 5 failed attempts."}]
@@ -0,0 +1,58 @@
+"""
+Unit tests cho conflict candidate generation
+"""
+
+import pytest
+from app.agents import conflict_candidates
+from app.agents.conflict_candidates import build_conflict_inputs, generate_candidate_pairs
+
+
+REQUIREMENTS = [
+    "REQ-001 The account shall be locked after 3 failed login attempts.",
+    "REQ-002 Accounts shall never be locked after failed login attempts.",
+    "REQ-003 Invoices shall be exported to PDF.",
+    "REQ-004 Invoices shall be exported to Excel only.",
+    "REQ-005 The dashboard shows the weather forecast.",
+]
+
+
+@pytest.fixture
+def python_backend(monkeypatch):
+    """Ép dùng fallback thuần Python (không phụ thuộc sentence-transformers / sklearn)"""
+    monkeypatch.setattr(conflict_candidates, "_neighbors_embeddings", lambda reqs, k: None)
+    monkeypatch.setattr(conflict_candidates, "_neighbors_tfidf_sklearn", lambda reqs, k: None)
+
+
+def test_candidate_pairs_pick_related_requirements(python_backend):
+    """Cặp cùng chủ đề xếp đầu, requirement không liên quan không tạo cặp"""
+    pairs = generate_candidate_pairs(REQUIREMENTS, top_k=1)
+    top_two = {(i, j) for i, j, _ in pairs[:2]}
+
+    assert top_two == {(0, 1), (2, 3)}
+    assert all(4 not in (i, j) for i, j, _ in pairs)
+    assert all(i < j for i, j, _ in pairs)
+
+
+def test_candidate_pairs_respect_budget(python_backend):
+    """Số cặp không vượt max_pairs"""
+    requirements = [f"REQ-{i} The report module shall export report type {i % 3}." for i in range(50)]
+    pairs = generate_candidate_pairs(requirements, top_k=5, max_pairs=30)
+    assert len(pairs) == 30
+    assert [score for _, _, score in pairs] == sorted((score for _, _, score in pairs), reverse=True)
+
+
+def test_build_conflict_inputs_small_document_unchanged():
+    """Document nhỏ vẫn gửi một prompt với toàn bộ requirement"""
+    inputs = build_conflict_inputs(REQUIREMENTS, min_requirements=30)
+    assert inputs == ["\n".join(f"- {req}" for req in REQUIREMENTS)]
+    assert build_conflict_inputs([]) == []
+
+
+def test_build_conflict_inputs_batches_pairs(python_backend):
+    """Document lớn được chia thành các batch cặp ứng viên"""
+    requirements = REQUIREMENTS * 2 + [f"REQ-1{i} Users shall reset password number {i}." for i in range(10)]
+    inputs = build_conflict_inputs(requirements, min_requirements=5, batch_size=4)
+
+    assert len(inputs) > 1
+    assert all(text.count("\n[") <= 4 for text in inputs)
+    assert inputs[0].startswith("Candidate requirement pairs")
@@ -0,0 +1,73 @@
+"""
+Unit tests cho execution planner
+"""
+
+import pytest
+from app.services.execution_planner import ExecutionPlanner, MODE_CHUNKED, MODE_FAST, MODE_FULL
+
+
+def _requirements(count: int, words: int = 12) -> str:
+    return "\n".join(f"REQ-{i:03d} The system shall " + " ".join(["handle"] * words) for i in range(count))
+
+
+@pytest.fixture
+def planner():
+    return ExecutionPlanner(
+        chunked_min_tokens=5000,
+        full_min_requirements=10,
+        full_max_tokens=3000,
+        latency_budget=120,
+        calibration_alpha=0.5
+    )
+
+
+def test_small_input_uses_fast_path(planner):
+    plan = planner.plan(_requirements(3))
+    assert plan.mode == MODE_FAST
+    assert plan.requirement_count == 3
+    assert plan.predicted_latency_seconds > 0
+
+
+def test_many_requirements_use_full_graph(planner):
+    plan = planner.plan(_requirements(15))
+    assert plan.mode == MODE_FULL
+    assert plan.requirement_count == 15
+
+
+def test_large_input_uses_chunked(planner):
+    plan = planner.plan(_requirements(300))
+    assert plan.estimated_tokens >= 5000
+    assert plan.mode == MODE_CHUNKED
+
+
+def test_tight_budget_falls_back_from_full_graph(planner):
+    """Full graph dự đoán vượt budget -> dùng fast path"""
+    text = _requirements(15)
+    budget = planner.predict_latency(MODE_FULL, planner.estimate_tokens(text)) - 1
+    plan = planner.plan(text, latency_budget=budget)
+    assert plan.mode == MODE_FAST
+    assert plan.latency_budget_seconds == budget
+
+
+def test_requested_mode_overrides_planner(planner):
+    assert planner.plan(_requirements(3), mode=MODE_CHUNKED).mode == MODE_CHUNKED
+    with pytest.raises(ValueError):
+        planner.plan("text", mode="turbo")
+
+
+def test_observe_calibrates_predictions(planner):
+    text = _requirements(3)
+    plan = planner.plan(text)
+    planner.observe(plan, plan.predicted_latency_seconds * 3)
+
+    assert plan.actual_latency_seconds == pytest.approx(plan.predicted_latency_seconds * 3, rel=0.01)
+    assert planner.plan(text).predicted_latency_seconds == pytest.approx(plan.predicted_latency_seconds * 2, rel=0.01)
+    assert planner.get_stats()["modes"][MODE_FAST]["observations"] == 1
+
+
+def test_observe_ignores_cache_hits(planner):
+    text = _requirements(3)
+    plan = planner.plan(text)
+    planner.observe(plan, 0.01)
+    assert planner.plan(text).predicted_latency_seconds == plan.predicted_latency_seconds
+    assert planner.get_stats()["modes"][MODE_FAST]["observations"] == 0
@@ -46,3 +46,41 @@ def test_save_and_retrieve():
     # Skip nếu không có DB
     pass
 
+
+
+def test_save_analysis_records_execution_plan(sqlite_session_factory):
+    """Plan của lần chạy được lưu vào các cột execution plan (latency theo ms)"""
+    plan = {
+        "mode": "full",
+        "estimated_tokens": 1200,
+        "requirement_count": 14,
+        "predicted_latency_seconds": 32.5,
+        "actual_latency_seconds": 28.25
+    }
+    with sqlite_session_factory() as db:
+        saved = save_analysis(db, [], [], [], text_input="REQ-1 ...", plan=plan)
+        data = get_analysis_by_id(db, saved.id).to_dict()
+
+    assert data["execution_plan"] == "full"
+    assert data["requirement_count"] == 14
+    assert data["predicted_latency_ms"] == 32500
+    assert data["actual_latency_ms"] == 28250
+
+
+def test_add_missing_columns_upgrades_existing_table():
+    """init_db thêm cột mới vào table đã tạo bởi phiên bản cũ"""
+    from sqlalchemy import create_engine, inspect, text
+    from app.database.db import Base, add_missing_columns
+    import app.database.models  # noqa: F401
+
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE analysis_history (id INTEGER PRIMARY KEY, text_input TEXT)"))
+    Base.metadata.create_all(bind=engine)
+
+    added = add_missing_columns(engine)
+
+    columns = {column["name"] for column in inspect(engine).get_columns("analysis_history")}
+    assert "analysis_history.execution_plan" in added
+    assert {"execution_plan", "predicted_latency_ms", "actual_latency_ms", "model_used"} <= columns
+    assert add_missing_columns(engine) == []
@@ -0,0 +1,203 @@
+"""
+Unit tests cho job subsystem (worker pool, cancel, recovery)
+"""
+
+import asyncio
+from app.services import job_service
+from app.services.job_service import (
+    JobManager,
+    STATUS_CANCELLED,
+    STATUS_FAILED,
+    STATUS_RUNNING,
+    STATUS_SUCCEEDED
+)
+
+
+RESULT = {
+    "conflicts": [{"req1": "A", "req2": "B", "description": "conflict"}],
+    "ambiguities": [{"req": "fast"}],  # Sai schema -> bị bỏ
+    "suggestions": []
+}
+
+
+class _FakeAgent:
+    def __init__(self, block=False, fail=False):
+        self.block = block
+        self.fail = fail
+        self.calls = 0
+        self.started = asyncio.Event()
+
+    async def aanalyze_fast(self, text, cache_mode=None):
+        self.calls += 1
+        self.started.set()
+        if self.block:
+            await asyncio.Event().wait()
+        if self.fail:
+            raise RuntimeError("LLM down")
+        return RESULT
+
+
+async def _wait_for_status(manager, job_id, statuses, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        job = await manager.get(job_id)
+        if job["status"] in statuses:
+            return job
+        assert asyncio.get_running_loop().time() < deadline, f"job stuck in {job['status']}"
+        await asyncio.sleep(0.01)
+
+
+def test_job_runs_to_completion(sqlite_session_factory):
+    """Test job chạy xong và có kết quả đã validate"""
+    agent = _FakeAgent()
+    manager = JobManager(worker_count=2, session_factory=sqlite_session_factory, agent_factory=lambda model: agent)
+
+    async def run():
+        job = await manager.submit("REQ-1 The system shall be fast")
+        assert job["status"] == "queued"
+        done = await _wait_for_status(manager, job["id"], {STATUS_SUCCEEDED})
+        await manager.stop()
+        return done
+
+    done = asyncio.run(run())
+    assert done["progress"] == 100
+    assert done["result"]["conflicts"] == RESULT["conflicts"]
+    assert done["result"]["ambiguities"] == []
+    assert agent.calls == 1
+
+
+def test_job_failure_is_reported(sqlite_session_factory):
+    """Test job lỗi có status failed và error message"""
+    manager = JobManager(session_factory=sqlite_session_factory, agent_factory=lambda model: _FakeAgent(fail=True))
+
+    async def run():
+        job = await manager.submit("REQ-1")
+        done = await _wait_for_status(manager, job["id"], {STATUS_FAILED})
+        await manager.stop()
+        return done
+
+    assert "LLM down" in asyncio.run(run())["error"]
+
+
+def test_cancel_running_job(sqlite_session_factory):
+    """Test hủy job đang chạy"""
+    agent = _FakeAgent(block=True)
+    manager = JobManager(session_factory=sqlite_session_factory, agent_factory=lambda model: agent)
+
+    async def run():
+        job = await manager.submit("REQ-1")
+        await asyncio.wait_for(agent.started.wait(), 2)
+        cancelled = await manager.cancel(job["id"])
+        await manager.stop()
+        return cancelled
+
+    assert asyncio.run(run())["status"] == STATUS_CANCELLED
+
+
+def test_cancel_queued_job(sqlite_session_factory):
+    """Test hủy job còn trong queue (worker đang bận)"""
+    agent = _FakeAgent(block=True)
+    manager = JobManager(worker_count=1, session_factory=sqlite_session_factory, agent_factory=lambda model: agent)
+
+    async def run():
+        first = await manager.submit("REQ-1")
+        await asyncio.wait_for(agent.started.wait(), 2)
+        second = await manager.submit("REQ-2")
+        cancelled = await manager.cancel(second["id"])
+        await manager.cancel(first["id"])
+        await asyncio.sleep(0.05)
+        await manager.stop()
+        return cancelled
+
+    assert asyncio.run(run())["status"] == STATUS_CANCELLED
+    assert agent.calls == 1
+
+
+def test_unfinished_jobs_recovered_after_restart(sqlite_session_factory, monkeypatch):
+    """Test job đang chạy khi server dừng được chạy lại sau restart (heartbeat đã cũ)"""
+    monkeypatch.setattr(job_service, "JOB_STALE_SECONDS", 0)
+    blocked_agent = _FakeAgent(block=True)
+    first = JobManager(session_factory=sqlite_session_factory, agent_factory=lambda model: blocked_agent)
+
+    async def crash():
+        job = await first.submit("REQ-1 The system shall be fast")
+        await asyncio.wait_for(blocked_agent.started.wait(), 2)
+        await first.stop()
+        return job["id"]
+
+    job_id = asyncio.run(crash())
+
+    healthy_agent = _FakeAgent()
+    restarted = JobManager(session_factory=sqlite_session_factory, agent_factory=lambda model: healthy_agent)
+
+    async def recover():
+        job = await restarted.get(job_id)
+        assert job["status"] == STATUS_RUNNING
+        await restarted.start(recover=True)
+        done = await _wait_for_status(restarted, job_id, {STATUS_SUCCEEDED})
+        await restarted.stop()
+        return done
+
+    assert asyncio.run(recover())["result"]["conflicts"] == RESULT["conflicts"]
+    assert healthy_agent.calls == 1
+
+
+def test_live_owner_keeps_job_and_remote_cancel_wins(sqlite_session_factory, monkeypatch):
+    """Test process khác không nhận lại job của owner còn sống; cancel từ process khác không bị ghi đè"""
+    monkeypatch.setattr(job_service, "JOB_HEARTBEAT_SECONDS", 0.02)
+    release = asyncio.Event()
+
+    class _SlowAgent(_FakeAgent):
+        async def aanalyze_fast(self, text, cache_mode=None):
+            self.calls += 1
+            self.started.set()
+            await release.wait()
+            return RESULT
+
+    owner_agent, other_agent = _SlowAgent(), _FakeAgent()
+    owner = JobManager(session_factory=sqlite_session_factory, agent_factory=lambda model: owner_agent)
+    other = JobManager(session_factory=sqlite_session_factory, agent_factory=lambda model: other_agent)
+
+    async def run():
+        job = await owner.submit("REQ-1 The system shall be fast")
+        await asyncio.wait_for(owner_agent.started.wait(), 2)
+        await other.start(recover=True)
+        await asyncio.sleep(0.1)  # Vài heartbeat: job vẫn thuộc owner
+        assert other_agent.calls == 0
+        assert (await other.get(job["id"]))["status"] == STATUS_RUNNING
+
+        cancelled = await other.cancel(job["id"])
+        release.set()  # Task của owner có thể xong trước khi heartbeat thấy cancel
+        await asyncio.sleep(0.1)
+        final = await owner.get(job["id"])
+        await owner.stop()
+        await other.stop()
+        return cancelled, final
+
+    cancelled, final = asyncio.run(run())
+    assert cancelled["status"] == STATUS_CANCELLED
+    assert final["status"] == STATUS_CANCELLED and final["result"] is None
+    assert other_agent.calls == 0
+
+
+def test_heartbeat_stops_job_cancelled_elsewhere(sqlite_session_factory, monkeypatch):
+    """Test owner dừng task khi job bị cancel từ process khác"""
+    monkeypatch.setattr(job_service, "JOB_HEARTBEAT_SECONDS", 0.02)
+    agent = _FakeAgent(block=True)
+    owner = JobManager(session_factory=sqlite_session_factory, agent_factory=lambda model: agent)
+    other = JobManager(session_factory=sqlite_session_factory, agent_factory=lambda model: _FakeAgent())
+
+    async def run():
+        job = await owner.submit("REQ-1")
+        await asyncio.wait_for(agent.started.wait(), 2)
+        await other.cancel(job["id"])
+        for _ in range(100):
+            if not owner._running:
+                break
+            await asyncio.sleep(0.01)
+        running = dict(owner._running)
+        await owner.stop()
+        return running, await owner.get(job["id"])
+
+    running, job = asyncio.run(run())
+    assert running == {} and job["status"] == STATUS_CANCELLED
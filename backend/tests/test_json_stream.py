@@ -0,0 +1,127 @@
+"""
+Unit tests cho incremental JSON parser (streaming findings)
+"""
+
+import os
+import json
+import pytest
+from app.utils.json_stream import FindingsStreamParser, extract_findings, loads_lenient
+
+
+RESPONSE = """```json
+{
+  "conflicts": [
+    {"req1": "User must login", "req2": "Guest {no login}", "description": "Says \\"login\\" vs not"}
+  ],
+  "ambiguities": [
+    {"req": "System is fast", "issue": "vague"},
+    {"req": "UI is nice", "issue": "subjective",}
+  ],
+  "suggestions": [
+    {"req": "System is fast", "new_version": "Respond in [2] seconds"}
+  ]
+}
+```"""
+
+
+def _feed_all(parser, text, step=1):
+    items = []
+    for i in range(0, len(text), step):
+        items.extend(parser.feed(text[i:i + step]))
+    return items
+
+
+def test_emits_each_item_as_soon_as_it_closes():
+    """Test item được emit ngay khi object đóng, trước khi JSON root kết thúc"""
+    parser = FindingsStreamParser()
+    cut = RESPONSE.index('"ambiguities"')
+    first = _feed_all(parser, RESPONSE[:cut])
+    assert first == [("conflicts", {
+        "req1": "User must login",
+        "req2": "Guest {no login}",
+        "description": 'Says "login" vs not'
+    })]
+    assert not parser.finished
+
+    rest = _feed_all(parser, RESPONSE[cut:], step=7)
+    assert [section for section, _ in rest] == ["ambiguities", "ambiguities", "suggestions"]
+    assert rest[1][1]["issue"] == "subjective"  # trailing comma được chấp nhận
+    assert parser.finished
+
+
+def test_chunk_size_does_not_matter():
+    """Test kết quả giống nhau với mọi kích thước chunk"""
+    expected = _feed_all(FindingsStreamParser(), RESPONSE)
+    for step in (2, 5, 64, len(RESPONSE)):
+        assert _feed_all(FindingsStreamParser(), RESPONSE, step=step) == expected
+
+
+def test_ignores_unknown_sections_and_nested_values():
+    """Test bỏ qua section không liên quan"""
+    text = json.dumps({
+        "summary": [{"req": "x", "issue": "y"}],
+        "ambiguities": [{"req": "a", "issue": "b", "tags": [{"k": 1}]}]
+    })
+    items = _feed_all(FindingsStreamParser(), text, step=3)
+    assert items == [("ambiguities", {"req": "a", "issue": "b", "tags": [{"k": 1}]})]
+
+
+def test_truncated_stream_keeps_completed_items():
+    """Test output bị cắt giữa chừng vẫn giữ được các item đã hoàn chỉnh"""
+    truncated = RESPONSE[:RESPONSE.index('"UI is nice"')]
+    items = _feed_all(FindingsStreamParser(), truncated, step=4)
+    assert len(items) == 2
+
+
+def test_loads_lenient_trailing_comma():
+    """Test loads_lenient chấp nhận trailing comma"""
+    assert loads_lenient('{"a": [1, 2,],}') == {"a": [1, 2]}
+
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "malformed_llm_responses.json")
+with open(CORPUS_PATH, "r", encoding="utf-8") as f:
+    CORPUS = json.load(f)
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=[case["name"] for case in CORPUS])
+def test_extract_findings_corpus(case):
+    """Test extract_findings trên corpus output lệch format của model"""
+    options = {}
+    if case.get("list_section"):
+        options = {"sections": (case["list_section"],), "list_section": case["list_section"]}
+    findings, report = extract_findings(case["response"], **options)
+
+    expected = case["expected"]
+    assert report.counts == expected["counts"]
+    assert {section: len(items) for section, items in findings.items()} == expected["counts"]
+    assert report.strict == expected["strict"]
+    assert len(report.dropped) == expected["dropped"]
+
+
+def test_extract_findings_reports_truncated_element():
+    """Test element bị cắt được báo cáo, các element trước đó được giữ"""
+    case = next(case for case in CORPUS if case["name"] == "truncated_at_max_tokens")
+    findings, report = extract_findings(case["response"])
+    assert report.truncated
+    assert report.dropped[0].section == "suggestions"
+    assert report.dropped[0].reason == "truncated"
+    assert findings["suggestions"][0]["new_version"] == "Reports load within 3 seconds at p95"
+    assert "truncated" in report.summary()
+
+
+def test_stream_parser_bare_array_root():
+    """Test mảng trần được emit theo list_section"""
+    text = '[{"req": "a", "new_version": "b"}, {"req": "c", "new_version": "[d]"}]'
+    parser = FindingsStreamParser(("suggestions",), list_section="suggestions")
+    items = _feed_all(parser, text, step=3)
+    assert [section for section, _ in items] == ["suggestions", "suggestions"]
+    assert items[1][1]["new_version"] == "[d]"
+    assert parser.finished
+
+
+def test_extract_findings_reports_missing_sections():
+    _, report = extract_findings('{"conflicts": []}')
+    assert report.strict and report.has_section("conflicts")
+    assert not report.has_section("ambiguities") and report.missing == ["ambiguities", "suggestions"]
+    _, report = extract_findings("[]", ("ambiguities",), list_section="ambiguities")
+    assert report.has_section("ambiguities")
@@ -0,0 +1,107 @@
+"""
+Unit tests cho full LangGraph pipeline (async nodes) với fake chains
+"""
+
+import asyncio
+import json
+import time
+import pytest
+from langchain_core.runnables import RunnableLambda
+from app.agents import langgraph_agent
+from app.agents.langgraph_agent import RequirementsAnalysisAgent
+from app.agents.prompt_registry import PROMPT_FILES, PromptRegistry
+
+
+REQUIREMENTS = [
+    "REQ-1 The account shall be locked after 3 failed attempts.",
+    "REQ-2 The account shall never be locked.",
+    "REQ-3 The system shall support reports in PDF, DOCX etc.",
+    "REQ-4 Passwords shall contain at least 12 characters.",
+]
+
+
+@pytest.fixture
+def agent(tmp_path):
+    """Agent với prompt giả và không cần Gemini (chains được thay trong từng test)"""
+    for filename in PROMPT_FILES.values():
+        (tmp_path / filename).write_text(f"{filename} {{input_text}}", encoding="utf-8")
+    return RequirementsAnalysisAgent(api_key="test-key", prompt_registry=PromptRegistry(tmp_path, reload_interval=0))
+
+
+def _install_fake_chains(agent, events, conflict_delay=0.2):
+    async def parse(inputs):
+        return "\n".join(REQUIREMENTS)
+
+    async def conflict(inputs):
+        events.append(("conflict_start", time.monotonic()))
+        await asyncio.sleep(conflict_delay)
+        events.append(("conflict_end", time.monotonic()))
+        return json.dumps({"conflicts": [{"req1": REQUIREMENTS[0], "req2": REQUIREMENTS[1], "description": "lock"}]})
+
+    async def ambiguity(inputs):
+        events.append(("clarity_start", time.monotonic()))
+        await asyncio.sleep(0.01)
+        return json.dumps({"ambiguities": [{"req": REQUIREMENTS[3], "issue": "which characters"}]})
+
+    async def improve(inputs):
+        events.append(("improve_start", time.monotonic(), inputs["parsed_requirements"]))
+        await asyncio.sleep(0.05)
+        events.append(("improve_end", time.monotonic()))
+        reqs = [line[2:] for line in inputs["parsed_requirements"].splitlines()]
+        return json.dumps({"suggestions": [{"req": req, "new_version": f"{req} (clear)"} for req in reqs]})
+
+    agent.parse_chain = RunnableLambda(parse)
+    agent.conflict_chain = RunnableLambda(conflict)
+    agent.ambiguity_chain = RunnableLambda(ambiguity)
+    agent.improve_chain = RunnableLambda(improve)
+
+
+def test_pipeline_runs_branches_concurrently(agent):
+    """Hai check chạy đồng thời; improve cho ambiguity bắt đầu trước khi conflict check xong"""
+    events = []
+    _install_fake_chains(agent, events)
+
+    result = asyncio.run(agent.aanalyze("\n".join(REQUIREMENTS), cache_mode="bypass"))
+
+    times = {event[0]: event[1] for event in events if event[0] != "improve_start"}
+    first_improve = min(event[1] for event in events if event[0] == "improve_start")
+    assert times["clarity_start"] < times["conflict_end"]
+    assert first_improve < times["conflict_end"]
+
+    assert len(result["conflicts"]) == 1
+    # Rule flag REQ-3 ("etc."), model flag REQ-4
+    assert {a["req"] for a in result["ambiguities"]} == {REQUIREMENTS[2], REQUIREMENTS[3]}
+    assert {s["req"] for s in result["suggestions"]} == set(REQUIREMENTS)
+
+
+def test_improve_fans_out_with_concurrency_limit(agent, monkeypatch):
+    """Improve được chia batch và không chạy quá IMPROVE_PARALLELISM call cùng lúc"""
+    monkeypatch.setattr(langgraph_agent, "IMPROVE_BATCH_SIZE", 1)
+    monkeypatch.setattr(langgraph_agent, "IMPROVE_PARALLELISM", 2)
+    events = []
+    _install_fake_chains(agent, events, conflict_delay=0)
+
+    result = asyncio.run(agent._aimprove(REQUIREMENTS, [], []))
+
+    active = peak = 0
+    for event in sorted((e for e in events if e[0].startswith("improve")), key=lambda e: e[1]):
+        active += 1 if event[0] == "improve_start" else -1
+        peak = max(peak, active)
+    assert sum(1 for e in events if e[0] == "improve_start") == 4
+    assert peak == 2
+    assert len(result) == 4
+
+
+def test_agent_recompiles_chains_when_prompts_change(agent):
+    """Prompt file đổi -> chains compile lại một lần, prompt_version (cache key) đổi theo"""
+    fast_chain, version = agent.fast_chain, agent.prompt_version
+    agent._refresh_chains()
+    assert agent.fast_chain is fast_chain
+
+    prompts_dir = agent.prompts.prompts_dir
+    (prompts_dir / "analyze_all_in_one.txt").write_text("v2 {input_text}", encoding="utf-8")
+    assert agent.prompts.reload()
+    agent._refresh_chains()
+
+    assert agent.fast_chain is not fast_chain
+    assert agent.prompt_version != version
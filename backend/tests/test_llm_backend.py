@@ -0,0 +1,97 @@
+"""
+Unit tests cho LLM backend record / replay (cassette + latency giả lập)
+"""
+
+import asyncio
+import time
+import pytest
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+from app.agents import llm_backend
+from app.agents.llm_backend import (
+    SYNTHETIC_RESPONSE,
+    Cassette,
+    CassetteMissError,
+    LatencyModel,
+    RecordingChatModel,
+    ReplayChatModel,
+)
+from app.agents.prompt_registry import PROMPT_FILES, PromptRegistry
+
+PROMPT = PromptTemplate.from_template("Analyze: {input_text}")
+
+
+def _chain(model):
+    return PROMPT | model | StrOutputParser()
+
+
+def test_record_then_replay_offline(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    recorder = RecordingChatModel(
+        model="gemini-test",
+        inner=FakeListChatModel(responses=['{"conflicts": []}']),
+        cassette=Cassette(path)
+    )
+    assert _chain(recorder).invoke({"input_text": "REQ-1"}) == '{"conflicts": []}'
+
+    replay = ReplayChatModel(model="gemini-test", cassette=Cassette(path), latency=LatencyModel.parse("fixed:0"))
+    assert asyncio.run(_chain(replay).ainvoke({"input_text": "REQ-1"})) == '{"conflicts": []}'
+    with pytest.raises(CassetteMissError):
+        _chain(replay).invoke({"input_text": "REQ-2"})
+
+
+def test_replay_missing_prompt_synthetic(tmp_path):
+    replay = ReplayChatModel(
+        model="gemini-test", cassette=Cassette(tmp_path / "empty.jsonl"),
+        latency=LatencyModel.parse("fixed:0"), missing="synthetic"
+    )
+    assert _chain(replay).invoke({"input_text": "anything"}) == SYNTHETIC_RESPONSE
+
+
+def test_replay_stream_is_paced_by_token_rate(tmp_path):
+    cassette = Cassette(tmp_path / "cassette.jsonl")
+    response = "x" * 256  # 64 token, 4 chunk
+    cassette.record("gemini-test", "Analyze: REQ-1", response, 5.0)
+    replay = ReplayChatModel(
+        model="gemini-test", cassette=cassette,
+        latency=LatencyModel.parse("fixed:0.05", tokens_per_second=640)
+    )
+
+    async def collect():
+        return [chunk async for chunk in _chain(replay).astream({"input_text": "REQ-1"}) if chunk]
+
+    start = time.monotonic()
+    chunks = asyncio.run(collect())
+    elapsed = time.monotonic() - start
+    assert "".join(chunks) == response and len(chunks) == 4
+    assert 0.05 + 0.07 <= elapsed < 1.0  # TTFT + 3 khoảng giữa chunk (16 token / 640 tok/s)
+
+
+def test_latency_model_distributions():
+    assert LatencyModel.parse("recorded").total(4000, 2.5) == 2.5
+    assert LatencyModel.parse("fixed:1", tokens_per_second=100).total(4000, 9.0) == pytest.approx(11.0)
+    first = [LatencyModel.parse("lognormal:1.5,0.5", seed=7).first_token(None) for _ in range(2)]
+    assert first[0] == first[1] > 0  # Cùng seed -> cùng sample
+    uniform = LatencyModel.parse("uniform:1,2", seed=1)
+    assert all(1 <= uniform.first_token(None) <= 2 for _ in range(20))
+    with pytest.raises(ValueError):
+        LatencyModel.parse("gamma:1,2")
+    with pytest.raises(ValueError):
+        LatencyModel.parse("fixed")
+
+
+def test_agent_runs_offline_in_replay_mode(tmp_path, monkeypatch):
+    from app.agents.langgraph_agent import RequirementsAnalysisAgent
+
+    for filename in PROMPT_FILES.values():
+        (tmp_path / filename).write_text(f"{filename} {{input_text}}", encoding="utf-8")
+    monkeypatch.setattr(llm_backend, "LLM_BACKEND", "replay")
+    monkeypatch.setattr(llm_backend, "LLM_REPLAY_MISSING", "synthetic")
+    monkeypatch.setattr(llm_backend, "LLM_CASSETTE_DIR", tmp_path)
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+
+    agent = RequirementsAnalysisAgent(prompt_registry=PromptRegistry(tmp_path, reload_interval=0))
+    assert isinstance(agent.llm_fast, ReplayChatModel)
+    result = asyncio.run(agent.aanalyze_fast("REQ-1 The system shall export reports.", cache_mode="bypass"))
+    assert result["conflicts"] == [] and result["suggestions"] == []
@@ -0,0 +1,81 @@
+"""
+Unit tests cho local CPU backend (parse không cần LLM, chọn backend theo node)
+"""
+
+import asyncio
+import json
+import pytest
+from langchain_core.runnables import RunnableLambda
+from app.agents import local_backend
+from app.agents.local_backend import (
+    NON_REQUIREMENT_LABEL,
+    REQUIREMENT_LABEL,
+    LocalClassifier,
+    LocalParser,
+    parse_node_backends,
+)
+from app.agents.prompt_registry import PROMPT_FILES, PromptRegistry
+
+SRS = """1. INTRODUCTION
+This document describes the login module.
+
+REQ-1 The system shall lock the account after 3 failed attempts.
+REQ-2 Passwords shall contain at least 12 characters."""
+
+
+class FakeClassifier(LocalClassifier):
+    """Classifier giả: dòng chứa "shall" là requirement"""
+
+    def __init__(self):
+        super().__init__(enabled=True, batch_size=2)
+        self.batches = []
+
+    def _load(self):
+        def classify(batch, candidate_labels, batch_size):
+            self.batches.append(list(batch))
+            return [
+                {"labels": [REQUIREMENT_LABEL if "shall" in text else NON_REQUIREMENT_LABEL], "scores": [0.95]}
+                for text in batch
+            ]
+        return classify
+
+
+def test_parse_node_backends_config():
+    assert parse_node_backends("parse=local, ambiguity = LLM") == {"parse": "local", "ambiguity": "llm"}
+    with pytest.raises(ValueError):
+        parse_node_backends("parse=gpu")
+
+
+def test_local_parser_filters_non_requirements_in_batches():
+    classifier = FakeClassifier()
+    requirements = asyncio.run(LocalParser(classifier).aparse(SRS))
+    assert requirements == [
+        "REQ-1 The system shall lock the account after 3 failed attempts.",
+        "REQ-2 Passwords shall contain at least 12 characters.",
+    ]
+    assert [len(batch) for batch in classifier.batches] == [2, 1]
+
+
+def test_local_parser_without_model_uses_segmentation():
+    parser = LocalParser(LocalClassifier(enabled=False))
+    requirements = asyncio.run(parser.aparse(SRS))
+    assert "REQ-2 Passwords shall contain at least 12 characters." in requirements
+
+
+def test_parse_node_skips_llm_when_local(tmp_path, monkeypatch):
+    from app.agents.langgraph_agent import RequirementsAnalysisAgent
+
+    for filename in PROMPT_FILES.values():
+        (tmp_path / filename).write_text(f"{filename} {{input_text}}", encoding="utf-8")
+    agent = RequirementsAnalysisAgent(api_key="test-key", prompt_registry=PromptRegistry(tmp_path, reload_interval=0))
+    calls = []
+    agent.parse_chain = RunnableLambda(lambda inputs: calls.append(inputs) or json.dumps([]))
+    monkeypatch.setattr(local_backend, "_local_classifier", LocalClassifier(enabled=False))
+
+    monkeypatch.setattr(local_backend, "_node_backends", {"parse": "local"})
+    update = asyncio.run(agent.parse_node({"input_text": SRS}))
+    assert len(update["parsed_requirements"]) >= 2 and calls == []
+
+    monkeypatch.setattr(local_backend, "_node_backends", {"parse": "llm"})
+    asyncio.run(agent.parse_node({"input_text": SRS}))
+    assert len(calls) == 1
@@ -0,0 +1,95 @@
+"""
+Unit tests cho ModelPool
+"""
+
+import asyncio
+import pytest
+from app.services.model_pool import ModelPool, UnsupportedModelError, parse_concurrency_limits
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class _FakeAgent:
+    def __init__(self, model):
+        self.model = model
+
+
+def _make_pool(**kwargs):
+    created = []
+
+    def factory(model):
+        created.append(model)
+        return _FakeAgent(model)
+
+    options = {"allowed_models": ["flash", "pro", "lite"], "default_model": "flash"}
+    options.update(kwargs)
+    return ModelPool(agent_factory=factory, **options), created
+
+
+def test_pool_reuses_agent_per_model():
+    """Agent được tạo lazily một lần cho mỗi model và dùng lại"""
+    pool, created = _make_pool()
+
+    assert pool.get("pro").model == "pro"
+    assert pool.get("pro") is pool.get("pro")
+    assert pool.get(None).model == "flash"
+    assert created == ["pro", "flash"]
+
+
+def test_pool_rejects_unknown_model():
+    """Model không nằm trong allowed_models bị reject"""
+    pool, created = _make_pool()
+    with pytest.raises(UnsupportedModelError):
+        pool.get("gpt-4")
+    assert created == []
+
+
+def test_pool_evicts_idle_and_overflow():
+    """Agent idle quá lâu hoặc vượt max_models bị evict, request sau tạo lại"""
+    clock = _FakeClock()
+    pool, created = _make_pool(idle_seconds=60, max_models=2, clock=clock)
+
+    pool.get("flash")
+    clock.now = 10
+    pool.get("pro")
+    clock.now = 20
+    pool.get("lite")  # Pool đầy -> evict "flash" (idle lâu nhất)
+    assert set(pool.get_stats()["models"]) == {"pro", "lite"}
+
+    clock.now = 200
+    assert sorted(pool.evict_idle()) == ["lite", "pro"]
+    pool.get("pro")
+    assert created == ["flash", "pro", "lite", "pro"]
+    assert pool.get_stats()["evicted"] == 3
+
+
+def test_model_slot_limits_concurrency_per_model():
+    """Mỗi model không chạy quá limit của nó, model khác không bị ảnh hưởng"""
+    pool, _ = _make_pool(default_limit=4, limits={"pro": 1})
+    active = {"pro": 0, "flash": 0}
+    peak = {"pro": 0, "flash": 0}
+
+    async def call(model):
+        async with pool.model_slot(model):
+            active[model] += 1
+            peak[model] = max(peak[model], active[model])
+            await asyncio.sleep(0.01)
+            active[model] -= 1
+
+    async def run():
+        await asyncio.gather(*[call("pro") for _ in range(3)], *[call("flash") for _ in range(6)])
+
+    asyncio.run(run())
+    assert peak == {"pro": 1, "flash": 4}
+    assert pool.get_stats()["models"]["pro"]["peak_in_flight"] == 1
+
+
+def test_parse_concurrency_limits():
+    """Parse MODEL_CONCURRENCY_LIMITS, bỏ qua giá trị sai"""
+    assert parse_concurrency_limits("pro=2, lite=0,bad,x=y") == {"pro": 2, "lite": 1}
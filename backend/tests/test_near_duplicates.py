@@ -0,0 +1,91 @@
+"""
+Unit tests cho near-duplicate collapsing (shingling + MinHash/LSH)
+"""
+
+from docx import Document
+from app.services.export_service import export_to_docx
+from app.utils.near_duplicates import collapse_near_duplicates, dedupe_findings, find_near_duplicates
+
+SRS = """3.1 Security
+REQ-1 The system shall lock the account after 3 failed attempts.
+REQ-2 Passwords shall contain at least 12 characters.
+ID | Description | Priority
+REQ-7 | The system shall lock the account after 3 failed login attempts. | High
+REQ-8 | The system shall lock the account after 5 failed attempts. | High
+REQ-9 | The system won't lock the account after 3 failed attempts. | Low
+- Password must contain at least 12 characters.
+"""
+LOCK = "REQ-1 The system shall lock the account after 3 failed attempts."
+PASSWORD = "REQ-2 Passwords shall contain at least 12 characters."
+
+
+def test_wording_changes_are_grouped_but_numbers_and_negation_are_not():
+    texts = [LOCK, "The system must lock the account after 3 failed login attempts.",
+             "The system shall lock the account after 5 failed attempts.",
+             "The system shall not lock the account after 3 failed attempts.",
+             "Reports shall be exported as PDF."]
+    assert find_near_duplicates(texts) == {0: [1]}
+
+
+def test_collapse_removes_duplicate_units_and_maps_findings_back():
+    collapsed = collapse_near_duplicates(SRS)
+    assert "REQ-7" not in collapsed.text and "Password must" not in collapsed.text
+    assert "REQ-8" in collapsed.text and "REQ-9" in collapsed.text and "ID | Description" in collapsed.text
+    assert collapsed.to_dict() == {"requirements": 6, "collapsed": 2, "clusters": 2}
+
+    result = collapsed.expand({
+        "conflicts": [{"req1": LOCK, "req2": "REQ-9 The system won't lock the account.", "description": "lock"}],
+        "ambiguities": [],
+        "suggestions": [{"req": PASSWORD, "new_version": "Passwords shall contain at least 12 characters and 1 digit."}]
+    })
+    assert result["conflicts"][0]["duplicates"] == ["REQ-7 The system shall lock the account after 3 failed login attempts."]
+    assert result["suggestions"][0]["duplicates"] == ["- Password must contain at least 12 characters."]
+
+
+def test_duplicate_findings_are_dropped_in_responses_and_docx(tmp_path):
+    analysis = {
+        "conflicts": [],
+        "ambiguities": [
+            {"req": LOCK, "issue": "which attempts"},
+            {"req": "REQ-7 The system must lock the account after 3 failed login attempts.", "issue": "which attempts"},
+            {"req": PASSWORD, "issue": "which characters"},
+        ],
+        "suggestions": []
+    }
+    deduped = dedupe_findings(analysis)
+    assert [item["req"] for item in deduped["ambiguities"]] == [LOCK, PASSWORD]
+    assert deduped["ambiguities"][0]["duplicates"] == [analysis["ambiguities"][1]["req"]]
+
+    path = export_to_docx(analysis, str(tmp_path / "report.docx"))
+    text = "\n".join(paragraph.text for paragraph in Document(path).paragraphs)
+    assert "Ambiguity 3" not in text and "Total Ambiguities: 2" in text
+    assert "Also applies to: REQ-7" in text
+
+
+def test_distinct_findings_on_the_same_requirement_are_kept():
+    analysis = {
+        "conflicts": [
+            {"req1": LOCK, "req2": PASSWORD, "description": "lockout vs reset"},
+            {"req1": PASSWORD, "req2": LOCK, "description": "different owners"},
+        ],
+        "ambiguities": [{"req": LOCK, "issue": "which attempts"}, {"req": LOCK, "issue": "how long locked"}],
+        "suggestions": []
+    }
+    assert collapse_near_duplicates("REQ-1 A.\nREQ-2 B.").expand(analysis) == analysis
+    assert dedupe_findings(analysis) == analysis
+
+
+def test_requirements_with_different_content_words_are_never_grouped():
+    pairs = [
+        ("REQ-1 The system shall delete user accounts.", "REQ-2 The system shall create user accounts."),
+        ("REQ-1 The system shall encrypt customer data.", "REQ-2 The system shall decrypt customer data."),
+        ("REQ-1 Customers shall be able to view order history.", "REQ-2 Administrators shall be able to view order history."),
+        ("REQ-1 The system shall send an email notification when an order ships.",
+         "REQ-2 The system shall send an SMS notification when an order ships."),
+    ]
+    for first, second in pairs:
+        assert find_near_duplicates([first, second]) == {}
+        assert collapse_near_duplicates(f"{first}\n{second}").text == f"{first}\n{second}"
+        analysis = {"conflicts": [], "ambiguities": [{"req": first, "issue": "vague"}, {"req": second, "issue": "vague"}],
+                    "suggestions": []}
+        assert dedupe_findings(analysis) == analysis
@@ -0,0 +1,79 @@
+"""
+Unit tests cho prompt registry (hot-reload, versioned prompts)
+"""
+
+import os
+import pytest
+from app.agents.prompt_registry import PromptRegistry
+
+FILES = {"parse": "parse.txt", "fast": "fast.txt"}
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _write(directory, filename, text, mtime_offset=0):
+    path = directory / filename
+    path.write_text(text, encoding="utf-8")
+    if mtime_offset:
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + mtime_offset))
+
+
+@pytest.fixture
+def prompts_dir(tmp_path):
+    _write(tmp_path, "parse.txt", "Parse: {input_text}")
+    _write(tmp_path, "fast.txt", "Analyze: {input_text}")
+    return tmp_path
+
+
+def test_version_is_content_hash(prompts_dir, tmp_path_factory):
+    """Cùng nội dung -> cùng version, bất kể thư mục"""
+    registry = PromptRegistry(prompts_dir, FILES, reload_interval=0)
+    other_dir = tmp_path_factory.mktemp("copy")
+    _write(other_dir, "parse.txt", "Parse: {input_text}")
+    _write(other_dir, "fast.txt", "Analyze: {input_text}")
+
+    assert PromptRegistry(other_dir, FILES, reload_interval=0).version == registry.version
+    assert registry.current()["parse"] == "Parse: {input_text}"
+
+
+def test_hot_reload_after_interval(prompts_dir):
+    """File thay đổi được swap vào sau reload_interval, không cần tạo registry mới"""
+    clock = _Clock()
+    registry = PromptRegistry(prompts_dir, FILES, reload_interval=2, clock=clock)
+    before = registry.current()
+
+    _write(prompts_dir, "fast.txt", "Analyze carefully: {input_text}", mtime_offset=10**9)
+    assert registry.current() is before  # Chưa tới lần kiểm tra
+
+    clock.now = 5
+    after = registry.current()
+    assert after.version != before.version
+    assert after["fast"] == "Analyze carefully: {input_text}"
+    assert after.versions["parse"] == before.versions["parse"]
+    assert registry.get_stats()["reloads"] == 1
+
+
+def test_invalid_prompt_keeps_previous_version(prompts_dir):
+    """Template lỗi hoặc file bị xóa không làm hỏng version đang chạy"""
+    registry = PromptRegistry(prompts_dir, FILES, reload_interval=0)
+    version = registry.version
+
+    _write(prompts_dir, "parse.txt", "Parse: {input_text", mtime_offset=10**9)
+    assert registry.reload() is False
+    (prompts_dir / "fast.txt").unlink()
+    assert registry.check_for_updates() is False
+
+    assert registry.version == version
+    assert registry.get_stats()["failed_reloads"] == 2
+
+
+def test_missing_prompt_on_first_load(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        PromptRegistry(tmp_path, FILES)
@@ -0,0 +1,106 @@
+"""
+Unit tests cho token-bucket rate limiter (RPM + TPM, SQLite, priority lanes)
+"""
+
+import asyncio
+import time
+import pytest
+from app.utils.rate_limiter import (
+    LANE_BATCH,
+    LANE_INTERACTIVE,
+    RateLimiter,
+    RateLimitTimeoutError,
+    current_lane,
+    priority_lane,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "quota.sqlite3")
+
+
+def test_requests_per_minute_bucket(db_path):
+    clock = FakeClock()
+    limiter = RateLimiter(db_path, rpm=2, tpm=0, output_reserve=0, clock=clock)
+    assert limiter._try_acquire("a", LANE_INTERACTIVE, 10) == 0
+    assert limiter._try_acquire("b", LANE_INTERACTIVE, 10) == 0
+    wait = limiter._try_acquire("c", LANE_INTERACTIVE, 10)
+    assert wait == pytest.approx(30)  # 2 RPM -> một request mỗi 30s
+    clock.now += 30
+    assert limiter._try_acquire("c", LANE_INTERACTIVE, 10) == 0
+
+
+def test_tokens_per_minute_bucket_and_settle(db_path):
+    clock = FakeClock()
+    limiter = RateLimiter(db_path, rpm=0, tpm=600, output_reserve=100, clock=clock)
+    assert limiter._try_acquire("a", LANE_INTERACTIVE, 500) == 0
+    limiter.settle(200)  # Output thật lớn hơn phần dự trữ 100 token
+    assert limiter.get_stats()["buckets"]["tokens"] == pytest.approx(0)
+    assert limiter._try_acquire("b", LANE_INTERACTIVE, 100) == pytest.approx(10)
+
+
+def test_state_is_shared_between_limiter_instances(db_path):
+    """Hai instance (vd: 2 worker process) dùng chung file SQLite -> chung quota"""
+    clock = FakeClock()
+    first = RateLimiter(db_path, rpm=1, tpm=0, output_reserve=0, clock=clock)
+    second = RateLimiter(db_path, rpm=1, tpm=0, output_reserve=0, clock=clock)
+    assert first._try_acquire("a", LANE_INTERACTIVE, 1) == 0
+    assert second._try_acquire("b", LANE_INTERACTIVE, 1) > 0
+
+
+def test_batch_lane_yields_to_waiting_interactive_request(db_path):
+    clock = FakeClock()
+    limiter = RateLimiter(db_path, rpm=60, tpm=0, output_reserve=0, clock=clock)
+    for index in range(60):
+        limiter._try_acquire(f"burst-{index}", LANE_INTERACTIVE, 1)
+    assert limiter._try_acquire("interactive", LANE_INTERACTIVE, 1) > 0  # Đang đợi
+    clock.now += 1
+    assert limiter._try_acquire("batch", LANE_BATCH, 1) > 0  # Có quota nhưng phải nhường
+    assert limiter._try_acquire("interactive", LANE_INTERACTIVE, 1) == 0
+    clock.now += 1
+    assert limiter._try_acquire("batch", LANE_BATCH, 1) == 0
+    assert limiter.get_stats()["queue_depth"] == {LANE_INTERACTIVE: 0, LANE_BATCH: 0}
+
+
+def test_async_acquire_waits_and_records_stats(db_path):
+    limiter = RateLimiter(db_path, rpm=600, tpm=0, output_reserve=0)  # Refill 10 request/s
+    limiter._try_acquire("warmup", LANE_INTERACTIVE, 1)
+    with limiter._transaction() as conn:
+        conn.execute("UPDATE buckets SET level = 0, updated = ?", (time.time(),))
+
+    waited = asyncio.run(limiter.acquire(1))
+    assert 0.05 <= waited < 1.0
+    lane = limiter.get_stats()["lanes"][LANE_INTERACTIVE]
+    assert lane["acquired"] == 1 and lane["waiting"] == 0 and lane["max_wait_seconds"] > 0
+
+
+def test_acquire_times_out(db_path):
+    limiter = RateLimiter(db_path, rpm=1, tpm=0, output_reserve=0, max_wait=0.2)
+    limiter.acquire_sync(1)
+    with pytest.raises(RateLimitTimeoutError):
+        limiter.acquire_sync(1)
+
+
+def test_priority_lane_context():
+    assert current_lane() == LANE_INTERACTIVE
+    with priority_lane(LANE_BATCH):
+        assert current_lane() == LANE_BATCH
+    assert current_lane() == LANE_INTERACTIVE
+    with pytest.raises(ValueError):
+        with priority_lane("urgent"):
+            pass
+
+
+def test_disabled_limiter_does_not_wait(db_path):
+    limiter = RateLimiter(db_path, rpm=0, tpm=0)
+    assert asyncio.run(limiter.acquire(10 ** 9)) == 0
+    assert limiter.get_stats()["enabled"] is False
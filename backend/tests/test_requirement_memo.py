@@ -0,0 +1,154 @@
+"""
+Unit tests cho requirement memo (verdict theo requirement, dùng chung giữa các document)
+"""
+
+import asyncio
+import json
+import pytest
+from langchain_core.runnables import RunnableLambda
+from app.agents.prompt_registry import PROMPT_FILES, PromptRegistry
+from app.services import requirement_memo
+from app.services.requirement_memo import (
+    KIND_AMBIGUITY,
+    KIND_FAST,
+    KIND_IMPROVE,
+    FastMemoPlan,
+    RequirementMemo,
+    make_memo_key,
+    memo_usage,
+)
+
+CLEAR = {"ambiguous": False, "issue": None}
+VAGUE = {"ambiguous": True, "issue": "how fast?"}
+
+
+def test_memo_key_ignores_ids_and_list_markers():
+    """Cùng requirement boilerplate trong 2 SRS khác nhau có cùng memo key"""
+    key = make_memo_key(KIND_AMBIGUITY, "m", "v1", "REQ-12: The system shall log all access.")
+    assert key == make_memo_key(KIND_AMBIGUITY, "m", "v1", "3. NFR-7 The system shall log all  access")
+    assert key == make_memo_key(KIND_AMBIGUITY, "m", "v1", "- the system shall log all access")
+    assert key != make_memo_key(KIND_AMBIGUITY, "m", "v2", "REQ-12: The system shall log all access.")
+    assert key != make_memo_key(KIND_IMPROVE, "m", "v1", "REQ-12: The system shall log all access.")
+
+
+def test_lookup_store_and_usage_counts(sqlite_session_factory):
+    """Verdict lưu từ document này được dùng lại cho document khác (kể cả sau khi mất memory tier)"""
+    memo = RequirementMemo(session_factory=sqlite_session_factory)
+    memo.store(KIND_AMBIGUITY, [("REQ-1 The system shall respond fast.", VAGUE)], "m", "v1")
+
+    memo.clear_memory()
+    with memo_usage() as usage:
+        cached = memo.lookup(KIND_AMBIGUITY, ["FR-9 Passwords are hashed.", "FR-3 The system shall respond fast."], "m", "v1")
+    assert cached == {1: VAGUE}
+    assert usage.to_dict()[KIND_AMBIGUITY] == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+    assert memo.get_stats()["persistent_hits"] == 1
+
+
+def test_bypass_and_refresh_modes(sqlite_session_factory):
+    memo = RequirementMemo(session_factory=sqlite_session_factory)
+    memo.store(KIND_AMBIGUITY, [("REQ-1 A", CLEAR)], "m", "v1")
+    with memo_usage("bypass"):
+        assert memo.lookup(KIND_AMBIGUITY, ["REQ-1 A"], "m", "v1") == {}
+        memo.store(KIND_AMBIGUITY, [("REQ-2 B", CLEAR)], "m", "v1")
+    with memo_usage("refresh"):
+        assert memo.lookup(KIND_AMBIGUITY, ["REQ-1 A"], "m", "v1") == {}
+        memo.store(KIND_AMBIGUITY, [("REQ-1 A", VAGUE)], "m", "v1")
+    assert memo.lookup(KIND_AMBIGUITY, ["REQ-1 A", "REQ-2 B"], "m", "v1") == {0: VAGUE}
+
+
+def test_persistent_lru_eviction(sqlite_session_factory):
+    """Bảng vượt max_rows: xóa các dòng có last_used_at cũ nhất"""
+    memo = RequirementMemo(max_rows=2, evict_every=1, session_factory=sqlite_session_factory)
+    memo.store(KIND_AMBIGUITY, [("REQ-1 A", CLEAR)], "m", "v1")
+    memo.store(KIND_AMBIGUITY, [("REQ-2 B", CLEAR)], "m", "v1")
+    memo.clear_memory()
+    memo.lookup(KIND_AMBIGUITY, ["REQ-1 A"], "m", "v1")  # REQ-2 thành LRU
+    memo.store(KIND_AMBIGUITY, [("REQ-3 C", CLEAR)], "m", "v1")
+
+    memo.clear_memory()
+    assert memo.lookup(KIND_AMBIGUITY, ["REQ-1 A", "REQ-2 B", "REQ-3 C"], "m", "v1") == {0: CLEAR, 2: CLEAR}
+    assert memo.get_stats()["evictions"] == 1
+
+
+def test_fast_plan_merges_cached_verdicts_and_skips_conflicts():
+    requirements = ["REQ-1 Lock after 3 attempts.", "REQ-2 Never lock.", "REQ-3 Respond fast."]
+    plan = FastMemoPlan(requirements, {2: {**VAGUE, "new_version": "Respond within 2s."}})
+    assert "REQ-3 Respond fast." in plan.annotate("text").split("\n\n", 1)[1]
+
+    result = {
+        "conflicts": [{"req1": requirements[0], "req2": requirements[1], "description": "lock"}],
+        "ambiguities": [{"req": requirements[2], "issue": "model repeated it"}],
+        "suggestions": []
+    }
+    merged = plan.merge(result)
+    assert merged["ambiguities"] == [{"req": requirements[2], "issue": "how fast?"}]
+    assert merged["suggestions"] == [{"req": requirements[2], "new_version": "Respond within 2s."}]
+    assert plan.verdicts(result) == []  # REQ-1, REQ-2 dính conflict của document này
+
+
+@pytest.fixture
+def agent(tmp_path, sqlite_session_factory, monkeypatch):
+    from app.agents.langgraph_agent import RequirementsAnalysisAgent
+
+    for filename in PROMPT_FILES.values():
+        (tmp_path / filename).write_text(f"{filename} {{input_text}}", encoding="utf-8")
+    monkeypatch.setattr(requirement_memo, "_requirement_memo", RequirementMemo(session_factory=sqlite_session_factory))
+    agent = RequirementsAnalysisAgent(api_key="test-key", prompt_registry=PromptRegistry(tmp_path, reload_interval=0))
+    agent.ambiguity_rules = None
+    return agent
+
+
+def test_clarity_node_sends_only_uncached_requirements(agent):
+    sent = []
+
+    async def ambiguity(inputs):
+        sent.append(inputs["parsed_requirements"])
+        found = [{"req": "The system shall respond fast.", "issue": "how fast?"}] if "fast" in sent[-1] else []
+        return json.dumps({"ambiguities": found})
+
+    agent.ambiguity_chain = RunnableLambda(ambiguity)
+    first = ["REQ-1 The system shall respond fast.", "REQ-2 Passwords shall be hashed with bcrypt."]
+    second = ["FR-7 The system shall respond fast.", "FR-8 Reports shall be exported as PDF."]
+
+    asyncio.run(agent.clarity_check_node({"parsed_requirements": first}))
+
+    async def run_second():
+        with memo_usage() as usage:
+            update = await agent.clarity_check_node({"parsed_requirements": second})
+        return update, usage
+
+    update, usage = asyncio.run(run_second())
+    assert sent[1] == "- FR-8 Reports shall be exported as PDF."
+    assert update["ambiguities"] == [{"req": second[0], "issue": "how fast?"}]
+    assert usage.to_dict()[KIND_AMBIGUITY]["hits"] == 1
+
+
+def test_streaming_fast_path_uses_memo_plan(agent):
+    version = agent._prompt_versions.get("analyze_all", "")
+    asyncio.run(agent.memo.astore(KIND_FAST, [("The system shall respond fast.", {**VAGUE, "new_version": None})],
+                                  agent.model, version))
+    prompts = []
+
+    async def fast(inputs):
+        prompts.append(inputs["input_text"])
+        return json.dumps({"conflicts": [], "suggestions": [],
+                           "ambiguities": [{"req": "FR-7 The system shall respond fast.", "issue": "model repeated it"}]})
+
+    agent.fast_chain = RunnableLambda(fast)
+
+    async def collect():
+        return [event async for event in agent.astream_fast("FR-7 The system shall respond fast.\nFR-8 Reports shall be PDF.")]
+
+    events = asyncio.run(collect())
+    assert "FR-7 The system shall respond fast." in prompts[0].split("\n\n", 1)[1]
+    assert [item for section, item in events if section == "ambiguities"] == [
+        {"req": "FR-7 The system shall respond fast.", "issue": "how fast?"}
+    ]
+
+
+def test_output_without_ambiguities_key_is_not_memoized(agent):
+    agent.ambiguity_chain = RunnableLambda(lambda inputs: "{}")
+    requirements = ["REQ-1 The system shall respond fast."]
+    asyncio.run(agent.clarity_check_node({"parsed_requirements": requirements}))
+    version = agent._prompt_versions.get("ambiguity", "")
+    assert asyncio.run(agent.memo.alookup(KIND_AMBIGUITY, requirements, agent.model, version)) == {}
@@ -0,0 +1,250 @@
+"""
+Unit tests cho resilience của LLM calls: hedging, retry với deadline, circuit breaker
+"""
+
+import asyncio
+import time
+import pytest
+from langchain_core.runnables import RunnableLambda
+from app.utils.resilience import (
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceededError,
+    ResiliencePolicy,
+    ResilientCaller,
+    ResilientChain,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class UpstreamError(Exception):
+    """Lỗi tạm thời của upstream (vd: 503)"""
+    code = 503
+
+
+def _policy(**overrides):
+    defaults = dict(
+        hedge_enabled=True, hedge_percentile=95, hedge_min_delay=0.0, hedge_initial_delay=0.05,
+        hedge_max_ratio=1.0, max_attempts=3, retry_base=0.001, retry_max=0.01, deadline=2.0
+    )
+    defaults.update(overrides)
+    return ResiliencePolicy(**defaults)
+
+
+def test_hedged_request_wins_over_slow_primary():
+    """Primary chậm hơn hedge delay -> request trùng được gửi và kết quả của nó được dùng"""
+    caller = ResilientCaller("test:hedge", policy=_policy())
+    calls = []
+
+    async def request():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            await asyncio.sleep(1.0)  # Primary bị treo
+            return "primary"
+        return "hedge"
+
+    start = time.monotonic()
+    result = asyncio.run(caller.acall(request))
+    assert result == "hedge"
+    assert time.monotonic() - start < 0.5
+    stats = caller.get_stats()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+
+
+def test_hedge_delay_follows_latency_percentile():
+    caller = ResilientCaller("test:percentile", policy=_policy(hedge_min_delay=0.5))
+    assert caller.hedge_delay() == 0.05  # Chưa đủ mẫu -> initial delay
+    for latency in range(1, 101):
+        caller._record_success(latency / 100)
+    assert caller.hedge_delay() == pytest.approx(0.96)
+
+
+def test_retries_transient_errors_then_succeeds():
+    caller = ResilientCaller("test:retry", policy=_policy(hedge_enabled=False))
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise UpstreamError("unavailable")
+        return "ok"
+
+    assert asyncio.run(caller.acall(request)) == "ok"
+    assert len(attempts) == 3
+    assert caller.get_stats()["retries"] == 2
+
+
+def test_does_not_retry_client_errors():
+    caller = ResilientCaller("test:no-retry", policy=_policy(hedge_enabled=False))
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        asyncio.run(caller.acall(request))
+    assert len(attempts) == 1
+
+
+def test_deadline_bounds_total_time():
+    caller = ResilientCaller("test:deadline", policy=_policy(hedge_enabled=False, deadline=0.2))
+
+    async def request():
+        await asyncio.sleep(5)
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(caller.acall(request))
+    assert time.monotonic() - start < 1.0
+
+
+def test_sync_call_retries_and_hedges():
+    caller = ResilientCaller("test:sync", policy=_policy())
+    attempts = []
+
+    def request():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise UpstreamError("unavailable")
+        if len(attempts) == 2:
+            time.sleep(0.5)  # Attempt thứ 2 chậm -> hedge
+            return "slow"
+        return "fast"
+
+    assert caller.call(request) == "fast"
+
+
+def test_circuit_opens_on_error_spike_and_recovers():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_rate=0.5, min_calls=4, window_seconds=60, open_seconds=30, clock=clock)
+    for success in (True, False, False, False):
+        breaker.before_call()
+        breaker.record(success)
+    assert breaker.state == STATE_OPEN
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_after == pytest.approx(30)
+
+    clock.now = 31
+    assert breaker.state == STATE_HALF_OPEN
+    breaker.before_call()  # Call thử
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # Chỉ một call thử cùng lúc
+    breaker.record(True)
+    assert breaker.state == STATE_CLOSED
+    assert breaker.get_stats()["trips"] == 1
+
+
+def test_failed_probe_reopens_circuit():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_rate=0.5, min_calls=2, open_seconds=10, clock=clock)
+    breaker.record(False)
+    breaker.record(False)
+    clock.now = 11
+    breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == STATE_OPEN
+
+
+def test_open_circuit_fails_fast_without_calling_upstream():
+    breaker = CircuitBreaker("test:fail-fast", min_calls=1, open_seconds=60)
+    caller = ResilientCaller("test:fail-fast", breaker=breaker, policy=_policy(hedge_enabled=False, max_attempts=1))
+    calls = []
+
+    async def request():
+        calls.append(1)
+        raise UpstreamError("unavailable")
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(caller.acall(request))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(caller.acall(request))
+    assert len(calls) == 1
+
+
+def test_resilient_chain_wraps_runnable():
+    attempts = []
+
+    async def flaky(inputs):
+        attempts.append(inputs)
+        if len(attempts) == 1:
+            raise UpstreamError("unavailable")
+        return inputs["x"] * 2
+
+    chain = ResilientChain(RunnableLambda(flaky), ResilientCaller("test:chain", policy=_policy(hedge_enabled=False)))
+    assert asyncio.run(chain.ainvoke({"x": 2})) == 4
+    assert asyncio.run(chain.abatch([{"x": 1}, {"x": 3}], config={"max_concurrency": 1})) == [2, 6]
+
+
+def test_cancelled_or_abandoned_probe_releases_half_open_slot():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test:probe", failure_rate=0.5, min_calls=1, open_seconds=10, clock=clock)
+    breaker.record(False)
+    clock.now = 11
+    caller = ResilientCaller("test:probe", breaker=breaker, policy=_policy(hedge_enabled=False, max_attempts=1))
+
+    async def cancel_probe():
+        task = asyncio.ensure_future(caller.acall(lambda: asyncio.sleep(60)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_probe())
+    assert breaker.state == STATE_HALF_OPEN
+
+    async def chunks(_):
+        for chunk in ("a", "b"):
+            yield chunk
+
+    async def read_first():
+        stream = ResilientChain(RunnableLambda(lambda x: x) | RunnableLambda(chunks), caller).astream("x")
+        first = await stream.__anext__()
+        await stream.aclose()  # Consumer dừng sớm
+        return first
+
+    assert asyncio.run(read_first()) == "a"
+    assert breaker.state == STATE_HALF_OPEN
+    assert asyncio.run(caller.acall(lambda: asyncio.sleep(0, "ok"))) == "ok"
+    assert breaker.state == STATE_CLOSED
+
+
+def test_client_errors_do_not_open_the_circuit():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test:client-errors", failure_rate=0.5, min_calls=2, open_seconds=10, clock=clock)
+    caller = ResilientCaller("test:client-errors", breaker=breaker, policy=_policy(hedge_enabled=False, max_attempts=1))
+
+    class InvalidArgument(Exception):
+        code = 400
+
+    for error in (InvalidArgument("document too large"), KeyError("input_text"), LookupError("cassette miss")):
+        async def request(error=error):
+            raise error
+
+        with pytest.raises(type(error)):
+            asyncio.run(caller.acall(request))
+        with pytest.raises(type(error)):
+            caller.call(lambda error=error: (_ for _ in ()).throw(error))
+    assert breaker.state == STATE_CLOSED
+
+    breaker.record(False)
+    breaker.record(False)
+    clock.now = 11
+
+    async def bad_request():
+        raise ValueError("bad prompt")
+
+    with pytest.raises(ValueError):
+        asyncio.run(caller.acall(bad_request))
+    assert breaker.state == STATE_HALF_OPEN  # Probe được trả lại, không làm mở lại breaker
@@ -0,0 +1,133 @@
+"""
+Unit tests cho incremental revision analysis
+"""
+
+import asyncio
+from app.agents.revision_engine import (
+    RevisionAnalysisEngine,
+    carry_forward,
+    diff_requirements,
+    find_counterparts
+)
+from app.utils.requirements_text import split_requirements
+
+
+OLD_SRS = """3.1 Functional Requirements
+REQ-001 The system shall allow users to login with email and password.
+REQ-002 The system shall lock the account after 3 failed login attempts.
+REQ-003 The report page should load fast.
+REQ-004 The system shall export invoices to PDF format.
+"""
+
+NEW_SRS = """3.1 Functional Requirements
+REQ-001 The system shall allow users to login with email and password.
+REQ-002 The system shall lock the account after 5 failed login attempts.
+REQ-003 The report page should load fast.
+REQ-004 The system shall export invoices to PDF format.
+REQ-005 The system shall never lock user accounts.
+"""
+
+PREVIOUS_RESULT = {
+    "conflicts": [{
+        "req1": "REQ-001 The system shall allow users to login with email and password.",
+        "req2": "REQ-002 The system shall lock the account after 3 failed login attempts.",
+        "description": "old conflict"
+    }],
+    "ambiguities": [
+        {"req": "REQ-003 The report page should load fast.", "issue": "fast is vague"},
+        {"req": "REQ-002 The system shall lock the account after 3 failed login attempts.", "issue": "lock duration"}
+    ],
+    "suggestions": [{"req": "REQ-003 The report page should load fast.", "new_version": "< 2s"}]
+}
+
+
+class _FakeAgent:
+    """Fake agent ghi lại text được gửi cho LLM"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def _acached_fast(self, text, cache_mode=None):
+        self.sent.append(text)
+        return {
+            "conflicts": [{
+                "req1": "REQ-002 The system shall lock the account after 5 failed login attempts.",
+                "req2": "REQ-005 The system shall never lock user accounts.",
+                "description": "lock vs never lock"
+            }],
+            "ambiguities": [
+                # Chỉ liên quan tới counterpart không đổi -> bị bỏ (đã có từ lần trước)
+                {"req": "REQ-001 The system shall allow users to login with email and password.", "issue": "new noise"}
+            ],
+            "suggestions": []
+        }
+
+
+def test_diff_requirements():
+    """Requirement được phân loại unchanged / changed / added / removed"""
+    old = split_requirements(OLD_SRS)
+    new = split_requirements(NEW_SRS)[:-1] + ["REQ-006 Audit logs shall be kept for 90 days."]
+    new.remove("REQ-004 The system shall export invoices to PDF format.")
+
+    diff = diff_requirements(old, new)
+    assert len(diff.unchanged) == 2
+    assert diff.changed == [(old[1], new[1])]
+    assert diff.added == ["REQ-006 Audit logs shall be kept for 90 days."]
+    assert diff.removed == ["REQ-004 The system shall export invoices to PDF format."]
+
+
+def test_carry_forward_keeps_only_unchanged_findings():
+    """Finding liên quan tới requirement đã sửa không được giữ"""
+    old = split_requirements(OLD_SRS)
+    diff = diff_requirements(old, split_requirements(NEW_SRS))
+
+    carried = carry_forward(PREVIOUS_RESULT, old, diff, NEW_SRS)
+    assert carried["conflicts"] == []
+    assert [a["issue"] for a in carried["ambiguities"]] == ["fast is vague"]
+    assert len(carried["suggestions"]) == 1
+
+
+def test_find_counterparts_includes_previous_conflict_partner():
+    """Requirement từng conflict với bản cũ của requirement đã sửa được gửi kèm"""
+    old = split_requirements(OLD_SRS)
+    diff = diff_requirements(old, split_requirements(NEW_SRS))
+
+    counterparts = find_counterparts(diff, PREVIOUS_RESULT, limit=1)
+    assert counterparts[0].startswith("REQ-001")
+
+
+def test_revision_engine_sends_only_diff():
+    """Chỉ requirement thay đổi + counterpart được gửi; kết quả gồm finding mới và finding cũ"""
+    agent = _FakeAgent()
+    engine = RevisionAnalysisEngine(agent, counterparts=1)
+
+    result = asyncio.run(engine.aanalyze(OLD_SRS, PREVIOUS_RESULT, NEW_SRS))
+
+    assert len(agent.sent) == 1
+    assert "REQ-004" not in agent.sent[0]
+    assert "REQ-005" in agent.sent[0] and "5 failed" in agent.sent[0]
+    assert [c["description"] for c in result["conflicts"]] == ["lock vs never lock"]
+    assert [a["issue"] for a in result["ambiguities"]] == ["fast is vague"]
+    assert result["revision"]["changed"] == 1
+    assert result["revision"]["added"] == 1
+    assert result["revision"]["carried_forward"] == 2
+
+
+def test_revision_engine_no_changes_skips_llm():
+    """Bản mới giống bản cũ -> không gọi LLM"""
+    agent = _FakeAgent()
+    result = asyncio.run(RevisionAnalysisEngine(agent).aanalyze(OLD_SRS, PREVIOUS_RESULT, OLD_SRS))
+
+    assert agent.sent == []
+    assert result["conflicts"] == PREVIOUS_RESULT["conflicts"]
+    assert result["revision"]["sent_requirements"] == 0
+
+
+def test_revision_engine_large_change_runs_full_analysis():
+    """Thay đổi quá nhiều -> phân tích lại toàn bộ document"""
+    agent = _FakeAgent()
+    new_text = "REQ-010 Payments shall be refunded within 7 days.\nREQ-011 Refunds shall be emailed."
+    result = asyncio.run(RevisionAnalysisEngine(agent).aanalyze(OLD_SRS, PREVIOUS_RESULT, new_text))
+
+    assert agent.sent == [new_text]
+    assert result["revision"]["mode"] == "full"
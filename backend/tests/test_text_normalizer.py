@@ -0,0 +1,101 @@
+"""
+Unit tests cho chuẩn hóa input (whitespace, header / footer, mục lục, lịch sử thay đổi)
+"""
+
+import pytest
+from app.utils.text_normalizer import MODE_ADAPTIVE, BoilerplateFilter, InputNormalizer, get_input_normalizer
+
+SRS = """ACME Corp - Confidential
+Table of Contents
+1. Introduction ........ 3
+2. Requirements ........ 5
+
+Revision History
+Version | Date | Author | Change
+1.0 | 2024-01-02 | An | Initial draft
+
+1. Introduction
+This   document describes  the “library”​ system.
+
+
+
+ACME Corp - Confidential
+Page 1 of 3
+2. Requirements
+REQ-1 The system shall lock the account after 3 failed attempts.
+Preconditions:
+ACME Corp - Confidential
+Page 2 of 3
+REQ-2 Passwords shall contain at least 12 characters.
+Preconditions:
+Preconditions:
+"""
+
+
+def test_stages_strip_noise_and_report_tokens():
+    result = InputNormalizer(stages=["whitespace", "headers", "toc", "changelog"]).normalize(SRS)
+    assert result.text == (
+        "1. Introduction\n"
+        'This document describes the "library" system.\n\n'
+        "2. Requirements\n"
+        "REQ-1 The system shall lock the account after 3 failed attempts.\n"
+        "Preconditions:\n"
+        "REQ-2 Passwords shall contain at least 12 characters.\n"
+        "Preconditions:\nPreconditions:"
+    )
+    report = result.to_dict()
+    assert [stage["stage"] for stage in report["stages"]] == ["whitespace", "headers", "toc", "changelog"]
+    assert all(stage["tokens_after"] <= stage["tokens_before"] for stage in report["stages"])
+    assert report["tokens_after"] < report["tokens_before"]
+
+
+def test_deterministic_mode_is_stable_and_adaptive_learns_boilerplate():
+    normalizer = InputNormalizer(stages=["whitespace", "boilerplate"])
+    assert normalizer.normalize(SRS).text == normalizer.normalize(SRS).text
+    assert "Confidential" not in normalizer.normalize(SRS).text
+
+    adaptive = BoilerplateFilter(adaptive=True, min_documents=2)
+    doc = "Prepared by the PMO office\nREQ-1 The system shall export PDF."
+    assert adaptive(doc) == doc
+    assert adaptive(doc.replace("PDF", "CSV")) == "REQ-1 The system shall export CSV."
+
+
+def test_unknown_stage_and_disabled_normalizer():
+    with pytest.raises(ValueError):
+        InputNormalizer(stages=["whitespace", "spellcheck"])
+    assert InputNormalizer(enabled=False).normalize(SRS).text == SRS
+    assert InputNormalizer(stages=[], mode=MODE_ADAPTIVE).normalize(" a ").text == " a "
+
+
+def test_template_fields_are_kept_and_headers_need_page_breaks():
+    use_cases = "\n".join(
+        f"UC-{i} Place order\nActor: {actor}\nPriority: {priority}\nMain flow\nThe customer confirms the cart."
+        for i, actor, priority in ((1, "Customer", "High"), (2, "Customer", "High"), (3, "Customer", "High"), (4, "Admin", "Low"))
+    )
+    result = InputNormalizer(stages=["whitespace", "headers"]).normalize(use_cases).text
+    assert result.count("Priority: High") == 3 and result.count("Main flow") == 4
+
+    paged = "\f".join(f"Library System SRS\nREQ-{i} The system shall log event {i}.\nInternal draft" for i in range(3))
+    result = InputNormalizer(stages=["whitespace", "headers"]).normalize(paged).text
+    assert result == "\n".join(f"REQ-{i} The system shall log event {i}." for i in range(3))
+    assert "\f" not in InputNormalizer(stages=["whitespace"]).normalize(paged).text
+
+
+def test_bare_numbers_are_values_unless_they_number_pages():
+    values = "REQ-1 The system shall support a maximum number of concurrent users:\n500\nREQ-2 Session timeout in minutes:\n15"
+    assert get_input_normalizer().normalize(values).text == values
+
+    normalizer = InputNormalizer(stages=["whitespace", "headers"])
+    numbered = "\f".join(f"REQ-{i} The system shall log event {i}.\n{i + 1}" for i in range(3))
+    assert normalizer.normalize(numbered).text == "\n".join(f"REQ-{i} The system shall log event {i}." for i in range(3))
+    # Số dưới header là số trang; cùng một giá trị ở cuối mọi trang là nội dung
+    headed = "\f".join(f"ACME SRS\n{i + 1}\nREQ-{i} The system shall log event {i}.\nMax users:\n500" for i in range(3))
+    assert normalizer.normalize(headed).text == "\n".join(
+        f"REQ-{i} The system shall log event {i}.\nMax users:\n500" for i in range(3)
+    )
+
+
+def test_changelog_ends_at_numbered_heading():
+    text = "Revision History\nVersion | Date | Author\n1.0 | 2024-01-02 | An\n1.1 Purpose\nThis document describes the system."
+    result = InputNormalizer(stages=["whitespace", "changelog"]).normalize(text).text
+    assert result == "1.1 Purpose\nThis document describes the system."
@@ -7,6 +7,8 @@ Uses HTTP API to connect to FastAPI backend
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 import os
+import json
+import time
 import requests
 from pathlib import Path
 from dotenv import load_dotenv
@@ -169,22 +171,22 @@ class Agent:
         """
         try:
             if self.backend_available:
-                # Estimate processing time based on text length
-                # Fast method: ~30-60 seconds for most cases
-                estimated_seconds = min(max(len(text) // 50, 30), 90)  # 30-90 seconds
-                
-                # Call backend HTTP API with optimized timeout
+                # Call streaming endpoint: backend gửi findings + heartbeat liên tục nên
+                # chỉ cần read timeout giữa 2 event thay vì timeout cố định cho cả request
                 response = requests.post(
-                    f"{self.api_base_url}/api/analyze",
+                    f"{self.api_base_url}/api/analyze/stream",
                     json={
                         "text": text,
                         "model": "gemini-2.5-flash"
                     },
-                    timeout=90  # Optimized: 90 seconds (fast method should complete in 30-60s)
+                    stream=True,
+                    timeout=(5, 60)  # (connect, read giữa 2 event)
                 )
                 
                 if response.status_code == 200:
-                    result = response.json()
+                    result = self._collect_stream(response)
+                    if "error" in result:
+                        return result
                     # Store analysis_id for later use (export, history)
                     self.current_analysis_id = result.get("analysis_id")
                     self.current_document = result
@@ -210,7 +212,7 @@ class Agent:
                 "conflicts": [],
                 "ambiguities": [],
                 "suggestions": [],
-                "error": "⏱️ Timeout: Phân tích mất quá 90 giây. Vui lòng thử với text ngắn hơn hoặc chia nhỏ document.",
+                "error": "⏱️ Timeout: Backend không phản hồi trong 60 giây. Vui lòng thử lại.",
                 "function_used": "error"
             }
         except requests.exceptions.ConnectionError:
@@ -230,6 +232,35 @@ class Agent:
                 "function_used": "error"
             }
     
+    def _collect_stream(self, response) -> Dict[str, Any]:
+        """
+        Đọc NDJSON stream từ /api/analyze/stream và gom thành kết quả như /api/analyze
+        
+        Args:
+            response: requests.Response (stream=True)
+            
+        Returns:
+            Dict với conflicts, ambiguities, suggestions, analysis_id (hoặc error)
+        """
+        result = {"conflicts": [], "ambiguities": [], "suggestions": [], "analysis_id": None}
+        sections = {"conflict": "conflicts", "ambiguity": "ambiguities", "suggestion": "suggestions"}
+        
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                continue
+            event = json.loads(line)
+            name = event.get("event")
+            if name in sections:
+                result[sections[name]].append(event.get("data", {}))
+            elif name == "done":
+                result["analysis_id"] = event.get("analysis_id")
+                result["processing_time_ms"] = event.get("processing_time_ms")
+            elif name == "error":
+                result["error"] = f"API Error: {event.get('detail', 'Unknown error')}"
+                result["function_used"] = "error"
+        
+        return result
+    
     def _answer_question(self, text: str, context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
         """
         Answer questions about requirements using context
@@ -460,31 +491,18 @@ class Agent:
                 'model': 'gemini-2.5-flash'
             }
             
-            # Call backend file upload API with optimized timeout
-            # Fast method should complete in 60-90 seconds for most files
+            # Submit job thay vì gọi /api/analyze/file trực tiếp: file lớn có thể mất
+            # vài phút, job vẫn chạy ở backend và kết quả không bị mất khi client timeout
             response = requests.post(
-                f"{self.api_base_url}/api/analyze/file",
+                f"{self.api_base_url}/api/jobs/analyze",
                 files=files,
                 data=data,
-                timeout=120  # Optimized: 120 seconds (fast method should complete in 60-90s)
+                timeout=30
             )
             
-            if response.status_code == 200:
-                try:
-                    result = response.json()
-                    # Store analysis_id for later use
-                    self.current_analysis_id = result.get("analysis_id")
-                    self.current_document = result
-                    result["function_used"] = "analyze_requirements"
-                    return result
-                except ValueError as e:
-                    return {
-                        "conflicts": [],
-                        "ambiguities": [],
-                        "suggestions": [],
-                        "error": f"❌ Lỗi parse response từ backend: {str(e)}. Response: {response.text[:200]}",
-                        "function_used": "error"
-                    }
+            if response.status_code == 202:
+                job_id = response.json()["id"]
+                return self._wait_for_job(job_id)
             else:
                 try:
                     error_detail = response.json().get("detail", response.text[:200])
@@ -502,7 +520,7 @@ class Agent:
                 "conflicts": [],
                 "ambiguities": [],
                 "suggestions": [],
-                "error": "⏱️ Timeout: Phân tích file mất quá 120 giây. File có thể quá lớn (>5000 từ). Vui lòng thử với file nhỏ hơn.",
+                "error": "⏱️ Timeout: Backend không phản hồi. Vui lòng thử lại.",
                 "function_used": "error"
             }
         except requests.exceptions.ConnectionError:
@@ -522,6 +540,48 @@ class Agent:
                 "function_used": "error"
             }
     
+    def _wait_for_job(self, job_id: str, poll_interval: float = 2.0, max_wait: float = 900) -> Dict[str, Any]:
+        """
+        Poll GET /api/jobs/{id} cho tới khi job xong
+        
+        Args:
+            job_id: ID của job
+            poll_interval: Số giây giữa 2 lần poll
+            max_wait: Thời gian đợi tối đa (giây)
+            
+        Returns:
+            Analysis results với conflicts, ambiguities, suggestions (hoặc error)
+        """
+        deadline = time.time() + max_wait
+        while time.time() < deadline:
+            response = requests.get(f"{self.api_base_url}/api/jobs/{job_id}", timeout=10)
+            job = response.json()
+            
+            if job.get("status") == "succeeded":
+                result = dict(job.get("result") or {})
+                result["analysis_id"] = job.get("analysis_id")
+                self.current_analysis_id = result["analysis_id"]
+                self.current_document = result
+                result["function_used"] = "analyze_requirements"
+                return result
+            if job.get("status") in ("failed", "cancelled"):
+                return {
+                    "conflicts": [],
+                    "ambiguities": [],
+                    "suggestions": [],
+                    "error": f"❌ Job {job.get('status')}: {job.get('error') or ''}",
+                    "function_used": "error"
+                }
+            time.sleep(poll_interval)
+        
+        return {
+            "conflicts": [],
+            "ambiguities": [],
+            "suggestions": [],
+            "error": f"⏱️ Job {job_id} vẫn đang chạy. Vui lòng kiểm tra lại sau trong History.",
+            "function_used": "error"
+        }
+    
     def export_analysis(self, analysis_id: int, format: str = "json") -> Optional[bytes]:
         """
         Export analysis result from backend